@@ -0,0 +1,85 @@
+import numpy as np
+from osgeo import gdal, ogr
+from osgeo.gdalconst import *
+
+# Block-wise generation of a DSM from sorted building polygons (height above sea level) and a DEM. Buildings are
+# rasterized and merged with the DEM one block at a time in memory, i.e. memory use is bounded by the block size
+# and not by the size of the DSM. The DEM is resampled block by block through a warped VRT.
+
+# Width and height (pixels) of the blocks
+BLOCK_SIZE = 1024
+
+# Creation options of the DSM (tiled and compressed GeoTIFF, BigTIFF if needed)
+DSM_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=256', 'BLOCKYSIZE=256', 'COMPRESS=DEFLATE', 'BIGTIFF=IF_SAFER']
+
+def raster_size(minx, miny, maxx, maxy, pixelResolution):
+    '''Columns and rows of a raster of the extent, as gdal.Rasterize and gdal.Warp with -te and -tr'''
+    cols = int((maxx - minx) / pixelResolution + 0.5)
+    rows = int((maxy - miny) / pixelResolution + 0.5)
+
+    return cols, rows
+
+def rasterize_block(layer, geotransform, cols, rows, field):
+    '''Buildings (field of the polygons in layer, 0 elsewhere) rasterized on a block in memory. Polygons are burnt in
+    the order of the layer'''
+    block = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, GDT_Float64)
+    block.SetGeoTransform(geotransform)
+    gdal.RasterizeLayer(block, [1], layer, options=['ATTRIBUTE=' + field])
+    buildings = block.ReadAsArray()
+    block = None
+
+    return buildings
+
+def merge_block(buildings, dem):
+    '''DSM of a block; DEM where the (integer part of the) building height is 0'''
+    return np.where(np.trunc(buildings) == 0, dem, buildings)
+
+def generate_dsm(polygonPath, filepath_dem, outputDSM, minx, miny, maxx, maxy, pixelResolution, feedback, field='height_asl'):
+    '''Writes the DSM of the extent to outputDSM. polygonPath is a polygon layer sorted on height (ascending) so
+    that lower buildings do not overwrite higher buildings'''
+    cols, rows = raster_size(minx, miny, maxx, maxy, pixelResolution)
+
+    warp_options = gdal.WarpOptions(options=[
+        '-dstnodata', '-9999',
+        '-q',
+        '-te', str(minx), str(miny), str(maxx), str(maxy),
+        '-tr', str(pixelResolution), str(pixelResolution),
+        '-of', 'VRT'])
+    dem_raster = gdal.Warp('', filepath_dem, options=warp_options)
+
+    vector = ogr.Open(polygonPath)
+    layer = vector.GetLayer()
+    srs = layer.GetSpatialRef()
+
+    outDs = gdal.GetDriverByName("GTiff").Create(outputDSM, cols, rows, int(1), GDT_Float32, options=DSM_OPTIONS)
+    outDs.SetGeoTransform((minx, pixelResolution, 0., maxy, 0., -pixelResolution))
+    outDs.SetProjection(srs.ExportToWkt() if srs is not None else dem_raster.GetProjection())
+    outBand = outDs.GetRasterBand(1)
+    outBand.SetNoDataValue(-9999)
+
+    blocks = [(y, x) for y in range(0, rows, BLOCK_SIZE) for x in range(0, cols, BLOCK_SIZE)]
+    for index, (y, x) in enumerate(blocks):
+        if feedback.isCanceled():
+            feedback.setProgressText("Calculation cancelled")
+            break
+        feedback.setProgress(60 + int(20 * index / blocks.__len__()))
+
+        block_cols = min(BLOCK_SIZE, cols - x)
+        block_rows = min(BLOCK_SIZE, rows - y)
+        geotransform = (minx + x * pixelResolution, pixelResolution, 0., maxy - y * pixelResolution, 0., -pixelResolution)
+
+        # only polygons intersecting the block are rasterized
+        layer.SetSpatialFilterRect(geotransform[0], geotransform[3] - block_rows * pixelResolution,
+                                   geotransform[0] + block_cols * pixelResolution, geotransform[3])
+
+        dem = dem_raster.ReadAsArray(x, y, block_cols, block_rows).astype(float)
+        buildings = rasterize_block(layer, geotransform, block_cols, block_rows, field)
+        outBand.WriteArray(merge_block(buildings, dem), x, y)
+
+    layer.SetSpatialFilter(None)
+    outBand.FlushCache()
+    outBand = None
+    outDs = None
+    layer = None
+    vector = None
+    dem_raster = None
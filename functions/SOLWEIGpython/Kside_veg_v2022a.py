@@ -2,13 +2,14 @@ from __future__ import absolute_import
 import numpy as np
 from .Kvikt_veg import Kvikt_veg
 from . import sunlit_shaded_patches
+from .patch_characteristics import cardinal_weights
 
 def Kside_veg_v2022a(radI,radD,radG,
                     shadow,svfS,svfW,svfN,svfE,svfEveg,svfSveg,svfWveg,svfNveg,
                     azimuth,altitude,psi,t,albedo,F_sh,
                     KupE,KupS,KupW,KupN,
                     cyl,lv,anisotropic_diffuse,diffsh,rows,cols,asvf,
-                    shmat, vegshmat, vbshvegshmat):
+                    shmat, vegshmat, vbshvegshmat, patch_classes=None):
 
     # New reflection equation 2012-05-25
     vikttot=4.4897
@@ -112,7 +113,56 @@ def Kside_veg_v2022a(radI,radD,radG,
 
         lumChi = (patch_luminance * radD) / radTot # Radiance fraction normalization
 
-        if cyl == 1:
+        # Shortwave reflected on sunlit surfaces
+        sunlit_surface = ((albedo * (radI * np.cos(altitude * deg2rad)) + (radD * 0.5)) / np.pi)
+        # Shortwave reflected on shaded surfaces and vegetation
+        shaded_surface = ((albedo * radD * 0.5) / np.pi)
+
+        if (cyl == 1) and (patch_classes is not None):
+            # Sums over the patches as matrix products of the (precomputed) patch matrices of all pixels
+            surface_weights = (steradian * np.cos(patch_altitude * deg2rad))[:, np.newaxis]
+
+            # Diffuse vertical radiation, angle of incidence np.cos(0) because cylinder - always perpendicular
+            KsideD = patch_classes.grid(patch_classes.diffuse_sum(lumChi * np.cos(patch_altitude * deg2rad) * steradian))
+
+            # Shortwave radiation reflected on vegetation - based on diffuse shortwave radiation
+            Kref_veg = shaded_surface * patch_classes.grid(patch_classes.class_sum(patch_classes.vegetation, surface_weights)[:, 0])
+
+            # Shortwave radiation reflected on buildings (shaded and sunlit), sunlit or shaded estimated for all patches
+            sunlit, shaded = patch_classes.building_sum(altitude, azimuth, patch_altitude, patch_azimuth,
+                                                        np.ones(patch_azimuth.shape[0], dtype=bool), surface_weights)
+            Kref_sun = sunlit_surface * patch_classes.grid(sunlit[:, 0])
+            Kref_sh = shaded_surface * patch_classes.grid(shaded[:, 0])
+
+            Kside = KsideI + KsideD + Kref_sun + Kref_sh + Kref_veg
+
+            Keast = (KupE * 0.5)
+            Kwest = (KupW * 0.5)
+            Knorth = (KupN * 0.5)
+            Ksouth = (KupS * 0.5)
+        elif patch_classes is not None: # Box
+            # Sums over the patches as matrix products of the (precomputed) patch matrices of all pixels
+            surface_weights = (steradian * np.cos(patch_altitude * deg2rad))[:, np.newaxis] * cardinal_weights(patch_azimuth, t)
+
+            # Diffuse radiation from the patches into each direction (patches on the upper azimuth limit included)
+            diffuse_weights = (lumChi * np.cos(patch_altitude * deg2rad) * steradian)[:, np.newaxis] * cardinal_weights(patch_azimuth, t, upper=True)
+            diffRad = patch_classes.diffuse_sum(diffuse_weights)
+
+            # Shortwave radiation reflected on vegetation - based on diffuse shortwave radiation
+            Kref_veg_ = shaded_surface * patch_classes.class_sum(patch_classes.vegetation, surface_weights)
+
+            # Shortwave radiation reflected on buildings (shaded and sunlit), sunlit or shaded estimated for patches
+            # facing away from the sun (others are shaded)
+            azimuth_difference = np.abs(azimuth - patch_azimuth)
+            sun_side = (azimuth_difference > 90) & (azimuth_difference < 270)
+            sunlit, shaded = patch_classes.building_sum(altitude, azimuth, patch_altitude, patch_azimuth, sun_side, surface_weights)
+            Kref = sunlit_surface * sunlit + shaded_surface * shaded + Kref_veg_
+
+            Keast = KeastI + patch_classes.grid(diffRad[:, 0] + Kref[:, 0]) + KupE * 0.5
+            Ksouth = KsouthI + patch_classes.grid(diffRad[:, 1] + Kref[:, 1]) + KupS * 0.5
+            Kwest = KwestI + patch_classes.grid(diffRad[:, 2] + Kref[:, 2]) + KupW * 0.5
+            Knorth = KnorthI + patch_classes.grid(diffRad[:, 3] + Kref[:, 3]) + KupN * 0.5
+        elif cyl == 1:
             for idx in range(patch_azimuth.shape[0]):
                 # Angle of incidence, np.cos(0) because cylinder - always perpendicular
                 anglIncC = np.cos(patch_altitude[idx] * deg2rad) * np.cos(0) # * np.sin(np.pi / 2) \
@@ -7,7 +7,7 @@ from . import patch_characteristics
     and the approach by Unsworth & Monteith or Martin & Berdahl (1984) or Bliss (1961) to calculate emissivities of the 
     different parts of the sky vault. '''
 
-def Lcyl_v2022a(esky, sky_patches, Ta, Tgwall, ewall, Lup, shmat, vegshmat, vbshvegshmat, solar_altitude, solar_azimuth, rows, cols, asvf):
+def Lcyl_v2022a(esky, sky_patches, Ta, Tgwall, ewall, Lup, shmat, vegshmat, vbshvegshmat, solar_altitude, solar_azimuth, rows, cols, asvf, patch_classes=None):
 
     # Stefan-Boltzmann's Constant
     SBC = 5.67051e-8
@@ -87,7 +87,7 @@ def Lcyl_v2022a(esky, sky_patches, Ta, Tgwall, ewall, Lup, shmat, vegshmat, vbsh
                                  shmat, vegshmat, vbshvegshmat,
                                  Lsky_down, Lsky_side, Lsky_normal, Lup,
                                  Ta, Tgwall, ewall,
-                                 rows, cols)
+                                 rows, cols, patch_classes)
 
     return Ldown, Lside, Least_, Lwest_, Lnorth_, Lsouth_
     # return Ldown, Lside, Lside_sky, Lside_veg, Lside_sh, Lside_sun, Lside_ref, Lsky_normal, Lsky_down, Lsky_side, Least_, Lwest_, Lnorth_, Lsouth_
\ No newline at end of file
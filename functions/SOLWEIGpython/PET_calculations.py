@@ -367,4 +367,261 @@ def _PET(ta,RH,tmrt,v,mbody,age,ht,work,icl,sex):
         count1 = count1 + 1
         enbal2 = 0
 
-    return tx
\ No newline at end of file
+    return tx
+
+def _PET_vec(ta,RH,tmrt,v,mbody,age,ht,work,icl,sex):
+    """
+    _PET of arrays of ta, RH, tmrt and v (broadcast together) for one person. The iterations of _PET are run for all
+    values together, each value iterating (and stopping) as in _PET.
+    Args:
+        ta: air temperature
+        RH: relative humidity
+        tmrt: Mean Radiant temperature
+        v: wind at pedestrian heigh
+        mbody, age, ht, work, icl, sex: as in _PET
+    Returns: PET (shape of the broadcast arrays)
+    """
+    ta, RH, tmrt, v = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (ta, RH, tmrt, v)])
+    shape = ta.shape
+    ta, RH, tmrt, v = [x.ravel() for x in (ta, RH, tmrt, v)]
+
+    # humidity conversion
+    vps = 6.107 * (10. ** (7.5 * ta / (238. + ta)))
+    vpa = RH * vps / 100  # water vapour presure, kPa
+
+    po = 1013.25  # Pressure
+    p = 1013.25  # Pressure
+    rob = 1.06
+    cb = 3.64 * 1000
+    food = 0
+    emsk = 0.99
+    emcl = 0.95
+    evap = 2.42e6
+    sigma = 5.67e-8
+    cair = 1.01 * 1000
+
+    eta = 0  # No idea what eta is
+
+    # INBODY
+    metbf = 3.19 * mbody ** (3 / 4) * (1 + 0.004 * (30 - age) + 0.018 * ((ht * 100 / (mbody ** (1 / 3))) - 42.1))
+    metbm = 3.45 * mbody ** (3 / 4) * (1 + 0.004 * (30 - age) + 0.010 * ((ht * 100 / (mbody ** (1 / 3))) - 43.4))
+    if sex == 1:
+        met = metbm + work
+    else:
+        met = metbf + work
+
+    h = met * (1 - eta)
+    rtv = 1.44e-6 * met
+
+    # sensible respiration energy
+    tex = 0.47 * ta + 21.0
+    eres = cair * (ta - tex) * rtv
+
+    # latent respiration energy
+    vpex = 6.11 * 10 ** (7.45 * tex / (235 + tex))
+    erel = 0.623 * evap / p * (vpa - vpex) * rtv
+    # sum of the results
+    ere = eres + erel
+
+    # calcul constants
+    feff = 0.725
+    adu = 0.203 * mbody ** 0.425 * ht ** 0.725
+    facl = (-2.36 + 173.51 * icl - 100.76 * icl * icl + 19.28 * (icl ** 3)) / 100
+    if facl > 1:
+        facl = 1
+    rcl = (icl / 6.45) / facl
+    y = 1
+
+    if icl < 2:
+        y = (ht-0.2) / ht
+    if icl <= 0.6:
+        y = 0.5
+    if icl <= 0.3:
+        y = 0.1
+
+    fcl = 1 + 0.15 * icl
+    r2 = adu * (fcl - 1. + facl) / (2 * 3.14 * ht * y)
+    r1 = facl * adu / (2 * 3.14 * ht * y)
+    di = r2 - r1
+    acl = adu * facl + adu * (fcl - 1)
+
+    hc = 2.67 + 6.5 * v ** 0.67
+    hc = hc * (p / po) ** 0.55
+    c_1 = h + ere
+    he = 0.633 * hc / (p * cair)
+    fec = 1 / (1 + 0.92 * hc * rcl)
+    htcl = 6.28 * ht * y * di / (rcl * np.log(r2 / r1) * acl)
+    aeff = adu * feff
+    c_2 = adu * rob * cb
+    c_5 = 0.0208 * c_2
+    c_6 = 0.76075 * c_2
+    rdsk = 0.79 * 10 ** 7
+    rdcl = 0
+
+    # state of the iterations of each value
+    n = ta.size
+    tcore = np.zeros((8, n))
+    tsk = np.zeros(n)
+    tcl = np.zeros(n)
+    wetsk = np.zeros(n)
+    esw = np.zeros(n)
+    vpts = np.zeros(n)
+    vb = np.zeros(n)
+    c_9 = np.zeros(n)
+    c_11 = np.zeros(n)
+    enbal = np.zeros(n)
+    enbal2 = np.zeros(n)
+    count3 = np.zeros(n, dtype=int)
+    searching = np.ones(n, dtype=bool)  # count2 == 0
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        for j in range(1, 7):
+            if not searching.any():
+                break
+            tsk[searching] = 34
+            tcl[searching] = (ta[searching] + tmrt[searching] + 34) / 3
+            count3[searching] = 1
+
+            for count1, xx in enumerate((1, 0.1, 0.01, 0.001)):
+                enbal[searching] = 0
+                enbal2[searching] = 0
+                running = searching & (count3 < 200)
+                while running.any():
+                    k = np.nonzero(running)[0]
+                    enbal2[k] = enbal[k]
+                    ta_k = ta[k]
+                    tmrt_k = tmrt[k]
+                    hc_k = hc[k]
+                    c_1_k = c_1[k]
+                    tcl_k = tcl[k]
+
+                    rclo2 = emcl * sigma * ((tcl_k + 273.2) ** 4 - (tmrt_k + 273.2) ** 4) * feff
+                    tsk_k = 1 / htcl * (hc_k * (tcl_k - ta_k) + rclo2) + tcl_k
+
+                    # radiation balance
+                    rbare = aeff * (1 - facl) * emsk * sigma * ((tmrt_k + 273.2) ** 4 - (tsk_k + 273.2) ** 4)
+                    rclo = feff * acl * emcl * sigma * ((tmrt_k + 273.2) ** 4 - (tcl_k + 273.2) ** 4)
+                    rsum = rbare + rclo
+
+                    # convection
+                    cbare = hc_k * (ta_k - tsk_k) * adu * (1 - facl)
+                    cclo = hc_k * (ta_k - tcl_k) * acl
+                    csum = cbare + cclo
+
+                    # core temperature
+                    c_3 = 18 - 0.5 * tsk_k
+                    c_4 = 5.28 * adu * c_3
+                    c_7 = c_4 - c_6 - tsk_k * c_5
+                    c_8 = -c_1_k * c_3 - tsk_k * c_4 + tsk_k * c_6
+                    c_9_k = c_7 * c_7 - 4. * c_5 * c_8
+                    c_10 = 5.28 * adu - c_6 - c_5 * tsk_k
+                    c_11_k = c_10 * c_10 - 4 * c_5 * (c_6 * tsk_k - c_1_k - 5.28 * adu * tsk_k)
+                    tsk_k[tsk_k == 36] = 36.01
+
+                    tcore[7, k] = c_1_k / (5.28 * adu + c_2 * 6.3 / 3600) + tsk_k
+                    tcore[3, k] = c_1_k / (5.28 * adu + (c_2 * 6.3 / 3600) / (1 + 0.5 * (34 - tsk_k))) + tsk_k
+                    tcore[6, k] = np.where(c_11_k >= 0, (-c_10-np.power(c_11_k, 0.5)) / (2 * c_5), tcore[6, k])
+                    tcore[1, k] = np.where(c_11_k >= 0, (-c_10+np.power(c_11_k, 0.5)) / (2 * c_5), tcore[1, k])
+                    tcore[2, k] = np.where(c_9_k >= 0, (-c_7+np.power(np.abs(c_9_k), 0.5)) / (2 * c_5), tcore[2, k])
+                    tcore[5, k] = np.where(c_9_k >= 0, (-c_7-np.power(np.abs(c_9_k), 0.5)) / (2 * c_5), tcore[5, k])
+                    tcore[4, k] = c_1_k / (5.28 * adu + c_2 * 1 / 40) + tsk_k
+
+                    # transpiration
+                    tbody = 0.1 * tsk_k + 0.9 * tcore[j, k]
+                    sw = 304.94 * (tbody - 36.6) * adu / 3600000
+                    vpts_k = 6.11 * 10 ** (7.45 * tsk_k / (235. + tsk_k))
+                    sw[tbody <= 36.6] = 0
+                    if sex == 2:
+                        sw = 0.7 * sw
+                    eswphy = -sw * evap
+
+                    eswpot = he[k] * (vpa[k] - vpts_k) * adu * evap * fec[k]
+                    wetsk_k = eswphy / eswpot
+                    wetsk_k[wetsk_k > 1] = 1
+                    eswdif = eswphy - eswpot
+                    esw_k = np.where(eswdif <= 0, eswpot, eswphy)
+                    esw_k[esw_k > 0] = 0
+
+                    # diffusion
+                    ed = evap / (rdsk + rdcl) * adu * (1 - wetsk_k) * (vpa[k] - vpts_k)
+
+                    # MAX VB
+                    vb1 = 34 - tsk_k
+                    vb2 = tcore[j, k] - 36.6
+                    vb2[vb2 < 0] = 0
+                    vb1[vb1 < 0] = 0
+                    vb[k] = (6.3 + 75 * vb2) / (1 + 0.5 * vb1)
+
+                    # energy balance
+                    enbal_k = h + ed + ere[k] + esw_k + csum + rsum + food
+
+                    # clothing's temperature
+                    tcl[k] = np.where(enbal_k > 0, tcl_k + xx, tcl_k - xx)
+
+                    tsk[k] = tsk_k
+                    c_9[k] = c_9_k
+                    c_11[k] = c_11_k
+                    vpts[k] = vpts_k
+                    wetsk[k] = wetsk_k
+                    esw[k] = esw_k
+                    enbal[k] = enbal_k
+                    count3[k] += 1
+                    running[k] = ((enbal_k * enbal2[k]) >= 0) & (count3[k] < 200)
+
+            # values of which the core temperature of this j is a solution
+            if j == 2 or j == 5:
+                found = (c_9 >= 0) & (tcore[j] >= 36.6) & (tsk <= 34.050) & ~(vb >= 91)
+            elif j == 6 or j == 1:
+                found = (c_11 > 0) & (tcore[j] >= 36.6) & (tsk > 33.850) & ~(vb >= 91)
+            elif j == 3:
+                found = (tcore[j] < 36.6) & (tsk <= 34.000) & ~(vb >= 91)
+            else:
+                found = ~(vb < 89)
+            searching &= ~found
+
+        # PET_cal
+        tx = np.copy(ta)
+        enbal = np.zeros(n)
+
+        hc = 2.67 + 6.5 * 0.1 ** 0.67
+        hc = hc * (p / po) ** 0.55
+
+        for count1, xx in enumerate((1, 0.1, 0.01, 0.001)):
+            enbal2 = np.zeros(n)
+            running = (enbal * enbal2) >= 0
+            while running.any():
+                k = np.nonzero(running)[0]
+                enbal2[k] = enbal[k]
+                tx_k = tx[k]
+                tsk_k = tsk[k]
+                tcl_k = tcl[k]
+
+                # radiation balance
+                rbare = aeff * (1 - facl) * emsk * sigma * ((tx_k + 273.2) ** 4 - (tsk_k + 273.2) ** 4)
+                rclo = feff * acl * emcl * sigma * ((tx_k + 273.2) ** 4 - (tcl_k + 273.2) ** 4)
+                rsum = rbare + rclo
+
+                # convection
+                cbare = hc * (tx_k - tsk_k) * adu * (1 - facl)
+                cclo = hc * (tx_k - tcl_k) * acl
+                csum = cbare + cclo
+
+                # diffusion
+                ed = evap / (rdsk + rdcl) * adu * (1 - wetsk[k]) * (12 - vpts[k])
+
+                # respiration
+                tex = 0.47 * tx_k + 21
+                eres = cair * (tx_k - tex) * rtv
+                vpex = 6.11 * 10 ** (7.45 * tex / (235 + tex))
+                erel = 0.623 * evap / p * (12 - vpex) * rtv
+                ere = eres + erel
+
+                # energy balance
+                enbal_k = h + ed + ere + esw[k] + csum + rsum
+
+                # iteration concerning Tx
+                tx[k] = np.where(enbal_k > 0, tx_k - xx, np.where(enbal_k < 0, tx_k + xx, tx_k))
+                enbal[k] = enbal_k
+                running[k] = (enbal_k * enbal2[k]) >= 0
+
+    return tx.reshape(shape)
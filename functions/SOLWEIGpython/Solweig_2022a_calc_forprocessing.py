@@ -27,7 +27,8 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
                        landcover, lc_grid, dectime, altmax, dirwalls, walls, cyl, elvis, Ta, RH, radG, radD, radI, P,
                        amaxvalue, bush, Twater, TgK, Tstart, alb_grid, emis_grid, TgK_wall, Tstart_wall, TmaxLST,
                        TmaxLST_wall, first, second, svfalfa, svfbuveg, firstdaytime, timeadd, timestepdec, Tgmap1, 
-                       Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, shmat, vegshmat, vbshvegshmat, anisotropic_sky, asvf, patch_option):
+                       Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, shmat, vegshmat, vbshvegshmat, anisotropic_sky, asvf, patch_option,
+                       patch_classes=None, shadows=None):
 
 #def Solweig_2021a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, svfveg, svfNveg, svfEveg, svfSveg,
 #                       svfWveg, svfaveg, svfEaveg, svfSaveg, svfWaveg, svfNaveg, vegdem, vegdem2, albedo_b, absK, absL,
@@ -95,6 +96,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
     # CI = Clearness index
     # TgOut1 = old Ts model
     # diffsh, ani = Used in anisotrpic models (Wallenberg et al. 2019, 2022)
+    # shadows = sh, vegsh and wallsun if already found, e.g. by ray marching at POIs only (solweig_poi)
 
     # # # Core program start # # #
     # Instrument offset in degrees
@@ -136,9 +138,13 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
             # Relative luminance
             lv, pc_, pb_ = Perez_v3(zenDeg, azimuth, radD, radI, jday, patchchoice, patch_option)   
             # Total relative luminance from sky, i.e. from each patch, into each cell
-            aniLum = np.zeros((rows, cols))
-            for idx in range(lv.shape[0]):
-                aniLum += diffsh[:,:,idx] * lv[idx,2]     
+            if (patch_classes is not None) and (patch_classes.diffuse is not None):
+                # One matrix-vector product of the patch matrix (pixels, patches) and the luminance of the patches
+                aniLum = patch_classes.grid(patch_classes.diffuse_sum(lv[:, 2]))
+            else:
+                aniLum = np.zeros((rows, cols))
+                for idx in range(lv.shape[0]):
+                    aniLum += diffsh[:,:,idx] * lv[idx,2]     
 
             dRad = aniLum * radD   # Total diffuse radiation from sky into each cell
         else:
@@ -149,7 +155,14 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
             # lv, pc_, pb_ = Perez_v3(zenDeg, azimuth, radD, radI, jday, patchchoice, patch_option)   # Relative luminance
 
         # Shadow  images
-        if usevegdem == 1:
+        if shadows is not None:
+            # Shadows found by ray marching from each pixel towards the sun (solweig_poi)
+            sh, vegsh, wallsun = shadows
+            if usevegdem == 1:
+                shadow = sh - (1 - vegsh) * (1 - psi)
+            else:
+                shadow = sh
+        elif usevegdem == 1:
             vegsh, sh, _, wallsh, wallsun, wallshve, _, facesun = shadowingfunction_wallheight_23(dsm, vegdem, vegdem2,
                                         azimuth, altitude, scale, amaxvalue, bush, walls, dirwalls * np.pi / 180.)
             shadow = sh - (1 - vegsh) * (1 - psi)
@@ -229,7 +242,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
 
         Keast, Ksouth, Kwest, Knorth, KsideI, KsideD, Kside = Kside_veg_v2022a(radI, radD, radG, shadow, svfS, svfW, svfN, svfE,
                     svfEveg, svfSveg, svfWveg, svfNveg, azimuth, altitude, psi, t, albedo_b, F_sh, KupE, KupS, KupW,
-                    KupN, cyl, lv, anisotropic_sky, diffsh, rows, cols, asvf, shmat, vegshmat, vbshvegshmat)
+                    KupN, cyl, lv, anisotropic_sky, diffsh, rows, cols, asvf, shmat, vegshmat, vbshvegshmat, patch_classes)
 
         firstdaytime = 0
 
@@ -302,7 +315,7 @@ def Solweig_2022a_calc(i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, s
 
         Ldown, Lside, Least_, Lwest_, Lnorth_, Lsouth_ \
                   = Lcyl_v2022a(esky, L_patches, Ta, Tgwall, ewall, Lup, shmat, vegshmat, vbshvegshmat, 
-                                altitude, azimuth, rows, cols, asvf)
+                                altitude, azimuth, rows, cols, asvf, patch_classes)
 
     else:
         Ldown = (svf + svfveg - 1) * esky * SBC * ((Ta + 273.15) ** 4) + (2 - svfveg - svfaveg) * ewall * SBC * \
@@ -250,6 +250,34 @@ def utci_calculator(Ta, RH, Tmrt, va10m):
 
     return UTCI_approx
 
+def utci_calculator_vec(Ta, RH, Tmrt, va10m):
+    # utci_calculator for arrays of Ta, RH, Tmrt and va10m (broadcast together), -999 where any input is -999
+
+    Ta, RH, Tmrt, va10m = np.broadcast_arrays(*[np.asarray(x, dtype=float) for x in (Ta, RH, Tmrt, va10m)])
+    invalid = (Ta <= -999) | (RH <= -999) | (va10m <= -999) | (Tmrt <= -999)
+
+    # saturation vapour pressure (es)
+    g = np.array([-2.8365744E3, - 6.028076559E3, 1.954263612E1, - 2.737830188E-2,
+                  1.6261698E-5, 7.0229056E-10, - 1.8680009E-13, 2.7150305])
+
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        tk = Ta + 273.15  # ! air temp in K
+        es = g[7] * np.log(tk)
+        for i in range(0, 7):
+            es = es + g[i] * tk ** (i + 1 - 3.)
+
+        es = np.exp(es) * 0.01
+
+        ehPa = es * RH / 100.
+
+        D_Tmrt = Tmrt - Ta
+        Pa = ehPa / 10.0  # use vapour pressure in kPa
+
+        # Calculate 6th order polynomial as approximation
+        UTCI_approx = utci_polynomial(D_Tmrt, Ta, va10m, Pa)
+
+    return np.where(invalid, -999., UTCI_approx)
+
 def utci_calculator_grid(Ta, RH, Tmrt, va10m, feedback):
     # Program for calculating UTCI Temperature (UTCI)
     # released for public use after termination of COST Action 730
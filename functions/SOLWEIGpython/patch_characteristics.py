@@ -4,7 +4,137 @@ from . import sunlit_shaded_patches
 
 ''' This function defines if a patch seen from a pixel is sky, building or vegetation. 
     It also calculates if a building patch is sunlit or shaded. From this it estimates 
-    corresponding longwave radiation originating from each surface.'''
+    corresponding longwave radiation originating from each surface.
+
+    The classification of the patches is the same for all timesteps and is made once (PatchClasses), stored as
+    bit-packed matrices (pixels, patches). The longwave radiation of a timestep is the product of these matrices
+    and the radiation (weights) of the patches, calculated for blocks of pixels. The diffuse shortwave transmission
+    of the patches (diffsh) is kept as a contiguous float32 matrix (pixels, patches), so that the sum over the patches
+    is one matrix-vector product reading the matrix once, row by row.'''
+
+# Number of pixels in each block of the matrix products
+PIXEL_BLOCK = 16384
+
+class PatchClasses():
+    '''Sky, vegetation, building and reflecting (not sky) patches seen from each pixel, from the shadow matrices
+    (rows, cols, patches). Each class is a bit-packed matrix (pixels, patches). If diffsh is given, the diffuse
+    transmission of the patches is stored as a float32 matrix (pixels, patches)'''
+    def __init__(self, shmat, vegshmat, vbshvegshmat, asvf, diffsh=None):
+        self.rows, self.cols, self.patches = shmat.shape
+        self.pixels = self.rows * self.cols
+        self.hsvf = np.tan(np.asarray(asvf, dtype=float)).reshape(-1)
+        self.diffuse = None
+        if diffsh is not None:
+            self.diffuse = np.empty((self.pixels, self.patches), dtype=np.float32)
+
+        packed = (self.patches + 7) // 8
+        self.sky = np.zeros((self.pixels, packed), dtype=np.uint8)
+        self.vegetation = np.zeros((self.pixels, packed), dtype=np.uint8)
+        self.building = np.zeros((self.pixels, packed), dtype=np.uint8)
+        self.reflecting = np.zeros((self.pixels, packed), dtype=np.uint8)
+
+        block_rows = max(1, PIXEL_BLOCK // max(self.cols, 1))
+        for row in range(0, self.rows, block_rows):
+            pixels = slice(row * self.cols, min(row + block_rows, self.rows) * self.cols)
+            sh = shmat[row:row + block_rows].reshape(-1, self.patches)
+            vegsh = vegshmat[row:row + block_rows].reshape(-1, self.patches)
+            vbshvegsh = vbshvegshmat[row:row + block_rows].reshape(-1, self.patches)
+
+            # shmat = 1 = sky is visible
+            self.sky[pixels] = np.packbits((sh == 1) & (vegsh == 1), axis=1)
+            # vegshmat = 0 = shade from vegetation
+            self.vegetation[pixels] = np.packbits((vegsh == 0) | (vbshvegsh == 0), axis=1)
+            # shmat = 0 = shade from buildings
+            self.building[pixels] = np.packbits(((1 - sh) * vbshvegsh) == 1, axis=1)
+            self.reflecting[pixels] = np.packbits((sh == 0) | (vegsh == 0) | (vbshvegsh == 0), axis=1)
+            if diffsh is not None:
+                self.diffuse[pixels] = diffsh[row:row + block_rows].reshape(-1, self.patches)
+
+    def blocks(self):
+        '''Slices of the pixels in each block'''
+        return [slice(start, min(start + PIXEL_BLOCK, self.pixels)) for start in range(0, self.pixels, PIXEL_BLOCK)]
+
+    def block(self, matrix, pixels):
+        '''Class of the patches (1 or 0) of a block of pixels, (pixels, patches)'''
+        return np.unpackbits(matrix[pixels], axis=1, count=self.patches).astype(float)
+
+    def sunlit_shaded(self, pixels, solar_altitude, solar_azimuth, patch_altitude, patch_azimuth, active, weights):
+        '''Weights of the patches (patches, n) summed over the sunlit and over the shaded building patches of a block
+        of pixels, (pixels, n). Sunlit and shaded walls are estimated (sunlit_shaded_patches) for the active patches,
+        building patches not active are shaded'''
+        building = np.unpackbits(self.building[pixels], axis=1, count=self.patches).view(bool)
+        sunlit = np.zeros(building.shape, dtype=bool)
+        shaded = building.copy()
+
+        if np.all(active):
+            sunlit_patches, shaded_patches = sunlit_shaded_patches.shaded_or_sunlit_matrix(
+                solar_altitude, solar_azimuth, patch_altitude, patch_azimuth, self.hsvf[pixels])
+            np.logical_and(building, sunlit_patches, out=sunlit)
+            shaded &= shaded_patches
+        elif np.any(active):
+            sunlit_patches, shaded_patches = sunlit_shaded_patches.shaded_or_sunlit_matrix(
+                solar_altitude, solar_azimuth, patch_altitude[active], patch_azimuth[active], self.hsvf[pixels])
+            sunlit[:, active] = building[:, active] & sunlit_patches
+            shaded[:, active] &= shaded_patches
+
+        return sunlit.astype(float) @ weights, shaded.astype(float) @ weights
+
+    def class_sum(self, matrix, weights):
+        '''Weights of the patches (patches, n) summed over the patches of a class for all pixels, (pixels, n)'''
+        values = np.zeros((self.pixels, weights.shape[1]))
+        for pixels in self.blocks():
+            values[pixels] = self.block(matrix, pixels) @ weights
+
+        return values
+
+    def building_sum(self, solar_altitude, solar_azimuth, patch_altitude, patch_azimuth, active, weights):
+        '''As sunlit_shaded for all pixels'''
+        sunlit = np.zeros((self.pixels, weights.shape[1]))
+        shaded = np.zeros((self.pixels, weights.shape[1]))
+        for pixels in self.blocks():
+            sunlit[pixels], shaded[pixels] = self.sunlit_shaded(pixels, solar_altitude, solar_azimuth, patch_altitude,
+                                                                patch_azimuth, active, weights)
+
+        return sunlit, shaded
+
+    def diffuse_sum(self, weights):
+        '''Weights of the patches, (patches) or (patches, n), times the diffuse transmission of the patches summed
+        over the patches of each pixel (one float32 matrix product)'''
+        return (self.diffuse @ np.asarray(weights, dtype=np.float32)).astype(float)
+
+    def grid(self, values):
+        '''Pixel values as a grid (rows, cols)'''
+        return values.reshape(self.rows, self.cols)
+
+def pixel_values(value, pixels):
+    '''Values of a block of pixels of a grid, or a scalar'''
+    value = np.asarray(value, dtype=float)
+    if value.ndim == 0:
+        return value
+    return value.reshape(-1)[pixels]
+
+def cardinal_weights(patch_azimuth, t=0, upper=False):
+    '''Portion of each patch into the cardinal directions (east, south, west, north) used for standing box or POI
+    output, (patches, 4). If upper, patches on the upper azimuth limit of a direction are included (as the diffuse
+    shortwave radiation of Kside_veg_v2022a)'''
+    deg2rad = np.pi / 180
+    weights = np.zeros((patch_azimuth.shape[0], 4))
+    if upper:
+        east = (patch_azimuth > 360) | (patch_azimuth <= 180)
+        south = (patch_azimuth > 90) & (patch_azimuth <= 270)
+        west = (patch_azimuth > 180) & (patch_azimuth <= 360)
+        north = (patch_azimuth > 270) | (patch_azimuth <= 90)
+    else:
+        east = (patch_azimuth > 360) | (patch_azimuth < 180)
+        south = (patch_azimuth > 90) & (patch_azimuth < 270)
+        west = (patch_azimuth > 180) & (patch_azimuth < 360)
+        north = (patch_azimuth > 270) | (patch_azimuth < 90)
+    weights[east, 0] = np.cos((90 - patch_azimuth[east] + t) * deg2rad)
+    weights[south, 1] = np.cos((180 - patch_azimuth[south] + t) * deg2rad)
+    weights[west, 2] = np.cos((270 - patch_azimuth[west] + t) * deg2rad)
+    weights[north, 3] = np.cos((0 - patch_azimuth[north] + t) * deg2rad)
+
+    return weights
 
 def define_patch_characteristics(solar_altitude, solar_azimuth,
                              patch_altitude, patch_azimuth, steradian,
@@ -12,7 +142,7 @@ def define_patch_characteristics(solar_altitude, solar_azimuth,
                              shmat, vegshmat, vbshvegshmat,
                              Lsky_down, Lsky_side, Lsky, Lup,
                              Ta, Tgwall, ewall,
-                             rows, cols):
+                             rows, cols, patch_classes=None):
     
     # Stefan-Boltzmann's Constant
     SBC = 5.67051e-8
@@ -20,136 +150,57 @@ def define_patch_characteristics(solar_altitude, solar_azimuth,
     # Degrees to radians
     deg2rad = np.pi / 180
 
-    # Define variables
-    Ldown = np.zeros((rows,cols))
-    Ldown_sky = np.zeros((rows,cols))
-    Ldown_veg = np.zeros((rows,cols))
-    Ldown_sun = np.zeros((rows,cols))
-    Ldown_sh = np.zeros((rows,cols))
-    Ldown_ref = np.zeros((rows,cols))
-
-    Lside = np.zeros((rows,cols))
-    Lside_sky = np.zeros((rows,cols))
-    Lside_veg = np.zeros((rows,cols))
-    Lside_sun = np.zeros((rows,cols))
-    Lside_sh = np.zeros((rows,cols))
-    Lside_ref = np.zeros((rows,cols))
-
-    Least = np.zeros((rows,cols))
-    Lwest = np.zeros((rows,cols))
-    Lnorth = np.zeros((rows,cols))
-    Lsouth = np.zeros((rows,cols))
+    if patch_classes is None:
+        patch_classes = PatchClasses(shmat, vegshmat, vbshvegshmat, asvf)
+
+    # Longwave radiation from vegetation surface (considered vertical)
+    vegetation_surface = ((ewall * SBC * ((Ta + 273.15) ** 4)) / np.pi)
+    # Longwave radiation from sunlit surfaces
+    sunlit_surface = ((ewall * SBC * ((Ta + Tgwall + 273.15) ** 4)) / np.pi)
+    # Longwave radiation from shaded surfaces
+    shaded_surface = ((ewall * SBC * ((Ta + 273.15) ** 4)) / np.pi)
+
+    # Weights of the patches; horizontal surface, vertical surface and cardinal directions (patches, 6)
+    cardinal = cardinal_weights(patch_azimuth)
+    sky_weights = np.column_stack((Lsky_down[:, 2], Lsky_side[:, 2], Lsky_side[:, 2, np.newaxis] * cardinal))
+    surface_weights = np.column_stack((steradian * np.sin(patch_altitude * deg2rad), steradian * np.cos(patch_altitude * deg2rad),
+                                       (steradian * np.cos(patch_altitude * deg2rad))[:, np.newaxis] * cardinal))
+
+    # Building patches where sunlit and shaded walls are estimated (others are shaded)
+    azimuth_difference = np.abs(solar_azimuth - patch_azimuth)
+    sun_side = (azimuth_difference > 90) & (azimuth_difference < 270) & (solar_altitude > 0)
 
     # Define patch characteristics (sky, vegetation or building, and sunlit or shaded if building)
-    for idx in range(patch_altitude.shape[0]):
-        # Calculations for patches on sky, shmat = 1 = sky is visible
-        temp_sky = ((shmat[:,:,idx] == 1) & (vegshmat[:,:,idx] == 1))
-        
-        # Longwave radiation from sky to vertical surface
-        Ldown_sky += temp_sky * Lsky_down[idx,2]
-        
-        # Longwave radiation from sky to horizontal surface
-        Lside_sky += temp_sky * Lsky_side[idx,2]
-
-        # Calculations for patches that are vegetation, vegshmat = 0 = shade from vegetation
-        temp_vegsh = ((vegshmat[:,:,idx] == 0) | (vbshvegshmat[:,:,idx] == 0))
-        # Longwave radiation from vegetation surface (considered vertical)
-        vegetation_surface = ((ewall * SBC * ((Ta + 273.15) ** 4)) / np.pi)
-
-        # Longwave radiation reaching a vertical surface
-        Lside_veg += vegetation_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_vegsh
-        
-        # Longwave radiation reaching a horizontal surface
-        Ldown_veg += vegetation_surface * steradian[idx] * np.sin(patch_altitude[idx] * deg2rad) * temp_vegsh
-        
-        # Portion into cardinal directions to be used for standing box or POI output
-        if (patch_azimuth[idx] > 360) or (patch_azimuth[idx] < 180):
-            Least += temp_sky * Lsky_side[idx,2] * np.cos((90 - patch_azimuth[idx]) * deg2rad)
-            Least += vegetation_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_vegsh * np.cos((90 - patch_azimuth[idx]) * deg2rad)
-        if (patch_azimuth[idx] > 90) and (patch_azimuth[idx] < 270):
-            Lsouth += temp_sky * Lsky_side[idx,2] * np.cos((180 - patch_azimuth[idx]) * deg2rad)
-            Lsouth += vegetation_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_vegsh * np.cos((180 - patch_azimuth[idx]) * deg2rad)
-        if (patch_azimuth[idx] > 180) and (patch_azimuth[idx] < 360):
-            Lwest += temp_sky * Lsky_side[idx,2] * np.cos((270 - patch_azimuth[idx]) * deg2rad)
-            Lwest += vegetation_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_vegsh * np.cos((270 - patch_azimuth[idx]) * deg2rad)
-        if (patch_azimuth[idx] > 270) or (patch_azimuth[idx] < 90):
-            Lnorth += temp_sky * Lsky_side[idx,2] * np.cos((0 - patch_azimuth[idx]) * deg2rad)
-            Lnorth += vegetation_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_vegsh * np.cos((0 - patch_azimuth[idx]) * deg2rad)
-
-        # Calculations for patches that are buildings, shmat = 0 = shade from buildings
-        temp_vbsh = (1 - shmat[:,:,idx]) * vbshvegshmat[:,:,idx]
-        temp_sh = (temp_vbsh == 1)
-        azimuth_difference = np.abs(solar_azimuth - patch_azimuth[idx])
-
-        # Longwave radiation from sunlit surfaces
-        sunlit_surface = ((ewall * SBC * ((Ta + Tgwall + 273.15) ** 4)) / np.pi)
-        # Longwave radiation from shaded surfaces
-        shaded_surface = ((ewall * SBC * ((Ta + 273.15) ** 4)) / np.pi)
-        if ((azimuth_difference > 90) and (azimuth_difference < 270) and (solar_altitude > 0)):
-            # Calculate which patches defined as buildings that are sunlit or shaded
-            sunlit_patches, shaded_patches = sunlit_shaded_patches.shaded_or_sunlit(solar_altitude, solar_azimuth, patch_altitude[idx], patch_azimuth[idx], asvf)
-            
-            # Calculate longwave radiation from sunlit walls to vertical surface
-            Lside_sun += sunlit_surface * sunlit_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh
-            # Calculate longwave radiation from shaded walls to vertical surface
-            Lside_sh += shaded_surface * shaded_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh
-            
-            # Calculate longwave radiation from sunlit walls to horizontal surface
-            Ldown_sun += sunlit_surface * sunlit_patches * steradian[idx] * np.sin(patch_altitude[idx] * deg2rad) * temp_sh
-            # Calculate longwave radiation from shaded walls to horizontal surface
-            Ldown_sh += shaded_surface * shaded_patches * steradian[idx] * np.sin(patch_altitude[idx] * deg2rad) * temp_sh
-            
-            # Portion into cardinal directions to be used for standing box or POI output
-            if (patch_azimuth[idx] > 360) or (patch_azimuth[idx] < 180):
-                Least += sunlit_surface * sunlit_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((90 - patch_azimuth[idx]) * deg2rad)
-                Least += shaded_surface * shaded_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((90 - patch_azimuth[idx]) * deg2rad)
-            if (patch_azimuth[idx] > 90) and (patch_azimuth[idx] < 270):
-                Lsouth += sunlit_surface * sunlit_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((180 - patch_azimuth[idx]) * deg2rad)
-                Lsouth += shaded_surface * shaded_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((180 - patch_azimuth[idx]) * deg2rad)
-            if (patch_azimuth[idx] > 180) and (patch_azimuth[idx] < 360):
-                Lwest += sunlit_surface * sunlit_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((270 - patch_azimuth[idx]) * deg2rad)
-                Lwest += shaded_surface * shaded_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((270 - patch_azimuth[idx]) * deg2rad)
-            if (patch_azimuth[idx] > 270) or (patch_azimuth[idx] < 90):
-                Lnorth += sunlit_surface * sunlit_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((0 - patch_azimuth[idx]) * deg2rad)
-                Lnorth += shaded_surface * shaded_patches * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((0 - patch_azimuth[idx]) * deg2rad)
-
-        else:
-            # Calculate longwave radiation from shaded walls reaching a vertical surface
-            Lside_sh += shaded_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh
-            
-            # Calculate longwave radiation from shaded walls reaching a horizontal surface
-            Ldown_sh += shaded_surface * steradian[idx] * np.sin(patch_altitude[idx] * deg2rad) * temp_sh
-
-            # Portion into cardinal directions to be used for standing box or POI output
-            if (patch_azimuth[idx] > 360) or (patch_azimuth[idx] < 180):
-                Least += shaded_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((90 - patch_azimuth[idx]) * deg2rad)
-            if (patch_azimuth[idx] > 90) and (patch_azimuth[idx] < 270):
-                Lsouth += shaded_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((180 - patch_azimuth[idx]) * deg2rad)
-            if (patch_azimuth[idx] > 180) and (patch_azimuth[idx] < 360):
-                Lwest += shaded_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((270 - patch_azimuth[idx]) * deg2rad)
-            if (patch_azimuth[idx] > 270) or (patch_azimuth[idx] < 90):
-                Lnorth += shaded_surface * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((0 - patch_azimuth[idx]) * deg2rad)
-
-    # Calculate reflected longwave in each patch
-    reflected_on_surfaces = (((Ldown_sky+Lup)*(1-ewall)*0.5) / np.pi)
-    for idx in range(patch_altitude.shape[0]):
-        temp_sh = ((shmat[:,:,idx] == 0) | (vegshmat[:,:,idx] == 0) | (vbshvegshmat[:,:,idx] == 0))
-        
-        # Reflected longwave radiation reaching vertical surfaces
-        Lside_ref += reflected_on_surfaces * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh
-        
-        # Reflected longwave radiation reaching horizontal surfaces
-        Ldown_ref += reflected_on_surfaces * steradian[idx] * np.sin(patch_altitude[idx] * deg2rad) * temp_sh
-        
-        # Portion into cardinal directions to be used for standing box or POI output
-        if (patch_azimuth[idx] > 360) or (patch_azimuth[idx] < 180):
-            Least += reflected_on_surfaces * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((90 - patch_azimuth[idx]) * deg2rad)
-        if (patch_azimuth[idx] > 90) and (patch_azimuth[idx] < 270):
-            Lsouth += reflected_on_surfaces * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((180 - patch_azimuth[idx]) * deg2rad)
-        if (patch_azimuth[idx] > 180) and (patch_azimuth[idx] < 360):
-            Lwest += reflected_on_surfaces * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((270 - patch_azimuth[idx]) * deg2rad)
-        if (patch_azimuth[idx] > 270) or (patch_azimuth[idx] < 90):
-            Lnorth += reflected_on_surfaces * steradian[idx] * np.cos(patch_altitude[idx] * deg2rad) * temp_sh * np.cos((0 - patch_azimuth[idx]) * deg2rad)
+    L_sky = np.zeros((patch_classes.pixels, 6))
+    L_veg = np.zeros((patch_classes.pixels, 6))
+    L_sun = np.zeros((patch_classes.pixels, 6))
+    L_sh = np.zeros((patch_classes.pixels, 6))
+    L_ref = np.zeros((patch_classes.pixels, 6))
+    for pixels in patch_classes.blocks():
+        L_sky[pixels] = patch_classes.block(patch_classes.sky, pixels) @ sky_weights
+        L_veg[pixels] = vegetation_surface * (patch_classes.block(patch_classes.vegetation, pixels) @ surface_weights)
+
+        sunlit, shaded = patch_classes.sunlit_shaded(pixels, solar_altitude, solar_azimuth, patch_altitude, patch_azimuth,
+                                                     sun_side, surface_weights)
+        L_sun[pixels] = pixel_values(sunlit_surface, pixels)[..., np.newaxis] * sunlit
+        L_sh[pixels] = pixel_values(shaded_surface, pixels)[..., np.newaxis] * shaded
+
+        # Calculate reflected longwave in each patch
+        reflected_on_surfaces = (((L_sky[pixels, 0] + pixel_values(Lup, pixels)) * (1 - ewall) * 0.5) / np.pi)
+        L_ref[pixels] = reflected_on_surfaces[:, np.newaxis] * (patch_classes.block(patch_classes.reflecting, pixels) @ surface_weights)
+
+    Ldown_sky, Lside_sky = patch_classes.grid(L_sky[:, 0]), patch_classes.grid(L_sky[:, 1])
+    Ldown_veg, Lside_veg = patch_classes.grid(L_veg[:, 0]), patch_classes.grid(L_veg[:, 1])
+    Ldown_sun, Lside_sun = patch_classes.grid(L_sun[:, 0]), patch_classes.grid(L_sun[:, 1])
+    Ldown_sh, Lside_sh = patch_classes.grid(L_sh[:, 0]), patch_classes.grid(L_sh[:, 1])
+    Ldown_ref, Lside_ref = patch_classes.grid(L_ref[:, 0]), patch_classes.grid(L_ref[:, 1])
+
+    # Portion into cardinal directions to be used for standing box or POI output
+    L_cardinal = L_sky[:, 2:] + L_veg[:, 2:] + L_sun[:, 2:] + L_sh[:, 2:] + L_ref[:, 2:]
+    Least = patch_classes.grid(L_cardinal[:, 0])
+    Lsouth = patch_classes.grid(L_cardinal[:, 1])
+    Lwest = patch_classes.grid(L_cardinal[:, 2])
+    Lnorth = patch_classes.grid(L_cardinal[:, 3])
 
     # Sum of all Lside components (sky, vegetation, sunlit and shaded buildings, reflected)
     Lside = Lside_sky + Lside_veg + Lside_sh + Lside_sun + Lside_ref
@@ -157,4 +208,4 @@ def define_patch_characteristics(solar_altitude, solar_azimuth,
     # Sum of all Lside components (sky, vegetation, sunlit and shaded buildings, reflected)
     Ldown = Ldown_sky + Ldown_veg + Ldown_sh + Ldown_sun + Ldown_ref
 
-    return Ldown, Lside, Lside_sky, Lside_veg, Lside_sh, Lside_sun, Lside_ref, Least, Lwest, Lnorth, Lsouth
\ No newline at end of file
+    return Ldown, Lside, Lside_sky, Lside_veg, Lside_sh, Lside_sun, Lside_ref, Least, Lwest, Lnorth, Lsouth
@@ -0,0 +1,73 @@
+import numpy as np
+from .PET_calculations import _PET_vec
+from .UTCI_calculations import utci_calculator_vec
+
+# Output of SOLWEIG at the points of interest (POIs), one text file (POI_<name>.txt) per POI. The values of all POIs
+# of a timestep are gathered with one index per grid into a preallocated array (timestep, POI, column) and written to
+# the POI files in blocks of timesteps, opening each file once per block. PET and UTCI of all timesteps and POIs of a
+# block are calculated together when the block is written.
+
+# Columns of the POI files
+POI_COLUMNS = 41
+TA_COLUMN = 22
+RH_COLUMN = 24
+TMRT_COLUMN = 26
+PET_COLUMN = 33
+UTCI_COLUMN = 34
+
+# Values (timesteps x POIs x columns) buffered before the POI files are written
+BUFFER_SIZE = 2 ** 22
+
+class PoiRecorder():
+    '''Buffered output of the POIs to filepaths (one per POI). rows and cols are the pixels of the POIs in the grids
+    of the outputs, pet is a PET_person and sensorheight the height of the wind speed of the met data'''
+    def __init__(self, filepaths, rows, cols, numformat, pet, sensorheight, timesteps):
+        self.filepaths = filepaths
+        self.rows = rows
+        self.cols = cols
+        self.numformat = numformat
+        self.pet = pet
+        self.sensorheight = sensorheight
+
+        size = max(1, min(timesteps, BUFFER_SIZE // (filepaths.__len__() * POI_COLUMNS)))
+        self.values = np.zeros((size, filepaths.__len__(), POI_COLUMNS))
+        self.wind = np.zeros(size)
+        self.count = 0
+
+    def record(self, values, wind):
+        '''Values (POI_COLUMNS) of one timestep, None for PET and UTCI. Grids are read at the POIs, 1D arrays hold
+        one value per POI and other values are the same for all POIs. wind is the wind speed of the timestep'''
+        timestep = self.values[self.count]
+        for column, value in enumerate(values):
+            if value is None:
+                continue
+            if isinstance(value, np.ndarray) and value.ndim == 2:
+                value = value[self.rows, self.cols]
+            timestep[:, column] = value
+        self.wind[self.count] = wind
+        self.count += 1
+
+        if self.count == self.values.shape[0]:
+            self.flush()
+
+    def flush(self):
+        '''Calculates PET and UTCI of the buffered timesteps and appends them to the POI files'''
+        if self.count == 0:
+            return
+
+        block = self.values[:self.count]
+        wind = self.wind[:self.count, np.newaxis]
+        # Recalculating wind speed based on powerlaw
+        WsPET = (1.1 / self.sensorheight) ** 0.2 * wind
+        WsUTCI = (10. / self.sensorheight) ** 0.2 * wind
+        block[:, :, PET_COLUMN] = _PET_vec(block[:, :, TA_COLUMN], block[:, :, RH_COLUMN], block[:, :, TMRT_COLUMN],
+                                           WsPET, self.pet.mbody, self.pet.age, self.pet.height, self.pet.activity,
+                                           self.pet.clo, self.pet.sex)
+        block[:, :, UTCI_COLUMN] = utci_calculator_vec(block[:, :, TA_COLUMN], block[:, :, RH_COLUMN],
+                                                       block[:, :, TMRT_COLUMN], WsUTCI)
+
+        for k, filepath in enumerate(self.filepaths):
+            with open(filepath, 'ab') as f_handle:
+                np.savetxt(f_handle, block[:, k, :], fmt=self.numformat)
+
+        self.count = 0
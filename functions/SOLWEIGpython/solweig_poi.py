@@ -0,0 +1,247 @@
+import numpy as np
+from math import radians
+from . import Solweig_2022a_calc_forprocessing as so
+from .patch_characteristics import PatchClasses
+
+# SOLWEIG at points of interest (POIs) only, without calculating the whole grid. Solweig_2022a_calc is run on a window
+# around each POI, just large enough for the ground view factors of the POI (second * scale pixels, see
+# sunonsurface_2018a). The shadows of the window pixels are found by ray marching from each pixel towards the sun over
+# the whole DSM, in the same steps as shadowingfunction_wallheight_13 (buildings) and shadowingfunction_wallheight_23
+# (buildings and vegetation), so that the values at the POIs are those of a SOLWEIG run of the whole grid.
+
+# Outputs of Solweig_2022a_calc that are inputs of the next timestep (position in the outputs)
+STATE = {'firstdaytime': 11, 'timestepdec': 12, 'timeadd': 13, 'Tgmap1': 14, 'Tgmap1E': 15, 'Tgmap1S': 16,
+         'Tgmap1W': 17, 'Tgmap1N': 18, 'TgOut1': 28}
+
+def window_radius(second, scale):
+    '''Pixels around a POI needed for the ground view factors of the POI'''
+    return int(max(np.round(second * scale), 1))
+
+def sun_steps(azimuth, altitude, scale, amaxvalue, sizex, sizey, index):
+    '''Steps (dx, dy, dz) towards the sun of the shadowing functions on a grid of sizex by sizey pixels. azimuth and
+    altitude in radians. index is the first step, 1 in shadowingfunction_wallheight_13 and 0 in
+    shadowingfunction_wallheight_23'''
+    pibyfour = np.pi/4
+    threetimespibyfour = 3 * pibyfour
+    fivetimespibyfour = 5 * pibyfour
+    seventimespibyfour = 7 * pibyfour
+    sinazimuth = np.sin(azimuth)
+    cosazimuth = np.cos(azimuth)
+    tanazimuth = np.tan(azimuth)
+    signsinazimuth = np.sign(sinazimuth)
+    signcosazimuth = np.sign(cosazimuth)
+    dssin = np.abs(1/sinazimuth)
+    dscos = np.abs(1/cosazimuth)
+    tanaltitudebyscale = np.tan(altitude)/scale
+
+    dx = 0
+    dy = 0
+    dz = 0
+    steps = []
+    while (amaxvalue >= dz) and (np.abs(dx) < sizex) and (np.abs(dy) < sizey):
+        if (pibyfour <= azimuth and azimuth < threetimespibyfour) or \
+                (fivetimespibyfour <= azimuth and azimuth < seventimespibyfour):
+            dy = signsinazimuth * index
+            dx = -1 * signcosazimuth * np.abs(np.round(index / tanazimuth))
+            ds = dssin
+        else:
+            dy = signsinazimuth * np.abs(np.round(index * tanazimuth))
+            dx = -1 * signcosazimuth * index
+            ds = dscos
+
+        dz = (ds * index) * tanaltitudebyscale
+        steps.append((int(dx), int(dy), dz))
+        index += 1
+
+    return steps
+
+def step_index(rows, cols, dx, dy, sizex, sizey):
+    '''Flat index of the pixels (rows, cols) moved by (dx, dy) and the pixels moved inside the grid (None if all)'''
+    moved_rows = rows + dx
+    moved_cols = cols + dy
+    inside = (moved_rows >= 0) & (moved_rows < sizex) & (moved_cols >= 0) & (moved_cols < sizey)
+    if inside.all():
+        return moved_rows * sizey + moved_cols, None
+
+    return np.clip(moved_rows, 0, sizex - 1) * sizey + np.clip(moved_cols, 0, sizey - 1), inside
+
+def moved(grid, index, inside, dz):
+    '''Flat grid minus dz at the index, 0 outside the grid (the moving grids of the shadowing functions)'''
+    values = grid[index] - dz
+    if inside is not None:
+        values[~inside] = 0.
+
+    return values
+
+def face_shadow(aspect, wallbol, azimuth):
+    '''Walls in self shadow, as in the shadowing functions. azimuth in radians'''
+    azilow = azimuth - np.pi/2
+    azihigh = azimuth + np.pi/2
+    if azilow >= 0 and azihigh < 2*np.pi:    # 90 to 270  (SHADOW)
+        facesh = np.logical_or(aspect < azilow, aspect >= azihigh).astype(float) - wallbol + 1
+    elif azilow < 0 and azihigh <= 2*np.pi:    # 0 to 90
+        azilow = azilow + 2*np.pi
+        facesh = np.logical_or(aspect > azilow, aspect <= azihigh) * -1 + 1    # (SHADOW)
+    elif azilow > 0 and azihigh >= 2*np.pi:    # 270 to 360
+        azihigh = azihigh - 2*np.pi
+        facesh = np.logical_or(aspect > azilow, aspect <= azihigh) * -1 + 1    # (SHADOW)
+
+    return facesh
+
+def ray_shadows(dsm, rows, cols, azimuth, altitude, scale, walls, aspect, usevegdem, vegdem, vegdem2, amaxvalue, bush):
+    '''Shadows of the pixels (rows, cols) of the DSM; sh, vegsh (None without vegetation) and wallsun of
+    shadowingfunction_wallheight_13 (usevegdem 0) or shadowingfunction_wallheight_23 (usevegdem 1). azimuth and
+    altitude in degrees. walls, aspect (radians) and bush are the values at the pixels, other grids the whole grids'''
+    sizex, sizey = dsm.shape
+    a_flat = dsm.ravel()
+    a = a_flat[rows * sizey + cols]
+    f = np.copy(a)
+    wallbol = (walls > 0).astype(float)
+
+    if usevegdem == 1:
+        azimuth = azimuth * (np.pi/180.)
+        altitude = altitude * (np.pi/180.)
+        vegdem_flat = vegdem.ravel()
+        vegdem2_flat = vegdem2.ravel()
+        shvoveg = vegdem_flat[rows * sizey + cols]
+        sh = np.zeros(a.shape)
+        vegsh = np.add(np.zeros(a.shape), bush > 1, dtype=float)
+        dzprev = 0
+        for dx, dy, dz in sun_steps(azimuth, altitude, scale, amaxvalue, sizex, sizey, 0):
+            index, inside = step_index(rows, cols, dx, dy, sizex, sizey)
+            tempvegdem = moved(vegdem_flat, index, inside, dz)
+            tempvegdem2 = moved(vegdem2_flat, index, inside, dz)
+            f = np.fmax(f, moved(a_flat, index, inside, dz))
+            shvoveg = np.fmax(shvoveg, tempvegdem)
+            sh[f > a] = 1
+            sh[f <= a] = 0
+
+            # vegetation above the pixel at this and the previous step (pergolas)
+            above = np.add(tempvegdem > a, tempvegdem2 > a, dtype=float)
+            above += moved(vegdem_flat, index, inside, dzprev) > a
+            above += moved(vegdem2_flat, index, inside, dzprev) > a
+            dzprev = dz
+            vegsh = np.fmax(vegsh, ((above > 0) & (above < 4)).astype(float))
+            vegsh[vegsh * sh > 0] = 0
+
+        sh = 1 - sh
+        vegsh[vegsh > 0] = 1
+        shvoveg = (shvoveg - a) * vegsh
+        vegsh = 1 - vegsh
+    else:
+        azimuth = radians(azimuth)
+        altitude = radians(altitude)
+        for dx, dy, dz in sun_steps(azimuth, altitude, scale, np.max(dsm), sizex, sizey, 1):
+            index, inside = step_index(rows, cols, dx, dy, sizex, sizey)
+            f = np.fmax(f, moved(a_flat, index, inside, dz))
+
+        sh = np.logical_not(np.logical_not(f - a)).astype(float)
+        sh = sh * -1 + 1
+        vegsh = None
+
+    facesh = face_shadow(aspect, wallbol, azimuth)
+    wallsun = np.copy(walls - (f - a))
+    wallsun[wallsun < 0] = 0
+    wallsun[facesh == 1] = 0    # Removing walls in "self"-shadow
+
+    if usevegdem == 1:
+        wallsh = np.copy(walls - wallsun)
+        wallshve = shvoveg * wallbol
+        wallshve = wallshve - wallsh
+        wallshve[wallshve < 0] = 0
+        id = np.where(wallshve > walls)
+        wallshve[id] = walls[id]
+        wallsun = wallsun - wallshve
+        wallsun[wallsun < 0] = 0
+
+    return sh, vegsh, wallsun
+
+class PoiWindow():
+    '''Window of the grids around a POI, with the ground temperature maps of the window passed between timesteps'''
+    def __init__(self, row, col, radius, arguments):
+        sizex, sizey = arguments['dsm'].shape
+        self.rows = slice(max(row - radius, 0), min(row + radius + 1, sizex))
+        self.cols = slice(max(col - radius, 0), min(col + radius + 1, sizey))
+        self.shape = (self.rows.stop - self.rows.start, self.cols.stop - self.cols.start)
+        self.poi = (row - self.rows.start, col - self.cols.start)
+
+        self.arguments = {}
+        for name, value in arguments.items():
+            if isinstance(value, np.ndarray) and value.shape[:2] == (sizex, sizey):
+                value = value[self.rows, self.cols]
+            self.arguments[name] = value
+
+        self.arguments['rows'], self.arguments['cols'] = self.shape
+        for name in ('Tgmap1', 'Tgmap1E', 'Tgmap1S', 'Tgmap1W', 'Tgmap1N', 'TgOut1'):
+            self.arguments[name] = np.zeros(self.shape)
+
+        self.arguments['patch_classes'] = None
+        if self.arguments['anisotropic_sky'] == 1:
+            self.arguments['patch_classes'] = PatchClasses(self.arguments['shmat'], self.arguments['vegshmat'],
+                self.arguments['vbshvegshmat'], self.arguments['asvf'], self.arguments['diffsh'])
+
+    def pixels(self):
+        '''Rows and columns (in the whole grid) of the pixels of the window'''
+        rows, cols = np.mgrid[self.rows, self.cols]
+        return rows.ravel(), cols.ravel()
+
+    def timestep(self, timestep_arguments, shadows):
+        '''Solweig_2022a_calc of the window for one timestep'''
+        outputs = so.Solweig_2022a_calc(**self.arguments, **timestep_arguments, shadows=shadows)
+        for name, position in STATE.items():
+            self.arguments[name] = outputs[position]
+
+        return outputs
+
+class SolweigPoi():
+    '''SOLWEIG at the POIs (poisxy, column 1 is the column and column 2 the row of each POI). arguments are the
+    arguments of Solweig_2022a_calc that do not change between timesteps, with grids of the whole DSM'''
+    def __init__(self, poisxy, arguments):
+        self.arguments = arguments
+        radius = window_radius(arguments['second'], arguments['scale'])
+        self.windows = [PoiWindow(int(poisxy[k, 2]), int(poisxy[k, 1]), radius, arguments)
+                        for k in range(poisxy.shape[0])]
+
+        # pixels of all windows, ray marched together
+        pixels = [window.pixels() for window in self.windows]
+        self.rows = np.concatenate([rows for rows, _ in pixels])
+        self.cols = np.concatenate([cols for _, cols in pixels])
+        self.splits = np.cumsum([rows.size for rows, _ in pixels])[:-1]
+        self.walls = arguments['walls'][self.rows, self.cols]
+        self.aspect = (arguments['dirwalls'] * np.pi / 180.)[self.rows, self.cols]
+        self.bush = arguments['bush'][self.rows, self.cols]
+
+    def shadows(self, altitude, azimuth):
+        '''Shadows (sh, vegsh, wallsun) of each window'''
+        arguments = self.arguments
+        sh, vegsh, wallsun = ray_shadows(arguments['dsm'], self.rows, self.cols, azimuth, altitude, arguments['scale'],
+                                         self.walls, self.aspect, arguments['usevegdem'], arguments['vegdem'],
+                                         arguments['vegdem2'], arguments['amaxvalue'], self.bush)
+        sh = np.split(sh, self.splits)
+        wallsun = np.split(wallsun, self.splits)
+        vegsh = np.split(vegsh, self.splits) if vegsh is not None else [None] * self.windows.__len__()
+
+        return [(sh[k].reshape(window.shape), vegsh[k].reshape(window.shape) if vegsh[k] is not None else None,
+                 wallsun[k].reshape(window.shape)) for k, window in enumerate(self.windows)]
+
+    def timestep(self, i, altitude, azimuth, zen, jday, psi, dectime, altmax, Ta, RH, radG, radD, radI, P, Twater, CI):
+        '''One timestep at all POIs. Returns the outputs of Solweig_2022a_calc, with grids as arrays (1, POIs) of the
+        values at the POIs and other outputs of the first window'''
+        timestep_arguments = {'i': i, 'altitude': altitude, 'azimuth': azimuth, 'zen': zen, 'jday': jday, 'psi': psi,
+                              'dectime': dectime, 'altmax': altmax, 'Ta': Ta, 'RH': RH, 'radG': radG, 'radD': radD,
+                              'radI': radI, 'P': P, 'Twater': Twater, 'CI': CI}
+        if altitude > 0:
+            shadows = self.shadows(altitude, azimuth)
+        else:
+            shadows = [None] * self.windows.__len__()
+
+        outputs = [window.timestep(timestep_arguments, window_shadows)
+                   for window, window_shadows in zip(self.windows, shadows)]
+
+        values = []
+        for position, value in enumerate(outputs[0]):
+            if isinstance(value, np.ndarray) and value.shape == self.windows[0].shape:
+                value = np.array([[output[position][window.poi] for window, output in zip(self.windows, outputs)]])
+            values.append(value)
+
+        return tuple(values)
@@ -38,4 +38,34 @@ def shaded_or_sunlit(solar_altitude, solar_azimuth, patch_altitude, patch_azimut
     # Boolean for pixels where patch is shaded
     shaded_patches = sunlit_degrees > patch_altitude
 
-    return sunlit_patches, shaded_patches
\ No newline at end of file
+    return sunlit_patches, shaded_patches
+
+def shaded_or_sunlit_matrix(solar_altitude, solar_azimuth, patch_altitude, patch_azimuth, hsvf):
+    ''' As shaded_or_sunlit for all pixels and patches at once, (pixels, patches). hsvf = np.tan(asvf) of the pixels '''
+
+    # Patch azimuth in relation to sun azimuth
+    patch_to_sun_azi = np.abs(solar_azimuth - patch_azimuth)
+
+    # Degrees to radians
+    deg2rad = np.pi/180
+
+    # Radians to degrees
+    rad2deg = 180/np.pi
+
+    xi = np.cos(patch_to_sun_azi * deg2rad)
+
+    yi = 2 * xi * np.tan(solar_altitude * deg2rad)
+
+    yi_ = np.where(yi > 0, 0, yi)
+
+    tan_delta = hsvf[:, np.newaxis] + yi_[np.newaxis, :]
+
+    # Degrees where below is in shade and above is sunlit
+    sunlit_degrees = np.arctan(tan_delta) * rad2deg
+
+    # Boolean for pixels where patch is sunlit
+    sunlit_patches = sunlit_degrees < patch_altitude[np.newaxis, :]
+    # Boolean for pixels where patch is shaded
+    shaded_patches = sunlit_degrees > patch_altitude[np.newaxis, :]
+
+    return sunlit_patches, shaded_patches
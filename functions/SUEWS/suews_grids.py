@@ -0,0 +1,124 @@
+import numpy as np
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from ...util.processContext import process_context
+
+# SUEWS (SuPy) runs for all grids of a RunControl. Each grid is run in a worker process with its own forcing,
+# loaded by the worker. The forcing is run one year at a time, the final state of a year being the initial state of
+# the next year, and the output of a grid is saved as soon as the grid is finished.
+
+# Seconds between two checks of the cancel button while waiting for the workers
+WAIT_TIMEOUT = 1
+
+def forcing_years(df_forcing):
+    '''Forcing split in calendar years. Timestamps are at the end of the timesteps, i.e. 00:00 on 1 January belongs
+    to the previous year'''
+    if df_forcing.index.size < 2:
+        return [df_forcing]
+
+    tstep = df_forcing.index[1] - df_forcing.index[0]
+    years = (df_forcing.index - tstep).year
+
+    return [df_forcing.loc[years == year] for year in np.unique(years)]
+
+def next_state(df_state_final):
+    '''Initial state (index grid) of the next year; the state at the end of the previous year'''
+    idx_dt = df_state_final.index.get_level_values('datetime').max()
+
+    return df_state_final.xs(idx_dt, level='datetime')
+
+def run_grid(path_runcontrol, grid, df_state_init, save_lock=None):
+    '''Runs SUEWS for one grid (df_state_init of the grid) year by year and saves the output. Returns the final
+    state and the paths of the saved files'''
+    import supy as sp
+    import pandas as pd
+
+    df_forcing = sp.load_forcing_grid(path_runcontrol, grid)
+
+    list_output = []
+    list_state = []
+    df_state = df_state_init
+    for df_forcing_year in forcing_years(df_forcing):
+        df_output, df_state_final = sp.run_supy(df_forcing_year,
+                                                df_state,
+                                                check_input=True,
+                                                serial_mode=True,
+                                                )
+        list_output.append(df_output)
+        list_state.append(df_state_final)
+        df_state = next_state(df_state_final)
+
+    df_output = pd.concat(list_output)
+    df_state_final = pd.concat(list_state)
+    df_state_final = df_state_final[~df_state_final.index.duplicated(keep='last')]
+
+    # the state file is the same for all grids; saving is serialized and the state of all grids is written at the end
+    with (save_lock if save_lock is not None else nullcontext()):
+        list_path_save = sp.save_supy(df_output,
+                                      df_state_final,
+                                      path_runcontrol=path_runcontrol)
+
+    return df_state_final, list_path_save
+
+def save_state(list_state, list_path_save):
+    '''Writes the final state of all grids to the state file written by save_supy'''
+    import pandas as pd
+
+    path_state = [path for path in list_path_save if str(path).endswith('.csv') and 'df_state' in str(path)]
+    if path_state and list_state:
+        df_state_final = pd.concat(list_state).sort_index()
+        df_state_final.to_csv(path_state[0])
+
+def run_grids(path_runcontrol, df_state_init, workers, feedback):
+    '''Runs SUEWS for all grids of df_state_init on a pool of workers. Falls back to a serial run if the worker
+    processes can not be started. Returns the paths of the saved files'''
+    grids = list(df_state_init.index)
+    list_state = []
+    list_path_save = []
+    remaining = list(grids)
+
+    if (workers > 1) & (grids.__len__() > 1):
+        feedback.setProgressText('Running model for ' + str(grids.__len__()) + ' grids on ' + str(workers) + ' processes')
+        try:
+            context = process_context()
+            with context.Manager() as manager, ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                save_lock = manager.Lock()
+                futures = {executor.submit(run_grid, path_runcontrol, grid, df_state_init.loc[[grid]], save_lock): grid
+                           for grid in grids}
+                pending = set(futures)
+                while pending:
+                    if feedback.isCanceled():
+                        for future in pending:
+                            future.cancel()
+                        break
+                    done, pending = wait(pending, timeout=WAIT_TIMEOUT, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        df_state_final, paths = future.result()
+                        list_state.append(df_state_final)
+                        list_path_save.extend(paths)
+                        remaining.remove(futures[future])
+                        feedback.setProgressText('Grid ' + str(futures[future]) + ' finished and saved')
+                    feedback.setProgress(int((grids.__len__() - remaining.__len__()) * 100 / grids.__len__()))
+        except (BrokenProcessPool, OSError) as e:
+            feedback.setProgressText('Could not run grids in parallel (' + str(e) + '). Running grids serially (QGIS not responsive)...')
+    else:
+        feedback.setProgressText('Running model for ' + str(grids.__len__()) + ' grids (QGIS not responsive)')
+
+    # Serial run, or the grids left if the worker processes failed
+    for grid in list(remaining):
+        if feedback.isCanceled():
+            break
+        df_state_final, paths = run_grid(path_runcontrol, grid, df_state_init.loc[[grid]])
+        list_state.append(df_state_final)
+        list_path_save.extend(paths)
+        remaining.remove(grid)
+        feedback.setProgressText('Grid ' + str(grid) + ' finished and saved')
+        feedback.setProgress(int((grids.__len__() - remaining.__len__()) * 100 / grids.__len__()))
+
+    if feedback.isCanceled():
+        feedback.setProgressText("Calculation cancelled")
+
+    save_state(list_state, list_path_save)
+
+    return list_path_save
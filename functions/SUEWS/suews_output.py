@@ -0,0 +1,164 @@
+import numpy as np
+import json
+import os
+import warnings
+
+# Columnar cache of SUEWS text output (<FileCode><grid>_<year>_SUEWS_<res>.txt). Each file is parsed once and stored
+# as one .npy array per column in a cache folder next to the output, together with the header and the modification
+# time and size of the text file. Columns are read memory-mapped, i.e. only the columns (variables) needed are read,
+# and the cache is rebuilt when the text file changes.
+
+# Folder (in the output folder) of the cached columns
+CACHE_FOLDER = '.suews_columns'
+
+# Column of the day of year (the time index of the analyses)
+DOY_COLUMN = 1
+
+def cache_path(filepath):
+    '''Cache folder of a SUEWS output file'''
+    folder, filename = os.path.split(filepath)
+    return os.path.join(folder, CACHE_FOLDER, os.path.splitext(filename)[0])
+
+def file_stamp(filepath):
+    '''Modification time and size of a file, the key of its cache'''
+    stat = os.stat(filepath)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+def read_text(filepath):
+    '''Header and data of a SUEWS output file, parsed as before by the SUEWS Analyzer'''
+    with open(filepath) as f:
+        header = f.readline().split()
+    data = np.genfromtxt(filepath, skip_header=1, missing_values='**********', filling_values=-9999)
+
+    return header, np.atleast_2d(data)
+
+def write_cache(filepath, header, data):
+    '''Writes the columns of data to the cache of filepath. The meta file is written last so that an interrupted
+    conversion is not used'''
+    folder = cache_path(filepath)
+    os.makedirs(folder, exist_ok=True)
+    for column in range(data.shape[1]):
+        np.save(os.path.join(folder, 'column_' + str(column) + '.npy'), np.ascontiguousarray(data[:, column]))
+
+    meta = file_stamp(filepath)
+    meta['header'] = header
+    meta['columns'] = data.shape[1]
+    meta['rows'] = data.shape[0]
+    with open(os.path.join(folder, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+def read_meta(filepath):
+    '''Meta data of the cache of filepath, None if there is no valid cache'''
+    try:
+        with open(os.path.join(cache_path(filepath), 'meta.json')) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    stamp = file_stamp(filepath)
+    if meta.get('mtime') != stamp['mtime'] or meta.get('size') != stamp['size']:
+        return None
+
+    return meta
+
+class SuewsOutput():
+    '''Columns of one SUEWS output file. Columns are read from the cache (memory-mapped), which is created the first
+    time the file is read. If the cache can not be written, the parsed file is kept in memory.'''
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.data = None
+        meta = read_meta(filepath)
+        if meta is None:
+            header, data = read_text(filepath)
+            try:
+                write_cache(filepath, header, data)
+                meta = read_meta(filepath)
+            except OSError:
+                meta = None
+            if meta is None:
+                self.data = data
+                meta = {'header': header, 'columns': data.shape[1], 'rows': data.shape[0]}
+
+        self.header = meta['header']
+        self.columns = meta['columns']
+        self.rows = meta['rows']
+
+    def column(self, column):
+        '''Values of a column (variable)'''
+        if self.data is not None:
+            return self.data[:, column]
+        return np.load(os.path.join(cache_path(self.filepath), 'column_' + str(column) + '.npy'), mmap_mode='r')
+
+def zenith_column(output):
+    '''Column of the solar zenith angle, depending on the number of columns written (WriteOutOption)'''
+    if output.columns > 38:
+        return 52
+    else:
+        return 25
+
+def doy_bounds(doy, startD, endD):
+    '''Rows (start, end) from the first timestep of startD until (not including) the first timestep of endD, or until
+    the last timestep of endD - 1 if endD is after the end of the output'''
+    start_found = doy == startD
+    if not np.any(start_found):
+        raise ValueError('Start day not present in output data')
+    start = np.argmax(start_found)
+
+    if endD > np.nanmax(doy):
+        last_day = doy == endD - 1
+        if not np.any(last_day):
+            raise ValueError('End day not present in output data')
+        end = doy.shape[0] - 1 - np.argmax(last_day[::-1])
+    else:
+        end_day = doy == endD
+        if not np.any(end_day):
+            raise ValueError('End day not present in output data')
+        end = np.argmax(end_day)
+
+    return start, max(start, end)
+
+def stack_columns(outputs, columns, bounds):
+    '''Rows (start, end) of the columns (one per output) of all outputs as an array (outputs, rows), padded with NaN.
+    Returns the array and the rows of each output that are not padding'''
+    rows = np.array([end - start for start, end in bounds], dtype=int)
+    # at least one (NaN) row, so that empty windows give NaN statistics
+    stacked = np.full((outputs.__len__(), rows.max(initial=1)), np.nan)
+    for i, (output, column, (start, end)) in enumerate(zip(outputs, columns, bounds)):
+        stacked[i, :end - start] = output.column(column)[start:end]
+
+    return stacked, np.arange(stacked.shape[1])[np.newaxis, :] < rows[:, np.newaxis]
+
+def grid_statistics(values, selected, statType):
+    '''Statistic (0: mean, 1: min, 2: max, 3: median, 4: IQR) of the selected values of each grid (row)'''
+    data = np.where(selected, values, np.nan)
+    with warnings.catch_warnings():
+        # all-NaN grids give NaN, as before
+        warnings.simplefilter('ignore', RuntimeWarning)
+        if statType == 0:
+            return np.nanmean(data, axis=1)
+        if statType == 1:
+            return np.nanmin(data, axis=1)
+        if statType == 2:
+            return np.nanmax(data, axis=1)
+        if statType == 3:
+            return np.nanmedian(data, axis=1)
+        if statType == 4:
+            # the 25th percentile is NaN if the selected values contain NaN
+            missing = np.any(selected & np.isnan(values), axis=1)
+            iqr = np.nanpercentile(data, 75, axis=1) - np.nanpercentile(data, 25, axis=1)
+            return np.where(missing, np.nan, iqr)
+
+def analyze_grids(outputs, variable, startD, endD, statType, dayType):
+    '''Statistic of variable (column) between startD and endD for all grids (SuewsOutput) in one pass. Only the rows
+    between startD and endD are read. dayType 1 selects daytime and 2 nighttime timesteps'''
+    bounds = [doy_bounds(output.column(DOY_COLUMN), startD, endD) for output in outputs]
+    values, selected = stack_columns(outputs, [variable] * outputs.__len__(), bounds)
+
+    if dayType in (1, 2):
+        zenith, _ = stack_columns(outputs, [zenith_column(output) for output in outputs], bounds)
+        if dayType == 1:
+            selected &= zenith < 90.
+        else:
+            selected &= zenith > 90.
+
+    return grid_statistics(values, selected, statType)
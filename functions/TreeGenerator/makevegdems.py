@@ -1,5 +1,6 @@
 from builtins import range
 import numpy as np
+from functools import lru_cache
 # import matplotlib.pylab as plt
 
 def vegunitsgeneration(buildings, vegdem, vegdem2, ttype, height, trunk, dia, rowa, cola, sizex, sizey, scale):
@@ -187,3 +188,91 @@ def imcircle(n):
     return y
 
 
+
+
+# Batch version of vegunitsgeneration for many trees. Crown shapes are computed once for each tree type and diameter
+# and scaled to the height of each tree (stamps). Each tree only updates the window of the rasters under its crown. Trees are applied tile by tile
+# (sorted on the tile of their position) so that the windows of consecutive trees are close in memory.
+
+# Width and height (pixels) of the tiles used to group trees
+TREE_TILE_SIZE = 512
+
+@lru_cache(maxsize=256)
+def crown_shape(ttype, dia):
+    '''Relative crown height (0 - 1) and crown circle for a tree type (1 conifer, 2 desiduous) and diameter (pixels)'''
+    trees = conifertree(dia)
+    if ttype != 1:  # desiduous tree
+        trees = 1 - ((1 - trees) ** 2)
+    circle = imcircle(dia)
+    n = trees.shape[0]
+
+    return np.broadcast_to(trees, (n, n)), np.broadcast_to(circle, (n, n))
+
+def tree_stamp(ttype, dia, height, trunk):
+    '''Canopy (vegdem) and trunk zone (vegdem2) of a tree, as in vegunitsgeneration'''
+    trees, circle = crown_shape(ttype, dia)
+    canopy = circle * (trees * (height - trunk) + trunk)
+    trunkzone = circle * trunk
+    # trunk zone outside the canopy is not used (-1000)
+    trunkzone = np.where(canopy == 0, -1000., trunkzone)
+
+    return canopy, trunkzone
+
+def vegunitsbatch(buildings, vegdem, vegdem2, ttype, height, trunk, dia, rowa, cola, scale, feedback=None):
+    '''Adds all trees (arrays of tree type, heights, diameters and positions) to vegdem (canopy) and vegdem2 (trunk
+    zone). Same result as calling vegunitsgeneration for each tree. Trees of type 0 are not added'''
+    vegdem = np.array(vegdem, dtype=float)
+    vegdem2 = np.array(vegdem2, dtype=float)
+    rows, cols = vegdem.shape
+
+    ttype = np.asarray(ttype)
+    dia = np.asarray(dia, dtype=float) * scale
+    row1 = np.asarray(rowa, dtype=float) - np.floor(dia / 2)
+    col1 = np.asarray(cola, dtype=float) - np.floor(dia / 2)
+
+    if ttype.size == 0:
+        return vegdem, vegdem2
+
+    # trees sorted on tile, trees in the same tile keep their order
+    tiles = np.floor_divide(np.maximum(row1, 0), TREE_TILE_SIZE) * (cols // TREE_TILE_SIZE + 1) + \
+            np.floor_divide(np.maximum(col1, 0), TREE_TILE_SIZE)
+    order = np.argsort(tiles, kind='stable')
+    n_tiles = np.unique(tiles).size
+    tile_counter = 0
+
+    for counter, i in enumerate(order):
+        if (counter == 0) or (tiles[i] != tiles[order[counter - 1]]):
+            tile_counter += 1
+            if feedback:
+                feedback.setProgress(int((tile_counter * 100) / n_tiles))
+                if feedback.isCanceled():
+                    feedback.setProgressText("Calculation cancelled")
+                    break
+
+        if ttype[i] == 0:  # remove trees, i.e. nothing added
+            continue
+
+        canopy, trunkzone = tree_stamp(1 if ttype[i] == 1 else 2, round(dia[i]), float(height[i]), float(trunk[i]))
+
+        # window of the tree cut at dem edges
+        r1 = int(row1[i]); c1 = int(col1[i])
+        wr1 = max(r1, 0); wc1 = max(c1, 0)
+        wr2 = min(r1 + canopy.shape[0], rows); wc2 = min(c1 + canopy.shape[1], cols)
+        if (wr1 >= wr2) or (wc1 >= wc2):
+            continue
+        stamp = (slice(wr1 - r1, wr2 - r1), slice(wc1 - c1, wc2 - c1))
+        window = (slice(wr1, wr2), slice(wc1, wc2))
+
+        vegdem[window] = np.maximum(vegdem[window], canopy[stamp])
+        trunk_window = vegdem2[window]
+        trunk_window[trunk_window == 0] = -1000
+        trunk_window = np.maximum(trunk_window, trunkzone[stamp])
+        trunk_window[trunk_window == -1000] = 0
+        vegdem2[window] = trunk_window
+
+    vegdem = vegdem * buildings  # remove vegetation from building pixels
+    vegdem2 = vegdem2 * buildings  # remove vegetation from building pixels
+
+    vegdem2[vegdem2 == -1000] = 0
+
+    return vegdem, vegdem2
@@ -1,14 +1,62 @@
 import numpy as np
 import os
+import hashlib
 from ....util.SEBESOLWEIGCommonFiles.clearnessindex_2013b import clearnessindex_2013b
 from ....util.SEBESOLWEIGCommonFiles import Solweig_v2015_metdata_noload as metload
 # from ..SOLWEIG1D import Solweig1D_2019a_calc as so
 from ..SOLWEIG1D import Solweig1D_2023a_calc as so
+from ..SOLWEIG1D.Solweig1D_2023a_batch import Solweig1D_batch_calc
 from ....util.SEBESOLWEIGCommonFiles.create_patches import create_patches
 
 from ...SOLWEIGpython.CirclePlotBar import PolarBarPlot
 
-def tmrt_1d_fun(metfilepath,infolder,tau,lon,lat,dsm,r_range,outputDir):
+# Tmrt under trees (tmrt_1d_cached), one column for each met file, settings, location, timesteps and transmissivity
+_tmrt_cache = {}
+# Sun positions and hours (tmrt_1d_cached), for each met file, settings, location and timesteps
+_sun_cache = {}
+# Number of entries kept in each cache, the oldest entries are removed first
+CACHE_SIZE = 32
+
+def file_hash(path):
+    '''sha1 of the content of a file'''
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def trim_cache(cache, size):
+    '''Removes the oldest entries of a cache (dict) above size entries'''
+    while cache.__len__() > size:
+        del cache[next(iter(cache))]
+
+def tmrt_1d_cached(metfilepath,infolder,taus,lon,lat,dsm,r_range,outputDir):
+    '''Tmrt under trees with transmissivities taus (list). Returns tmrt_1d (timesteps, taus + 1) with one column of
+    Tmrt for each transmissivity followed by the hour. Tmrt is calculated with the batched model for the
+    transmissivities that have not been calculated before for the same met file, settings, location and timesteps'''
+    base_key = (file_hash(metfilepath), file_hash(infolder + '/treeplantersettings.txt'), float(lon), float(lat))
+    range_key = base_key + (r_range.start, r_range.stop, r_range.step)
+
+    missing = [tau for tau in dict.fromkeys(taus) if range_key + (float(tau),) not in _tmrt_cache]
+    if missing or (range_key not in _sun_cache):
+        tmrt_new, azimuth, altitude, _ = tmrt_1d_fun(metfilepath, infolder, missing, lon, lat, dsm, r_range, outputDir, batch=True)
+        _sun_cache[range_key] = (azimuth, altitude, tmrt_new[:, -1])
+        for c, tau in enumerate(missing):
+            _tmrt_cache[range_key + (float(tau),)] = tmrt_new[:, c]
+
+    azimuth, altitude, hours = _sun_cache[range_key]
+    tmrt_1d = np.zeros((r_range.__len__(), taus.__len__() + 1))
+    for c, tau in enumerate(taus):
+        tmrt_1d[:, c] = _tmrt_cache[range_key + (float(tau),)]
+    tmrt_1d[:, -1] = hours
+
+    trim_cache(_sun_cache, CACHE_SIZE)
+    trim_cache(_tmrt_cache, CACHE_SIZE)
+
+    amaxvalue = dsm.max() - dsm.min()
+
+    return tmrt_1d, azimuth, altitude, amaxvalue
+
+def tmrt_1d_fun(metfilepath,infolder,tau,lon,lat,dsm,r_range,outputDir,batch=False):
+    '''Tmrt under a tree with transmissivity tau for the timesteps in r_range. With batch, tau is a list of
+    transmissivities and Tmrt is calculated for all timesteps and transmissivities with Solweig1D_batch_calc'''
     
     # Load settings from SOLWEIG
     # settingsHeader = 'UTC, posture, onlyglobal, landcover, anisotropic, cylinder, albedo_walls, albedo_ground, emissivity_walls, emissivity_ground, absK, absL, elevation'
@@ -230,6 +278,17 @@ def tmrt_1d_fun(metfilepath,infolder,tau,lon,lat,dsm,r_range,outputDir):
     else:
         diffsh = []
 
+    if batch:
+        tmrt_1d = np.zeros((r_range.__len__(), tau.__len__() + 1))
+        tmrt_1d[:, :-1] = Solweig1D_batch_calc(svf, svfveg, svfaveg, sh, vegsh, albedo_b, absK, absL, ewall, Fside, Fup, Fcyl,
+                                               altitude, azimuth, zen, jday, onlyglobal, location, dectime, altmax, elvis,
+                                               Ta, RH, radG, radD, radI, P, TgK_wall, Tstart_wall, TmaxLST_wall, albedo_g, eground,
+                                               svfalfa, CI, tau, patch_option, skyp, buip, vegp, asvf,
+                                               Lsky_patch_characteristics, steradian, r_range)
+        tmrt_1d[:, -1] = [hours[i] for i in r_range]
+
+        return tmrt_1d, azimuth, altitude, amaxvalue
+
     tmrt_1d = np.zeros((r_range.__len__(), 2))
     i_c = 0
     for i in r_range:
@@ -0,0 +1,181 @@
+import numpy as np
+from ...SOLWEIGpython.daylen import daylen
+from ....util.SEBESOLWEIGCommonFiles.clearnessindex_2013b import clearnessindex_2013b
+from ....util.SEBESOLWEIGCommonFiles.diffusefraction import diffusefraction
+from ...SOLWEIGpython.cylindric_wedge import cylindric_wedge
+from ....util.SEBESOLWEIGCommonFiles.Perez_v3 import Perez_v3
+from . import emissivity_models
+
+# Batched version of Solweig1D_2019a_calc (Solweig1D_2023a_calc) with anisotropic sky and a cylindric human body,
+# i.e. the settings used by tmrt_1d_fun. Point values (clearness index, sky luminance, wall temperature) are
+# estimated for each timestep, the patch sums of anisotropic_sky are computed as arrays (timesteps, patches) and
+# Tmrt is returned for all timesteps and all transmissivities of the tree canopy at once.
+
+def Solweig1D_batch_calc(svf, svfveg, svfaveg, sh, vegsh, albedo_b, absK, absL, ewall, Fside, Fup, Fcyl, altitude, azimuth, zen, jday,
+                         onlyglobal, location, dectime, altmax, elvis, Ta, RH, radG, radD, radI, P,
+                         TgK_wall, Tstart_wall, TmaxLST_wall, albedo_g, eground, svfalfa, CI, taus, patch_option,
+                         skyp, buip, vegp, asvf, L_patches, steradians, r_range):
+    '''Tmrt (timesteps in r_range, taus) under a tree canopy. Met and sun position arrays are given for the whole
+    met file, as in tmrt_1d_fun'''
+
+    # Stefan Bolzmans Constant
+    SBC = 5.67051e-8
+
+    # Degrees to radians
+    deg2rad = np.pi/180
+
+    steps = r_range.__len__()
+    patches = L_patches.shape[0]
+
+    # Point values for each timestep
+    esky_band = np.zeros((steps, patches))
+    lum = np.zeros((steps, patches))
+    Tgwall = np.zeros((steps))
+    F_sh = np.zeros((steps))
+    radI_t = np.zeros((steps))
+    radD_t = np.zeros((steps))
+    _, band_index = np.unique(L_patches[:, 0], return_inverse=True)
+
+    for c, i in enumerate(r_range):
+        # Nocturnal cloudfraction from Offerle et al. 2003
+        if (dectime[i] - np.floor(dectime[i])) == 0:
+            daylines = np.where(np.floor(dectime) == dectime[i])
+            alt = altitude[0][daylines]
+            alt2 = np.where(alt > 1)
+            rise = alt2[0][0]
+            [_, CI, _, _, _] = clearnessindex_2013b(zen[0, i + rise + 1], jday[0, i + rise + 1],
+                                                    Ta[i + rise + 1],
+                                                    RH[i + rise + 1] / 100., radG[i + rise + 1], location,
+                                                    P[i + rise + 1])
+            if (CI > 1) or (CI == np.inf):
+                CI = 1
+
+        radI_t[c] = radI[i]
+        radD_t[c] = radD[i]
+
+        if altitude[0][i] > 0:
+            I0, CI, Kt, _, _ = clearnessindex_2013b(zen[0][i], jday[0][i], Ta[i], RH[i] / 100., radG[i], location, P[i])
+            if (CI > 1) or (CI == np.inf):
+                CI = 1
+
+            # Estimation of radD and radI if not measured after Reindl et al.(1990)
+            if onlyglobal == 1:
+                radI_t[c], radD_t[c] = diffusefraction(radG[i], altitude[0][i], Kt, Ta[i], RH[i])
+
+            # Relative luminance of the patches (Perez et al. 1993)
+            lv, _, _ = Perez_v3(zen[0][i] * (180 / np.pi), azimuth[0][i], radD_t[c], radI_t[c], jday[0][i], 1, patch_option)
+            lum[c, :] = lv[:, 2]
+
+            # Wall temperature based on max sun altitude
+            _, _, _, SNUP = daylen(jday[0][i], location['latitude'])
+            Tgampwall = TgK_wall * altmax[0][i] + Tstart_wall
+            Tgwall_c = Tgampwall * np.sin((((dectime[i] - np.floor(dectime[i])) - SNUP / 24) / (TmaxLST_wall / 24 - SNUP / 24)) * np.pi / 2)
+            if Tgwall_c < 0:
+                Tgwall_c = 0
+
+            # Reduction for non - clear situation based on Reindl et al.1990
+            radI0, radD0 = diffusefraction(I0, altitude[0][i], 1., Ta[i], RH[i])
+            corr = 0.1473 * np.log(90 - (zen[0][i] / np.pi * 180)) + 0.3454
+            radG0 = radI0 * (np.sin(altitude[0][i] * deg2rad)) + radD0
+            CI_TgG = (radG[i] / radG0) + (1 - corr)
+            if (CI_TgG > 1) or (CI_TgG == np.inf):
+                CI_TgG = 1
+            Tgwall[c] = np.squeeze(Tgwall_c * CI_TgG)
+
+            F_sh_c = cylindric_wedge(zen[0][i], svfalfa, 1, 1)
+            F_sh_c[np.isnan(F_sh_c)] = 0.5
+            F_sh[c] = F_sh_c[0, 0]
+
+        # Clear - sky emissivity from Prata (1996), corrected for clouds
+        ea = 6.107 * 10 ** ((7.5 * Ta[i]) / (237.3 + Ta[i])) * (RH[i] / 100.)
+        msteg = 46.5 * (ea / (Ta[i] + 273.15))
+        esky = (1 - (1 + msteg) * np.exp(-((1.2 + 3.0 * msteg) ** 0.5))) + elvis
+        if CI < 0.95:
+            esky = CI * esky + (1 - CI) * 1.
+
+        # Anisotropic sky emissivity (Martin & Berdahl, 1984)
+        _, esky_c = emissivity_models.model2(L_patches, esky, Ta[i])
+        esky_band[c, :] = esky_c[band_index]
+
+    Ta_t = np.array([Ta[i] for i in r_range])
+    radG_t = np.array([radG[i] for i in r_range])
+    sun_altitude = np.array([altitude[0][i] for i in r_range])
+    sun_azimuth = np.array([azimuth[0][i] for i in r_range])
+    day = sun_altitude > 0
+
+    # Ground always in shade, i.e. ground longwave radiation based on ground emissivity and air temperature
+    Lup = SBC * eground * ((Ta_t + 273.15) ** 4)
+
+    # Patch geometry (cylinder, i.e. always perpendicular)
+    patch_altitude = L_patches[:, 0]
+    patch_azimuth = L_patches[:, 1]
+    angle_of_incidence = np.cos(patch_altitude * deg2rad) * steradians
+    angle_of_incidence_h = np.sin(patch_altitude * deg2rad) * steradians
+
+    # Longwave radiation from sky
+    Lsky = esky_band * ((SBC * ((Ta_t + 273.15) ** 4)) / np.pi)[:, np.newaxis] * skyp
+    Ldown_sky = Lsky @ angle_of_incidence_h
+    Lside_sky = Lsky @ angle_of_incidence
+
+    # Longwave radiation from vegetation
+    vegetation_surface = ((ewall * SBC * ((Ta_t + 273.15) ** 4)) / np.pi)
+    Ldown_veg = vegetation_surface * np.sum(vegp * angle_of_incidence_h)
+    Lside_veg = vegetation_surface * np.sum(vegp * angle_of_incidence)
+
+    # Sunlit and shaded building patches (sunlit_shaded_patches.shaded_or_sunlit)
+    azimuth_difference = np.abs(sun_azimuth[:, np.newaxis] - patch_azimuth)
+    yi = 2 * np.cos(azimuth_difference * deg2rad) * np.tan(sun_altitude * deg2rad)[:, np.newaxis]
+    sunlit_degrees = np.arctan(np.tan(asvf) + np.minimum(yi, 0)) * (180 / np.pi)
+    sunlit_patches = sunlit_degrees < patch_altitude
+    shaded_patches = sunlit_degrees > patch_altitude
+
+    # Longwave radiation from buildings; all walls are shaded unless the sun is behind the patch
+    sun_side = (azimuth_difference > 90) & (azimuth_difference < 270) & day[:, np.newaxis]
+    wall_sun = np.where(sun_side, sunlit_patches, 0) * buip
+    wall_sh = np.where(sun_side, shaded_patches, 1) * buip
+    sunlit_wall = ((ewall * SBC * ((Ta_t + Tgwall + 273.15) ** 4)) / np.pi)
+    shaded_wall = vegetation_surface
+    Ldown_bui = sunlit_wall * (wall_sun @ angle_of_incidence_h) + shaded_wall * (wall_sh @ angle_of_incidence_h)
+    Lside_bui = sunlit_wall * (wall_sun @ angle_of_incidence) + shaded_wall * (wall_sh @ angle_of_incidence)
+
+    # Reflected longwave from buildings and vegetation
+    reflecting = (buip == 1) | (vegp == 1)
+    reflected_radiation = (((Ldown_sky + Lup) * (1 - ewall) * 0.5) / np.pi)
+    Ldown_ref = reflected_radiation * np.sum(reflecting * angle_of_incidence_h)
+    Lside_ref = reflected_radiation * np.sum(reflecting * angle_of_incidence)
+
+    Ldown = Ldown_sky + Ldown_veg + Ldown_bui + Ldown_ref
+    Lside = Lside_sky + Lside_veg + Lside_bui + Lside_ref
+
+    # Diffuse and reflected shortwave radiation on the cylinder (daytime)
+    radTot = lum @ (np.sin(patch_altitude * deg2rad) * steradians)
+    lumChi = lum * (radD_t / np.where(day, radTot, 1.))[:, np.newaxis]
+    KsideD = (lumChi * skyp) @ angle_of_incidence
+    sunlit_surface = ((albedo_b * (radI_t * np.cos(sun_altitude * deg2rad)) + (radD_t * 0.5)) / np.pi)
+    shaded_surface = ((albedo_b * radD_t * 0.5) / np.pi)
+    Kref_veg = shaded_surface * np.sum(vegp * angle_of_incidence)
+    Kref_sun = sunlit_surface * ((sunlit_patches * buip) @ angle_of_incidence)
+    Kref_sh = shaded_surface * ((shaded_patches * buip) @ angle_of_incidence)
+    Kside_diffuse = np.where(day, KsideD + Kref_sun + Kref_sh + Kref_veg, 0.)
+
+    # Shortwave radiation depending on the transmissivity of the canopy, (timesteps, taus)
+    shadow = (sh - (1 - vegsh) * (1 - np.asarray(taus, dtype=float)))[np.newaxis, :] * day[:, np.newaxis]
+    direct = (radI_t * np.sin(sun_altitude * deg2rad))[:, np.newaxis] * shadow
+    dRad = (lum @ skyp) * radD_t
+    reflected_b = albedo_b * (1 - svf) * (radG_t * (1 - F_sh) + radD_t * F_sh)
+    Kdown = np.where(day, dRad + reflected_b, 0.)[:, np.newaxis] + direct
+    Kup = np.where(day, radD_t * svf + reflected_b, 0.)[:, np.newaxis] + albedo_g * direct
+    KsideI = (radI_t * np.cos(sun_altitude * deg2rad))[:, np.newaxis] * shadow
+    Kside = KsideI + Kside_diffuse[:, np.newaxis]
+
+    # Cardinal directions: half of Kup and Lup from each direction
+    Kcardinal = 4 * (Kup * 0.5)
+    Lcardinal = 4 * (Lup * 0.5)
+
+    # # # # Calculation of radiant flux density and Tmrt # # # #
+    Sstr = absK * (Kside * Fcyl + (Kdown + Kup) * Fup + Kcardinal * Fside) + absL * \
+                    ((Ldown + Lup) * Fup + Lside * Fcyl + Lcardinal * Fside)[:, np.newaxis]
+
+    Tmrt = np.sqrt(np.sqrt((Sstr / (absL * SBC)))) - 273.2
+
+    return Tmrt
@@ -1,15 +1,12 @@
 import numpy as np
-import time
-import timeit
-from scipy.ndimage import label
-from ..TreePlanter.TreePlanterTreeshade import tsh_gen
-from ..TreePlanter.TreePlanterTreeshade import tsh_gen_ts
-from ..TreePlanter.TreePlanterTreeshade import tsh_gen_mt1, tsh_gen_mt2
-import itertools
+from ..TreePlanter.TreePlanterClasses import ShadowCoverage
+from ..TreePlanter.TreePlanterScoring import shadow_weights
 
 # This function will look for better shading position for a tree by looking one pixel east, west, north, south of it's
 # current position. It will compare it's position to the other trees in the study area, i.e. other moving trees.
-def topt(y, x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, ti, pos_m_pad, p_tmrt):
+# Each possible position is scored from a coverage count of the tree shadows (ShadowCoverage), i.e. only from the pixels
+# that the shadow of the moving tree adds to the shadows of the other trees.
+def topt(y, x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, ti, pos_m_pad, p_tmrt, coverage=None):
 
     # x = x positions of trees
     # y = y positions of trees
@@ -19,6 +16,13 @@ def topt(y, x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, ti, p
     # shadow_rg = vector with which timesteps shade which pixels
     # tmrt from SOLWEIG
     # i = which tree to move
+    # coverage = shadow coverage of all trees (ShadowCoverage), created if None
+
+    if coverage is None:
+        weight_sun, weight_shade = shadow_weights(treeinput.buildings, treeinput.shadow, treeinput.tmrt_ts, tmrt_1d)
+        coverage = ShadowCoverage(y, x, treerasters, treeinput, weight_sun, weight_shade)
+    else:
+        coverage.update(y, x)
 
     t_y = y[ti]    # y-position of tree to move
     t_x = x[ti]    # x-position of tree to move
@@ -37,26 +41,13 @@ def topt(y, x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, ti, p
     # domain = np.array([[0,1,0],
     #                    [1,0,1],
     #                    [0,1,0]])
+    # Possible positions around the tree, i.e. positions with an id in pos_m
     t_pos = pos_m_pad[yt - k_d:yt + k_d+1, xt - k_d:xt + k_d+1]
-    t_pos = t_pos * domain
-    t_pos = t_pos.flatten()
-    t_pos = t_pos[t_pos != 0]
-    t_yx = np.zeros((t_pos.shape[0],2))
-    for i in range(t_pos.shape[0]):
-        t_yx[i,0] = positions.pos[positions.pos[:, 0] == t_pos[i], 2]
-        t_yx[i,1] = positions.pos[positions.pos[:, 0] == t_pos[i], 1]
+    t_dy, t_dx = np.where((t_pos * domain) != 0)
+    t_yx = np.column_stack((t_y + t_dy - k_d, t_x + t_dx - k_d))
 
     t_yx = np.int_(t_yx)
 
-    # Check if it is possible to move to all positions
-    pos_bool = np.zeros((t_yx.shape[0]))
-    for i in range(t_yx.shape[0]):
-        if np.any(positions.pos[((positions.pos[:, 1] == t_yx[i,1]) & (positions.pos[:, 2] == t_yx[i,0])), 0]):
-            pos_bool[i] = 1
-
-    pos_bool = np.bool_(pos_bool)
-    t_yx = t_yx[pos_bool,:]
-
     # Where not to move, i.e. positions of all other trees
     not_t = ((x[:] != t_x) | (y[:] != t_y))
 
@@ -65,112 +56,31 @@ def topt(y, x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, ti, p
 
     # Check euclidean distance between  moving tree and none-moving trees, i.e. where possible to move.
     # Also checking for canopy diameter / 2 to see if tree fits
-    eucl = np.zeros((y_n.shape[0],t_yx.shape[0]))
-    e_bool = np.ones((t_yx.shape[0]))
-    e_bool_sh = np.zeros((t_yx.shape[0]))
-    for i in range(y_n.shape[0]):
-        yx_temp = np.array((y_n[i], x_n[i]))
-        for j in range(t_yx.shape[0]):
-            eucl[i,j] = np.linalg.norm(t_yx[j,:] - yx_temp)
-            if (eucl[i,j] < dia):
-                e_bool[j] = 0
-            if (eucl[i,j] < treerasters.euclidean_d):
-                e_bool_sh[j] = 1
-
-    e_bool = np.bool_(e_bool)   # Boolean of where it's possible and not to move
+    eucl = np.hypot(t_yx[np.newaxis, :, 0] - y_n[:, np.newaxis], t_yx[np.newaxis, :, 1] - x_n[:, np.newaxis])
+    e_bool = ~np.any(eucl < dia, axis=0)   # Boolean of where it's possible and not to move
     t_yx = t_yx[e_bool,:]  # Positions where it's possible to move to
-    e_bool_sh = np.bool_(e_bool_sh)
-
-    # Checking euclidean distance between none-moving trees
-    yx_nmt = tuple(itertools.combinations(np.arange(y_n.shape[0]), 2))
-    e_bool_nmt = np.zeros((yx_nmt.__len__()))
-    e_nmt = np.zeros((yx_nmt.__len__()))
-    for i in range(e_bool_nmt.shape[0]):
-        ax = x_n[yx_nmt[i][0]]
-        ay = y_n[yx_nmt[i][0]]
-        a = np.array(([ay, ax]))
-        bx = x_n[yx_nmt[i][1]]
-        by = y_n[yx_nmt[i][1]]
-        b = np.array(([by, bx]))
-        e_nmt[i] = np.linalg.norm(a - b)
-        if (e_nmt[i] < treerasters.euclidean_d):
-            e_bool_nmt[i] = 1
-
-    e_bool_nmt = np.bool_(e_bool_nmt)
 
     tree_tmrt = np.zeros((t_yx.shape[0] + 1, 5))  # y, x, tmrt shade, tmrt sun, tmrt diff, sum tmrt all trees
     tree_tmrt[-1, :] = p_tmrt
 
-    compare_mt = np.zeros((t_yx.shape[0]))
-    compare = 0
-    if ((np.any(e_bool_nmt == 1)) | (np.any(e_bool_sh == 1))):
-
-    # Check if tree shadows overlap
-        treesh_ts_bool_pad, treesh_ts_bool_pad_large, compare = tsh_gen_ts(y_n, x_n, treerasters, treeinput)  # Boolean tree shadows for trees that are not moving
-
-        if (compare == 0):    # If none of the none-moving trees overlap, go in here
-            treesh_bool_mt = tsh_gen_mt1(t_yx[:,0], t_yx[:,1], treerasters, treeinput)
-            if np.any(((treesh_bool_mt == 1) & (treesh_ts_bool_pad_large == 1))):
-                for j in range(t_yx.shape[0]):
-                    if (e_bool_sh[j] == 1):   # If boolean distance between coming position of the moving tree possibly have overlapping shadows with the other trees, continue
-                        y_t = np.array([t_yx[j, 0]])    # Y-position of the current position of the currently moving tree
-                        x_t = np.array([t_yx[j, 1]])    # X-position of the current position of the currently moving tree
-                        treesh_bool_mt_pad, treesh_bool_mt_pad_large, _ = tsh_gen_ts(y_t, x_t, treerasters, treeinput)    # Boolean tree shadows for moving tree
-                        if np.any(((treesh_ts_bool_pad_large == 1) & (treesh_bool_mt_pad_large == 1))):
-                            for ij in range(treesh_bool_mt_pad.shape[2]):   # Check if timesteps overlap
-                                temp_bool = ((treesh_ts_bool_pad[:,:,ij] == 1) | (treesh_bool_mt_pad[:,:,ij] == 1)) * (treeinput.shadow[:,:,ij] == 1) * (treeinput.buildings == 1)
-                                tree_tmrt[j,0] += np.sum(temp_bool * tmrt_1d[ij, 0])
-                                tree_tmrt[j,1] += np.sum(temp_bool * treeinput.tmrt_ts[:,:,ij])
-                                compare_mt[j] = 1
-
-                    tree_tmrt[j,2] = tree_tmrt[j,1] - tree_tmrt[j,0]
-
-        else:
-            for j in range(t_yx.shape[0]):
-                if (e_bool_sh[j] == 1):
-                    y_t = np.array([t_yx[j, 0]])
-                    x_t = np.array([t_yx[j, 1]])
-                    treesh_bool_mt_pad = tsh_gen_mt2(y_t, x_t, treerasters, treeinput)    # Boolean tree shadows for moving tree
-                    for ij in range(treesh_bool_mt_pad.shape[2]):
-                        temp_bool = ((treesh_ts_bool_pad[:, :, ij] == 1) | (treesh_bool_mt_pad[:, :, ij] == 1)) * (
-                                    treeinput.shadow[:, :, ij] == 1) * (treeinput.buildings == 1)
-                        tree_tmrt[j, 0] += np.sum(temp_bool * tmrt_1d[ij, 0])
-                        tree_tmrt[j, 1] += np.sum(temp_bool * treeinput.tmrt_ts[:, :, ij])
-                        compare_mt[j] = 1
-                tree_tmrt[j, 2] = tree_tmrt[j, 1] - tree_tmrt[j, 0]
+    # Shadows of the none-moving trees, i.e. the moving tree is removed from the coverage while looking for a position
+    coverage.remove(t_y, t_x)
 
     # Calculation of shadows for the currently moving tree
     for i in range(t_yx.shape[0]):
-        y_t = np.array([t_yx[i,0]])
-        x_t = np.array([t_yx[i,1]])
+        y_t = t_yx[i,0]
+        x_t = t_yx[i,1]
 
         tree_tmrt[i, 3] = y_t               # y position of currently moving tree
         tree_tmrt[i, 4] = x_t               # x position of  currently moving tree
 
-        # Comparison between the currently moving tree and other trees if their shadows overlap
-        # If moving tree is overlapping with any of the other trees
-
-        # If any of the none-moving trees are overlapping with each other but the moving tree is not overlapping with them
-        if ((compare == 1) & (compare_mt[i] == 0)):
-            start_time = time.time()
-            for j in range(treesh_ts_bool_pad.shape[2]):
-                tree_bool_temp = treesh_ts_bool_pad[:,:,j] * treeinput.shadow[:,:,j] * treeinput.buildings
-                tree_tmrt[i, 0] += np.sum(tree_bool_temp * tmrt_1d[j, 0])
-                tree_tmrt[i, 1] += np.sum(tree_bool_temp * treeinput.tmrt_ts[:,:,j])
-            tree_tmrt[i, 0] += treerasters.tmrt_shade[y_t, x_t]
-            tree_tmrt[i, 1] += treerasters.tmrt_sun[y_t, x_t]
-            tree_tmrt[i, 2] = tree_tmrt[i, 1] - tree_tmrt[i, 0]
-
-        # If no trees are overlapping
-        elif ((compare == 0) & (compare_mt[i] == 0)):
-            start_time = time.time()
-            for j in range(y_n.shape[0]):
-                tree_tmrt[i, 0] += treerasters.tmrt_shade[y_n[j], x_n[j]]   # Tree shade
-                tree_tmrt[i, 1] += treerasters.tmrt_sun[y_n[j], x_n[j]]     # Sunlit
-                tree_tmrt[i, 2] += treerasters.d_tmrt[y_n[j], x_n[j]]       # Sunlit - Tree shade
-            tree_tmrt[i,0] += treerasters.tmrt_shade[y_t,x_t]    # Potential decrease in Tmrt from shade due to other trees
-            tree_tmrt[i,1] += treerasters.tmrt_sun[y_t,x_t]      # Tmrt in sun for the tree shadow
-            tree_tmrt[i,2] += treerasters.d_tmrt[y_t,x_t]        # Difference in Tmrt between sunlit and shaded
+        # Tmrt under the shadows of all trees, i.e. none-moving trees and pixels added by the moving tree
+        tmrt_shade, tmrt_sun = coverage.gain(y_t, x_t)
+        tree_tmrt[i, 0] = np.around(coverage.tmrt_shade + tmrt_shade, decimals=1)     # Tree shade
+        tree_tmrt[i, 1] = np.around(coverage.tmrt_sun + tmrt_sun, decimals=1)         # Sunlit
+        tree_tmrt[i, 2] = tree_tmrt[i, 1] - tree_tmrt[i, 0]                          # Sunlit - Tree shade
+
+    coverage.add(t_y, t_x)
 
     nc = 0 # no change
 
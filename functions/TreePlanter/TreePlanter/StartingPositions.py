@@ -1,6 +1,10 @@
 import numpy as np
 import itertools
 
+# Number of draws before giving up a new starting position, both for a starting position not drawn before and for a
+# starting position with trees at least dia apart. The restarts then stop (break_loop), in serial and parallel runs.
+MAX_TRIES = 100
+
 # Creating trees at random positions
 def random_start(pos, trees, tree_pos_all, r_iters):
 
@@ -8,19 +12,38 @@ def random_start(pos, trees, tree_pos_all, r_iters):
     tp_c = 0
     break_loop = 0
 
-    while np.any(np.where((tree_pos_all == np.sort(tree_pos)).all(axis=1))):
+    while (tree_pos_all == np.sort(tree_pos)).all(axis=1).any():
         tree_pos = np.random.choice(pos, trees)
         tp_c += 1
         # print('re-random')
-        if (tp_c == 100):
+        if (tp_c == MAX_TRIES):
             break_loop = r_iters + 1
             break
 
     return tree_pos, tp_c, break_loop
 
+# Creating trees at random positions at least dia apart, as the starting positions of the hill climbing restarts.
+# tp_c is MAX_TRIES if no new starting position is found.
+def spaced_random_start(positions, trees, dia, tree_pos_all, counter, r_iters):
+
+    for tries in range(MAX_TRIES):
+        tree_pos, tp_c, break_loop = random_start(positions.pos[:, 0], trees, tree_pos_all, r_iters)
+        if (tp_c == MAX_TRIES):
+            return tree_pos, tp_c, break_loop
+
+        tree_pos_all[counter] = np.sort(tree_pos)
+
+        # Euclidean distance between random positions so that trees are not too close to each other
+        yx = [np.array(([positions.pos[positions.pos[:, 0] == p, 2][0], positions.pos[positions.pos[:, 0] == p, 1][0]]))
+              for p in tree_pos]
+        eucl_dist = [np.linalg.norm(a - b) for a, b in itertools.combinations(yx, 2)]
+        if (np.min(eucl_dist) >= dia):
+            return tree_pos, tp_c, break_loop
+
+    return tree_pos, MAX_TRIES, r_iters + 1
+
 # Creating trees evolutionary from previous starting position. First population is random.
 def genetic_start(tree_pos_x, tree_pos_y, tree_pos_c, positions, trees, tree_pos_all, r_iters, counter, dia):
-    pos = positions.pos[:, 0]
     pos_y = positions.pos[:, 2]
     pos_x = positions.pos[:, 1]
 
@@ -32,7 +55,7 @@ def genetic_start(tree_pos_x, tree_pos_y, tree_pos_c, positions, trees, tree_pos
 
     # Random for first run
     if counter == 0:
-        tree_pos, tp_c, break_loop = random_start(pos, trees, tree_pos_all, r_iters)
+        tree_pos, tp_c, break_loop = spaced_random_start(positions, trees, dia, tree_pos_all, counter, r_iters)
 
     # Take either x or y position from previous local optimum for each tree, make the other coordinate random
     else:
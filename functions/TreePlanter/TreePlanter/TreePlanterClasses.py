@@ -2,6 +2,9 @@ from osgeo import gdal, osr
 import numpy as np
 from scipy.ndimage import label
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ..TreePlanter.TreePlanterTreeshade import tree_slice
 
 def spatialReferenceData(self, feedback):
     # Find latlon etc for input data.
@@ -53,10 +56,27 @@ def spatialReferenceData(self, feedback):
 
     return minx, miny, maxx, maxy
 
+# Number of threads reading the Shadow and Tmrt rasters
+READ_THREADS = 4
+
+# Folder (in the SOLWEIG output folder) where Shadow and Tmrt stacks are cached
+CACHE_FOLDER = 'treeplanter_cache'
+
+def read_timestep(sh_file, tmrt_file, rows, cols):
+    '''Read the window rows, cols of a Shadow and a Tmrt raster. Tmrt is rounded to one decimal and set to 0 in shade'''
+    xoff, yoff = cols.start, rows.start
+    xsize, ysize = cols.stop - cols.start, rows.stop - rows.start
+    shadow = gdal.Open(sh_file).ReadAsArray(xoff, yoff, xsize, ysize).astype(np.float32)
+    tmrt = gdal.Open(tmrt_file).ReadAsArray(xoff, yoff, xsize, ysize).astype(float)
+
+    return shadow, (np.around(tmrt, decimals=1) * shadow).astype(np.float32)
+
 class Inputdata():
-    '''Class containing input data for Tree planter'''
-    __slots__ = ('dataSet', 'buildings', 'selected_area', 'dsm', 'cdsm', 'cdsm_b', 'shadow', 'tmrt_ts', 'tmrt_s', 'tmrt_avg', 'rows', 'cols', 'scale', 'lat', 'lon', 'gt')
-    def __init__(self,r_range, sh_fl, tmrt_fl, infolder, inputPolygonlayer, feedback):
+    '''Class containing input data for Tree planter. Shadow and Tmrt rasters are only read for the window used in
+    the calculation (read_window)'''
+    __slots__ = ('dataSet', 'buildings', 'selected_area', 'dsm', 'cdsm', 'cdsm_b', 'shadow', 'tmrt_ts', 'tmrt_s', 'tmrt_avg', 'rows', 'cols', 'scale', 'lat', 'lon', 'gt',
+                 'r_range', 'sh_fl', 'tmrt_fl', 'cache_dir')
+    def __init__(self,r_range, sh_fl, tmrt_fl, infolder, inputPolygonlayer, feedback, cache=False):
 
         self.dataSet = gdal.Open(infolder + '/buildings.tif')            # GIS data
         self.buildings = self.dataSet.ReadAsArray().astype(float)    # Building raster
@@ -65,9 +85,14 @@ class Inputdata():
         self.cols = self.buildings.shape[1]                             # Cols of input rasters from SOLWEIG
         self.cdsm = np.zeros((self.rows,self.cols))                               # Canopy digital surface model
         self.cdsm_b = np.zeros((self.rows,self.cols))  # Canopy digital surface model
-        self.shadow = np.zeros((self.rows,self.cols, r_range.__len__()))          # Shadow rasters
-        self.tmrt_ts = np.zeros((self.rows,self.cols, r_range.__len__()))        # Tmrt for each timestep
-        self.tmrt_s = np.zeros((self.rows,self.cols))                            # Sum of tmrt for all timesteps
+        self.shadow = None          # Shadow rasters (read_window)
+        self.tmrt_ts = None         # Tmrt for each timestep (read_window)
+        self.tmrt_s = None          # Sum of tmrt for all timesteps (read_window)
+        self.tmrt_avg = None
+        self.r_range = r_range
+        self.sh_fl = sh_fl
+        self.tmrt_fl = tmrt_fl
+        self.cache_dir = os.path.join(infolder, CACHE_FOLDER) if cache else None
 
         # Loading DEm, DSM (and CDSM) rasters
         dataSet = gdal.Open(infolder + '/DSM.tif')
@@ -84,20 +109,6 @@ class Inputdata():
             # self.cdsm_b = self.cdsm == np.nan
             self.buildings = (self.buildings == True) & (self.cdsm_b == True)
 
-        c = 0
-        for iy in r_range:
-            dataSet1 = gdal.Open(sh_fl[iy])
-            feedback.setProgressText('Loading ' + sh_fl[iy] + '..')
-            self.shadow[:, :, c] = dataSet1.ReadAsArray().astype(float)
-            dataSet2 = gdal.Open(tmrt_fl[iy])
-            feedback.setProgressText('Loading ' + tmrt_fl[iy] + '..')
-            self.tmrt_ts[:, :, c] = np.around(dataSet2.ReadAsArray().astype(float), decimals=1) * self.shadow[:, :, c]
-            self.tmrt_s = self.tmrt_s + self.tmrt_ts[:, :, c]
-
-            c += 1
-
-        self.tmrt_avg = (self.tmrt_s / c)
-
         # Get spatial reference data
         minx, miny, maxx, maxy = spatialReferenceData(self, feedback)
 
@@ -129,6 +140,43 @@ class Inputdata():
 
         self.selected_area = self.selected_area * buffer_zone
 
+    def read_window(self, rows, cols, feedback):
+        '''Read the Shadow and Tmrt rasters of all timesteps in the window rows, cols (slices). Shadows are stored as
+        uint8 (float32 if some shadows are not 0 or 1) and Tmrt as float32. Stacks are read from (or saved to) the
+        cache folder if cache is used'''
+        files = [(self.sh_fl[iy], self.tmrt_fl[iy]) for iy in self.r_range]
+
+        cache_file = None
+        if self.cache_dir:
+            key = [(f, os.path.getsize(f), os.path.getmtime(f)) for pair in files for f in pair]
+            key.append((rows.start, rows.stop, cols.start, cols.stop))
+            cache_file = os.path.join(self.cache_dir, hashlib.sha1(repr(key).encode()).hexdigest())
+
+        if cache_file and os.path.exists(cache_file + '_tmrt.npy'):
+            feedback.setProgressText('Loading Shadow and Tmrt rasters from ' + self.cache_dir + '..')
+            # Copy on write, i.e. the cached stacks are not modified
+            self.shadow = np.load(cache_file + '_shadow.npy', mmap_mode='c')
+            self.tmrt_ts = np.load(cache_file + '_tmrt.npy', mmap_mode='c')
+        else:
+            shadow = np.zeros((rows.stop - rows.start, cols.stop - cols.start, files.__len__()), dtype=np.float32)
+            self.tmrt_ts = np.zeros(shadow.shape, dtype=np.float32)
+            with ThreadPoolExecutor(max_workers=READ_THREADS) as executor:
+                futures = {executor.submit(read_timestep, sh_file, tmrt_file, rows, cols): c for c, (sh_file, tmrt_file) in enumerate(files)}
+                for future in as_completed(futures):
+                    c = futures[future]
+                    shadow[:, :, c], self.tmrt_ts[:, :, c] = future.result()
+                    feedback.setProgressText('Loaded ' + files[c][0] + ' and ' + files[c][1] + '..')
+
+            self.shadow = shadow.astype(np.uint8) if np.all((shadow == 0) | (shadow == 1)) else shadow
+
+            if cache_file:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                np.save(cache_file + '_shadow.npy', self.shadow)
+                np.save(cache_file + '_tmrt.npy', self.tmrt_ts)
+
+        self.tmrt_s = np.sum(self.tmrt_ts, axis=2, dtype=float)
+        self.tmrt_avg = (self.tmrt_s / files.__len__())
+
 class Treerasters():
     '''Class containing calculated shadows, regional grouping of shadows \
     if many timesteps, tmrt in shade, tmrt sunlit, difference between \
@@ -200,6 +248,66 @@ class Position():
             x = np.int_(vector[idx, 1])
             self.pos_m[y, x] = vector[idx, 0]
 
+class ShadowCoverage():
+    '''Class containing the number of tree shadows covering each pixel for each timestep and the sum of Tmrt in sun
+    (tmrt_sun) and in tree shade (tmrt_shade) under the union of the tree shadows. Trees are added, removed and moved
+    one by one, i.e. only the pixels of their shadow footprint are updated'''
+    __slots__ = ('count', 'weight_sun', 'weight_shade', 'tmrt_sun', 'tmrt_shade', 'y', 'x', 'treerasters', 'treeinput')
+    def __init__(self, y, x, treerasters, treeinput, weight_sun, weight_shade):
+        self.count = np.zeros((treeinput.rows, treeinput.cols, treerasters.treeshade_bool.shape[2]), dtype=np.int16)
+        self.weight_sun = weight_sun        # Tmrt sunlit where the ground is sunlit and not a building
+        self.weight_shade = weight_shade    # Tmrt in tree shade where the ground is sunlit and not a building
+        self.tmrt_sun = 0.
+        self.tmrt_shade = 0.
+        self.treerasters = treerasters
+        self.treeinput = treeinput
+        self.y = np.int_(y).copy()
+        self.x = np.int_(x).copy()
+        for i in range(self.y.shape[0]):
+            self.add(self.y[i], self.x[i])
+
+    def footprint(self, y, x):
+        '''Slices and boolean shadow (for each timestep) of a tree in position y, x'''
+        y1 = np.int_(y - self.treerasters.buffer_y[0])
+        y2 = np.int_(y + self.treerasters.buffer_y[1])
+        x1 = np.int_(x - self.treerasters.buffer_x[0])
+        x2 = np.int_(x + self.treerasters.buffer_x[1])
+
+        yslice1, xslice1, yslice2, xslice2 = tree_slice(y1, y2, x1, x2, self.treeinput, self.treerasters)
+
+        return yslice2, xslice2, self.treerasters.treeshade_bool[yslice1, xslice1, :] > 0
+
+    def gain(self, y, x):
+        '''Sum of Tmrt in tree shade and in sun for the pixels that a tree in position y, x adds to the shadows'''
+        yslice, xslice, tsh = self.footprint(y, x)
+        new = tsh & (self.count[yslice, xslice, :] == 0)
+
+        return np.sum(self.weight_shade[yslice, xslice, :][new]), np.sum(self.weight_sun[yslice, xslice, :][new])
+
+    def add(self, y, x):
+        '''Add the shadow of a tree in position y, x'''
+        tmrt_shade, tmrt_sun = self.gain(y, x)
+        self.tmrt_shade += tmrt_shade
+        self.tmrt_sun += tmrt_sun
+        yslice, xslice, tsh = self.footprint(y, x)
+        self.count[yslice, xslice, :] += tsh
+
+    def remove(self, y, x):
+        '''Remove the shadow of a tree in position y, x'''
+        yslice, xslice, tsh = self.footprint(y, x)
+        self.count[yslice, xslice, :] -= tsh
+        tmrt_shade, tmrt_sun = self.gain(y, x)
+        self.tmrt_shade -= tmrt_shade
+        self.tmrt_sun -= tmrt_sun
+
+    def update(self, y, x):
+        '''Move the trees for which the position differs from y, x'''
+        for i in np.where((self.y != y) | (self.x != x))[0]:
+            self.remove(self.y[i], self.x[i])
+            self.y[i] = y[i]
+            self.x[i] = x[i]
+            self.add(self.y[i], self.x[i])
+
 class Treedata():
 # Class containing data for the tree that is used in Tree planter, i.e. the tree that is being "planted" and studied
     __slots__ = ('ttype', 'height', 'trunk', 'dia', 'treey', 'treex')
@@ -276,7 +384,7 @@ class ClippedInputdata():
     #__slots__ = ('buildings', 'selected_area', 'dem', 'dsm', 'cdsm', 'cdsm_b', 'shadow', 'tmrt_ts', 'tmrt_s')
     __slots__ = ('dataSet', 'buildings', 'selected_area', 'dsm', 'cdsm', 'cdsm_b', 'shadow', 'tmrt_ts', 'tmrt_s', 'rows', 'cols', 'scale', 'lat', 'lon', 'gt', 'shadows_pad', 'tmrt_ts_pad', 'buildings_pad', 'rows_pad', 'cols_pad',
     'clip_rows', 'clip_cols')
-    def __init__(self, treeinput, treerasters):
+    def __init__(self, treeinput, treerasters, feedback):
         # Estimate extent of selected area
         sa_rows, sa_cols = np.where(treeinput.selected_area == 1)
 
@@ -308,9 +416,12 @@ class ClippedInputdata():
         self.dsm = treeinput.dsm[self.clip_rows[0]:self.clip_rows[1], self.clip_cols[0]:self.clip_cols[1]]
         self.cdsm = treeinput.cdsm[self.clip_rows[0]:self.clip_rows[1], self.clip_cols[0]:self.clip_cols[1]]
         self.cdsm_b = treeinput.cdsm_b[self.clip_rows[0]:self.clip_rows[1], self.clip_cols[0]:self.clip_cols[1]]
-        self.shadow = treeinput.shadow[self.clip_rows[0]:self.clip_rows[1], self.clip_cols[0]:self.clip_cols[1]]
-        self.tmrt_ts = treeinput.tmrt_ts[self.clip_rows[0]:self.clip_rows[1], self.clip_cols[0]:self.clip_cols[1]]
-        self.tmrt_s = treeinput.tmrt_s[self.clip_rows[0]:self.clip_rows[1], self.clip_cols[0]:self.clip_cols[1]]
+
+        # Shadow and Tmrt rasters are only read for the clipped extent
+        treeinput.read_window(slice(self.clip_rows[0], self.clip_rows[1]), slice(self.clip_cols[0], self.clip_cols[1]), feedback)
+        self.shadow = treeinput.shadow
+        self.tmrt_ts = treeinput.tmrt_ts
+        self.tmrt_s = treeinput.tmrt_s
 
         # Save other stuff from input rasters
         self.dataSet = treeinput.dataSet
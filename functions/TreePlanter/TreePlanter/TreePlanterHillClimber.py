@@ -8,14 +8,62 @@ from ..TreePlanter.TreePlanterTreeshade import tsh_gen
 from ..TreePlanter.TreePlanterTreeshade import tsh_gen_ts
 from ..TreePlanter.adjustments import treenudge
 from ..TreePlanter import StartingPositions
+from ..TreePlanter.TreePlanterClasses import ShadowCoverage
+from ..TreePlanter.TreePlanterScoring import shadow_weights
+
+# Default seed of the restarts (None for non reproducible restarts)
+RANDOM_SEED = None
 
 def combine(tup, t):
     return tuple(itertools.combinations(tup, t))
 
-def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, r_iters, sa, feedback):
+def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, r_iters, sa, feedback, workers=1, seed=RANDOM_SEED):
+
+    # Restarts are split in independent chains (one per worker) that are run in parallel if workers > 1.
+    # If seed is not None, each restart is seeded with seed + restart number, i.e. random restarts are reproducible
+    # whatever the number of workers.
+    if (workers > 1) & (r_iters > 1):
+        from ..TreePlanter import TreePlanterParallel
+        results = TreePlanterParallel.run_restarts(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, r_iters, sa,
+                                                   feedback, workers, seed)
+    else:
+        results = [hill_climb(np.arange(r_iters), treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, sa, seed, feedback)]
+
+    # Merging the results of all chains
+    i_tmrt = np.concatenate([r[0] for r in results])
+    i_y = np.concatenate([r[1] for r in results])
+    i_x = np.concatenate([r[2] for r in results])
+
+    # Save locations for occurrence map
+    i_y_all = i_y.copy()
+    i_x_all = i_x.copy()
+
+    # Finding best position from all r_iters iteration, i.e. if r_iters = 1000 then best position out of 1000 runs
+    t_max = np.max(i_tmrt)
+    y = np.where(i_tmrt == t_max)
+
+    # Calculate heat map for best 33 % positions
+
+    # Returns all the unique positions found by the algorithm and the potential decrease in tmrt
+    #from misc import max_tmrt
+    #unique_tmrt, unique_tmrt_max = max_tmrt(i_y, i_x, i_tmrt, trees, positions.pos)
+
+    # Optimal positions of trees
+    i_y = i_y[y[0][0], :]
+    i_x = i_x[y[0][0], :]
+
+    return i_y, i_x, t_max, i_y_all, i_x_all
+    #return i_y, i_x, unique_tmrt, unique_tmrt_max, tree_paths
+
+def hill_climb(restarts, treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, sa, seed, feedback=None,
+               starts=None):
+    '''Runs a chain of hill climbing restarts. Returns Tmrt decrease and y, x positions of the trees for each restart.
+    starts are the starting positions (and random states) of the first restarts drawn by TreePlanterParallel.draw_starts'''
 
     #time_sum = 0
 
+    r_iters = restarts.__len__()
+
     dia = treedata.dia  # Diameter of tree canopy
 
     i_tmrt = np.zeros((r_iters)) # Empty vector to be filled with Tmrt values for each tree
@@ -24,6 +72,9 @@ def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d,
 
     tree_pos_all = np.zeros((r_iters,trees))
 
+    # Tmrt in sun and in tree shade where the ground is sunlit, used to score the union of the tree shadows
+    weight_sun, weight_shade = shadow_weights(treeinput.buildings, treeinput.shadow, treeinput.tmrt_ts, tmrt_1d)
+
     # Pad for kernel for neighboring trees
     pos_m_pad_t = np.pad(positions.pos_m, pad_width=((1, 1), (1, 1)), mode='constant',
                        constant_values=0)
@@ -49,32 +100,44 @@ def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d,
     # Iterate for r_iters number of iterations. Will find optimal positions for trees and return the positions and decrease in tmrt
     for counter in range(r_iters):
         # Check if plugin is cancelled
-        if feedback.isCanceled():
+        if feedback and feedback.isCanceled():
             break
 
         # Printing progress
-        if counter == iters_progress[progress]:
+        if feedback and (counter == iters_progress[progress]):
             feedback.setProgressText(str(percentage_progress[progress] * 100) + " percent of iterations finished...")
             progress = progress_counter.__next__()
 
+        # Deterministic seed for each restart
+        if seed is not None:
+            np.random.seed(seed + restarts[counter])
+
         r_count = 0
         while r_count < 1:
             # Check if plugin is cancelled
-            if feedback.isCanceled():
+            if feedback and feedback.isCanceled():
                 break
 
             # Creating starting positions.
             # If sa = 0, random restart, i
             # If sa = 1 evolutionary restart, i.e. y or x is random, the other is kept from previous run (previous local optimum)
-            if sa == 0:
-                tree_pos, tp_c, break_loop = StartingPositions.random_start(positions.pos[:,0], trees, tree_pos_all, r_iters)
+            if (starts is not None) and (counter < starts.__len__()):
+                tree_pos, state = starts[counter]
+                if state is not None:
+                    np.random.set_state(state)
+                tp_c = 0
+                break_loop = 0
+            elif sa == 0:
+                tree_pos, tp_c, break_loop = StartingPositions.spaced_random_start(positions, trees, dia, tree_pos_all,
+                                                                                   counter, r_iters)
             elif sa == 1:
                 tree_pos_y, tree_pos_x, tree_pos, tree_pos_c, tp_c, break_loop = \
                     StartingPositions.genetic_start(tree_pos_x, tree_pos_y, tree_pos_c, positions, trees, tree_pos_all,
                                                    r_iters, counter, dia)
 
-            if (tp_c == 100):
-                feedback.setProgressText('Possibly too many trees to fit in planting area. Try a lower number.')
+            if (tp_c == StartingPositions.MAX_TRIES):
+                if feedback:
+                    feedback.setProgressText('Possibly too many trees to fit in planting area. Try a lower number.')
                 break
 
             if ((counter == 0) | (sa == 0)):
@@ -114,13 +177,11 @@ def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d,
 
         ti = itertools.cycle(range(trees)) # Iterator to move between trees moving around in the study area
 
-        # Create matrices for tree paths and add starting positions
-        tree_paths_temp = np.zeros((treerasters.rows, treerasters.cols, trees))
-        for t_i in range(trees):
-            tree_paths_temp[tree_pos_y[t_i],tree_pos_x[t_i], t_i] = 1
-
         t1 = np.zeros((1,5))
 
+        # Number of tree shadows covering each pixel, updated while trees are moving
+        coverage = ShadowCoverage(tree_pos_y, tree_pos_x, treerasters, treeinput, weight_sun, weight_shade)
+
         # Moving trees, i.e. optimization
         while np.sum(tp_nc[:,0]) < trees:
 
@@ -128,7 +189,8 @@ def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d,
 
             # Running optimizer
             # t1 = best shading position
-            t1, nc, y_out, x_out = HillClimberAlgorithm.topt(tree_pos_y, tree_pos_x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, i, pos_m_pad_t, t1)
+            t1, nc, y_out, x_out = HillClimberAlgorithm.topt(tree_pos_y, tree_pos_x, treerasters, treeinput, dia, shadow_rg, tmrt_1d, positions, i, pos_m_pad_t, t1,
+                                                           coverage)
             tp_nc[i, 0] = nc
 
             if (tp_nc[i,0] == 0):
@@ -145,9 +207,6 @@ def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d,
                     tree_pos_y = y_out
                     tree_pos_x = x_out
 
-            if (tp_nc[i,0] == 0): # Tree paths of current random run
-                tree_paths_temp[tree_pos_y[i], tree_pos_x[i], i] = 1
-
             # Changing position of tree
             if (t1[0, 2] > i_tmrt[counter]):
                 i_tmrt[counter] = t1[0, 2]
@@ -169,32 +228,11 @@ def treeoptinit(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d,
                 high_p = d_tmrt_temp > d_tmrt_p
                 tree_pos_c[high_p] = 0
 
-        if (i_tmrt[counter] == np.max(i_tmrt)):   # Path of trees with best positions from starting to ending
-            tree_paths = tree_paths_temp.copy()
-
-        if (tp_c == 100):
+        if (tp_c == StartingPositions.MAX_TRIES):
             break
 
         # Progress bar
-        feedback.setProgress(int(counter * (100 / r_iters)))
-
-    # Save locations for occurrence map
-    i_y_all = i_y.copy()
-    i_x_all = i_x.copy()
-
-    # Finding best position from all r_iters iteration, i.e. if r_iters = 1000 then best position out of 1000 runs
-    t_max = np.max(i_tmrt)
-    y = np.where(i_tmrt == t_max)
-
-    # Calculate heat map for best 33 % positions
-
-    # Returns all the unique positions found by the algorithm and the potential decrease in tmrt
-    #from misc import max_tmrt
-    #unique_tmrt, unique_tmrt_max = max_tmrt(i_y, i_x, i_tmrt, trees, positions.pos)
+        if feedback:
+            feedback.setProgress(int(counter * (100 / r_iters)))
 
-    # Optimal positions of trees
-    i_y = i_y[y[0][0], :]
-    i_x = i_x[y[0][0], :]
-
-    return i_y, i_x, t_max, i_y_all, i_x_all
-    #return i_y, i_x, unique_tmrt, unique_tmrt_max, tree_paths
+    return i_tmrt, i_y, i_x
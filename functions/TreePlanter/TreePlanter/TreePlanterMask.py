@@ -0,0 +1,51 @@
+import numpy as np
+import hashlib
+
+# Masks of possible tree positions. Trees can not be planted on buildings or closer than one canopy radius to walls
+# (and, in the greedy algorithm, to already planted trees). The buffers are erosions with the 4-neighbour cross
+# computed with shifted views of the whole raster instead of per pixel loops.
+
+# Maximum number of planting masks kept in the cache
+MASK_CACHE_SIZE = 8
+
+_mask_cache = {}
+
+def buffer_pixels(dia, pixel_size):
+    '''Width of the buffer (pixels), i.e. one canopy radius'''
+    return np.int_(np.ceil((dia / 2) / pixel_size))
+
+def cross_minimum(raster, border):
+    '''Minimum of the 4 neighbours (north, south, west, east) of each pixel. Edge pixels are set to border'''
+    neighbours = np.full(raster.shape, border, dtype=float)
+    neighbours[1:-1, 1:-1] = np.minimum(np.minimum(raster[:-2, 1:-1], raster[2:, 1:-1]),
+                                        np.minimum(raster[1:-1, :-2], raster[1:-1, 2:]))
+
+    return neighbours
+
+def planting_mask(buildings, selected_area, dia, pixel_size):
+    '''Possible tree positions (1) in the selected area and one canopy radius from buildings. Masks are cached for
+    each buildings, selected area, canopy diameter and pixel size'''
+    key = (buildings.shape, hashlib.sha1(np.ascontiguousarray(buildings, dtype=float).tobytes()).hexdigest(),
+           hashlib.sha1(np.ascontiguousarray(selected_area, dtype=float).tobytes()).hexdigest(), dia, pixel_size)
+
+    if key not in _mask_cache:
+        if _mask_cache.__len__() >= MASK_CACHE_SIZE:
+            _mask_cache.pop(next(iter(_mask_cache)))
+
+        # Buffer on building raster so that trees can't be planted next to walls. Can be planted one radius from walls.
+        bld_copy = np.asarray(buildings, dtype=float)
+        for i1 in range(buffer_pixels(dia, pixel_size)):
+            bld_copy = cross_minimum(bld_copy, 0)
+
+        # Remove all possible positions outside selected area
+        _mask_cache[key] = bld_copy * selected_area
+
+    return _mask_cache[key].copy()
+
+def tree_buffer(added_tree, bd_b):
+    '''Buffer of bd_b pixels around a planted tree; added_tree is 0 under the canopy of the tree and 1 elsewhere'''
+    added_tree = np.asarray(added_tree, dtype=float)
+    for i1 in range(bd_b):
+        added_tree = added_tree * cross_minimum(added_tree, 1)
+
+    return added_tree
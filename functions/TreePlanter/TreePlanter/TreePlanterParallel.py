@@ -0,0 +1,175 @@
+import numpy as np
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+from ....util.processContext import process_context
+from ..TreePlanter import StartingPositions
+
+# Parallel hill climbing restarts. The rasters used by the hill climbing (Treerasters, Inputdata, Position) are
+# copied once into shared memory and attached read-only by the worker processes instead of being pickled for each
+# chain of restarts. The random starting positions are drawn in the main process so that they are unique over all
+# the chains, as in a serial run.
+
+# Arrays smaller than this number of bytes are pickled with the other attributes
+SHARED_MIN_BYTES = 1024
+
+# Seconds between two checks of the cancel button while waiting for the workers
+WAIT_TIMEOUT = 1
+
+# Number of chains per worker with random restarts (more chains give a more regular progress bar).
+# Genetic restarts depend on the previous restart and are split in one chain per worker.
+CHAINS_PER_WORKER = 4
+
+class SharedRasters():
+    '''Copies of numpy arrays in shared memory. specs can be pickled and passed to attach_rasters in other processes'''
+    __slots__ = ('blocks', 'specs')
+    def __init__(self, arrays):
+        self.blocks = []
+        self.specs = {}
+        for key, array in arrays.items():
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.specs[key] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+def attach_rasters(specs):
+    '''Attach (read-only) the arrays of a SharedRasters. Returns the arrays and the blocks to keep them alive'''
+    arrays = {}
+    blocks = []
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        array.flags.writeable = False
+        arrays[key] = array
+        blocks.append(block)
+
+    return arrays, blocks
+
+def split_attributes(name, obj, attributes, shared):
+    '''Split the attributes of an object between large arrays (added to shared) and other attributes (returned)'''
+    plain = {}
+    for attr in attributes:
+        value = getattr(obj, attr)
+        if isinstance(value, np.ndarray) and (value.nbytes >= SHARED_MIN_BYTES):
+            shared[name + '.' + attr] = np.ascontiguousarray(value)
+        else:
+            plain[attr] = value
+
+    return plain
+
+def join_attributes(name, plain, arrays):
+    '''Rebuild an object from its plain and shared attributes'''
+    attributes = dict(plain)
+    prefix = name + '.'
+    for key, array in arrays.items():
+        if key.startswith(prefix):
+            attributes[key[len(prefix):]] = array
+
+    return SimpleNamespace(**attributes)
+
+def draw_starts(restarts, positions, trees, dia, seed):
+    '''Draws the random starting positions of restarts, unique over all the restarts, as hill_climb does. Drawing
+    stops when no new starting position is found. Returns a list of (starting positions, random state after the draw),
+    the random state is None if seed is None'''
+    tree_pos_all = np.zeros((restarts.__len__(), trees))
+    starts = []
+    for counter, restart in enumerate(restarts):
+        if seed is not None:
+            np.random.seed(seed + restart)
+        tree_pos, tp_c, break_loop = StartingPositions.spaced_random_start(positions, trees, dia, tree_pos_all, counter,
+                                                                           restarts.__len__())
+        if (tp_c == StartingPositions.MAX_TRIES):
+            break
+        starts.append((tree_pos, np.random.get_state() if seed is not None else None))
+
+    return starts
+
+def hill_climb_chain(restarts, specs, plain, treedata, shadow_rg, tmrt_1d, trees, sa, seed, starts):
+    '''Worker; runs a chain of restarts on the shared rasters from the starting positions drawn by draw_starts'''
+    from ..TreePlanter.TreePlanterHillClimber import hill_climb
+
+    arrays, blocks = attach_rasters(specs)
+    try:
+        treerasters = join_attributes('treerasters', plain['treerasters'], arrays)
+        treeinput = join_attributes('treeinput', plain['treeinput'], arrays)
+        positions = join_attributes('positions', plain['positions'], arrays)
+        result = hill_climb(restarts, treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, sa, seed,
+                            starts=starts)
+        # Results are copied before the shared memory is released
+        return tuple(np.array(r) for r in result)
+    finally:
+        for block in blocks:
+            block.close()
+
+def run_restarts(treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, r_iters, sa, feedback, workers, seed):
+    '''Runs the r_iters restarts in chains distributed on a pool of workers. Returns the results of the chains in the
+    order of the restarts. Falls back to a serial run if the worker processes can not be started.'''
+    from ..TreePlanter.TreePlanterHillClimber import hill_climb
+
+    n_chains = workers if sa == 1 else workers * CHAINS_PER_WORKER
+    chains = [c for c in np.array_split(np.arange(r_iters), min(n_chains, r_iters)) if c.size > 0]
+
+    # Random restarts start from the drawn positions, genetic restarts only the first restart of each chain
+    if sa == 0:
+        starts = draw_starts(np.arange(r_iters), positions, trees, treedata.dia, seed)
+        chain_starts = [starts[c[0]:c[-1] + 1] for c in chains]
+    else:
+        starts = draw_starts(np.array([c[0] for c in chains]), positions, trees, treedata.dia, seed)
+        chain_starts = [[start] for start in starts]
+    # Restarts after the last drawn starting position are not run (as hill_climb stops)
+    chains = [c[:s.__len__()] if sa == 0 else c for c, s in zip(chains, chain_starts) if s.__len__() > 0]
+    chain_starts = [s for s in chain_starts if s.__len__() > 0]
+    n_run = sum(c.size for c in chains)
+    stopped = n_run < r_iters
+    if stopped:
+        feedback.setProgressText('Possibly too many trees to fit in planting area. Try a lower number.')
+
+    shared = {}
+    plain = {'treerasters': split_attributes('treerasters', treerasters, treerasters.__slots__, shared),
+             'treeinput': split_attributes('treeinput', treeinput, ('rows', 'cols', 'buildings', 'shadow', 'tmrt_ts'), shared),
+             'positions': split_attributes('positions', positions, positions.__slots__, shared)}
+
+    feedback.setProgressText('Running ' + str(n_run) + ' restarts in ' + str(chains.__len__()) + ' chains on ' + str(workers) + ' processes...')
+
+    results = [None] * chains.__len__()
+    rasters = SharedRasters(shared)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) as executor:
+            futures = {executor.submit(hill_climb_chain, chain, rasters.specs, plain, treedata, shadow_rg, tmrt_1d, trees, sa, seed,
+                                       chain_starts[c]): c
+                       for c, chain in enumerate(chains)}
+            pending = set(futures)
+            finished = 0
+            while pending:
+                if feedback.isCanceled():
+                    for future in pending:
+                        future.cancel()
+                    break
+                done, pending = wait(pending, timeout=WAIT_TIMEOUT, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[futures[future]] = future.result()
+                    finished += chains[futures[future]].size
+                feedback.setProgress(int(finished * (100 / n_run)))
+    except (BrokenProcessPool, OSError) as e:
+        feedback.setProgressText('Could not run restarts in parallel (' + str(e) + '). Running restarts serially...')
+        results = [hill_climb(np.arange(r_iters), treerasters, treeinput, positions, treedata, shadow_rg, tmrt_1d, trees, sa, seed, feedback)]
+        stopped = False
+    finally:
+        rasters.close()
+
+    # Cancelled chains do not contribute
+    results = [r for r in results if r is not None]
+    if not results:
+        results = [(np.zeros((1)), np.zeros((1, trees)), np.zeros((1, trees)))]
+    elif stopped:
+        # Restarts that were not run, as in the results of hill_climb
+        results.append((np.zeros((r_iters - n_run)), np.zeros((r_iters - n_run, trees)), np.zeros((r_iters - n_run, trees))))
+
+    return results
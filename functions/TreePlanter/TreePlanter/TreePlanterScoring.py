@@ -0,0 +1,87 @@
+import numpy as np
+from scipy import fft
+
+# Scoring of tree positions as a 2D cross-correlation of the tree shadow (one kernel per timestep) with the
+# weighted Tmrt rasters, i.e. sum_tmrt[y, x] = sum over timesteps and shadow pixels of shadow * weight.
+# All positions (or all positions in a window) are scored with a few FFTs instead of pasting the tree shadow
+# into a full raster for each position and timestep.
+
+# Maximum number of elements in the (rows, cols, timesteps) arrays transformed at once
+MAX_FFT_ELEMENTS = 2 ** 24
+
+# Round-off of the FFTs relative to the magnitude of the scores. Scores within this tolerance of 0 are set to 0 and
+# scores within this tolerance of each other are ties (tied_max)
+SCORE_RTOL = 1e-9
+
+def shadow_weights(buildings, shadow, tmrt_ts, tmrt_1d):
+    '''Weights summed under the tree shadow; Tmrt sunlit (tmrt_ts) and Tmrt in tree shade (tmrt_1d) where the ground
+    is sunlit and not a building. Shadows can be uint8 and Tmrt float32 (Inputdata.read_window)'''
+    sunlit = buildings[:, :, np.newaxis] * np.asarray(shadow, dtype=float)
+    tmrt_ts = np.asarray(tmrt_ts, dtype=float)
+    if np.issubdtype(shadow.dtype, np.integer):
+        # Tmrt has one decimal where shadows are 0 or 1
+        tmrt_ts = np.around(tmrt_ts, decimals=1)
+    weight_sun = sunlit * tmrt_ts
+    weight_shade = sunlit * tmrt_1d[np.newaxis, np.newaxis, :tmrt_ts.shape[2], 0]
+
+    return weight_sun, weight_shade
+
+def score_positions(weights, treerasters, yslice=None, xslice=None):
+    '''Sum of each weight raster under the tree shadow (all timesteps) for tree positions in yslice, xslice.
+    Returns one (rows, cols) array for each weight raster. Pixels outside the rasters do not contribute.'''
+    rows, cols, steps = weights[0].shape
+    yslice = slice(0, rows) if yslice is None else yslice
+    xslice = slice(0, cols) if xslice is None else xslice
+    kernel = treerasters.treeshade_bool
+    ky, kx = kernel.shape[0], kernel.shape[1]
+    ny = yslice.stop - yslice.start
+    nx = xslice.stop - xslice.start
+
+    # Rows and cols of the weight rasters that can be shaded by a tree in the window
+    y1 = yslice.start - np.int_(treerasters.buffer_y[0])
+    x1 = xslice.start - np.int_(treerasters.buffer_x[0])
+    fft_shape = (fft.next_fast_len(ny + 2 * (ky - 1), real=True), fft.next_fast_len(nx + 2 * (kx - 1), real=True))
+
+    scores = [np.zeros((ny, nx)) for w in weights]
+    if (ny <= 0) | (nx <= 0):
+        return scores
+    # Largest possible score of each weight raster, i.e. the magnitude of the FFT round-off
+    magnitudes = [0. for w in weights]
+
+    # Timesteps are transformed in chunks to limit memory use
+    t_chunk = max(1, MAX_FFT_ELEMENTS // (fft_shape[0] * fft_shape[1]))
+    for t1 in range(0, steps, t_chunk):
+        t2 = min(t1 + t_chunk, steps)
+        # Flipped kernel, i.e. correlation as a convolution
+        kernel_f = fft.rfft2(kernel[::-1, ::-1, t1:t2], s=fft_shape, axes=(0, 1))
+        for i, (w, score) in enumerate(zip(weights, scores)):
+            w_window = padded_window(w[:, :, t1:t2], y1, y1 + ny + ky - 1, x1, x1 + nx + kx - 1)
+            w_f = fft.rfft2(w_window, s=fft_shape, axes=(0, 1))
+            full = fft.irfft2(np.sum(w_f * kernel_f, axis=2), s=fft_shape)
+            score += full[ky - 1:ky - 1 + ny, kx - 1:kx - 1 + nx]
+            magnitudes[i] += np.max(np.abs(w_window)) * np.sum(kernel[:, :, t1:t2])
+
+    # Positions without weights under the tree shadow score 0, as when summing the weights
+    for score, magnitude in zip(scores, magnitudes):
+        score[np.isclose(score, 0, rtol=0, atol=SCORE_RTOL * magnitude)] = 0
+
+    return scores
+
+def score_tolerance(*scores):
+    '''Absolute tolerance of comparisons of scores (or of differences of scores), scaled to the largest score'''
+    return SCORE_RTOL * max([np.max(np.abs(score), initial=0) for score in scores])
+
+def tied_max(score, atol):
+    '''Boolean of the positions with the highest score. Scores within atol of the maximum are ties, i.e. np.where
+    gives the first of the tied positions (row-major) whatever the round-off of each score'''
+    return np.isclose(score, np.max(score), rtol=0, atol=atol)
+
+def padded_window(raster, y1, y2, x1, x2):
+    '''Window y1:y2, x1:x2 of a (rows, cols, timesteps) raster, zero padded where the window is outside the raster'''
+    window = np.zeros((y2 - y1, x2 - x1, raster.shape[2]))
+    ry1 = max(y1, 0); ry2 = min(y2, raster.shape[0])
+    rx1 = max(x1, 0); rx2 = min(x2, raster.shape[1])
+    if (ry1 < ry2) & (rx1 < rx2):
+        window[ry1 - y1:ry2 - y1, rx1 - x1:rx2 - x1, :] = raster[ry1:ry2, rx1:rx2, :]
+
+    return window
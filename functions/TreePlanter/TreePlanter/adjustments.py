@@ -66,7 +66,7 @@ def treenudge(y_out, x_out, tp_nc, tp_nc_a, i, t1, counter, i_tmrt, treerasters,
                             tsh_bool_nc_t[:, :, j] = tsh_bool_nc_t[:, :, j] * treeinput.shadow[:, :,
                                                                               j] * treeinput.buildings
                             tmrt_nc[iy, 0] += np.sum(tsh_bool_nc_t[:, :, j] * tmrt_1d[j, 0])  # Tree shade
-                            tmrt_nc[iy, 1] += np.sum(tsh_bool_nc_t[:, :, j] * treeinput.tmrt_ts[:, :, j])  # Sunlit
+                            tmrt_nc[iy, 1] += np.sum(tsh_bool_nc_t[:, :, j] * treeinput.tmrt_ts[:, :, j], dtype=float)  # Sunlit
                         tmrt_nc[iy, 2] = tmrt_nc[iy, 1] - tmrt_nc[iy, 0]  # New Tmrt (sunlit - tree shade)
 
                     if (np.around(np.max(tmrt_nc[:, 2]), decimals=1) > np.around(i_tmrt[counter], decimals=1)):  # If any new Tmrt decrease is higher, continue
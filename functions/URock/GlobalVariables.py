@@ -24,6 +24,10 @@ REMOVE_INITIALIZATION_OFFSET = False
 # If the solver should go descending order along y (does not work yet...)
 DESCENDING_Y = False
 
+# If the grid points are affected to the Röckle zones using the Python
+# grid-bucket index (ZoneIndex) instead of spatial joins in the database
+INDEXED_ZONE_ASSIGNMENT = True
+
 # Street canyon scheme limitation (below this angle, no street canyon is created)
 STREET_CANYON_ANGLE_THRESH = 30
 
@@ -77,6 +81,13 @@ ONLY_INITIALIZATION = False
 SAVE_ROCKLE_ZONES = False
 MAX_ITERATIONS = 500      # Based on QUIC-URB default values (2021)
 THRESHOLD_ITERATIONS = 1e-4 # Based on QUIC-URB default values (2021)
+# If True, the wind solver stores the wind fields and lambda as float32 and
+# the obstacle coefficients as a single array of int8 boundary codes
+LOW_MEMORY_SOLVER = False
+# Suffix of the file where the converged lambda and wind field are saved in
+# order to warm-start a later run (nearby wind direction, speed or geometry)
+WARM_START_SUFFIX = "_warmstart.npz"
+SAVE_WARM_START = False
 
 # Note that the number of points of an ellipse is only used to identify whether
 # the upper or lower part of an ellipse should be used (fro displacement zones),
@@ -118,6 +129,7 @@ ID_POINT = "ID_POINT"
 ID_POINT_X = "ID_X"
 ID_POINT_Y = "ID_Y"
 ID_POINT_Z = "ID_Z"
+ID_ZONE_ROW = "ID_ZONE_ROW"
 
 HEIGHT_FIELD = "HEIGHT_ROO"
 BASE_HEIGHT_FIELD = "BASE_HEIGHT"
@@ -248,5 +260,14 @@ LON = "lon"
 WINDSPEED_X = "windSpeed_x"
 WINDSPEED_Y = "windSpeed_y"
 WINDSPEED_Z = "windSpeed_z"
+BUILDING_MASK = "isBuilding"
 LEVELS = "Levels"
 WINDSPEED_PROFILE = "windSpeed"
+
+# NetCDF output options (zlib compression level - 0 means no compression -,
+# variables and heights to save - None means all levels - and chunk sizes
+# suited for both horizontal slices and vertical sections)
+NETCDF_COMPRESSION_LEVEL = 4
+NETCDF_VARIABLES = [WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z]
+NETCDF_LEVELS = None
+NETCDF_CHUNK_SIZES = {RLON: 64, RLAT: 64, "z": 8}
@@ -40,7 +40,9 @@ from .GlobalVariables import ALONG_WIND_ZONE_EXTEND, CROSS_WIND_ZONE_EXTEND,\
     SIN_BLOCK_LEFT_AZIMUTH, SIN_BLOCK_AZIMUTH, STACKED_BLOCK_WIDTH,\
     DOWNSTREAM_X_RELATIVE_POSITION, V_WEIGHT, U_WEIGHT, W_WEIGHT,\
     STACKED_BLOCK_X_MED, REMOVE_INITIALIZATION_OFFSET, IS_UPSTREAM_FIELD,\
-    IS_UPSTREAM_UPSTREAM_WEIGHTING, CANYON_DELTAH_FIELD
+    IS_UPSTREAM_UPSTREAM_WEIGHTING, CANYON_DELTAH_FIELD, ID_ZONE_ROW,\
+    INDEXED_ZONE_ASSIGNMENT
+from . import ZoneIndex as ZoneIndex
 import math
 import numpy as np
 import os
@@ -123,7 +125,10 @@ def createGrid(cursor, dicOfInputTables,  srid,
     return gridTable
 
 def affectsPointToBuildZone(cursor, gridTable, dicOfBuildRockleZoneTable,
-                            prefix = PREFIX_NAME):
+                            prefix = PREFIX_NAME,
+                            indexedAssignment = INDEXED_ZONE_ASSIGNMENT,
+                            gridIndex = None,
+                            tempoDirectory = TEMPO_DIRECTORY):
     """ Affects each point to a building Rockle zone and calculates relative
     point position within the zone for some of them.
 
@@ -139,6 +144,14 @@ def affectsPointToBuildZone(cursor, gridTable, dicOfBuildRockleZoneTable,
                 as value the corresponding table name
             prefix: String, default PREFIX_NAME
                 Prefix to add to the output table name
+            indexedAssignment: boolean, default INDEXED_ZONE_ASSIGNMENT
+                If True, points are affected to zones using the grid-bucket
+                index of 'ZoneIndex' instead of a spatial join
+            gridIndex: dictionary, default None
+                Grid-bucket index (from 'ZoneIndex.loadGridIndex'), loaded
+                from 'gridTable' if None and 'indexedAssignment' is True
+            tempoDirectory: String, default = TEMPO_DIRECTORY
+                Path of the directory used to exchange data between H2 and Python
             
 		Returns
 		_ _ _ _ _ _ _ _ _ _ 
@@ -188,6 +201,20 @@ def affectsPointToBuildZone(cursor, gridTable, dicOfBuildRockleZoneTable,
                                              fieldName=GEOM_FIELD,
                                              isSpatial=True),
                          ",".join(dicOfOutputTables.values()))]
+    
+    # Identify the (zone, point) pairs using the grid-bucket index
+    dicOfKeyedZoneTable, dicOfPairTable = {}, {}
+    if indexedAssignment:
+        if gridIndex is None:
+            gridIndex = ZoneIndex.loadGridIndex(cursor = cursor,
+                                                gridTable = gridTable,
+                                                tempoDirectory = tempoDirectory)
+        dicOfKeyedZoneTable, dicOfPairTable = \
+            ZoneIndex.affectsPointToZones(cursor = cursor,
+                                          gridIndex = gridIndex,
+                                          dicOfZoneTable = dicOfBuildRockleZoneTable,
+                                          tempoDirectory = tempoDirectory)
+    
     # Construct a query to affect each point to a Rockle zone
     for i, t in enumerate(dicOfBuildRockleZoneTable):
         # The query differs depending on whether y value should be kept
@@ -223,22 +250,41 @@ def affectsPointToBuildZone(cursor, gridTable, dicOfBuildRockleZoneTable,
                                                ROOFTOP_WIND_FACTOR,
                                                ID_POINT_X)             
             
-        query.append(""" 
-            {5};
-            DROP TABLE IF EXISTS {2};
-            CREATE TABLE {2}
-                AS SELECT {4}
-                FROM    {0} AS a, {3} AS b
-                WHERE   a.{1} && b.{1}
-                        AND ST_INTERSECTS(a.{1}, b.{1})
-                        """.format( dicOfBuildRockleZoneTable[t],
-                                    GEOM_FIELD,
-                                    dicOfTempoOutput[t],
-                                    gridTable,
-                                    columnsToKeepQuery,
-                                    DataUtil.createIndex(tableName=dicOfBuildRockleZoneTable[t], 
-                                                         fieldName=GEOM_FIELD,
-                                                         isSpatial=True)))
+        if indexedAssignment:
+            query.append(""" 
+                {4};
+                DROP TABLE IF EXISTS {1};
+                CREATE TABLE {1}
+                    AS SELECT {3}
+                    FROM    {0} AS a, {5} AS c, {2} AS b
+                    WHERE   a.{6} = c.{6} AND c.{7} = b.{7}
+                            """.format( dicOfKeyedZoneTable[t],
+                                        dicOfTempoOutput[t],
+                                        gridTable,
+                                        columnsToKeepQuery,
+                                        DataUtil.createIndex(tableName=gridTable, 
+                                                             fieldName=ID_POINT,
+                                                             isSpatial=False),
+                                        dicOfPairTable[t],
+                                        ID_ZONE_ROW,
+                                        ID_POINT))
+        else:
+            query.append(""" 
+                {5};
+                DROP TABLE IF EXISTS {2};
+                CREATE TABLE {2}
+                    AS SELECT {4}
+                    FROM    {0} AS a, {3} AS b
+                    WHERE   a.{1} && b.{1}
+                            AND ST_INTERSECTS(a.{1}, b.{1})
+                            """.format( dicOfBuildRockleZoneTable[t],
+                                        GEOM_FIELD,
+                                        dicOfTempoOutput[t],
+                                        gridTable,
+                                        columnsToKeepQuery,
+                                        DataUtil.createIndex(tableName=dicOfBuildRockleZoneTable[t], 
+                                                             fieldName=GEOM_FIELD,
+                                                             isSpatial=True)))
     
     # Get the ID of the lower grid point row
     cursor.execute("""
@@ -744,17 +790,22 @@ def affectsPointToBuildZone(cursor, gridTable, dicOfBuildRockleZoneTable,
     if not DEBUG:
         # Remove intermediate tables
         cursor.execute("""
-            DROP TABLE IF EXISTS TEMPO_WAKE0, TEMPO_WAKE, {0},{1},{2}
+            DROP TABLE IF EXISTS TEMPO_WAKE0, TEMPO_WAKE, {0},{1},{2}{3}
                       """.format(",".join(list(dicOfTempoOutput.values())),
                                  ",".join(list(dicOfPrefixZoneLim.values())),
-                                 tempoCavity))
+                                 tempoCavity,
+                                 "".join([","+t for t in list(dicOfKeyedZoneTable.values())
+                                                         +list(dicOfPairTable.values())])))
         
      
     return dicOfOutputTables, verticalLineTable
 
 
 def affectsPointToVegZone(cursor, gridTable, dicOfVegRockleZoneTable,
-                          prefix = PREFIX_NAME):
+                          prefix = PREFIX_NAME,
+                          indexedAssignment = INDEXED_ZONE_ASSIGNMENT,
+                          gridIndex = None,
+                          tempoDirectory = TEMPO_DIRECTORY):
     """ Affects each point to a vegetation Rockle zone and calculates the
     maximum vegetation height for each point.
 
@@ -770,6 +821,14 @@ def affectsPointToVegZone(cursor, gridTable, dicOfVegRockleZoneTable,
                 as value the corresponding vegetation table name
             prefix: String, default PREFIX_NAME
                 Prefix to add to the output table name
+            indexedAssignment: boolean, default INDEXED_ZONE_ASSIGNMENT
+                If True, points are affected to zones using the grid-bucket
+                index of 'ZoneIndex' instead of a spatial join
+            gridIndex: dictionary, default None
+                Grid-bucket index (from 'ZoneIndex.loadGridIndex'), loaded
+                from 'gridTable' if None and 'indexedAssignment' is True
+            tempoDirectory: String, default = TEMPO_DIRECTORY
+                Path of the directory used to exchange data between H2 and Python
             
 		Returns
 		_ _ _ _ _ _ _ _ _ _ 
@@ -790,6 +849,70 @@ def affectsPointToVegZone(cursor, gridTable, dicOfVegRockleZoneTable,
     
     # Calculate the max of the canopy height for each point and then keep each
     # intersection between point and zone
+    if indexedAssignment:
+        if gridIndex is None:
+            gridIndex = ZoneIndex.loadGridIndex(cursor = cursor,
+                                                gridTable = gridTable,
+                                                tempoDirectory = tempoDirectory)
+        dicOfKeyedZoneTable, dicOfPairTable = \
+            ZoneIndex.affectsPointToZones(cursor = cursor,
+                                          gridIndex = gridIndex,
+                                          dicOfZoneTable = dicOfVegRockleZoneTable,
+                                          tempoDirectory = tempoDirectory)
+        cursor.execute(";".join(["""
+            {12};
+            {13};
+            {14};
+            DROP TABLE IF EXISTS {0};
+            CREATE TABLE {0}
+                AS SELECT b.{1}, b.{2}, MAX(a.{3}) AS {7}
+                FROM {6} AS a, {15} AS c, {5} AS b
+                WHERE    a.{16} = c.{16} AND c.{2} = b.{2}
+                GROUP BY b.{2}, b.{1};
+            {17};
+            DROP TABLE IF EXISTS {11};
+            CREATE TABLE {11}
+                AS SELECT a.{1}, a.{2}, a.{7}, b.{4}, b.{8}, b.{9}, b.{10}
+                FROM {0} AS a, {15} AS c, {6} AS b
+                WHERE    a.{2} = c.{2} AND c.{16} = b.{16}
+               """.format(  maxHeightPointTable+t,
+                            GEOM_FIELD,
+                            ID_POINT,
+                            VEGETATION_CROWN_TOP_HEIGHT,
+                            ID_VEGETATION,
+                            gridTable,
+                            dicOfKeyedZoneTable[t],
+                            TOP_CANOPY_HEIGHT_POINT,
+                            VEGETATION_ATTENUATION_FACTOR,
+                            VEGETATION_CROWN_BASE_HEIGHT,
+                            VEGETATION_CROWN_TOP_HEIGHT,
+                            dicOfOutputTables[t],
+                            DataUtil.createIndex(gridTable, 
+                                                 fieldName=ID_POINT,
+                                                 isSpatial=False),
+                            DataUtil.createIndex(dicOfPairTable[t], 
+                                                 fieldName=ID_POINT,
+                                                 isSpatial=False),
+                            DataUtil.createIndex(dicOfPairTable[t], 
+                                                 fieldName=ID_ZONE_ROW,
+                                                 isSpatial=False),
+                            dicOfPairTable[t],
+                            ID_ZONE_ROW,
+                            DataUtil.createIndex(maxHeightPointTable+t, 
+                                                 fieldName=ID_POINT,
+                                                 isSpatial=False))
+                                 for t in dicOfVegRockleZoneTable]))
+        
+        if not DEBUG:
+            # Remove intermediate tables
+            cursor.execute("""
+                DROP TABLE IF EXISTS {0}
+                          """.format(",".join([maxHeightPointTable+t for t in dicOfVegRockleZoneTable]
+                                              +list(dicOfKeyedZoneTable.values())
+                                              +list(dicOfPairTable.values()))))
+        
+        return dicOfOutputTables
+    
     cursor.execute(";".join(["""
         {12};
         {13};           
@@ -15,6 +15,7 @@ from . import Obstacles
 from . import Zones
 from . import CalculatesIndicators
 from . import InitWindField
+from . import ZoneIndex
 from . import DataUtil
 from . import WindSolver
 import time
@@ -67,7 +68,13 @@ def main(javaEnvironmentPath,
          saveNetcdf = True,
          debug = DEBUG,
          profileType = PROFILE_TYPE,
-         verticalProfileFile = None):
+         verticalProfileFile = None,
+         lowMemory = LOW_MEMORY_SOLVER,
+         warmStartFile = None,
+         saveWarmStart = SAVE_WARM_START,
+         netcdfVariables = NETCDF_VARIABLES,
+         netcdfLevels = NETCDF_LEVELS,
+         netcdfCompressionLevel = NETCDF_COMPRESSION_LEVEL):
     # If the function is called within QGIS, a feedback is sent into the QGIS interface
     if feedback:
         feedback.setProgressText('Initiating algorithm')
@@ -441,19 +448,30 @@ def main(javaEnvironmentPath,
                                          meshSize = meshSize,
                                          prefix = prefix)
     
+    # Index the grid points once for the point to Röckle zone assignment
+    gridIndex = None
+    if INDEXED_ZONE_ASSIGNMENT:
+        gridIndex = ZoneIndex.loadGridIndex(cursor = cursor,
+                                            gridTable = gridPoint,
+                                            tempoDirectory = tempoDirectory)
+    
     # Affects each 2D point to a build Rockle zone and calculates needed variables for 3D wind speed factors
     dicOfInitBuildZoneGridPoint, verticalLineTable = \
         InitWindField.affectsPointToBuildZone(  cursor = cursor, 
                                                 gridTable = gridPoint,
                                                 dicOfBuildRockleZoneTable = dicOfBuildRockleZoneTable,
-                                                prefix = prefix)
+                                                prefix = prefix,
+                                                gridIndex = gridIndex,
+                                                tempoDirectory = tempoDirectory)
         
     # Same for vegetation Röckle zones
     dicOfVegZoneGridPoint = \
         InitWindField.affectsPointToVegZone(cursor = cursor, 
                                             gridTable = gridPoint,
                                             dicOfVegRockleZoneTable = dicOfVegRockleZoneTable,
-                                            prefix = prefix)
+                                            prefix = prefix,
+                                            gridIndex = gridIndex,
+                                            tempoDirectory = tempoDirectory)
     
     # Remove some of the Röckle points where building Röckle zones overlap
     dicOfBuildZoneGridPoint = \
@@ -658,9 +676,11 @@ def main(javaEnvironmentPath,
     # (note that v axis direction is changed since we first use Röckle schemes
     # considering wind speed coming from North thus axis facing South)
     buildGrid3D = np.array([buildGrid3D.xs(i, level = 0).unstack().values for i in range(0,nx)])
-    u0 = np.array([df_wind0[U].xs(i, level = 0).unstack().values for i in range(0,nx)])
-    v0 = -np.array([df_wind0[V].xs(i, level = 0).unstack().values for i in range(0,nx)])
-    w0 = np.array([df_wind0[W].xs(i, level = 0).unstack().values for i in range(0,nx)])
+    # (stored as float32 in low memory mode)
+    fieldType = np.float32 if lowMemory else np.float64
+    u0 = np.array([df_wind0[U].xs(i, level = 0).unstack().values for i in range(0,nx)], dtype = fieldType)
+    v0 = -np.array([df_wind0[V].xs(i, level = 0).unstack().values for i in range(0,nx)], dtype = fieldType)
+    w0 = np.array([df_wind0[W].xs(i, level = 0).unstack().values for i in range(0,nx)], dtype = fieldType)
     
     # Identify all cells needing to be updated by the wind solver and store
     # their coordinates in a 1D array
@@ -711,14 +731,79 @@ def main(javaEnvironmentPath,
             feedback.setProgressText("Calculation cancelled by user")
             return {}
     if not onlyInitialization:
+        # Report the memory needed by the solver before starting
+        solverMemory = WindSolver.estimateSolverMemory(nx = nx, ny = ny, nz = nz,
+                                                       nCells4Solver = cells4Solver.shape[0],
+                                                       lowMemory = lowMemory)
+        memoryText = "Estimated peak memory of the wind solver: {0} GB{1}"\
+            .format(round(solverMemory / 1024 ** 3, 2),
+                    " (low memory mode)" if lowMemory else "")
+        print(memoryText)
+        if feedback:
+            feedback.pushInfo(memoryText)
+        
+        # Location of the grid in the coordinates of the input data (from the
+        # first and last grid points) to match the grids of warm starts
+        gridTransform = None
+        if warmStartFile or saveWarmStart:
+            cursor.execute(
+                """
+                SELECT  ST_X(a.{0}), ST_Y(a.{0})
+                FROM {3} AS a
+                WHERE   (a.{1} = 1 AND a.{2} = 1) OR (a.{1} = {4} AND a.{2} = {5})
+                ORDER BY a.{1}
+                """.format(GEOM_FIELD                   , ID_POINT_X,
+                           ID_POINT_Y                   , gridPoint,
+                           nx                           , ny))
+            firstPoint, lastPoint = cursor.fetchall()
+            gridTransform = WindSolver.gridToWorld(x = x, y = y,
+                                                   windDirection = windDirection,
+                                                   rotationCenterCoordinates = rotationCenterCoordinates,
+                                                   firstPoint = firstPoint,
+                                                   lastPoint = lastPoint)
+        
+        # Seed the solver with the lambda of a previous run if any
+        lambdaInit = None
+        if warmStartFile:
+            lambdaInit, warmStartDirection, warmStartIterations = \
+                WindSolver.loadWarmStart(filePath = warmStartFile,
+                                         x = x, y = y, z = z,
+                                         gridTransform = gridTransform)
+        
         # Apply a mass-flow balance to have a more physical 3D wind speed field
-        u, v, w = \
+        u, v, w, lambdaN1, nIterations = \
             WindSolver.solver(  x = x                       , y = y                 , z = z,
                                 dx = meshSize               , dy = meshSize         , dz = dz,
                                 u0 = u0                     , v0 = v0               , w0 = w0, cursor = cursor,
                                 buildingCoordinates = buildingCoordinates   , cells4Solver = cells4Solver,
                                 maxIterations = maxIterations, thresholdIterations = thresholdIterations,
-                                feedback = feedback)
+                                feedback = feedback, lowMemory = lowMemory,
+                                lambdaInit = lambdaInit, returnLambda = True)
+        
+        if warmStartFile:
+            if warmStartIterations is None:
+                warmStartText = "Warm start from a {0}° wind direction solution: {1} iterations"\
+                    .format(warmStartDirection, nIterations)
+            else:
+                warmStartText = "Warm start from a {0}° wind direction solution: {1} iterations "\
+                    "(saved solution: {2} iterations, {3} iterations saved)"\
+                    .format(warmStartDirection, nIterations, warmStartIterations,
+                            warmStartIterations - nIterations)
+            print(warmStartText)
+            if feedback:
+                feedback.pushInfo(warmStartText)
+        
+        # Save the converged lambda and wind field for later warm starts
+        if saveWarmStart:
+            WindSolver.saveWarmStart(filePath = os.path.join(outputFilePath,
+                                                             outputFilename + WARM_START_SUFFIX),
+                                     x = x, y = y, z = z,
+                                     lambdaN1 = lambdaN1,
+                                     u = u, v = v, w = w,
+                                     windDirection = windDirection,
+                                     gridTransform = gridTransform,
+                                     nIterations = nIterations)
+        del lambdaN1
     else:
         u = u0
         v = v0
@@ -801,7 +886,11 @@ def main(javaEnvironmentPath,
                                   outputFilePath = outputFilePath, outputFilename = outputFilename,
                                   meshSize = meshSize            , outputRaster = outputRaster,
                                   saveRaster = saveRaster        , saveVector = saveVector,
-                                  saveNetcdf = saveNetcdf        , prefix_name = prefix)
+                                  saveNetcdf = saveNetcdf        , prefix_name = prefix,
+                                  netcdfVariables = netcdfVariables,
+                                  netcdfLevels = netcdfLevels,
+                                  netcdfCompressionLevel = netcdfCompressionLevel,
+                                  buildingCoordinates = buildingCoordinates)
     
     # Save also the initialisation field if needed
     if debug:
@@ -813,7 +902,8 @@ def main(javaEnvironmentPath,
                                       outputFilePath = tempoDirectory, outputFilename = "wind_initiatlisation",
                                       meshSize = meshSize            , outputRaster = outputRaster,
                                       saveRaster = saveRaster        , saveVector = saveVector,
-                                      saveNetcdf = saveNetcdf        , prefix_name = prefix)  
+                                      saveNetcdf = saveNetcdf        , prefix_name = prefix,
+                                      buildingCoordinates = buildingCoordinates)  
     else:
         dicVectorTables_ini = None
         netcdf_path_ini = None
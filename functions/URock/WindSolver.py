@@ -13,16 +13,28 @@ Created on Mon Mar 29 14:57:25 2021
 """
 import numpy as np
 import time
-from .GlobalVariables import MAX_ITERATIONS, THRESHOLD_ITERATIONS, DESCENDING_Y
+from .GlobalVariables import MAX_ITERATIONS, THRESHOLD_ITERATIONS, DESCENDING_Y,\
+    LOW_MEMORY_SOLVER
+from scipy.interpolate import RegularGridInterpolator
 try:
     from numba import jit
 except ImportError:
     exit("'numba' Python package is missing")
 import pandas as pd
 
+# Bits of the boundary codes used in low memory mode (a bit set means that
+# the corresponding coefficient of Pardyjak et Brown (2003) is 0)
+CODE_E = 1
+CODE_F = 2
+CODE_G = 4
+CODE_H = 8
+CODE_M = 16
+CODE_N = 32
+
 def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, cursor,
            maxIterations = MAX_ITERATIONS, thresholdIterations = THRESHOLD_ITERATIONS,
-           feedback = None):
+           feedback = None, lowMemory = LOW_MEMORY_SOLVER, lambdaInit = None,
+           returnLambda = False):
     """ Use the mass-balance solver minimizing the modification of the initial
     wind speed field. The method used is based on Pardyjak and Brown (2003).
     
@@ -64,6 +76,17 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
                 threshold, the wind solver stops
             feedback: Qgis.core class QgsProcessingFeedback
                 Base class for providing feedback to QGIS from a processing algorithm (if not in standalone mode).
+            lowMemory: boolean, default LOW_MEMORY_SOLVER
+                If True, wind speed and lambda fields are stored as float32
+                (residual accumulated as float64) and the nine obstacle
+                coefficient arrays are replaced by one array of int8 codes
+            lambdaInit: 3D array, default None
+                Initial guess of the Lagrange multiplier (e.g. the converged
+                lambda of a previous run loaded with 'loadWarmStart'). If None,
+                lambda is initialized with ones
+            returnLambda: boolean, default False
+                Whether or not the converged lambda and the number of
+                iterations should also be returned
         
     		Returns
     		_ _ _ _ _ _ _ _ _ _ 
@@ -73,7 +96,11 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
             v: 3D array
                 Updated 3D wind speed value in Y direction 
             w: 3D array
-                Updated 3D wind speed value in Z direction"""    
+                Updated 3D wind speed value in Z direction
+            lambdaN1: 3D array
+                Converged Lagrange multiplier (only if 'returnLambda')
+            nIterations: int
+                Number of iterations performed (only if 'returnLambda')"""    
 
     print("Start to apply the wind solver")
     timeStartCalculation = time.time()
@@ -83,14 +110,26 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
     ny = y.size
     nz = z.size
     
+    # Floating point precision used for the 3D fields
+    if lowMemory:
+        dtype = np.float32
+        u0 = u0.astype(dtype, copy = False)
+        v0 = v0.astype(dtype, copy = False)
+        w0 = w0.astype(dtype, copy = False)
+    else:
+        dtype = np.float64
+    
     # Create empty matrix for the 3D wind speed calculation
-    u = np.zeros((nx, ny, nz))
-    v = np.zeros((nx, ny, nz))
-    w = np.zeros((nx, ny, nz))
+    u = np.zeros((nx, ny, nz), dtype = dtype)
+    v = np.zeros((nx, ny, nz), dtype = dtype)
+    w = np.zeros((nx, ny, nz), dtype = dtype)
 
     # Preallocating lambda and lambda + 1 and set values to 0 on sketch boundaries
-    lambdaN = np.ones([nx, ny, nz])
-    lambdaN1 = np.ones([nx, ny, nz])
+    if lambdaInit is None:
+        lambdaN1 = np.ones([nx, ny, nz], dtype = dtype)
+    else:
+        lambdaN1 = np.array(lambdaInit, dtype = dtype)
+    lambdaN = lambdaN1.copy()
     lambdaN[0, :, :] = 0.
     lambdaN[:, 0, :] = 0.
     lambdaN[:, :, 0] = 0.
@@ -126,18 +165,6 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
     #         ax.plot(buildingCoordinates[0][i], buildingCoordinates[1][i], marker = "o")
     ########################################################################
 
-    # Set coefficients according to table 1 (Pardyjak et Brown, 2003) 
-    # to modify the Equation near obstacles
-    e = np.ones([nx, ny, nz])
-    f = np.ones([nx, ny, nz])
-    g = np.ones([nx, ny, nz])
-    h = np.ones([nx, ny, nz])
-    m = np.ones([nx, ny, nz])
-    n = np.ones([nx, ny, nz])
-    o = np.ones([nx, ny, nz])
-    p = np.ones([nx, ny, nz])
-    q = np.ones([nx, ny, nz])
-    
     # Identify index having wall below AND (front, left, right or behind)
     indBelow = pd.MultiIndex.from_tuples(list(zip(*[buildingCoordinates[0], 
                                                     buildingCoordinates[1], 
@@ -174,30 +201,55 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
     indQ = indBelow.union(indAbove).union(indBelowFront).union(indBelowLeft)\
         .union(indBelowRight).union(indBelowBehind)
     
-    # Go descending order along y
-    if DESCENDING_Y:
-        e[indF.get_level_values(0), indF.get_level_values(1), indF.get_level_values(2)] = 0.
-        f[indE.get_level_values(0), indE.get_level_values(1), indE.get_level_values(2)] = 0. 
-        g[indH.get_level_values(0), indH.get_level_values(1), indH.get_level_values(2)] = 0.
-        h[indG.get_level_values(0), indG.get_level_values(1), indG.get_level_values(2)] = 0.
-        m[indM.get_level_values(0), indM.get_level_values(1), indM.get_level_values(2)] = 0.
-        n[indN.get_level_values(0), indN.get_level_values(1), indN.get_level_values(2)] = 0.
-    else:    
-        e[indE.get_level_values(0), indE.get_level_values(1), indE.get_level_values(2)] = 0.
-        f[indF.get_level_values(0), indF.get_level_values(1), indF.get_level_values(2)] = 0. 
-        g[indG.get_level_values(0), indG.get_level_values(1), indG.get_level_values(2)] = 0.
-        h[indH.get_level_values(0), indH.get_level_values(1), indH.get_level_values(2)] = 0.
-        m[indM.get_level_values(0), indM.get_level_values(1), indM.get_level_values(2)] = 0.
-        n[indN.get_level_values(0), indN.get_level_values(1), indN.get_level_values(2)] = 0.
-    
-    o[indO.get_level_values(0), indO.get_level_values(1), indO.get_level_values(2)] = 0.5
-    p[indP.get_level_values(0), indP.get_level_values(1), indP.get_level_values(2)] = 0.5
-    q[indQ.get_level_values(0), indQ.get_level_values(1), indQ.get_level_values(2)] = 0.5
+    # Set coefficients according to table 1 (Pardyjak et Brown, 2003) 
+    # to modify the Equation near obstacles
+    if lowMemory:
+        # e, f, g, h, m and n are stored as bits of a single code
+        # (o, p and q are deduced from them)
+        codes = np.zeros([nx, ny, nz], dtype = np.int8)
+        if DESCENDING_Y:
+            listOfCodes = [(indF, CODE_E), (indE, CODE_F), (indH, CODE_G),
+                           (indG, CODE_H), (indM, CODE_M), (indN, CODE_N)]
+        else:
+            listOfCodes = [(indE, CODE_E), (indF, CODE_F), (indG, CODE_G),
+                           (indH, CODE_H), (indM, CODE_M), (indN, CODE_N)]
+        for ind, code in listOfCodes:
+            codes[ind.get_level_values(0), ind.get_level_values(1), ind.get_level_values(2)] |= code
+    else:
+        e = np.ones([nx, ny, nz])
+        f = np.ones([nx, ny, nz])
+        g = np.ones([nx, ny, nz])
+        h = np.ones([nx, ny, nz])
+        m = np.ones([nx, ny, nz])
+        n = np.ones([nx, ny, nz])
+        o = np.ones([nx, ny, nz])
+        p = np.ones([nx, ny, nz])
+        q = np.ones([nx, ny, nz])
+        
+        # Go descending order along y
+        if DESCENDING_Y:
+            e[indF.get_level_values(0), indF.get_level_values(1), indF.get_level_values(2)] = 0.
+            f[indE.get_level_values(0), indE.get_level_values(1), indE.get_level_values(2)] = 0. 
+            g[indH.get_level_values(0), indH.get_level_values(1), indH.get_level_values(2)] = 0.
+            h[indG.get_level_values(0), indG.get_level_values(1), indG.get_level_values(2)] = 0.
+            m[indM.get_level_values(0), indM.get_level_values(1), indM.get_level_values(2)] = 0.
+            n[indN.get_level_values(0), indN.get_level_values(1), indN.get_level_values(2)] = 0.
+        else:    
+            e[indE.get_level_values(0), indE.get_level_values(1), indE.get_level_values(2)] = 0.
+            f[indF.get_level_values(0), indF.get_level_values(1), indF.get_level_values(2)] = 0. 
+            g[indG.get_level_values(0), indG.get_level_values(1), indG.get_level_values(2)] = 0.
+            h[indH.get_level_values(0), indH.get_level_values(1), indH.get_level_values(2)] = 0.
+            m[indM.get_level_values(0), indM.get_level_values(1), indM.get_level_values(2)] = 0.
+            n[indN.get_level_values(0), indN.get_level_values(1), indN.get_level_values(2)] = 0.
+        
+        o[indO.get_level_values(0), indO.get_level_values(1), indO.get_level_values(2)] = 0.5
+        p[indP.get_level_values(0), indP.get_level_values(1), indP.get_level_values(2)] = 0.5
+        q[indQ.get_level_values(0), indQ.get_level_values(1), indQ.get_level_values(2)] = 0.5
         
     for N in range(maxIterations):
         print("Iteration {0} (max {1})".format( N + 1, 
                                                 maxIterations))
-        lambdaN = np.copy(lambdaN1)
+        lambdaN[:] = lambdaN1
         
         # ########################################################################
         # # Only used for debug
@@ -227,12 +279,18 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
         # # end of debug
         # ########################################################################
                                           
-        lambdaN1 = calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1,
-                              u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q,
-                              DESCENDING_Y, A, B)
+        if lowMemory:
+            lambdaN1 = calcLambdaCoded(cells4Solver, lambdaN, lambdaN1, omega, alpha1,
+                                       u0, v0, w0, dx, dy, dz, codes,
+                                       DESCENDING_Y, A, B)
+        else:
+            lambdaN1 = calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1,
+                                  u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q,
+                                  DESCENDING_Y, A, B)
         
-        # Calculate how much lambda evolves between 2 consecutive iterations                                      
-        eps = np.sum(np.abs(lambdaN1 - lambdaN)) / np.sum(np.abs(lambdaN1))
+        # Calculate how much lambda evolves between 2 consecutive iterations
+        # (accumulated in double precision without full-size temporary arrays)
+        eps = calcRelativeVariation(lambdaN.ravel(), lambdaN1.ravel())
         
         # Check if the condition for ending process is reached
         if eps < thresholdIterations:
@@ -281,8 +339,250 @@ def solver(x, y, z, dx, dy, dz, u0, v0, w0, buildingCoordinates, cells4Solver, c
 
     print("Time spent by the wind speed solver: {0} s".format(time.time()-timeStartCalculation))
     
+    if returnLambda:
+        return u, v, w, lambdaN1, N + 1
     return u, v, w
 
+def gridToWorld(x, y, windDirection, rotationCenterCoordinates, firstPoint,
+                lastPoint):
+    """ Affine transformation from the local grid coordinates (x, y) to the
+    coordinates of the input data (i.e. before the rotation of the obstacles
+    to the wind direction).
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            x: 1D array
+                X-axis cell coordinates in a local reference system (starting from 0)
+            y: 1D array
+                Y-axis cell coordinates in a local reference system (starting from 0)
+            windDirection: float
+                Wind direction (in degrees) used to rotate the obstacles
+            rotationCenterCoordinates: tuple of float
+                Coordinates of the center of rotation of the obstacles
+            firstPoint: tuple of float
+                Coordinates of the first grid point (x[0], y[0]) in the
+                reference of the rotated obstacles
+            lastPoint: tuple of float
+                Coordinates of the last grid point (x[-1], y[-1]) in the
+                reference of the rotated obstacles
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            gridTransform: 2D array
+                Transformation (2, 3) such as (X, Y) = gridTransform[:, :2]
+                . (x, y) + gridTransform[:, 2]"""
+    # Local coordinates to the (axis aligned) grid of the rotated obstacles
+    scale = np.diag([(lastPoint[0] - firstPoint[0]) / x[-1],
+                     (lastPoint[1] - firstPoint[1]) / y[-1]])
+    # Rotation of the obstacles cancelled
+    theta = -windDirection * np.pi / 180
+    rot = np.array([[np.cos(theta), -np.sin(theta)],
+                    [np.sin(theta), np.cos(theta)]])
+    center = np.array(rotationCenterCoordinates, dtype = np.float64)
+    
+    return np.column_stack((rot.dot(scale),
+                            rot.dot(np.array(firstPoint) - center) + center))
+
+def saveWarmStart(filePath, x, y, z, lambdaN1, u, v, w, windDirection,
+                  gridTransform, nIterations):
+    """ Save the converged Lagrange multiplier and wind field of a solver run
+    in a compressed numpy file (.npz) in order to warm-start later runs.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            filePath: String
+                Path of the file to save
+            x: 1D array
+                X-axis cell coordinates in a local reference system (starting from 0)
+            y: 1D array
+                Y-axis cell coordinates in a local reference system (starting from 0)   
+            z: 1D array
+                Z-axis cell coordinates in a local reference system (starting from 0)
+            lambdaN1: 3D array
+                Converged Lagrange multiplier
+            u: 3D array
+                Wind speed value in X direction (local reference system)
+            v: 3D array
+                Wind speed value in Y direction (local reference system)
+            w: 3D array
+                Wind speed value in Z direction
+            windDirection: float
+                Wind direction (in degrees) of the run
+            gridTransform: 2D array
+                Transformation from the local grid coordinates to the
+                coordinates of the input data (see 'gridToWorld')
+            nIterations: int
+                Number of iterations of the solver run
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            None"""
+    np.savez_compressed(filePath,
+                        x = x, y = y, z = z,
+                        lambdaN1 = lambdaN1.astype(np.float32),
+                        u = u.astype(np.float32),
+                        v = v.astype(np.float32),
+                        w = w.astype(np.float32),
+                        windDirection = windDirection,
+                        gridTransform = gridTransform,
+                        nIterations = nIterations)
+
+def loadWarmStart(filePath, x, y, z, gridTransform):
+    """ Load the Lagrange multiplier saved by 'saveWarmStart' and resample it
+    (trilinear, nearest value outside the saved grid) on a new grid if the
+    grids differ. The grids are matched in the coordinates of the input data,
+    thus the saved solution may come from another wind direction or extent.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            filePath: String
+                Path of the file saved by 'saveWarmStart'
+            x: 1D array
+                X-axis cell coordinates of the new grid
+            y: 1D array
+                Y-axis cell coordinates of the new grid 
+            z: 1D array
+                Z-axis cell coordinates of the new grid
+            gridTransform: 2D array
+                Transformation from the local coordinates of the new grid to
+                the coordinates of the input data (see 'gridToWorld')
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            lambdaInit: 3D array
+                Initial guess of the Lagrange multiplier on the new grid
+            windDirection: float
+                Wind direction (in degrees) of the saved run
+            nIterations: int
+                Number of iterations of the saved run (None if not saved)"""
+    with np.load(filePath) as data:
+        x0, y0, z0 = data["x"], data["y"], data["z"]
+        lambda0 = data["lambdaN1"].astype(np.float64)
+        windDirection = float(data["windDirection"])
+        gridTransform0 = data["gridTransform"]
+        nIterations = int(data["nIterations"]) if "nIterations" in data.files else None
+    
+    if (x0.shape == x.shape) and (y0.shape == y.shape) and (z0.shape == z.shape)\
+        and np.allclose(x0, x) and np.allclose(y0, y) and np.allclose(z0, z)\
+        and np.allclose(gridTransform0, gridTransform):
+        return lambda0, windDirection, nIterations
+    
+    # Coordinates of the new grid in the local reference of the saved grid
+    xGrid, yGrid = np.meshgrid(x, y, indexing = "ij")
+    toSaved = np.linalg.inv(gridTransform0[:, :2]).dot(gridTransform[:, :2])
+    offset = np.linalg.inv(gridTransform0[:, :2]).dot(gridTransform[:, 2] - gridTransform0[:, 2])
+    xSaved = np.clip(toSaved[0, 0] * xGrid + toSaved[0, 1] * yGrid + offset[0], x0[0], x0[-1])
+    ySaved = np.clip(toSaved[1, 0] * xGrid + toSaved[1, 1] * yGrid + offset[1], y0[0], y0[-1])
+    
+    # Interpolation is made level by level to limit memory use
+    interpolator = RegularGridInterpolator((x0, y0, z0), lambda0,
+                                           bounds_error = False,
+                                           fill_value = None)
+    lambdaInit = np.zeros((x.size, y.size, z.size))
+    for k, z_k in enumerate(np.clip(z, z0[0], z0[-1])):
+        lambdaInit[:, :, k] = interpolator((xSaved, ySaved, np.full(xGrid.shape, z_k)))
+    
+    return lambdaInit, windDirection, nIterations
+
+def estimateSolverMemory(nx, ny, nz, nCells4Solver, lowMemory = LOW_MEMORY_SOLVER):
+    """ Estimate the peak memory used by the wind solver.
+    
+    		Parameters
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            nx: int
+                Number of cells along X-axis
+            ny: int
+                Number of cells along Y-axis
+            nz: int
+                Number of cells along Z-axis
+            nCells4Solver: int
+                Number of cells for which the wind solver is applied
+            lowMemory: boolean, default LOW_MEMORY_SOLVER
+                Whether or not the solver is used in low memory mode
+        
+    		Returns
+    		_ _ _ _ _ _ _ _ _ _ 
+    
+            peakMemory: float
+                Estimated peak memory (in bytes)"""
+    nCells = nx * ny * nz
+    if lowMemory:
+        fieldSize = 4
+        coefficientSize = 1
+    else:
+        fieldSize = 8
+        coefficientSize = 9 * 8
+    # u0, v0, w0, u, v, w, lambdaN, lambdaN1 and one temporary array
+    # needed for the final wind speed calculation
+    peakMemory = 9 * nCells * fieldSize + nCells * coefficientSize\
+        + nCells4Solver * 3 * 4
+    
+    return peakMemory
+
+@jit(nopython=True)
+def calcRelativeVariation(lambdaN, lambdaN1):
+    # Sums are accumulated in double precision whatever the lambda precision
+    sumDiff = 0.
+    sumLambda = 0.
+    for i in range(lambdaN1.size):
+        sumDiff += abs(np.float64(lambdaN1[i]) - np.float64(lambdaN[i]))
+        sumLambda += abs(np.float64(lambdaN1[i]))
+    return sumDiff / sumLambda
+
+@jit(nopython=True)
+def calcLambdaCoded(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz, codes, DESCENDING_Y, A, B):
+    # Same as 'calcLambda' but coefficients are decoded from the boundary codes
+    if DESCENDING_Y:
+        for k, j, i in np.flip(cells4Solver):
+            c = codes[i, j, k]
+            e = 0. if c & CODE_E else 1.
+            f = 0. if c & CODE_F else 1.
+            g = 0. if c & CODE_G else 1.
+            h = 0. if c & CODE_H else 1.
+            m = 0. if c & CODE_M else 1.
+            n = 0. if c & CODE_N else 1.
+            o = 0.5 if c & (CODE_E | CODE_F) else 1.
+            p = 0.5 if c & (CODE_G | CODE_H) else 1.
+            q = 0.5 if c & (CODE_M | CODE_N) else 1.
+            lambdaN1[i, j, k] = omega * (
+                ((-1.) * (dx ** 2 * (-2. * alpha1 ** 2) * (((u0[i, j, k] - u0[i + 1, j, k]) / (dx) + (
+                        v0[i, j, k] - v0[i, j + 1, k]) / (dy) +
+                                                            (w0[i, j, k] - w0[i, j, k + 1]) / (dz)))) + (
+                          e * lambdaN[i - 1, j, k] + f * lambdaN1[i + 1, j, k] + A * (
+                          g * lambdaN[i, j - 1, k] + h * lambdaN1[i, j + 1, k]) + B * (
+                                  m * lambdaN[i, j, k - 1] + n * lambdaN1[i, j, k + 1]))) / (
+                        2. * (o + A * p + B * q))) + (1 - omega) * lambdaN1[i, j, k]  
+                                      
+    else:
+        for i, j, k in cells4Solver:
+            c = codes[i, j, k]
+            e = 0. if c & CODE_E else 1.
+            f = 0. if c & CODE_F else 1.
+            g = 0. if c & CODE_G else 1.
+            h = 0. if c & CODE_H else 1.
+            m = 0. if c & CODE_M else 1.
+            n = 0. if c & CODE_N else 1.
+            o = 0.5 if c & (CODE_E | CODE_F) else 1.
+            p = 0.5 if c & (CODE_G | CODE_H) else 1.
+            q = 0.5 if c & (CODE_M | CODE_N) else 1.
+            lambdaN1[i, j, k] = omega * (
+                ((-1.) * (dx ** 2 * (-2. * alpha1 ** 2) * (((u0[i + 1, j, k] - u0[i, j, k]) / (dx) + (
+                        v0[i, j + 1, k] - v0[i, j, k]) / (dy) +
+                                                            (w0[i, j, k + 1] - w0[i, j, k]) / (dz)))) + (
+                          e * lambdaN[i + 1, j, k] + f * lambdaN1[i - 1, j, k] + A * (
+                          g * lambdaN[i, j + 1, k] + h * lambdaN1[i, j - 1, k]) + B * (
+                                  m * lambdaN[i, j, k + 1] + n * lambdaN1[i, j, k - 1]))) / (
+                        2. * (o + A * p + B * q))) + (1 - omega) * lambdaN1[i, j, k]  
+                                      
+    return lambdaN1
+
 @jit(nopython=True)
 def calcLambda(cells4Solver, lambdaN, lambdaN1, omega, alpha1, u0, v0, w0, dx, dy, dz, e, f, g, h, m, n, o, p, q, DESCENDING_Y, A, B):
     # Go descending order along y
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indexed assignment of the 2D grid points to Röckle zone polygons.
+
+The grid created by 'InitWindField.createGrid' is regular, thus the grid
+itself is used as a bucket index: the bounding box of each zone polygon is
+converted into a window of columns and rows and the point-in-polygon test
+is only performed (vectorized) on the points of this window. The resulting
+(zone, point) pairs are sent back to the database in order to replace the
+spatial joins between the zone tables and the full point grid.
+"""
+
+from . import DataUtil as DataUtil
+import pandas as pd
+import numpy as np
+import re
+import os
+from .GlobalVariables import GEOM_FIELD, ID_POINT, ID_ZONE_ROW,\
+    TEMPO_DIRECTORY
+
+# Relative tolerance used to consider that a point is located on a polygon
+# boundary (ST_INTERSECTS returns True for boundary points)
+BOUNDARY_RELATIVE_TOLERANCE = 1e-9
+
+# Regular expression catching the innermost parenthesis of a WKT (the rings)
+RING_PATTERN = re.compile(r"\(([^()]+)\)")
+
+# Maximum number of (point, edge) combinations evaluated at once
+MAX_CHUNK_ELEMENTS = 1000000
+
+# Number of decimals kept to identify the grid columns and rows
+GRID_COORDINATE_DECIMALS = 6
+
+
+def loadGridIndex(cursor, gridTable, tempoDirectory = TEMPO_DIRECTORY):
+    """ Load the grid point coordinates from the database and organize them
+    as a 2D array of point IDs (the grid-bucket index).
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _
+
+            cursor: conn.cursor
+                A cursor object, used to perform spatial SQL queries
+            gridTable: String
+                Name of the grid point table
+            tempoDirectory: String, default = TEMPO_DIRECTORY
+                Path of the directory used to exchange data between H2 and Python
+
+		Returns
+		_ _ _ _ _ _ _ _ _ _
+
+            gridIndex: dictionary
+                Dictionary containing the sorted x ("x") and y ("y") coordinates
+                of the grid columns and rows and the 2D array of point IDs ("id")
+                (-1 where no point exists)"""
+    gridFile = os.path.join(tempoDirectory, "GRID_INDEX_POINTS.csv")
+    cursor.execute("""
+           CALL CSVWRITE('{0}',
+                         'SELECT {1}, ST_X({2}) AS X_COORD, ST_Y({2}) AS Y_COORD
+                          FROM {3}',
+                         'charset=UTF-8 fieldSeparator=,')
+           """.format(gridFile, ID_POINT, GEOM_FIELD, gridTable))
+    df_grid = pd.read_csv(gridFile, header = 0)
+
+    return createGridIndex(idPoints = df_grid[ID_POINT].values,
+                           xPoints = df_grid["X_COORD"].values,
+                           yPoints = df_grid["Y_COORD"].values)
+
+
+def createGridIndex(idPoints, xPoints, yPoints):
+    """ Organize regular grid points as a 2D array of point IDs.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _
+
+            idPoints: np.array of int
+                ID of each grid point
+            xPoints: np.array of float
+                x coordinate of each grid point
+            yPoints: np.array of float
+                y coordinate of each grid point
+
+		Returns
+		_ _ _ _ _ _ _ _ _ _
+
+            gridIndex: dictionary
+                Dictionary containing the sorted x ("x") and y ("y") coordinates
+                of the grid columns and rows and the 2D array of point IDs ("id")
+                (-1 where no point exists)"""
+    xCoord, iCol = np.unique(np.round(xPoints, GRID_COORDINATE_DECIMALS),
+                             return_inverse = True)
+    yCoord, iRow = np.unique(np.round(yPoints, GRID_COORDINATE_DECIMALS),
+                             return_inverse = True)
+    idArray = np.full((xCoord.size, yCoord.size), -1, dtype = np.int64)
+    idArray[iCol, iRow] = idPoints
+
+    return {"x": xCoord, "y": yCoord, "id": idArray}
+
+
+def parseRings(wkt):
+    """ Convert the WKT of a (multi)polygon into a list of rings
+    (each ring being a (n, 2) array of coordinates).
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _
+
+            wkt: String
+                Well-known text of the geometry
+
+		Returns
+		_ _ _ _ _ _ _ _ _ _
+
+            rings: list of np.array
+                Coordinates of each ring of the geometry"""
+    rings = []
+    for ringText in RING_PATTERN.findall(wkt):
+        coord = np.array([c.split()[0:2] for c in ringText.split(",")],
+                         dtype = float)
+        if coord.shape[0] > 2:
+            rings.append(coord)
+
+    return rings
+
+
+def pointsInRings(x, y, rings):
+    """ Vectorized point-in-polygon test (even-odd rule) where points located
+    on the polygon boundary are considered as inside.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _
+
+            x: np.array of float
+                x coordinate of the points to test
+            y: np.array of float
+                y coordinate of the points to test
+            rings: list of np.array
+                Coordinates of each ring of the polygon (outer ring and holes
+                or rings of several polygons)
+
+		Returns
+		_ _ _ _ _ _ _ _ _ _
+
+            isIn: np.array of boolean
+                Whether or not each point intersects the polygon"""
+    # Edges of all rings (the even-odd rule holds for holes and multi-parts)
+    edges = np.concatenate([np.hstack([ring[:-1], ring[1:]]) for ring in rings])
+    xa, ya, xb, yb = [edges[:, i][np.newaxis, :] for i in range(4)]
+    dx, dy = xb - xa, yb - ya
+    tol = BOUNDARY_RELATIVE_TOLERANCE * max(np.abs(edges).max(), 1.)
+
+    isIn = np.zeros(x.shape, dtype = bool)
+    onBoundary = np.zeros(x.shape, dtype = bool)
+    # Points are processed by chunk to limit the (points, edges) array size
+    chunkSize = max(1, MAX_CHUNK_ELEMENTS // edges.shape[0])
+    for i in range(0, x.size, chunkSize):
+        xp = x[i:i + chunkSize, np.newaxis]
+        yp = y[i:i + chunkSize, np.newaxis]
+        # Crossing of an horizontal ray going to the east
+        crossY = (ya > yp) != (yb > yp)
+        xCross = xa + (yp - ya) * dx / np.where(dy == 0, 1, dy)
+        isIn[i:i + chunkSize] = np.logical_xor.reduce(crossY & (xp < xCross),
+                                                      axis = 1)
+        # Points located on an edge
+        cross = (xp - xa) * dy - (yp - ya) * dx
+        dot = (xp - xa) * dx + (yp - ya) * dy
+        onBoundary[i:i + chunkSize] = ((np.abs(cross) <= tol * np.maximum(np.hypot(dx, dy), tol))
+                                       & (dot >= -tol)
+                                       & (dot <= dx * dx + dy * dy + tol)).any(axis = 1)
+
+    return isIn | onBoundary
+
+
+def assignPointsToPolygons(gridIndex, listOfRings):
+    """ Identify for each polygon the grid points it intersects.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _
+
+            gridIndex: dictionary
+                Grid-bucket index returned by 'createGridIndex'
+            listOfRings: list of list of np.array
+                Rings of each polygon (as returned by 'parseRings')
+
+		Returns
+		_ _ _ _ _ _ _ _ _ _
+
+            polygonIndex: np.array of int
+                Position (in 'listOfRings') of the polygon of each pair
+            idPoint: np.array of int
+                ID of the grid point of each pair"""
+    xCoord, yCoord, idArray = gridIndex["x"], gridIndex["y"], gridIndex["id"]
+    listOfPolygonIndex = []
+    listOfIdPoint = []
+    for i, rings in enumerate(listOfRings):
+        if not rings:
+            continue
+        allCoord = np.concatenate(rings)
+        tol = BOUNDARY_RELATIVE_TOLERANCE * max(np.abs(allCoord).max(), 1.)
+        xmin, ymin = allCoord.min(axis = 0) - tol
+        xmax, ymax = allCoord.max(axis = 0) + tol
+
+        # Window of the grid covered by the polygon bounding box
+        col0, col1 = np.searchsorted(xCoord, xmin, side = "left"),\
+            np.searchsorted(xCoord, xmax, side = "right")
+        row0, row1 = np.searchsorted(yCoord, ymin, side = "left"),\
+            np.searchsorted(yCoord, ymax, side = "right")
+        if col1 <= col0 or row1 <= row0:
+            continue
+        xWin, yWin = np.meshgrid(xCoord[col0:col1], yCoord[row0:row1],
+                                 indexing = "ij")
+        idWin = idArray[col0:col1, row0:row1]
+        isIn = pointsInRings(xWin.ravel(), yWin.ravel(), rings)\
+            & (idWin.ravel() >= 0)
+        if isIn.any():
+            listOfIdPoint.append(idWin.ravel()[isIn])
+            listOfPolygonIndex.append(np.full(listOfIdPoint[-1].size, i,
+                                              dtype = np.int64))
+
+    if not listOfIdPoint:
+        return np.array([], dtype = np.int64), np.array([], dtype = np.int64)
+    return np.concatenate(listOfPolygonIndex), np.concatenate(listOfIdPoint)
+
+
+def affectsPointToZones(cursor, gridIndex, dicOfZoneTable,
+                        tempoDirectory = TEMPO_DIRECTORY):
+    """ Calculates the (zone, point) intersection pairs for a set of zone
+    tables and saves them into the database.
+
+		Parameters
+		_ _ _ _ _ _ _ _ _ _
+
+            cursor: conn.cursor
+                A cursor object, used to perform spatial SQL queries
+            gridIndex: dictionary
+                Grid-bucket index returned by 'loadGridIndex'
+            dicOfZoneTable: Dictionary of Röckle zone tables
+                Dictionary containing as key the Rockle zone name and
+                as value the corresponding table name
+            tempoDirectory: String, default = TEMPO_DIRECTORY
+                Path of the directory used to exchange data between H2 and Python
+
+		Returns
+		_ _ _ _ _ _ _ _ _ _
+
+            dicOfKeyedZoneTable: dictionary of table name
+                Dictionary having as key the type of Rockle zone and as value
+                the name of a copy of the zone table having a zone row ID
+                (ID_ZONE_ROW)
+            dicOfPairTable: dictionary of table name
+                Dictionary having as key the type of Rockle zone and as value
+                the name of the table containing the (ID_ZONE_ROW, ID_POINT)
+                intersection pairs"""
+    dicOfKeyedZoneTable = {}
+    dicOfPairTable = {}
+    for t, zoneTable in dicOfZoneTable.items():
+        dicOfKeyedZoneTable[t] = DataUtil.postfix(zoneTable, suffix = "KEYED")
+        dicOfPairTable[t] = DataUtil.postfix(zoneTable, suffix = "POINT_PAIRS")
+        zoneFile = os.path.join(tempoDirectory, "ZONE_INDEX_POLYGONS.csv")
+        pairFile = os.path.join(tempoDirectory, "ZONE_INDEX_PAIRS.csv")
+
+        # Give a row ID to each zone and export the zone geometries
+        cursor.execute("""
+               DROP TABLE IF EXISTS {0};
+               CREATE TABLE {0}
+                   AS SELECT ROW_NUMBER() OVER() AS {1}, a.*
+                   FROM {2} AS a;
+               CALL CSVWRITE('{3}',
+                             'SELECT {1}, ST_ASTEXT({4}) AS WKT FROM {0}',
+                             'charset=UTF-8 fieldSeparator=,')
+               """.format(dicOfKeyedZoneTable[t], ID_ZONE_ROW, zoneTable,
+                          zoneFile, GEOM_FIELD))
+        df_zones = pd.read_csv(zoneFile, header = 0)
+
+        # Identify the points located in each zone
+        polygonIndex, idPoint = \
+            assignPointsToPolygons(gridIndex = gridIndex,
+                                   listOfRings = [parseRings(str(wkt))
+                                                  for wkt in df_zones["WKT"]])
+        pd.DataFrame({ID_ZONE_ROW: df_zones[ID_ZONE_ROW].values[polygonIndex],
+                      ID_POINT: idPoint}).to_csv(pairFile, index = False)
+
+        # Load the pairs into the database
+        cursor.execute("""
+               DROP TABLE IF EXISTS {0};
+               CREATE TABLE {0}({1} INTEGER, {2} INTEGER)
+                   AS SELECT {1}, {2} FROM CSVREAD('{3}');
+               {4}
+               {5}
+               {6}
+               """.format(dicOfPairTable[t], ID_ZONE_ROW, ID_POINT, pairFile,
+                          DataUtil.createIndex(tableName=dicOfPairTable[t],
+                                               fieldName=ID_ZONE_ROW,
+                                               isSpatial=False),
+                          DataUtil.createIndex(tableName=dicOfPairTable[t],
+                                               fieldName=ID_POINT,
+                                               isSpatial=False),
+                          DataUtil.createIndex(tableName=dicOfKeyedZoneTable[t],
+                                               fieldName=ID_ZONE_ROW,
+                                               isSpatial=False)))
+
+    return dicOfKeyedZoneTable, dicOfPairTable
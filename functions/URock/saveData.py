@@ -15,7 +15,9 @@ from .GlobalVariables import HORIZ_WIND_DIRECTION, HORIZ_WIND_SPEED, WIND_SPEED,
     OUTPUT_DIRECTORY, MESH_SIZE, OUTPUT_FILENAME, DELETE_OUTPUT_IF_EXISTS,\
     OUTPUT_RASTER_EXTENSION, OUTPUT_VECTOR_EXTENSION, OUTPUT_NETCDF_EXTENSION,\
     WIND_GROUP, WINDSPEED_PROFILE, RLON, RLAT, LON, LAT, LEVELS, WINDSPEED_X,\
-    WINDSPEED_Y, WINDSPEED_Z, VERT_WIND, Z, OUTPUT_FILENAME, PREFIX_NAME
+    WINDSPEED_Y, WINDSPEED_Z, VERT_WIND, Z, OUTPUT_FILENAME, PREFIX_NAME,\
+    NETCDF_COMPRESSION_LEVEL, NETCDF_VARIABLES, NETCDF_LEVELS,\
+    NETCDF_CHUNK_SIZES, BUILDING_MASK
 from datetime import datetime
 import netCDF4 as nc4
 import os
@@ -25,7 +27,11 @@ def saveBasicOutputs(cursor, z_out, dz, u, v, w, gridName,
                      outputFilename = OUTPUT_FILENAME,
                      outputRaster = None, saveRaster = True,
                      saveVector = True, saveNetcdf = True,
-                     prefix_name = PREFIX_NAME):
+                     prefix_name = PREFIX_NAME,
+                     netcdfVariables = NETCDF_VARIABLES,
+                     netcdfLevels = NETCDF_LEVELS,
+                     netcdfCompressionLevel = NETCDF_COMPRESSION_LEVEL,
+                     buildingCoordinates = None):
 
     # -------------------------------------------------------------------
     # SAVE NETCDF -------------------------------------------------------
@@ -74,7 +80,11 @@ def saveBasicOutputs(cursor, z_out, dz, u, v, w, gridName,
                                          path = netcdf_base_dir_name,
                                          urock_srid = srid,
                                          horizontal_res = meshSize,
-                                         vertical_res = dz)
+                                         vertical_res = dz,
+                                         variables = netcdfVariables,
+                                         levels = netcdfLevels,
+                                         compressionLevel = netcdfCompressionLevel,
+                                         buildingCoordinates = buildingCoordinates)
 
     horizOutputUrock = {z_i : "HORIZ_OUTPUT_UROCK_{0}".format(str(z_i).replace(".","_")) for z_i in z_out}
     for z_i in z_out:
@@ -193,10 +203,18 @@ def saveToNetCDF(longitude,
                  path,
                  urock_srid,
                  horizontal_res,
-                 vertical_res):
+                 vertical_res,
+                 variables = NETCDF_VARIABLES,
+                 levels = NETCDF_LEVELS,
+                 compressionLevel = NETCDF_COMPRESSION_LEVEL,
+                 chunkSizes = NETCDF_CHUNK_SIZES,
+                 buildingCoordinates = None):
     """
     Create a netCDF file and save wind speed, direction and initial 
     vertical wind profile in it (based on https://pyhogs.github.io/intro_netcdf4.html )
+    The 3D wind variables are stored as float32, chunked (chunks suited for
+    both horizontal slices and vertical sections) and zlib compressed. The
+    building cells are saved as a mask (BUILDING_MASK).
     
     Parameters
     _ _ _ _ _ _ _ _ _ _ 
@@ -220,6 +238,22 @@ def saveToNetCDF(longitude,
             Path and filename to save NetCDF file
         urock_srid: int
             EPSG code initially used for the URock calculations
+        horizontal_res: float
+            Horizontal resolution of the grid
+        vertical_res: float
+            Vertical resolution of the grid
+        variables: list, default NETCDF_VARIABLES
+            3D wind variables to save (among WINDSPEED_X, WINDSPEED_Y
+            and WINDSPEED_Z)
+        levels: list, default NETCDF_LEVELS
+            Heights (m) of the levels to save (the closest level is used
+            for each height). If None, all levels are saved
+        compressionLevel: int, default NETCDF_COMPRESSION_LEVEL
+            zlib compression level (from 0 - no compression - to 9)
+        chunkSizes: dictionary, default NETCDF_CHUNK_SIZES
+            Chunk size of each dimension of the 3D wind variables
+        buildingCoordinates: np.array (2D - 3, number of building cells), default None
+            Indices (X, Y, Z) of the building cells (no mask saved if None)
     
     Returns
     -------
@@ -233,30 +267,69 @@ def saveToNetCDF(longitude,
     # Creates a group within this file for the 3D wind speed
     wind3dGrp = f.createGroup(WIND_GROUP)
     
+    # Identify the levels to save
+    zAll = verticalWindProfile[Z].values
+    if levels is None:
+        levelIndex = np.arange(zAll.size)
+    else:
+        levelIndex = np.unique([np.abs(zAll - h).argmin() for h in levels])
+    
     # Creates dimensions within this group
     wind3dGrp.createDimension('rlon', len(x))
     wind3dGrp.createDimension('rlat', len(y))
-    wind3dGrp.createDimension('z', verticalWindProfile.index.size)
+    wind3dGrp.createDimension('z', levelIndex.size)
     
     # Build the variables
     rlon = wind3dGrp.createVariable(RLON, 'i4', 'rlon')
     rlat = wind3dGrp.createVariable(RLAT, 'i4', 'rlat')
     z = wind3dGrp.createVariable(Z, 'f4', 'z')
-    lon = wind3dGrp.createVariable(LON, 'f8', ('rlon', 'rlat'))
-    lat = wind3dGrp.createVariable(LAT, 'f8', ('rlon', 'rlat'))
-    windSpeed_x = wind3dGrp.createVariable(WINDSPEED_X, 'f4', ('rlon', 'rlat', 'z'))
-    windSpeed_y = wind3dGrp.createVariable(WINDSPEED_Y, 'f4', ('rlon', 'rlat', 'z'))  
-    windSpeed_z = wind3dGrp.createVariable(WINDSPEED_Z, 'f4', ('rlon', 'rlat', 'z'))
+    lon = wind3dGrp.createVariable(LON, 'f8', ('rlon', 'rlat'),
+                                   zlib = compressionLevel > 0,
+                                   complevel = max(compressionLevel, 1))
+    lat = wind3dGrp.createVariable(LAT, 'f8', ('rlon', 'rlat'),
+                                   zlib = compressionLevel > 0,
+                                   complevel = max(compressionLevel, 1))
     
     # Fill the variables
     rlon[:] = x
     rlat[:] = y
-    z[:] = verticalWindProfile[Z].values
+    z[:] = zAll[levelIndex]
+    z.units = 'meters'
     lon[:,:] = longitude
     lat[:,:] = latitude
-    windSpeed_x[:,:,:] = u
-    windSpeed_y[:,:,:] = v
-    windSpeed_z[:,:,:] = w
+    
+    # The 3D wind variables are chunked and compressed
+    chunks = (min(chunkSizes[RLON], len(x)),
+              min(chunkSizes[RLAT], len(y)),
+              min(chunkSizes["z"], levelIndex.size))
+    windData = {WINDSPEED_X: u, WINDSPEED_Y: v, WINDSPEED_Z: w}
+    for varName in variables:
+        windVar = wind3dGrp.createVariable(varName, 'f4', ('rlon', 'rlat', 'z'),
+                                           zlib = compressionLevel > 0,
+                                           complevel = max(compressionLevel, 1),
+                                           shuffle = True,
+                                           chunksizes = chunks)
+        windVar.units = 'meter per second'
+        # Fill by slabs of one chunk height (each chunk is compressed once)
+        # to avoid a full size copy of the 3D array
+        for k in range(0, levelIndex.size, chunks[2]):
+            windVar[:,:,k:k + chunks[2]] = \
+                windData[varName][:,:,levelIndex[k:k + chunks[2]]].astype(np.float32)
+    
+    # Building cells (the wind speed of air cells may also be 0)
+    if buildingCoordinates is not None:
+        levelPosition = np.full(zAll.size, -1)
+        levelPosition[levelIndex] = np.arange(levelIndex.size)
+        isSaved = levelPosition[buildingCoordinates[2]] >= 0
+        isBuilding = np.zeros((len(x), len(y), levelIndex.size), dtype = np.int8)
+        isBuilding[buildingCoordinates[0][isSaved],
+                   buildingCoordinates[1][isSaved],
+                   levelPosition[buildingCoordinates[2][isSaved]]] = 1
+        buildVar = wind3dGrp.createVariable(BUILDING_MASK, 'i1', ('rlon', 'rlat', 'z'),
+                                            zlib = compressionLevel > 0,
+                                            complevel = max(compressionLevel, 1),
+                                            chunksizes = chunks)
+        buildVar[:,:,:] = isBuilding
     
     # VERTICAL WIND PROFILE DATA
     # Creates a group within this file for the vertical wind profile
@@ -278,10 +351,6 @@ def saveToNetCDF(longitude,
     #Add local attributes to variable instances
     lon.units = 'degrees east'
     lat.units = 'degrees north'
-    windSpeed_x.units = 'meter per second'
-    windSpeed_y.units = 'meter per second'
-    windSpeed_z.units = 'meter per second'
-    z.units = 'meters'
     WindSpeed.units = 'meter per second'
     z_profile.units = 'meters'
 
@@ -14,15 +14,16 @@ import os
 import pandas as pd
 import numpy as np
 import matplotlib.pylab as plt
-from matplotlib.patches import Rectangle
+from matplotlib.colors import ListedColormap
 from pathlib import Path
 import time
 
 from . import H2gisConnection
 from .loadData import loadFile
 from . import DataUtil
+from .ZoneIndex import parseRings, pointsInRings
 from .GlobalVariables import WIND_GROUP, TEMPO_DIRECTORY,\
-    RLON, RLAT, GEOM_FIELD, LON , LAT, WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z,\
+    GEOM_FIELD, LON , LAT, WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z, BUILDING_MASK,\
     Z, HORIZ_WIND_SPEED, WIND_SPEED
 
 idx = pd.IndexSlice
@@ -34,6 +35,9 @@ HEAD_LENGTH = 1.5
 HEAD_AXIS_LENGTH = 1.5
 WIDTH = 0.2
 
+# Tolerance used when converting polygon coordinates into grid indices
+INDEX_TOLERANCE = 1e-6
+
 def plotSectionalViews(pluginDirectory, inputWindFile, lines_file='', srid_lines=None,
                        idLines='', isStream = False, savePlot = False,
                        polygons_file='', srid_polygons=None, idPolygons='', 
@@ -43,117 +47,107 @@ def plotSectionalViews(pluginDirectory, inputWindFile, lines_file='', srid_lines
 
     if savePlot:
         plt.ioff()
-    # Set the SRID for work (by default use the srid_lines if exists)
-    if srid_polygons and not srid_lines:
-        srid_all = srid_polygons
-    else:
-        srid_all = srid_lines
         
     # Create temporary table names (for tables that will be removed at the end of the process)
-    allPointsTab = DataUtil.postfix("ALL_POINTS")
     linesTab = DataUtil.postfix("LINES")
-    pointsIntersecTab = DataUtil.postfix("POINTS_INTERSECT")
     polygonsTab = DataUtil.postfix("POLYGONS")
-    polygonsMeanTab = DataUtil.postfix("POLYGONS_MEAN")
-    
-    # Temporary files are declared
-    pointsDir = os.path.join(TEMPO_DIRECTORY, "urock_allPoints.csv")
-    outputPointsDir = os.path.join(TEMPO_DIRECTORY, "urock_selectedPoints.csv")
-    outputPolygonsDir = os.path.join(TEMPO_DIRECTORY, "urock_selectedPolygons.csv")
     
-    if feedback:
-        feedback.setProgressText('Load NetCDF file in Python and save as csv file...')
-        
-    # Load the group of the NetCDF file containing the wind speed field
+    # Open (lazily) the group of the NetCDF file containing the wind speed field
     ds = xr.open_dataset(inputWindFile, group = WIND_GROUP)
     
-    # Get the SRID that has been used in the URock processing calculation
-    urock_srid = xr.open_dataset(inputWindFile).urock_srid    
-    
-    # Send to a csv file
-    ds.to_dataframe().to_csv(pointsDir, index_label = ['rlat', 'rlon', 'zlev'])
+    # Get the SRID and the horizontal resolution used in the URock processing calculation
+    with xr.open_dataset(inputWindFile) as ds_attrs:
+        urock_srid = ds_attrs.urock_srid
+        horiz_res = round(float(ds_attrs.horizontal_res))
     
-    if feedback:
-        feedback.setProgressText('Load csv file into H2GIS Database...')    
     # Initialize an H2GIS database connection
     dBDir = os.path.join(Path(pluginDirectory).parent, 'functions','URock')
     cursor, conn, localH2InstanceDir = H2gisConnection.startH2gisInstance(dbDirectory = dBDir,
                                                                           dbInstanceDir = TEMPO_DIRECTORY,
                                                                           suffix = str(time.time()).replace(".", "_"))
     
-    # Load coordinates in a H2GIS table
-    cursor.execute("""
-       DROP TABLE IF EXISTS {0};
-       CREATE TABLE {0}(ID_POINT BIGINT AUTO_INCREMENT,
-                        {3} INTEGER,
-                        {4} INTEGER,
-                        {8} DOUBLE,
-                        {9} DOUBLE,
-                        {10} DOUBLE,
-                        {11} DOUBLE,
-                        {5} GEOMETRY) AS
-            SELECT  CAST((row_number() over()) as Integer) AS ID_POINT, {3}, {4}, {8}, {9}, {10}, {11},
-                    ST_TRANSFORM(ST_SETSRID(ST_MakePoint({6}, {7}), 4326), {1}) AS {5}
-            FROM CSVREAD('{2}')
-        """.format(allPointsTab             , urock_srid, 
-                    pointsDir               , RLON,
-                    RLAT                    , GEOM_FIELD,
-                    LON                     , LAT,
-                    Z                       , WINDSPEED_X,
-                    WINDSPEED_Y             , WINDSPEED_Z))
+    # Load the lines and polygons first in order to only read the part of
+    # the wind field they cover
+    isPolygons = polygons_file and srid_polygons and idPolygons
+    isLines = lines_file and srid_lines and idLines
+    if isPolygons:
+        loadFile(cursor = cursor, 
+                 filePath = polygons_file, 
+                 tableName = polygonsTab, 
+                 srid = srid_polygons,
+                 srid_repro = urock_srid)
+    if isLines:
+        loadFile(cursor = cursor, 
+                 filePath = lines_file, 
+                 tableName = linesTab, 
+                 srid = srid_lines,
+                 srid_repro = urock_srid)
+    
+    if feedback:
+        feedback.setProgressText('Load NetCDF file in Python...')
+    
+    # Keep only the (chunks of) the wind field covered by lines and polygons
+    ds = selectWindow(cursor = cursor,
+                      ds = ds,
+                      listOfTables = [t for t, isT in [(polygonsTab, isPolygons),
+                                                       (linesTab, isLines)] if isT],
+                      buffer = 2 * horiz_res)
+    
+    # Variables which have not been saved in the NetCDF file are set to 0
+    for var in [WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z]:
+        if var not in ds.variables:
+            if feedback:
+                feedback.pushWarning("{0} is not in the NetCDF file and is set to 0".format(var))
+            ds[var] = xr.zeros_like(ds[WINDSPEED_X if var != WINDSPEED_X else WINDSPEED_Y])
+    
+    # Load the window of the wind field as (rlon, rlat, z) arrays
+    u = ds[WINDSPEED_X].transpose("rlon", "rlat", "z").values
+    v = ds[WINDSPEED_Y].transpose("rlon", "rlat", "z").values
+    w = ds[WINDSPEED_Z].transpose("rlon", "rlat", "z").values
+    zLevels = ds[Z].values.astype(float)
+    # Building cells are saved as a mask (files without mask: cells where the
+    # wind speed is 0)
+    if BUILDING_MASK in ds.variables:
+        isBuild = ds[BUILDING_MASK].transpose("rlon", "rlat", "z").values == 1
+    else:
+        isBuild = (u == 0) & (v == 0) & (w == 0)
+    gridTransform = gridAffineTransform(cursor = cursor,
+                                        lon = ds[LON].values,
+                                        lat = ds[LAT].values,
+                                        srid = urock_srid)
+    ds.close()
+    
+    if gridTransform is None:
+        isPolygons = False
+        isLines = False
+        if feedback:
+            feedback.pushWarning("The lines and polygons do not cover at least 2 x 2 wind field cells")
     
     # DEAL WITH POLYGON (MEAN WIND PROFILES)
     fig_poly = None
     ax_poly = None
-    if polygons_file and srid_polygons and idPolygons:
+    if isPolygons:
         if feedback:
             feedback.setProgressText('Calculates average wind profile (within polygons)...')    
-        # Load polygons
-        loadFile(cursor = cursor, 
-                 filePath = polygons_file, 
-                 tableName = polygonsTab, 
-                 srid = srid_polygons,
-                 srid_repro = urock_srid)    
         
         # Calculates horizontal mean wind speed within each polygon
         cursor.execute("""
-           {0}{1}{2}{3}
-           DROP TABLE IF EXISTS {4};
-           CREATE TABLE {4}
-               AS SELECT b.{5},
-                         a.{6},
-                         AVG(a.{7}) AS {7},
-                         AVG(a.{8}) AS {8},
-                         AVG(a.{9}) AS {9},
-                         AVG(POWER(POWER(a.{7},2) + POWER(a.{8},2), 0.5)) AS {10},
-                         AVG(POWER(POWER(a.{7},2) + POWER(a.{8},2) + POWER(a.{9},2), 0.5)) AS {11}
-               FROM {12} AS a, {13} AS b
-               WHERE    a.{14} && b.{14} AND ST_INTERSECTS(a.{14}, b.{14}) AND
-                        a.{7} <> 0 AND a.{8} <> 0 AND a.{9} <> 0
-               GROUP BY a.{6}, b.{5};
-           CALL CSVWrite('{15}', 'SELECT * FROM {4}');
-           """.format(  DataUtil.createIndex(tableName=allPointsTab, 
-                                             fieldName=GEOM_FIELD,
-                                             isSpatial=True),
-                        DataUtil.createIndex(tableName=polygonsTab, 
-                                             fieldName=GEOM_FIELD,
-                                             isSpatial=True),
-                        DataUtil.createIndex(tableName=allPointsTab, 
-                                             fieldName=Z,
-                                             isSpatial=False),
-                        DataUtil.createIndex(tableName=polygonsTab, 
-                                             fieldName=idPolygons,
-                                             isSpatial=False),
-                        polygonsMeanTab         , idPolygons,
-                        Z                       , WINDSPEED_X,
-                        WINDSPEED_Y             , WINDSPEED_Z,
-                        HORIZ_WIND_SPEED        , WIND_SPEED,
-                        allPointsTab            , polygonsTab,
-                        GEOM_FIELD              , outputPolygonsDir))
-    
-        # Back to dataframe for the plotting the mean wind speed for each level
-        df_selectedPolygons = pd.read_csv(outputPolygonsDir, 
-                                          index_col = None, header = 0)
+           SELECT {0}, ST_ASTEXT({1}) FROM {2}
+           """.format(idPolygons, GEOM_FIELD, polygonsTab))
+        listOfProfiles = []
+        for idPol, wkt in cursor.fetchall():
+            mask = polygonMask(rings = parseRings(wkt),
+                               gridTransform = gridTransform,
+                               shape = isBuild.shape[0:2])
+            listOfProfiles.append(polygonProfile(u = u[mask], v = v[mask], w = w[mask],
+                                                 isBuild = isBuild[mask],
+                                                 zLevels = zLevels,
+                                                 idPolygon = idPol,
+                                                 idName = idPolygons.upper()))
+        df_selectedPolygons = pd.concat(listOfProfiles, ignore_index = True)\
+            if listOfProfiles else pd.DataFrame(columns = [idPolygons.upper(), Z])
+        
+        # Plot the mean wind speed for each level
         windList = pd.Series(["Wind speed along x-axis (m/s)",
                               "Wind speed along y-axis (m/s)",
                               "Wind speed along z-axis (m/s)",
@@ -164,138 +158,74 @@ def plotSectionalViews(pluginDirectory, inputWindFile, lines_file='', srid_lines
         polygonsList = df_selectedPolygons[idPolygons.upper()].unique()
         fig_poly = {}
         ax_poly = {}
-        for w in windList.index:
-            fig_poly[w], ax_poly[w] = plt.subplots()
+        for var in windList.index:
+            fig_poly[var], ax_poly[var] = plt.subplots()
             for p in polygonsList:
                 data2plot = df_selectedPolygons[df_selectedPolygons[idPolygons.upper()] == p].sort_values(Z)
-                ax_poly[w].plot(data2plot[w.upper()], data2plot[Z], label = "Polygon {0}".format(p))
-                ax_poly[w].set_xlabel(windList[w]),
-                ax_poly[w].set_ylabel("Height above ground (m)")
+                ax_poly[var].plot(data2plot[var.upper()], data2plot[Z], label = "Polygon {0}".format(p))
+                ax_poly[var].set_xlabel(windList[var]),
+                ax_poly[var].set_ylabel("Height above ground (m)")
                 plt.legend()
             if savePlot:
-                fig_poly[w].savefig(os.path.join(outputDirectory,
-                                                 simulationName + "_" + w + ".png"))
+                fig_poly[var].savefig(os.path.join(outputDirectory,
+                                                   simulationName + "_" + var + ".png"))
             
     
     # DEAL WITH LINES (ALONG LINE VERTICAL PROFILES)
     fig = None
     ax = None
     scale = None
-    if lines_file and srid_lines and idLines:
+    if isLines:
         if feedback:
             feedback.setProgressText('Calculates vertical sectional plot (along lines)...')    
-        # Get the resolution of the wind speed data
-        cursor.execute("""
-           SELECT ST_DISTANCE(a.{0}, b.{0}) AS dist 
-           FROM {1} AS a, {1} AS b 
-           WHERE a.{2} = 0 AND a.{3} = 0 AND b.{2} = 1 AND b.{3} = 0
-           """.format(GEOM_FIELD            , allPointsTab,
-                       RLON                 , RLAT))
-        horiz_res = round(cursor.fetchall()[0][0])
-        dist_max = horiz_res * (2 ** 0.5) / 2
-    
-        # Load lines
-        loadFile(cursor = cursor, 
-                 filePath = lines_file, 
-                 tableName = linesTab, 
-                 srid = srid_lines,
-                 srid_repro = urock_srid)
     
-        # Calculates a buffer of about half the horizontal resolution of the
-        # wind data around the lines and project the points contained in this buffer
-        # on the lines and calculate the distance to this point to the begining of the line
+        # Need regularly spaced levels for stream plot
+        z_plot = zLevels.copy()
+        if isStream:
+            z_plot[z_plot == 0] = 0 - float(horiz_res) / 2
+        
         # NOTE : ONLY LINES HAVING TWO POINTS ARE USED (SEGMENTS) 
         cursor.execute("""
-           {7}{8}
-           DROP TABLE IF EXISTS {0};
-           CREATE TABLE {0}
-               AS SELECT a.ID_POINT,
-                         a.{9},
-                         a.{10},
-                         a.{11},
-                         a.{12},
-                         ST_DISTANCE(ST_PROJECTPOINT(a.{1}, b.{1}), ST_STARTPOINT(b.{1})) AS DIST,
-                         ST_AZIMUTH(ST_STARTPOINT(b.{1}), ST_ENDPOINT(b.{1})) AS AZIMUTH,
-                         b.{2}
-               FROM {3} AS a, {4} AS b
-               WHERE ST_NPOINTS(b.{1}) = 2 AND a.{1} && ST_EXPAND(b.{1}, {5}) AND ST_DWITHIN(a.{1}, b.{1}, {5});
-           CALL CSVWrite('{6}', 'SELECT * FROM {0}');
-           """.format(pointsIntersecTab         , GEOM_FIELD,
-                       idLines                  , allPointsTab,
-                       linesTab                 , dist_max,
-                       outputPointsDir          , DataUtil.createIndex(tableName=allPointsTab, 
-                                                                       fieldName=GEOM_FIELD,
-                                                                       isSpatial=True),
-                       DataUtil.createIndex(tableName=linesTab, 
-                                            fieldName=GEOM_FIELD,
-                                            isSpatial=True),
-                       Z                        , WINDSPEED_X,
-                       WINDSPEED_Y              , WINDSPEED_Z))
-    
-        # Back to dataframe for the plotting of the wind speed for each level
-        df_selectedPoints = pd.read_csv(outputPointsDir, index_col = None, header = 0)
-        df_selectedPoints["PROJECTED_HORIZ_WIND"] = \
-            df_selectedPoints[WINDSPEED_X.upper()] * np.cos(df_selectedPoints["AZIMUTH"] - np.pi / 2) +\
-                df_selectedPoints[WINDSPEED_Y.upper()] * np.cos(df_selectedPoints["AZIMUTH"])
-    
-        # Where wind speed equal to 0, we assume it is buildings
-        buildIndexAll = df_selectedPoints[(df_selectedPoints[WINDSPEED_X.upper()]==0) &\
-                                          (df_selectedPoints[WINDSPEED_Y.upper()]==0) &\
-                                          (df_selectedPoints[WINDSPEED_Z.upper()]==0)].index
-        df_selectedPoints.loc[buildIndexAll, [WINDSPEED_X.upper(), WINDSPEED_Y.upper(), WINDSPEED_Z.upper()]] = np.nan
-            
-        uniques_z = pd.unique(df_selectedPoints[Z.upper()])
-        # Need to reindex regularly values for stream plot
-        if isStream:
-            uniques_z[uniques_z == 0] = 0 - float(horiz_res) / 2
-            df_selectedPoints[Z.upper()] = df_selectedPoints[Z.upper()].replace(0, 0 - float(horiz_res) / 2)
-            dic_all = {id_line : {zval : df_selectedPoints[(df_selectedPoints[idLines.upper()] == id_line) &
-                                                            (df_selectedPoints[Z.upper()] == zval)].groupby("DIST").mean()
-                                      for zval in uniques_z}
-                           for id_line in pd.unique(df_selectedPoints[idLines.upper()])}
-            dic_all = {id_line : {zval : conditional_interpolate(dic_all[id_line][zval].reindex(pd.Index(np.arange(0, 
-                                                                                                                   dic_all[id_line][zval].index.max(), 
-                                                                                                                   horiz_res))\
-                                                                                                .union(dic_all[id_line][zval].index)).sort_index(),
-                                                                 cols = [WINDSPEED_X.upper(),
-                                                                         WINDSPEED_Y.upper(),
-                                                                         WINDSPEED_Z.upper()],
-                                                                 limit = 2).reindex(pd.Index(np.arange(0, 
-                                                                                                       dic_all[id_line][zval].index.max(), 
-                                                                                                       horiz_res)))
-                                      for zval in dic_all[id_line]}
-                           for id_line in dic_all}
-                                               
+           SELECT {0}, ST_X(ST_STARTPOINT({1})), ST_Y(ST_STARTPOINT({1})),
+                  ST_X(ST_ENDPOINT({1})), ST_Y(ST_ENDPOINT({1}))
+           FROM {2}
+           WHERE ST_NPOINTS({1}) = 2
+           """.format(idLines, GEOM_FIELD, linesTab))
+        lines = cursor.fetchall()
+        
         if not fig and not ax:
             fig = {}
             ax = {}
         if not scale:
             scale = {}
-        for line in sorted(set(df_selectedPoints[idLines.upper()])):
+        for line, x0, y0, x1, y1 in sorted(lines, key = lambda l: l[0]):
             if not fig.get(line) and not ax.get(line):
                 fig[line], ax[line] = plt.subplots(figsize = (15,7))
-            df_plot = df_selectedPoints[df_selectedPoints[idLines.upper()] == line].groupby([Z.upper(), "DIST"]).mean()
+            
+            # Sample the line every horizontal resolution and interpolate
+            # the wind speed at each sample point for all levels
+            dist, xs, ys = sampleLine(x0 = x0, y0 = y0, x1 = x1, y1 = y1,
+                                      step = horiz_res)
+            i, j = toGridIndices(x = xs, y = ys, gridTransform = gridTransform)
+            (u_s, v_s, w_s), build_s = bilinearGather(fields = (u, v, w),
+                                                      isBuild = isBuild,
+                                                      i = i, j = j)
+            
+            # Horizontal wind speed projected along the line direction
+            length = max(np.hypot(x1 - x0, y1 - y0), np.finfo(float).eps)
+            wind_d = ((u_s * (x1 - x0) + v_s * (y1 - y0)) / length).T
+            wind_z = w_s.T
+            D, z = np.meshgrid(dist, z_plot)
             
             if isStream:
-                uniques_dist = dic_all[line][uniques_z[0]].index.unique()
-                D = np.array([[d for d in uniques_dist] for z in uniques_z])
-                z = np.array([[z for d in uniques_dist] for z in uniques_z])
-                wind_d = np.array([[dic_all[line][zval].loc[d, "PROJECTED_HORIZ_WIND"] for d in uniques_dist] for zval in uniques_z])
-                wind_z = np.array([[dic_all[line][zval].loc[d, WINDSPEED_Z.upper()] for d in uniques_dist] for zval in uniques_z])
                 ax[line].streamplot(D, z, wind_d, wind_z, density = STREAM_DENSITY,
                                     color = color)
             else:
-                uniques_dist = df_plot.index.unique(level = "DIST")
-                D = np.array([[d for d in uniques_dist] for z in uniques_z])
-                z = np.array([[z for d in uniques_dist] for z in uniques_z])
-                wind_d = np.array([[df_plot.loc[zval, d]["PROJECTED_HORIZ_WIND"] for d in uniques_dist] for zval in uniques_z])
-                wind_z = np.array([[df_plot.loc[zval, d][WINDSPEED_Z.upper()] for d in uniques_dist] for zval in uniques_z])
-                
                 if not scale.get(line):
-                    if np.max(np.abs(wind_d)) > 3 * np.median(np.abs(wind_d)):
-                        scale[line] = np.max(np.abs(wind_d)) / (1.5 * horiz_res)
+                    if np.nanmax(np.abs(wind_d)) > 3 * np.nanmedian(np.abs(wind_d)):
+                        scale[line] = np.nanmax(np.abs(wind_d)) / (1.5 * horiz_res)
                     else:
-                        scale[line] = np.median(np.abs(wind_d)) / (1.5 * horiz_res)
+                        scale[line] = np.nanmedian(np.abs(wind_d)) / (1.5 * horiz_res)
                 Q = ax[line].quiver(D, z, wind_d, wind_z, 
                                     units = 'xy', scale = scale[line],
                                     headwidth = HEAD_WIDTH, headlength = HEAD_LENGTH,
@@ -305,44 +235,13 @@ def plotSectionalViews(pluginDirectory, inputWindFile, lines_file='', srid_lines
                 ax[line].quiverkey(Q, 0.9, 0.9, 1, r'$1 \frac{m}{s}$', labelpos='E',
                                    coordinates='figure', color = color)
     
-                
-            # Set buildings using a given color
-            buildIndexes = df_plot[np.isnan(df_plot[WINDSPEED_X.upper()]) &\
-                                   np.isnan(df_plot[WINDSPEED_Y.upper()]) &\
-                                   np.isnan(df_plot[WINDSPEED_Z.upper()])].sort_index(axis = 0, 
-                                                                                      level = 1).index
-            # Sort distances from start of the line and z from ground
-            sorted_dist = pd.Index(np.sort(df_plot.index.unique(level = "DIST")))
-            sorted_z = pd.Index(np.sort(z[:,0]))
-            rect = {}
-            for i, bcell in enumerate(buildIndexes):
-                # Get starting height and height of building rectangle
-                loc_z = sorted_z.get_loc(bcell[0])
-                if loc_z == 0:
-                    rec_z0 = sorted_z[loc_z]
-                    rec_height = 0.5 * (sorted_z[loc_z + 1] - sorted_z[loc_z])
-                elif loc_z == sorted_z.size - 1:
-                    rec_z0 = 0.5 * (sorted_z[loc_z - 1] + sorted_z[loc_z])
-                    rec_height = sorted_z[loc_z] - sorted_z[loc_z - 1]            
-                else:
-                    rec_z0 = sorted_z[loc_z] - 0.5 * (sorted_z[loc_z] - sorted_z[loc_z - 1])
-                    rec_height = 0.5 * (sorted_z[loc_z + 1] - sorted_z[loc_z - 1])                
-                # Get starting distance and width of building rectangle
-                loc_d = sorted_dist.get_loc(bcell[1])    
-                if loc_d == 0:
-                    rec_d0 = sorted_dist[loc_d] - 0.5 * (sorted_dist[loc_d + 1] - sorted_dist[loc_d])
-                    rec_width = sorted_dist[loc_d + 1] - sorted_dist[loc_d]
-                elif loc_d == sorted_dist.size - 1:
-                    rec_d0 = 0.5 * (sorted_dist[loc_d-1] + sorted_dist[loc_d])
-                    rec_width = sorted_dist[loc_d] - sorted_dist[loc_d - 1] 
-                else:
-                    rec_d0 = 0.5 * (sorted_dist[loc_d-1] + sorted_dist[loc_d])
-                    rec_width = 0.5 * (sorted_dist[loc_d + 1] - sorted_dist[loc_d - 1])
-                
-                # Define and plot the building rectangle
-                rect[i] = Rectangle((rec_d0, rec_z0), rec_width, rec_height,
-                                    color='grey')
-                ax[line].add_patch(rect[i])
+            # Set buildings using a given color (one cell per sample point and level)
+            if build_s.any():
+                ax[line].pcolormesh(cellEdges(dist, isStart = False),
+                                    cellEdges(z_plot, isStart = True),
+                                    np.ma.masked_where(~build_s.T, build_s.T),
+                                    cmap = ListedColormap(['grey']),
+                                    shading = "flat")
             if savePlot:
                 fig[line].savefig(os.path.join(outputDirectory, simulationName + "_line" + str(line) + ".png"))
             else:
@@ -355,11 +254,287 @@ def plotSectionalViews(pluginDirectory, inputWindFile, lines_file='', srid_lines
 
     return fig, ax, scale, fig_poly, ax_poly
             
-def conditional_interpolate(df, cols, limit = 2):
-    s = df[cols].isna().prod(axis = 1) == 0
-    s = s.ne(s.shift()).cumsum()
-    m = df[cols].groupby([s, df[cols].isna().prod(axis = 1) == 0])[cols[0]].transform('size').where(df[cols].isnull().prod(axis = 1).astype(bool))
+def selectWindow(cursor, ds, listOfTables, buffer):
+    """ Select the part of the (lazily opened) wind dataset covering the
+    geometries of a set of tables, so that only the NetCDF chunks touched
+    by these geometries are read.
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        cursor: conn.cursor
+            A cursor object, used to perform spatial SQL queries
+        ds: xr.Dataset
+            Wind speed dataset (3D wind group of the URock NetCDF file)
+        listOfTables: list
+            Name of the tables containing the geometries
+        buffer: float
+            Distance (in the table SRID unit) used to extend the geometry extent
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        ds: xr.Dataset
+            Wind speed dataset restricted to the geometry extent"""
+    if not listOfTables:
+        return ds
+    cursor.execute("""
+       SELECT ST_XMIN({0}), ST_XMAX({0}), ST_YMIN({0}), ST_YMAX({0})
+       FROM (SELECT ST_TRANSFORM(ST_EXPAND(ST_EXTENT({0}), {1}, {1}), 4326) AS {0}
+             FROM ({2}))
+       """.format(GEOM_FIELD, buffer,
+                  " UNION ALL ".join(["SELECT {0} FROM {1}".format(GEOM_FIELD, t)
+                                      for t in listOfTables])))
+    lonMin, lonMax, latMin, latMax = cursor.fetchall()[0]
+    
+    # Only the 2D coordinates are read to identify the window
+    lon = ds[LON].values
+    lat = ds[LAT].values
+    ind_rlon, ind_rlat = np.where((lon >= lonMin) & (lon <= lonMax) &
+                                  (lat >= latMin) & (lat <= latMax))
+    if ind_rlon.size == 0:
+        return ds.isel(rlon = slice(0, 0), rlat = slice(0, 0))
+    
+    return ds.isel(rlon = slice(ind_rlon.min(), ind_rlon.max() + 1),
+                   rlat = slice(ind_rlat.min(), ind_rlat.max() + 1))
+
+def gridAffineTransform(cursor, lon, lat, srid):
+    """ Calculates the affine transformation between the (rlon, rlat) indices
+    of the (rotated) wind field grid and the coordinates in the URock SRID.
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        cursor: conn.cursor
+            A cursor object, used to perform spatial SQL queries
+        lon: np.array
+            2D (rlon, rlat) array of longitude of the grid points
+        lat: np.array
+            2D (rlon, rlat) array of latitude of the grid points
+        srid: int
+            SRID used in the URock calculation
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        gridTransform: dictionary
+            Coordinates of the first grid point ("origin"), matrix converting
+            indices into coordinates ("toCoord") and its inverse ("toIndex")
+            (None if the grid has less than 2 points along rlon or rlat)"""
+    nx, ny = lon.shape
+    if nx < 2 or ny < 2:
+        return None
+    
+    # Only three corners of the grid are needed to define the transformation
+    corners = [(0, 0), (nx - 1, 0), (0, ny - 1)]
+    cursor.execute(" UNION ALL ".join(["""
+       SELECT {0}, ST_X(G), ST_Y(G)
+       FROM (SELECT ST_TRANSFORM(ST_SETSRID(ST_MAKEPOINT({1}, {2}), 4326), {3}) AS G)
+       """.format(k, lon[i, j], lat[i, j], srid) for k, (i, j) in enumerate(corners)]))
+    coord = np.array([c[1:] for c in sorted(cursor.fetchall())], dtype = float)
+    toCoord = np.column_stack([(coord[1] - coord[0]) / (nx - 1),
+                               (coord[2] - coord[0]) / (ny - 1)])
+    
+    return {"origin": coord[0],
+            "toCoord": toCoord,
+            "toIndex": np.linalg.inv(toCoord)}
+
+def toGridIndices(x, y, gridTransform):
+    """ Convert coordinates (in the URock SRID) into fractional grid indices.
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        x: np.array
+            x coordinates of the points
+        y: np.array
+            y coordinates of the points
+        gridTransform: dictionary
+            Grid transformation (as returned by 'gridAffineTransform')
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        i: np.array
+            Fractional index of the points along the rlon axis
+        j: np.array
+            Fractional index of the points along the rlat axis"""
+    i, j = gridTransform["toIndex"] @ np.vstack([np.asarray(x, dtype = float) - gridTransform["origin"][0],
+                                                 np.asarray(y, dtype = float) - gridTransform["origin"][1]])
+    
+    return i, j
+
+def sampleLine(x0, y0, x1, y1, step):
+    """ Regularly sample a segment (the first and last points are included).
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        x0, y0: float
+            Coordinates of the start point of the segment
+        x1, y1: float
+            Coordinates of the end point of the segment
+        step: float
+            Approximative distance between two sample points
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        dist: np.array
+            Distance of each sample point to the start point
+        x: np.array
+            x coordinate of each sample point
+        y: np.array
+            y coordinate of each sample point"""
+    length = np.hypot(x1 - x0, y1 - y0)
+    dist = np.linspace(0, length, max(int(round(length / step)), 1) + 1)
+    ratio = dist / max(length, np.finfo(float).eps)
+    
+    return dist, x0 + ratio * (x1 - x0), y0 + ratio * (y1 - y0)
+
+def bilinearGather(fields, isBuild, i, j):
+    """ Bilinear interpolation of 3D (rlon, rlat, z) fields at fractional
+    grid indices, for all levels at once. Building cells are not used in the
+    interpolation and a sample point is considered as building when its
+    nearest grid cell is a building.
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        fields: tuple of np.array
+            3D (rlon, rlat, z) fields to interpolate
+        isBuild: np.array of boolean
+            3D (rlon, rlat, z) array, True for building cells
+        i: np.array
+            Fractional index of the sample points along the rlon axis
+        j: np.array
+            Fractional index of the sample points along the rlat axis
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        values: list of np.array
+            (sample point, z) interpolated values of each field (NaN for
+            building and out of grid sample points)
+        build: np.array of boolean
+            (sample point, z) array, True for building sample points"""
+    nx, ny = isBuild.shape[0:2]
+    outside = (i < -0.5) | (i > nx - 0.5) | (j < -0.5) | (j > ny - 0.5)
+    i = np.clip(i, 0, nx - 1)
+    j = np.clip(j, 0, ny - 1)
+    i0 = np.minimum(np.floor(i).astype(int), nx - 2)
+    j0 = np.minimum(np.floor(j).astype(int), ny - 2)
+    di = i - i0
+    dj = j - j0
+    
+    # Four neighbours of each sample point: (4, sample point) arrays
+    ii = np.vstack([i0, i0 + 1, i0, i0 + 1])
+    jj = np.vstack([j0, j0, j0 + 1, j0 + 1])
+    weights = np.vstack([(1 - di) * (1 - dj), di * (1 - dj),
+                         (1 - di) * dj, di * dj])
+    
+    # (4, sample point, z) weights where buildings are excluded
+    validWeights = weights[:, :, np.newaxis] * ~isBuild[ii, jj, :]
+    sumWeights = validWeights.sum(axis = 0)
+    sumWeights[sumWeights == 0] = np.nan
+    
+    build = isBuild[np.rint(i).astype(int), np.rint(j).astype(int), :]
+    build[outside, :] = False
+    values = []
+    for field in fields:
+        val = (validWeights * field[ii, jj, :]).sum(axis = 0) / sumWeights
+        val[build | outside[:, np.newaxis]] = np.nan
+        values.append(val)
+        
+    return values, build
+
+def polygonMask(rings, gridTransform, shape):
+    """ Rasterize a polygon on the wind field grid (a grid cell belongs to
+    the polygon when its center intersects the polygon).
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        rings: list of np.array
+            Coordinates (in the URock SRID) of each ring of the polygon
+        gridTransform: dictionary
+            Grid transformation (as returned by 'gridAffineTransform')
+        shape: tuple
+            Number of grid points along the rlon and rlat axis
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        mask: np.array of boolean
+            2D (rlon, rlat) array, True for the cells within the polygon"""
+    mask = np.zeros(shape, dtype = bool)
+    if not rings:
+        return mask
+    # Rings are converted in index coordinates
+    ringsInd = [np.column_stack(toGridIndices(x = r[:, 0], y = r[:, 1],
+                                              gridTransform = gridTransform))
+                for r in rings]
+    allInd = np.vstack(ringsInd)
+    iMin, jMin = np.maximum(np.ceil(allInd.min(axis = 0) - INDEX_TOLERANCE).astype(int), 0)
+    iMax, jMax = np.minimum(np.floor(allInd.max(axis = 0) + INDEX_TOLERANCE).astype(int),
+                            np.array(shape) - 1)
+    if iMin > iMax or jMin > jMax:
+        return mask
+    
+    # The point-in-polygon test is only performed within the polygon bounding box
+    iWin, jWin = np.meshgrid(np.arange(iMin, iMax + 1), np.arange(jMin, jMax + 1),
+                             indexing = "ij")
+    mask[iMin:iMax + 1, jMin:jMax + 1] = \
+        pointsInRings(x = iWin.ravel().astype(float),
+                      y = jWin.ravel().astype(float),
+                      rings = ringsInd).reshape(iWin.shape)
+    
+    return mask
+
+def polygonProfile(u, v, w, isBuild, zLevels, idPolygon, idName):
+    """ Calculates the mean wind speed profile of a set of grid cells
+    (building cells being excluded).
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        u, v, w: np.array
+            (cell, z) wind speed along x, y and z
+        isBuild: np.array of boolean
+            (cell, z) array, True for building cells
+        zLevels: np.array
+            Height of each level
+        idPolygon: object
+            ID of the polygon
+        idName: str
+            Name of the polygon ID column
+    
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        df_profile: pd.DataFrame
+            Mean wind speed for each level containing at least one air cell"""
+    air = ~isBuild
+    nAir = air.sum(axis = 0)
+    
+    def meanByLevel(values):
+        return np.where(air, values, 0).sum(axis = 0) / np.maximum(nAir, 1)
+    
+    hws = (u ** 2 + v ** 2) ** 0.5
+    df_profile = pd.DataFrame({idName: idPolygon,
+                               Z: zLevels,
+                               WINDSPEED_X.upper(): meanByLevel(u),
+                               WINDSPEED_Y.upper(): meanByLevel(v),
+                               WINDSPEED_Z.upper(): meanByLevel(w),
+                               HORIZ_WIND_SPEED.upper(): meanByLevel(hws),
+                               WIND_SPEED.upper(): meanByLevel((hws ** 2 + w ** 2) ** 0.5)})
+    
+    return df_profile[nAir > 0]
+
+def cellEdges(centers, isStart):
+    """ Calculates the edges of the cells surrounding a set of sorted centers.
+    
+    Parameters
+    _ _ _ _ _ _ _ _ _ _ 
+        centers: np.array
+            Sorted cell centers
+        isStart: boolean
+            Whether the first cell starts at its center (ground level) or not
     
-    result = df.interpolate(limit_area='inside', method='slinear').mask(m >= limit)
+    Returns
+    _ _ _ _ _ _ _ _ _ _ 
+        edges: np.array
+            Edges of the cells (one more value than the centers)"""
+    if centers.size < 2:
+        return np.array([centers[0] - 0.5, centers[0] + 0.5])
+    middle = 0.5 * (centers[1:] + centers[:-1])
+    first = centers[0] if isStart else centers[0] - (middle[0] - centers[0])
     
-    return result
\ No newline at end of file
+    return np.concatenate([[first], middle,
+                           [centers[-1] + (centers[-1] - middle[-1])]])
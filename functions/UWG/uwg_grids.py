@@ -0,0 +1,270 @@
+import numpy as np
+import json
+import os
+import shutil
+import traceback
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from ...util.umep_uwg_export_component import get_uwg_file, read_uwg_file
+from ...util.processContext import process_context
+
+# UWG runs for all grids of a polygon layer. Each grid is run in a worker process and the output EPW of the grid is
+# converted to UMEP format from the weather data of the model in memory. The rural EPW is parsed and converted once.
+# Finished grids are recorded in a manifest in the output folder with the modification time and size of their UWG input
+# file, so that an interrupted run can be resumed with the same settings. Grids whose input file changed are run again.
+
+# Seconds between two checks of the cancel button while waiting for the workers
+WAIT_TIMEOUT = 1
+
+# Manifest of the finished grids (in the output folder)
+MANIFEST = 'uwg_manifest.json'
+
+# Value of missing or non-numeric EPW fields (as np.genfromtxt with filling_values=99999)
+EPW_MISSING = 99999
+
+# Building fraction below which grids are not calculated if rural grids are excluded
+RURAL_BLD_DENSITY = 0.005
+
+UMEP_HEADER = '%iy  id  it imin   Q*      QH      QE      Qs      Qf    Wind    RH     Td     press   rain ' \
+              '   Kdn    snow    ldown   fcld    wuh     xsmd    lai_hr  Kdiff   Kdir    Wd'
+UMEP_FORMAT = '%d %d %d %d %.2f %.2f %.2f %.2f %.2f %.5f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
+              '%.2f %.2f %.2f %.2f %.2f %.2f %.2f'
+
+def read_epw(epw_path):
+    '''Weather data of an EPW file (8 header lines)'''
+    return np.genfromtxt(epw_path, skip_header=8, delimiter=',', filling_values=EPW_MISSING)
+
+def epw_field(value):
+    '''Value of an EPW field, parsed as read_epw'''
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return EPW_MISSING
+
+def epw_values(rows):
+    '''Weather data of the rows (lists of fields) of an EPW in memory, as read_epw'''
+    return np.array([[epw_field(value) for value in row] for row in rows], dtype=float)
+
+def epw2umep(met_old):
+    '''UMEP meteorological forcing (24 columns) of EPW weather data'''
+    met_new = np.zeros((met_old.shape[0], 24)) - 999
+
+    # yyyy
+    met_new[:, 0] = 1985
+    met_new[met_old.shape[0] - 1, 0] = 1986
+
+    # hour
+    met_new[:, 2] = met_old[:, 3]
+    test = met_new[:, 2] == 24
+    met_new[test, 2] = 0
+
+    # day of year (1985 and 1986 are not leap years)
+    dayspermonth = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+    daysbefore = np.concatenate(([0], np.cumsum(dayspermonth)))
+    mm = np.clip((met_old[:, 1] - 1).astype(int), 0, 12)
+    met_new[:, 1] = daysbefore[mm] + met_old[:, 2]
+
+    met_new[np.where(met_new[:, 2] == 0), 1] = met_new[np.where(met_new[:, 2] == 0), 1] + 1
+    met_new[met_old.shape[0] - 1, 1] = 1
+
+    # minute
+    met_new[:, 3] = 0
+
+    # met variables
+    met_new[:, 11] = met_old[:, 6]  # Ta
+    met_new[:, 10] = met_old[:, 8]  # Rh
+    met_new[:, 12] = met_old[:, 9] / 1000.  # P
+    met_new[:, 16] = met_old[:, 12]  # Ldown
+    met_new[:, 14] = met_old[:, 13]  # Kdown
+    met_new[:, 22] = met_old[:, 14]  # Kdir
+    met_new[:, 21] = met_old[:, 15]  # Kdiff
+    met_new[:, 23] = met_old[:, 20]  # Wdir
+    met_new[:, 9] = met_old[:, 21]  # Ws
+    met_new[:, 13] = met_old[:, 33]  # Rain
+    met_new[np.where(met_new[:, 13] == 999), 13] = 0
+
+    return met_new
+
+def output_path(outputDir, prefix, attr, umepformat):
+    '''Output file of a grid'''
+    if umepformat:
+        return outputDir + '/' + prefix + '_' + str(attr) + '_UMEP_UWG.txt'
+    else:
+        return outputDir + '/' + prefix + '_' + str(attr) + '_UWG.epw'
+
+def save_umep(met, outputDir, prefix, attr):
+    '''Saves the UMEP forcing of a grid'''
+    np.savetxt(output_path(outputDir, prefix, attr, True), met, fmt=UMEP_FORMAT, header=UMEP_HEADER, comments='')
+
+def save_rural(inputMet, rural_forcing, outputDir, prefix, attr, umepformat):
+    '''Output of a grid not calculated (rural grid); the rural weather'''
+    if umepformat:
+        save_umep(rural_forcing, outputDir, prefix, attr)
+    else:
+        shutil.copy(inputMet, Path(output_path(outputDir, prefix, attr, False)))
+
+def run_grid(inputDir, prefix, attr, mm, dd, nDays, dtSim, inputMet, outputDir, umepformat, excludeRural):
+    '''Runs UWG for one grid and saves the output. Returns the status of the grid ('done', 'rural' if the grid is
+    not calculated or 'failed') and, if failed, the error message and traceback'''
+    from uwg import UWG
+
+    name = prefix + '_' + str(attr)
+
+    ## generate input files for UWG
+    uwgDict = read_uwg_file(inputDir, name)
+    uwgDict['Month'] = mm
+    uwgDict['Day'] = dd
+    uwgDict['nDay'] = nDays
+    uwgDict['dtSim'] = dtSim
+    get_uwg_file(uwgDict, inputDir, name)
+
+    if excludeRural and (uwgDict['bldDensity'] < RURAL_BLD_DENSITY):
+        return 'rural', None, None
+
+    epw_path = inputDir + '/' + name + '.epw'
+    uwg_path = inputDir + '/' + name + '_UWG.epw'
+    param_path = inputDir + '/' + name + '.uwg'
+
+    shutil.copy(inputMet, epw_path)
+
+    try:
+        model = UWG.from_param_file(param_path, epw_path=epw_path)
+        model.generate()
+        model.simulate()
+        model.write_epw()
+
+        if umepformat:
+            # weather data of the model (written to uwg_path by write_epw)
+            epwinput = getattr(model, 'epwinput', None)
+            if epwinput is not None:
+                epwdata_uwg = epw_values(epwinput)
+            else:
+                epwdata_uwg = read_epw(uwg_path)
+            save_umep(epw2umep(epwdata_uwg), outputDir, prefix, attr)
+            os.remove(uwg_path)
+        else:
+            shutil.move(uwg_path, Path(output_path(outputDir, prefix, attr, False)))
+
+        os.remove(epw_path)
+
+    except Exception as e:
+        return 'failed', str(e), traceback.format_exc()
+
+    return 'done', None, None
+
+def run_settings(inputDir, prefix, startDate, nDays, dtSim, inputMet, umepformat, excludeRural):
+    '''Settings of a run. Grids of a manifest are only reused by a run with the same settings'''
+    return {'inputDir': str(inputDir), 'prefix': prefix, 'startDate': startDate[0:10], 'nDays': nDays,
+            'dtSim': dtSim, 'inputMet': str(inputMet), 'inputMetTime': os.stat(inputMet).st_mtime_ns,
+            'umepformat': bool(umepformat), 'excludeRural': bool(excludeRural)}
+
+def input_stamp(inputDir, prefix, attr):
+    '''Modification time and size of the UWG input file (.uwg) of a grid'''
+    stat = os.stat(inputDir + '/' + prefix + '_' + str(attr) + '.uwg')
+    return [stat.st_mtime_ns, stat.st_size]
+
+def read_manifest(outputDir, settings):
+    '''Grids (status and input stamp) finished by a previous run with the same settings, with output left and with
+    an unchanged input file'''
+    try:
+        with open(os.path.join(outputDir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+    if manifest.get('settings') != settings:
+        return {}
+
+    finished = {}
+    for attr, grid in manifest.get('grids', {}).items():
+        if not isinstance(grid, dict):
+            continue
+        if not os.path.isfile(output_path(outputDir, settings['prefix'], attr, settings['umepformat'])):
+            continue
+        try:
+            stamp = input_stamp(settings['inputDir'], settings['prefix'], attr)
+        except OSError:
+            continue
+        if grid.get('input') == stamp:
+            finished[attr] = grid
+
+    return finished
+
+def write_manifest(outputDir, settings, finished):
+    '''Writes the finished grids to the manifest (replaced in one step)'''
+    path = os.path.join(outputDir, MANIFEST)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'settings': settings, 'grids': finished}, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+def run_grids(grids, inputDir, prefix, startDate, nDays, dtSim, inputMet, outputDir, umepformat, excludeRural,
+              workers, feedback):
+    '''Runs UWG for the grids (ids) on a pool of workers. Grids finished by an interrupted run with the same settings
+    are not calculated again. Falls back to a serial run if the worker processes can not be started. Returns the
+    grids and their status'''
+    mm = startDate[5:7]
+    dd = startDate[8:10]
+    settings = run_settings(inputDir, prefix, startDate, nDays, dtSim, inputMet, umepformat, excludeRural)
+    args = (mm, dd, nDays, dtSim, inputMet, outputDir, umepformat, excludeRural)
+
+    finished = read_manifest(outputDir, settings)
+    remaining = [attr for attr in grids if str(attr) not in finished]
+    if remaining.__len__() < grids.__len__():
+        feedback.setProgressText(str(grids.__len__() - remaining.__len__()) + ' grid(s) already calculated. Resuming run')
+
+    # rural weather is parsed and converted once
+    rural_forcing = None
+    if umepformat:
+        rural_forcing = epw2umep(read_epw(inputMet))
+        np.savetxt(outputDir + '/metdata_UMEP.txt', rural_forcing, fmt=UMEP_FORMAT, header=UMEP_HEADER, comments='')
+
+    def grid_finished(attr, result):
+        status, message, trace = result
+        if status == 'rural':
+            feedback.setProgressText("Grid: " + str(attr) + ' not calculated. Less than ' + str(RURAL_BLD_DENSITY) + ' in building fraction.')
+            save_rural(inputMet, rural_forcing, outputDir, prefix, attr, umepformat)
+        elif status == 'failed':
+            feedback.pushWarning("Calculating grid " + str(attr) + ' failed: ' + message)
+            feedback.pushWarning('To get the full traceback error message, open the Python console in QGIS and re-run the simulation.')
+            feedback.pushWarning('If you cannot solve the error yourself, report an issue to our code reporitory (see UMEP-Manual for details).')
+            print('Traceback error message while caclulation grid: ' + str(attr))
+            print(trace)
+        else:
+            feedback.setProgressText("UWG finished grid: " + str(attr))
+
+        if status != 'failed':
+            # stamp of the input file as rewritten by run_grid
+            finished[str(attr)] = {'status': status, 'input': input_stamp(inputDir, prefix, attr)}
+            write_manifest(outputDir, settings, finished)
+        remaining.remove(attr)
+        feedback.setProgress(int((grids.__len__() - remaining.__len__()) * 100 / grids.__len__()))
+
+    if (workers > 1) & (remaining.__len__() > 1):
+        feedback.setProgressText('UWG calculating ' + str(remaining.__len__()) + ' grids on ' + str(workers) + ' processes')
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) as executor:
+                futures = {executor.submit(run_grid, inputDir, prefix, attr, *args): attr for attr in remaining}
+                pending = set(futures)
+                while pending:
+                    if feedback.isCanceled():
+                        for future in pending:
+                            future.cancel()
+                        break
+                    done, pending = wait(pending, timeout=WAIT_TIMEOUT, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        grid_finished(futures[future], future.result())
+        except (BrokenProcessPool, OSError) as e:
+            feedback.setProgressText('Could not calculate grids in parallel (' + str(e) + '). Calculating grids serially...')
+
+    # Serial run, or the grids left if the worker processes failed
+    for attr in list(remaining):
+        if feedback.isCanceled():
+            break
+        feedback.setProgressText("UWG calculating grid: " + str(attr))
+        grid_finished(attr, run_grid(inputDir, prefix, attr, *args))
+
+    if feedback.isCanceled():
+        feedback.setProgressText("Calculation cancelled")
+
+    return {attr: grid['status'] for attr, grid in finished.items()}
@@ -0,0 +1,93 @@
+import numpy as np
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+# Nighttime urban heat island (UHI) statistics of UWG output (<prefix>_<grid>_UMEP_UWG.txt) for all grids. The
+# output of the grids is read on a pool of threads into one array (grid, time, variable) and the UHI (urban minus
+# rural air temperature) and all statistics are calculated for all grids at once.
+
+# Columns of the UMEP met format
+DOY_COLUMN = 1
+TA_COLUMN = 11
+KDOWN_COLUMN = 14
+
+# Timesteps after the last day included to get the whole final night
+NIGHT_EXTENSION = 12
+
+# Statistics (names used as attribute headers) and the percentile of each statistic after mean and max
+STATISTICS = ('mean', 'max', 'median', '75precentile', '95precentile')
+PERCENTILES = (50, 75, 95)
+
+def read_output(filepath):
+    '''UMEP met data of a UWG output (or the rural met data)'''
+    return np.atleast_2d(np.genfromtxt(filepath, skip_header=1))
+
+def load_outputs(filepaths, feedback):
+    '''Output of all grids as one array (grid, time, variable), padded with NaN. The files are read on a pool of
+    threads. Returns None if cancelled'''
+    outputs = []
+    with ThreadPoolExecutor() as executor:
+        for index, data in enumerate(executor.map(read_output, filepaths)):
+            if feedback.isCanceled():
+                executor.shutdown(wait=False, cancel_futures=True)
+                return None
+            feedback.setProgress(int(((index + 1) * 100) / filepaths.__len__()))
+            outputs.append(data)
+
+    rows = max([data.shape[0] for data in outputs] + [0])
+    columns = max([data.shape[1] for data in outputs] + [0])
+    stacked = np.full((outputs.__len__(), rows, columns), np.nan)
+    for i, data in enumerate(outputs):
+        stacked[i, :data.shape[0], :data.shape[1]] = data
+
+    return stacked
+
+def last_row(doy, endD):
+    '''Last row of the period; the first row of endD or the last row of endD - 1 if endD is after the end of the
+    data. Rows are along the last axis. Raises ValueError if that day is not in the data'''
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        after_end = endD > np.nanmax(doy, axis=-1)
+    if np.any(np.where(after_end, ~np.any(doy == endD - 1, axis=-1), ~np.any(doy == endD, axis=-1))):
+        raise ValueError('End day not present in output data')
+    last = doy.shape[-1] - 1 - np.argmax((doy == endD - 1)[..., ::-1], axis=-1)
+    first = np.argmax(doy == endD, axis=-1)
+
+    return np.where(after_end, last, first)
+
+def night_selection(data, dataref, startD, endD):
+    '''Nighttime (no global radiation) timesteps from the first timestep of startD until the end of the final night,
+    for each grid (grid, time), in the grids and the rural data'''
+    doy = data[:, :, DOY_COLUMN]
+    if not np.all(np.any(doy == startD, axis=1)):
+        raise ValueError('Start day not present in output data')
+    start = np.argmax(doy == startD, axis=1)
+    ending = last_row(doy, endD)
+    ending_ref = last_row(dataref[:, DOY_COLUMN], endD)
+
+    rows = np.arange(doy.shape[1])[np.newaxis, :]
+    selected = (rows >= start[:, np.newaxis]) & (rows < (ending[:, np.newaxis] + NIGHT_EXTENSION))
+    selected &= rows < ending_ref + NIGHT_EXTENSION
+    selected &= data[:, :, KDOWN_COLUMN] < 1.
+
+    with np.errstate(invalid='ignore'):
+        selected[:, :dataref.shape[0]] &= dataref[np.newaxis, :doy.shape[1], KDOWN_COLUMN] < 1.
+    selected[:, dataref.shape[0]:] = False
+
+    return selected
+
+def uhi_statistics(data, dataref, startD, endD):
+    '''All statistics (STATISTICS) of the nighttime UHI of each grid. Returns a dictionary of arrays (grids)'''
+    selected = night_selection(data, dataref, startD, endD)
+    rows = min(data.shape[1], dataref.shape[0])
+    uhi = np.full(data.shape[:2], np.nan)
+    uhi[:, :rows] = data[:, :rows, TA_COLUMN] - dataref[np.newaxis, :rows, TA_COLUMN]
+    uhi[~selected] = np.nan
+
+    with warnings.catch_warnings():
+        # grids without nighttime timesteps give NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        results = [np.nanmean(uhi, axis=1), np.nanmax(uhi, axis=1)]
+        results.extend(np.nanpercentile(uhi, PERCENTILES, axis=1))
+
+    return dict(zip(STATISTICS, results))
@@ -43,6 +43,7 @@ import sys
 from ..util import f90nml
 import shutil
 from ..util.misc import saverasternd, saveraster
+from ..functions.SUEWS import suews_output as suewsoutput
 
 # def saverasternd(gdal_data, filename, raster):
 #     rows = gdal_data.RasterYSize
@@ -335,8 +336,6 @@ class ProcessingSuewsAnalyzerAlgorithm(QgsProcessingAlgorithm):
         #         return
 
         # load, cut data and calculate statistics
-        statvectemp = [0]
-        statresult = [0]
         idvec = [0]
         vlayer = inputPolygonlayer #QgsVectorLayer(poly.source(), "polygon", "ogr")
         prov = vlayer.dataProvider()
@@ -397,8 +396,10 @@ class ProcessingSuewsAnalyzerAlgorithm(QgsProcessingAlgorithm):
             raise QgsProcessingException('Selected timeperiod not present in output data. Choose a period within the year(s): ' + str(yeartest[:]))
 
         # for i in range(0, self.idgrid.shape[0]): # loop over vector grid instead
+        # SUEWS output of all grids, read from the columnar cache (created the first time a file is analyzed)
         index = 1
         nGrids = vlayer.featureCount()
+        outputs = []
         for f in vlayer.getFeatures():
             feedback.setProgress(int((index * 100) / nGrids))
             if feedback.isCanceled():
@@ -407,60 +408,21 @@ class ProcessingSuewsAnalyzerAlgorithm(QgsProcessingAlgorithm):
             index += 1
 
             gid = str(int(f.attributes()[idx]))
-            datawhole = np.genfromtxt(self.fileoutputpath + '/' + self.fileCode + gid + '_'
-                                     + str(self.YYYY) + '_SUEWS_' + str(self.resout) + '.txt', skip_header=1,
-                                     missing_values='**********', filling_values=-9999)
-
-            writeoption = datawhole.shape[1]
-            if writeoption > 38:
-                altpos = 52
-            else:
-                altpos = 25
-            feedback.setProgressText("Processing grid: " + str(gid))
-            
-            start = np.min(np.where(datawhole[:, 1] == startD))
-            if endD > np.max(datawhole[:, 1]):
-                ending = np.max(np.where(datawhole[:, 1] == endD - 1))
-            else:
-                ending = np.min(np.where(datawhole[:, 1] == endD))
-            data1 = datawhole[start:ending, :]
-
-            # if self.dlg.checkBox_TOD.isChecked():
-            #     hh = self.dlg.comboBox_HH.currentText()
-            #     hhdata = np.where(data1[:, 2] == int(hh))
-            #     data1 = data1[hhdata, :]
-            #     minute = self.dlg.comboBox_mm.currentText()
-            #     mmdata = np.where(data1[0][:, 3] == int(minute))
-            #     data1 = data1[0][mmdata, :]
-            #     data1 = data1[0][:]
-            # else:
-            
-            if dayTypeStr == '1':
-                data1 = data1[np.where(data1[:, altpos] < 90.), :]
-                data1 = data1[0][:]
-            if dayTypeStr == '2':
-                data1 = data1[np.where(data1[:, altpos] > 90.), :]
-                data1 = data1[0][:]
-
-            vardata = data1[:, self.id]
-
-            if statTypeStr == '0':
-                statresult = np.nanmean(vardata)
-            if statTypeStr == '1':
-                statresult = np.nanmin(vardata)
-            if statTypeStr == '2':
-                statresult = np.nanmax(vardata)
-            if statTypeStr == '3':
-                statresult = np.nanmedian(vardata)
-            if statTypeStr == '4':
-                statresult = np.nanpercentile(vardata, 75) - np.percentile(vardata, 25)
-
-            statvectemp = np.vstack((statvectemp, statresult))
+            feedback.setProgressText("Reading grid: " + str(gid))
+            outputs.append(suewsoutput.SuewsOutput(self.fileoutputpath + '/' + self.fileCode + gid + '_'
+                                                   + str(self.YYYY) + '_SUEWS_' + str(self.resout) + '.txt'))
             idvec = np.vstack((idvec, int(gid)))
 
-        statvector = statvectemp[1:, :]
-        # fix_print_with_import
-        statmat = np.hstack((idvec[1:, :], statvector))
+        if feedback.isCanceled():
+            return {self.SUEWS_GRID_OUT: None}
+
+        # statistics of all grids in one pass
+        try:
+            statresult = suewsoutput.analyze_grids(outputs, self.id, startD, endD, statType, int(dayTypeStr))
+        except ValueError as e:
+            raise QgsProcessingException(str(e) + ' (' + startday + ' - ' + endday + ')')
+
+        statmat = np.hstack((idvec[1:, :], statresult[:, np.newaxis]))
         
         # numformat2 = '%8d %5.3f'
         # header2 = 'id value'
@@ -95,7 +95,7 @@ from ..functions.TreePlanter.TreePlanter import TreePlanterHillClimber
 from ..functions.TreePlanter.TreePlanter.TreePlanterClasses import Inputdata, Treedata, Regional_groups, ClippedInputdata, Treerasters
 from ..functions.TreePlanter.TreePlanter import GreedyAlgorithm
 # from ..functions.TreePlanter.SOLWEIG1D.SOLWEIG_1D import tmrt_1d_fun
-from ..functions.TreePlanter.SOLWEIG1D.SOLWEIG1D_2023a import tmrt_1d_fun
+from ..functions.TreePlanter.SOLWEIG1D.SOLWEIG1D_2023a import tmrt_1d_cached
 # from ..functions.TreePlanter.treeplanterclasses import Treedata
 # from ..functions.TreePlanter.treeplanterclasses import Regional_groups
 # from ..functions.TreePlanter.treeplanterclasses import ClippedInputdata
@@ -123,6 +123,9 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
     INCLUDE_OUTSIDE = 'INCLUDE_OUTSIDE'
     RANDOM_STARTING = 'RANDOM_STARTING'
     GREEDY_ALGORITHM = 'GREEDY_ALGORITHM'
+    WORKERS = 'WORKERS'
+    CACHE_STACKS = 'CACHE_STACKS'
+    SEED = 'SEED'
 
     # Output
     OUTPUT_CDSM = 'OUTPUT_CDSM'
@@ -221,6 +224,23 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
         greedyAlgorithm.setFlags(greedyAlgorithm.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(greedyAlgorithm)
 
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+            self.tr("Number of parallel processes for the restart iterations"),
+            QgsProcessingParameterNumber.Integer, defaultValue=1, minValue=1)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+
+        seed = QgsProcessingParameterNumber(self.SEED,
+            self.tr("Random seed of the restart iterations (for reproducible results)"),
+            QgsProcessingParameterNumber.Integer, optional=True, minValue=0)
+        seed.setFlags(seed.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(seed)
+
+        cacheStacks = QgsProcessingParameterBoolean(self.CACHE_STACKS,
+            self.tr("Cache Shadow and Tmrt rasters in the SOLWEIG output directory for repeated runs"), defaultValue=False)
+        cacheStacks.setFlags(cacheStacks.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(cacheStacks)
+
     def processAlgorithm(self, parameters, context, feedback):
         # InputParameters 
 
@@ -249,6 +269,12 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
         outside_selected = self.parameterAsBoolean(parameters, self.INCLUDE_OUTSIDE, context)
         greedy = self.parameterAsBoolean(parameters, self.GREEDY_ALGORITHM, context)
         starting_algorithm = self.parameterAsBoolean(parameters, self.RANDOM_STARTING, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
+        if parameters.get(self.SEED) is None:
+            seed = None
+        else:
+            seed = self.parameterAsInt(parameters, self.SEED, context)
+        cache_stacks = self.parameterAsBoolean(parameters, self.CACHE_STACKS, context)
 
         # inputPolygonlayer = parameters[self.INPUT_POLYGONLAYER]
         inputPolygonlayer = self.parameterAsVectorLayer(parameters, self.INPUT_POLYGONLAYER, context).dataProvider().dataSourceUri()
@@ -308,18 +334,15 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
 
         r_range = range(r1,r2)
 
-        # Loading all shadow and tmrt rasters and summing up all tmrt into one
-        tree_input = Inputdata(r_range, sh_fl, tmrt_fl, infolder, inputPolygonlayer, feedback)
+        # Loading input rasters. Shadow and tmrt rasters are loaded for the clipped extent (ClippedInputdata)
+        tree_input = Inputdata(r_range, sh_fl, tmrt_fl, infolder, inputPolygonlayer, feedback, cache=cache_stacks)
 
         if not outside_selected:
             feedback.setProgressText("Tree shade ineffective outside planting area...")
             tree_input.buildings = tree_input.buildings * tree_input.selected_area
-            for i in np.arange(tree_input.tmrt_ts.shape[2]):
-                tree_input.tmrt_ts[:,:,i] = tree_input.tmrt_ts[:,:,i] * tree_input.selected_area
-                tree_input.shadow[:,:,i] = tree_input.shadow[:,:,i] * tree_input.selected_area
 
         # Tmrt for shaded point
-        tmrt_1d, azimuth, altitude, amaxvalue = tmrt_1d_fun(INPUT_MET,infolder,transVeg,tree_input.lon,tree_input.lat,tree_input.dsm,r_range,outputDir)
+        tmrt_1d, azimuth, altitude, amaxvalue = tmrt_1d_cached(INPUT_MET,infolder,[transVeg],tree_input.lon,tree_input.lat,tree_input.dsm,r_range,outputDir)
         tmrt_1d = np.around(tmrt_1d, decimals=1) # Round Tmrt to one decimal
 
         print(tmrt_1d)
@@ -334,9 +357,6 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
         # Copy of building raster
         bld_orig = tree_input.buildings.copy()
 
-        # Remove all Tmrt values that are on top of buildings
-        tree_input.tmrt_s = tree_input.tmrt_s * tree_input.buildings  
-
         cdsm_ = np.zeros((tree_input.rows, tree_input.cols))  # Empty cdsm
         tdsm_ = np.zeros((tree_input.rows, tree_input.cols))  # Empty tdsm
         dsm_empty = np.ones((tree_input.rows, tree_input.cols))  # Empty dsm raster
@@ -382,7 +402,12 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
         treerasters = Treerasters(treesh_sum_tmrt, shadow_rg.shadow, treesh_ts1, cdsm_, treedata)
 
         # Crop to size of inputPolygonlayer
-        cropped_rasters = ClippedInputdata(tree_input, treerasters)
+        cropped_rasters = ClippedInputdata(tree_input, treerasters, feedback)
+
+        if not outside_selected:
+            outside = cropped_rasters.selected_area == 0
+            cropped_rasters.tmrt_ts[outside] = 0
+            cropped_rasters.shadow[outside] = 0
 
         if greedy:
             # Greedy algorithm
@@ -408,7 +433,8 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
                 feedback.setProgressText(str(possible_locations) + " possible locations for trees...")
                 # Running tree planter
                 t_y, t_x, tmrt_max, t_y_all, t_x_all = TreePlanterHillClimber.treeoptinit(treerasters, cropped_rasters, positions, treedata,
-                                                                                                    shadow_rg, tmrt_1d, nTree, ITERATIONS, sa, feedback)
+                                                                                                    shadow_rg, tmrt_1d, nTree, ITERATIONS, sa, feedback,
+                                                                                                    workers=workers, seed=seed)
                 
                 if outputOccurrence:
                     # Create occurrence map
@@ -533,6 +559,10 @@ class ProcessingTreePlanterAlgorithm(QgsProcessingAlgorithm):
         '   + Try to use small area as planting area\n'
         '   + Use hourly meteorological data, preferably one single day.\n'
         '   If running with a large number of trees, or over a large extent, consider using the greedy algorithm.\n'
+        '- The restart iterations can be distributed on several processes (advanced parameter). With genetic starting '
+        'positions, each process runs its own chain of restarts.\n'
+        '- Shadow and Tmrt rasters are only read around the planting area. For repeated runs on the same SOLWEIG output, '
+        'the rasters can be cached in the SOLWEIG output directory (advanced parameter).\n'
         '-------------\n'
         'Wallenberg and Lindberg (2020): https://doi.org/10.5194/gmd-15-1107-2022<br>'
         '--------------\n'
@@ -44,6 +44,7 @@ import shutil
 import datetime
 from ..util.misc import saveraster
 from ..util.umep_uwg_export_component import read_uwg_file
+from ..functions.UWG import uwg_statistics as uwgstatistics
 
 
 class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
@@ -60,6 +61,7 @@ class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
     PIXELSIZE = 'PIXELSIZE'
     STAT_TYPE = 'STAT_TYPE'
     ADD_ATTRIBUTES ='ADD_ATTRIBUTES'
+    ALL_STATISTICS = 'ALL_STATISTICS'
  
     # Output
     UWG_GRID_OUT = 'UWG_GRID_OUT'
@@ -109,6 +111,11 @@ class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterBoolean(self.ADD_ATTRIBUTES,
                                                         self.tr("Add results to vector polygon grid attribute table"), 
                                                         defaultValue=False))
+        allStatistics = QgsProcessingParameterBoolean(self.ALL_STATISTICS,
+                                                      self.tr("Add all statistic measures to the attribute table"),
+                                                      defaultValue=False)
+        allStatistics.setFlags(allStatistics.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(allStatistics)
         self.addParameter(QgsProcessingParameterRasterDestination(self.UWG_GRID_OUT,
                                                                   self.tr("Output raster from statistical analysis"),
                                                                   None,
@@ -130,6 +137,7 @@ class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
         # dayTypeStr = self.parameterAsString(parameters, self.TIME_OF_DAY, context)
         pixelsize = self.parameterAsDouble(parameters, self.PIXELSIZE, context)
         addAttributes = self.parameterAsBool(parameters, self.ADD_ATTRIBUTES, context)
+        allStatistics = self.parameterAsBool(parameters, self.ALL_STATISTICS, context)
         outputStat = self.parameterAsOutputLayer(parameters, self.UWG_GRID_OUT, context)
 
         feedback.setProgressText("Initializing...")
@@ -152,7 +160,7 @@ class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
 
         # Load rural data
         sitein = uwgOut + '/metdata_UMEP.txt'
-        dataref = np.genfromtxt(sitein, skip_header=1)
+        dataref = uwgstatistics.read_output(sitein)
         yyyy = dataref[0,0]
 
         start = datetime.date(int(yyyy), int(mm), int(dd))
@@ -197,8 +205,6 @@ class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
         idx = vlayer.fields().indexFromName(poly_field[0])
 
         # load, cut data and calculate statistics
-        statvectemp = [0]
-        statresult = [0]
         idvec = [0]
         # starty = int(startDate.year())
         # startm = int(startDate.month())
@@ -225,81 +231,35 @@ class ProcessingUWGAnalyzerAlgorithm(QgsProcessingAlgorithm):
 
         startD = int(startDate.strftime('%j'))
         endD = int(endDate.strftime('%j'))
-        
-        
-        # for i in range(0, self.idgrid.shape[0]): # loop over vector grid instead
-        index = 1
-        nGrids = vlayer.featureCount()
-        for f in vlayer.getFeatures():
-            feedback.setProgress(int((index * 100) / nGrids))
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            index += 1
 
+        # output of all grids (loop over vector grid instead)
+        filepaths = []
+        for f in vlayer.getFeatures():
             gid = str(int(f.attributes()[idx]))
+            filepaths.append(uwgOut + '/' + prefix + '_' + gid + '_UMEP_UWG.txt')
+            idvec = np.vstack((idvec, int(gid)))
 
-            feedback.setProgressText("Processing grid: " + str(gid))
-
-            datawhole = np.genfromtxt(uwgOut + '/' + prefix + '_' + gid + '_UMEP_UWG.txt', skip_header=1)
-
-            # cut UWG data
-            start = np.min(np.where(datawhole[:, 1] == startD))
-            if endD > np.max(datawhole[:, 1]):
-                ending = np.max(np.where(datawhole[:, 1] == endD - 1))
-            else:
-                ending = np.min(np.where(datawhole[:, 1] == endD))
-            data1 = datawhole[start:int(ending + 12), :] # + 12 to include whole final night 
-
-            data1 = data1[np.where(data1[:, 14] < 1.), :] # include only nighttime. 14 is position for global radiation
-            data1 = data1[0][:]
+        feedback.setProgressText("Reading output of " + str(filepaths.__len__()) + " grids")
+        datawhole = uwgstatistics.load_outputs(filepaths, feedback)
+        if datawhole is None:
+            feedback.setProgressText("Calculation cancelled")
+            return {self.UWG_GRID_OUT: None}
 
-            # cut ref data
-            if endD > np.max(dataref[:, 1]):
-                ending = np.max(np.where(dataref[:, 1] == endD - 1))
-            else:
-                ending = np.min(np.where(dataref[:, 1] == endD))
-            data2 = dataref[start:int(ending + 12), :] # + 12 to include whole final night 
-
-            data2 = data2[np.where(data2[:, 14] < 1.), :] # include only nighttime. 14 is position for global radiation
-            data2 = data2[0][:]
-            
-            # if dayTypeStr == '1':
-            #     data1 = data1[np.where(data1[:, altpos] < 90.), :]
-            #     data1 = data1[0][:]
-            # if dayTypeStr == '2':
-            #     data1 = data1[np.where(data1[:, altpos] > 90.), :]
-            #     data1 = data1[0][:]
-
-            vardatauwg = data1[:, 11] # 11 is temperature column
-            vardataref = data2[:, 11] 
-            vardata = vardatauwg - vardataref
-
-            if statTypeStr == '0':
-                statresult = np.nanmean(vardata)
-                header = 'mean'
-            if statTypeStr == '1':
-                statresult = np.nanmin(vardata)
-                header = 'max'
-            if statTypeStr == '2':
-                statresult = np.nanpercentile(vardata, 50)
-                header = 'median'
-            if statTypeStr == '3':
-                statresult = np.nanpercentile(vardata, 75)
-                header = '75precentile'
-            if statTypeStr == '4':
-                statresult = np.nanpercentile(vardata, 95)
-                header = '95precentile'
-
-            statvectemp = np.vstack((statvectemp, statresult))
-            idvec = np.vstack((idvec, int(gid)))
+        # all statistics of all grids in one pass
+        try:
+            statresults = uwgstatistics.uhi_statistics(datawhole, dataref, startD, endD)
+        except ValueError as e:
+            raise QgsProcessingException(str(e))
 
-        statvector = statvectemp[1:, :]
-        # fix_print_with_import
-        statmat = np.hstack((idvec[1:, :], statvector))
+        header = uwgstatistics.STATISTICS[int(statTypeStr)]
+        statmat = np.hstack((idvec[1:, :], statresults[header][:, np.newaxis]))
 
         if addAttributes:
-            self.addattributes(vlayer, statmat, header)
+            if allStatistics:
+                for stat in uwgstatistics.STATISTICS:
+                    self.addattributes(vlayer, np.hstack((idvec[1:, :], statresults[stat][:, np.newaxis])), stat)
+            else:
+                self.addattributes(vlayer, statmat, header)
 
         if irreg:
             resx = pixelsize
@@ -63,15 +63,14 @@ from qgis.PyQt.QtGui import QIcon
 from osgeo import gdal, osr, ogr
 from osgeo.gdalconst import *
 import os
-import numpy as np
 import inspect
 from pathlib import Path
 import zipfile
 import sys
 import urllib
 from ..util import misc
-from ..util.misc import saveraster
 from ..functions import svf_functions as svf
+from ..functions.DSMGenerator import dsmblocks
 
 class ProcessingDSMGeneratorAlgorithm(QgsProcessingAlgorithm):
     """
@@ -212,7 +211,6 @@ class ProcessingDSMGeneratorAlgorithm(QgsProcessingAlgorithm):
         provider = demlayer.dataProvider()
         filepath_dem = str(provider.dataSourceUri())
         gdal_dem = gdal.Open(filepath_dem)
-        dem = gdal_dem.ReadAsArray().astype(float)
 
         dem_crs = osr.SpatialReference()
         dem_crs.ImportFromWkt(gdal_dem.GetProjection())
@@ -428,43 +426,11 @@ class ProcessingDSMGeneratorAlgorithm(QgsProcessingAlgorithm):
 
         # Reads temp file with sorted polygons
         sort_layer = QgsVectorLayer(sortPoly, 'sortPoly', 'ogr')
-        fileInfo = QFileInfo(sort_layer.source())
-        sort_ln = fileInfo.baseName()
-
-        # Convert polygon layer to raster
-        # Create the destination data source
-        rasterize_options = gdal.RasterizeOptions(options=[
-            '-a', 'height_asl',
-            '-te', str(minx), str(miny), str(maxx), str(maxy),
-            '-tr', str(pixelResolution), str(pixelResolution),
-            '-l', str(sort_ln)])
-
-        gdal.Rasterize(temp_dir + 'clipdsm.tif', str(sort_layer.source()), options=rasterize_options)
-
-        warp_options = gdal.WarpOptions(options=[
-            '-dstnodata', '-9999',
-            '-q',
-            '-overwrite',
-            '-te', str(minx), str(miny), str(maxx), str(maxy),
-            '-tr', str(pixelResolution), str(pixelResolution),
-            '-of', 'GTiff'])
-
-        gdal.Warp(temp_dir + 'clipdem.tif', filepath_dem, options=warp_options)
 
+        # Convert polygon layer to raster and add to DEM, block by block
         feedback.setProgress(60)
-
-        # Adding DSM to DEM
-        # Read DEM
-        dem_raster = gdal.Open(temp_dir + 'clipdem.tif')
-        dem_array = np.array(dem_raster.ReadAsArray().astype(float))
-        dsm_raster = gdal.Open(temp_dir + 'clipdsm.tif')
-        dsm_array = np.array(dsm_raster.ReadAsArray().astype(float))
-
-        indx = dsm_array.shape
-        for ix in range(0, int(indx[0])):
-            for iy in range(0, int(indx[1])):
-                if int(dsm_array[ix, iy]) == 0:
-                    dsm_array[ix, iy] = dem_array[ix, iy]
+        feedback.setProgressText('Rasterizing buildings and merging with DEM')
+        dsmblocks.generate_dsm(str(sort_layer.source()), filepath_dem, outputDSM, minx, miny, maxx, maxy, pixelResolution, feedback)
 
         # If saving OSM polygon layer, remove large polygons
         if len(outputShape) > 0:
@@ -497,8 +463,6 @@ class ProcessingDSMGeneratorAlgorithm(QgsProcessingAlgorithm):
 
         feedback.setProgress(80)
 
-        saveraster(dsm_raster, outputDSM, dsm_array)
-
         if useOsm:
             feedback.setProgressText('DSM Generator: Operation successful! ' + str(counterDiff) + ' building polygons out of ' + str(counter) + ' contained height values.')
         else:
@@ -42,24 +42,18 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterField,
                        QgsProcessingException,
-                       QgsFeature,
-                       QgsVectorFileWriter,
                        QgsVectorDataProvider,
                        QgsField,
                        QgsProcessingParameterDefinition)
 
 from qgis.PyQt.QtGui import QIcon
-from osgeo import gdal, osr, ogr
 from osgeo.gdalconst import *
 import os
 import numpy as np
 import inspect
 from pathlib import Path
 import sys
-from ..util import RoughnessCalcFunctionV2 as rg
-from ..util import imageMorphometricParms_v2 as morph
-from ..functions import wallalgorithms as wa
-from ..util import ssParms as ss
+from ..util import gridProcessing as gp
 
 
 class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
@@ -84,6 +78,7 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
     CALC_SS = 'CALC_SS'
     #SS_HEIGHTS = 'SS_HEIGHTS'
     INPUT_CDSM = 'INPUT_CDSM'
+    WORKERS = 'WORKERS'
     
     
     def initAlgorithm(self, config):
@@ -140,6 +135,12 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
         sscdsm.setFlags(sscdsm.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(sscdsm)
 
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+            self.tr("Number of parallel processes for the grid polygons"),
+            QgsProcessingParameterNumber.Integer, defaultValue=1, minValue=1)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+
 
         self.plugin_dir = os.path.dirname(__file__)
         if not (os.path.isdir(self.plugin_dir + '/data')):
@@ -162,6 +163,7 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
         ignoreNodata = self.parameterAsBool(parameters, self.IGNORE_NODATA, context)
         outputDir = self.parameterAsString(parameters, self.OUTPUT_DIR, context)
         calcSS = self.parameterAsBool(parameters, self.CALC_SS, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
         
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not (os.path.isdir(outputDir)):
@@ -180,7 +182,6 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
             headerSS = ' z  paib bScale paiv vScale '
             numformatSS = '%3d %4.3f %4.3f %4.3f %4.3f'
             
-        imp_point = 0 # only used in menu-based tool
         imid = int(searchMethod)
         arrmat = np.empty((1, 9))
 
@@ -194,11 +195,9 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
         poly_field = idField
         vlayer = inputPolygonlayer
         prov = vlayer.dataProvider()
-        fields = prov.fields()
         idx = vlayer.fields().indexFromName(poly_field[0])
         # dir_poly = self.plugin_dir + '/data/poly_temp.shp'
         nGrids = vlayer.featureCount()
-        index = 1
         feedback.setProgressText("Number of grids to analyse: " + str(nGrids))
 
         # #Calculate Z0m and Zdm depending on the Z0 method
@@ -215,218 +214,141 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
         else:
             Roughnessmethod = 'Kan'
 
-        # looping through each grid polygon
-        for f in vlayer.getFeatures():  
-            feedback.setProgress(int((index * 100) / nGrids))
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            
-            index += 1
-
-            attributes = f.attributes()
-            geometry = f.geometry()
-            feature = QgsFeature()
-            feature.setAttributes(attributes)
-            feature.setGeometry(geometry)
-
-            if imid == 1: # from centroid point
-                r = inputDistance
-                y = f.geometry().centroid().asPoint().y()
-                x = f.geometry().centroid().asPoint().x()
-                bbox = (x - r, y + r, x + r, y - r)
-            else: # from cutline polygon
-                r = 0  # Used as info to separate from IMP point to grid
-                writer = QgsVectorFileWriter(self.dir_poly, "CP1250", fields, prov.wkbType(),
-                                                prov.crs(), "ESRI shapefile")
-                if writer.hasError() != QgsVectorFileWriter.NoError:
-                    raise QgsProcessingException("Error when creating shapefile: ", str(writer.hasError()))
-                writer.addFeature(feature)
-                del writer
-                VectorDriver = ogr.GetDriverByName("ESRI Shapefile")
-                Vector = VectorDriver.Open(self.dir_poly, 0)  #self.dir_poly
-                layer = Vector.GetLayer()
-                feature = layer.GetFeature(0)
-                geom = feature.GetGeometryRef()
-                minX, maxX, minY, maxY = geom.GetEnvelope()
-                bbox = (minX, maxY, maxX, minY)  # Reorder bbox to use with gdal_translate
-                Vector.Destroy()
-
-            if useDsmBuild:  # Only building heights
-                dsmlayer = self.parameterAsRasterLayer(parameters, self.INPUT_DSMBUILD, context)
-                if dsmlayer is None:
-                    raise QgsProcessingException("No valid building DSM raster layer is selected")
-
-                provider = dsmlayer.dataProvider()
-                filePath_dsm_build = str(provider.dataSourceUri())
-
-                # added gdal.Warp() for irregular grids
-                bigraster = gdal.Open(filePath_dsm_build)
-                if imid == 1:
-                    gdal.Translate(self.plugin_dir + '/data/clipdsm.tif', bigraster, projWin=bbox)
-                else:
-                    clip_spec = gdal.WarpOptions(format="GTiff", cutlineDSName=self.dir_poly, cropToCutline=True)
-                    gdal.Warp(self.plugin_dir + '/data/clipdsm.tif', bigraster, options=clip_spec)
-                bigraster = None
-
-                dataset = gdal.Open(self.plugin_dir + '/data/clipdsm.tif')
+        # rasters read once, each grid polygon is clipped in memory
+        if useDsmBuild:  # Only building heights
+            dsmlayer = self.parameterAsRasterLayer(parameters, self.INPUT_DSMBUILD, context)
+            if dsmlayer is None:
+                raise QgsProcessingException("No valid building DSM raster layer is selected")
+
+            provider = dsmlayer.dataProvider()
+            filePath_dsm_build = str(provider.dataSourceUri())
+            bigdsm = gp.memory_raster(filePath_dsm_build)
+            bigdem = None
+        else:  # Both building ground heights
+            dsmlayer = self.parameterAsRasterLayer(parameters, self.INPUT_DSM, context)
+            demlayer = self.parameterAsRasterLayer(parameters, self.INPUT_DEM, context)
+
+            if dsmlayer is None:
+                raise QgsProcessingException("No valid ground and building DSM raster layer is selected")
+            if demlayer is None:
+                raise QgsProcessingException("No valid ground DEM raster layer is selected")
+
+            provider = dsmlayer.dataProvider()
+            filePath_dsm = str(provider.dataSourceUri())
+            provider = demlayer.dataProvider()
+            filePath_dem = str(provider.dataSourceUri())
+            bigdsm = gp.memory_raster(filePath_dsm)
+            bigdem = gp.memory_raster(filePath_dem)
+
+        bigcdsm = None
+        if calcSS: #add vegetion (if present) for SUEWS/SS
+            cdsmlayer = self.parameterAsRasterLayer(parameters, self.INPUT_CDSM, context)
+            if cdsmlayer is not None:
+                provider = cdsmlayer.dataProvider()
+                filePath_cdsm = str(provider.dataSourceUri())
+                bigcdsm = gp.memory_raster(filePath_cdsm)
+
+        crs_wkt = prov.crs().toWkt()
+        gridids = [f.attributes()[idx] for f in vlayer.getFeatures()]
+
+        def grids():
+            for f in vlayer.getFeatures():  # looping through each grid polygon
+                if imid == 1: # from centroid point
+                    r = inputDistance
+                    y = f.geometry().centroid().asPoint().y()
+                    x = f.geometry().centroid().asPoint().x()
+                    bbox = (x - r, y + r, x + r, y - r)
+                else: # from cutline polygon
+                    bbox = None
+                polygon_wkt = f.geometry().asWkt()
+
+                dataset = gp.clip_grid(bigdsm, imid, bbox, polygon_wkt, crs_wkt)
                 dsm_array = dataset.ReadAsArray().astype(float)
-                sizex = dsm_array.shape[0]
-                sizey = dsm_array.shape[1]
-                dem_array = np.zeros((sizex, sizey))
-                ndDEM = -9999
-
-            else:  # Both building ground heights
-                dsmlayer = self.parameterAsRasterLayer(parameters, self.INPUT_DSM, context)
-                demlayer = self.parameterAsRasterLayer(parameters, self.INPUT_DEM, context)
-
-                if dsmlayer is None:
-                    raise QgsProcessingException("No valid ground and building DSM raster layer is selected")
-                if demlayer is None:
-                    raise QgsProcessingException("No valid ground DEM raster layer is selected")
-
-                provider = dsmlayer.dataProvider()
-                filePath_dsm = str(provider.dataSourceUri())
-                provider = demlayer.dataProvider()
-                filePath_dem = str(provider.dataSourceUri())
-
-                # added gdal.Warp() for irregular grids
-                bigraster = gdal.Open(filePath_dsm)
-                if imid == 1:
-                    gdal.Translate(self.plugin_dir + '/data/clipdsm.tif', bigraster, projWin=bbox)
+                if bigdem is None:
+                    dem_array = np.zeros((dsm_array.shape[0], dsm_array.shape[1]))
+                    ndDEM = -9999
                 else:
-                    clip_spec = gdal.WarpOptions(format="GTiff", cutlineDSName=self.dir_poly, cropToCutline=True)
-                    gdal.Warp(self.plugin_dir + '/data/clipdsm.tif', bigraster, options=clip_spec)
-                bigraster = None
-                bigraster = gdal.Open(filePath_dem)
-                if imid == 1:
-                    gdal.Translate(self.plugin_dir + '/data/clipdem.tif', bigraster, projWin=bbox)
-                else:
-                    clip_spec = gdal.WarpOptions(format="GTiff", cutlineDSName=self.dir_poly, cropToCutline=True)
-                    gdal.Warp(self.plugin_dir + '/data/clipdem.tif', bigraster, options=clip_spec)
-                bigraster = None
+                    dataset2 = gp.clip_grid(bigdem, imid, bbox, polygon_wkt, crs_wkt)
+                    dem_array = dataset2.ReadAsArray().astype(float)
+                    ndDEM = dataset2.GetRasterBand(1).GetNoDataValue()
+                    dataset2 = None
 
-                dataset = gdal.Open(self.plugin_dir + '/data/clipdsm.tif')
-                dsm_array = dataset.ReadAsArray().astype(float)
-                dataset2 = gdal.Open(self.plugin_dir + '/data/clipdem.tif')
-                dem_array = dataset2.ReadAsArray().astype(float)
-                ndDEM = dataset2.GetRasterBand(1).GetNoDataValue()
-
-                if not (dsm_array.shape[0] == dem_array.shape[0]) & (dsm_array.shape[1] == dem_array.shape[1]):
-                    raise QgsProcessingException("All grids must be of same extent and resolution")
-
-            if calcSS: #add vegetion (if present) for SUEWS/SS
-                cdsmlayer = self.parameterAsRasterLayer(parameters, self.INPUT_CDSM, context)
-                if cdsmlayer is None:
-                    cdsm_array = dsm_array * 0.0
-                    ndCDSM = -9999
+                    if not (dsm_array.shape[0] == dem_array.shape[0]) & (dsm_array.shape[1] == dem_array.shape[1]):
+                        raise QgsProcessingException("All grids must be of same extent and resolution")
+
+                if calcSS:
+                    if bigcdsm is None:
+                        cdsm_array = dsm_array * 0.0
+                        ndCDSM = -9999
+                    else:
+                        dataseti = gp.clip_grid(bigcdsm, imid, bbox, polygon_wkt, crs_wkt)
+                        ndCDSM = dataseti.GetRasterBand(1).GetNoDataValue()
+                        cdsm_array = dataseti.ReadAsArray().astype(float)
+                        dataseti = None
+                else:
+                    cdsm_array = None
+
+                geotransform = dataset.GetGeoTransform()
+                scale = 1 / geotransform[1]
+                nd = dataset.GetRasterBand(1).GetNoDataValue()
+                dataset = None
+                if nd is None:
+                    feedback.pushWarning("NoData in DSM layer not set. Tick off 'Ignore NoData pixels' to make use of this tool or assign NoData value to your raster data.")
                 else:
-                    provider = cdsmlayer.dataProvider()
-                    filePath_cdsm = str(provider.dataSourceUri())
-                    bigraster = gdal.Open(filePath_cdsm)
-                    if imid == 1:
-                        gdal.Translate(self.plugin_dir + '/data/clipdsm.tif', bigraster, projWin=bbox)
+                    feedback.setProgressText("NoData-value in DSM-layer: " + str(nd))
+                nodata_test = (dsm_array == nd)
+                if ignoreNodata:
+                    if np.sum(dsm_array) == (dsm_array.shape[0] * dsm_array.shape[1] * nd):
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes Only NoData Pixels")
+                        cal = 0
                     else:
-                        clip_spec = gdal.WarpOptions(format="GTiff", cutlineDSName=self.dir_poly, cropToCutline=True)
-                        gdal.Warp(self.plugin_dir + '/data/clipcdsm.tif', bigraster, options=clip_spec)
-                    bigraster = None
-                    dataseti = gdal.Open(self.plugin_dir + '/data/clipcdsm.tif')
-                    ndCDSM = dataseti.GetRasterBand(1).GetNoDataValue()
-                    cdsm_array = dataseti.ReadAsArray().astype(float)
-
-
-            geotransform = dataset.GetGeoTransform()
-            scale = 1 / geotransform[1]
-            nd = dataset.GetRasterBand(1).GetNoDataValue()
-            if nd is None:
-                feedback.pushWarning("NoData in DSM layer not set. Tick off 'Ignore NoData pixels' to make use of this tool or assign NoData value to your raster data.")
-            else:
-                feedback.setProgressText("NoData-value in DSM-layer: " + str(nd))
-            nodata_test = (dsm_array == nd)
-            if ignoreNodata:
-                if np.sum(dsm_array) == (dsm_array.shape[0] * dsm_array.shape[1] * nd):
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes Only NoData Pixels")
-                    cal = 0
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
+                        cal = 1
                 else:
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
-                    cal = 1
-            else:
-                if nodata_test.any():
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes NoData Pixels")
-                    cal = 0
+                    if nodata_test.any():
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes NoData Pixels")
+                        cal = 0
+                    else:
+                        cal = 1
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
+
+                if cal == 1:
+                    #set nodata to same
+                    dsm_array[dsm_array == nd] = -9999
+                    dem_array[dem_array == ndDEM] = -9999
+                    if calcSS:
+                        cdsm_array[cdsm_array == ndCDSM] = -9999
+
+                    yield (dsm_array, dem_array, cdsm_array, nd, scale, geotransform[1] * abs(geotransform[5]),
+                           imid, degree)
                 else:
-                    cal = 1
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
-
-            if cal == 1:
-                #set nodata to same
-                dsm_array[dsm_array == nd] = -9999
-                dem_array[dem_array == ndDEM] = -9999
-                if calcSS:  
-                    cdsm_array[cdsm_array == ndCDSM] = -9999
-                
-                #calculate morphometric params
-                immorphresult = morph.imagemorphparam_v2(dsm_array, dem_array, scale, imid, degree, feedback, imp_point)
-
-                zH = immorphresult["zH"]
-                fai = immorphresult["fai"]
-                pai = immorphresult["pai"]
-                zMax = immorphresult["zHmax"]
-                zSdev = immorphresult["zH_sd"]
-                
-                zd, z0 = rg.RoughnessCalcMany(Roughnessmethod, zH, fai, pai, zMax, zSdev)
-
-                # save to file
-                arr = np.concatenate((immorphresult["deg"], immorphresult["pai"], immorphresult["fai"],
-                                    immorphresult["zH"], immorphresult["zHmax"], immorphresult["zH_sd"], zd, z0, immorphresult["test"]), axis=1)
-                np.savetxt(outputDir + '/' + pre + '_' + 'IMPGrid_anisotropic_' + str(f.attributes()[idx]) + '.txt', arr,
-                            fmt=numformat, delimiter=' ', header=headerAniso, comments='')
-                del arr
-
-                zHall = immorphresult["zH_all"]
-                faiall = immorphresult["fai_all"]
-                paiall = immorphresult["pai_all"]
-                zMaxall = immorphresult["zHmax_all"]
-                zSdevall = immorphresult["zH_sd_all"]
-                zdall, z0all = rg.RoughnessCalc(Roughnessmethod, zHall, faiall, paiall, zMaxall, zSdevall)
-
-                # If zd and z0 are lower than open country, set to open country
-                if zdall == 0.0:
-                    zdall = 0.1
-                if z0all == 0.0:
-                    z0all = 0.03
-
-                # If pai is larger than 0 and fai is zero, set fai to 0.001. Issue # 164
-                if paiall > 0.:
-                    if faiall == 0.:
-                        faiall = 0.001
-
-                # adding wai area to isotrophic (wall area index)
-                total = 100. / (int(dsm_array.shape[0] * dsm_array.shape[1]))
-
-                numPixels = len(dsm_array[np.where(dsm_array != nd)])
-                buildDSM = np.copy(dsm_array) - np.copy(dem_array)
-                buildDSM[buildDSM == nd] = 0
-                buildDSM[(buildDSM < 2.)] = 0 # building should be higher than 2 meter
-                walls = wa.findwalls(buildDSM, 0.5, feedback, total) # 0.5 meter difference in kernel filter identify a wall
-                wallarea = np.sum(walls)
-                gridArea = numPixels * geotransform[1] * abs(geotransform[5]) # changed to work for irregular grids
-                wai = wallarea / gridArea
-
-                arr2 = np.array([[f.attributes()[idx], immorphresult["pai_all"], immorphresult["fai_all"], immorphresult["zH_all"],
-                                    immorphresult["zHmax_all"], immorphresult["zH_sd_all"], zdall, z0all, wai]])
-
-                arrmat = np.vstack([arrmat, arr2])
+                    yield None
 
-                if calcSS:
-                    #arrmatSS = np.empty((1, 5))
-                    ssResults = ss.ss_calc(buildDSM, cdsm_array, walls, numPixels, feedback)                    
-                    arrSS = np.hstack([ssResults["z"], ssResults["paiZ_b"], ssResults["bScale"], ssResults["paiZ_v"], ssResults["vScale"]])
-                    np.savetxt(outputDir + '/' + pre + '_' + 'IMPGrid_SS_'  + str(f.attributes()[idx]) + '.txt', arrSS,
-                    fmt=numformatSS, delimiter=' ', header=headerSS, comments='')
+        #calculate morphometric params
+        results = gp.run_grids(gp.morphometry_grid, grids(), nGrids, workers, feedback)
+        bigdsm = None
+        bigdem = None
+        bigcdsm = None
+
+        calculated = [(gridid, result) for gridid, result in zip(gridids, results) if result is not None]
+        zd, z0, zdall, z0all = gp.morphometry_roughness(Roughnessmethod, [result[0] for gridid, result in calculated])
+
+        for c, (gridid, (immorphresult, wai, arrSS)) in enumerate(calculated):
+            # save to file
+            arr = np.concatenate((immorphresult["deg"], immorphresult["pai"], immorphresult["fai"],
+                                immorphresult["zH"], immorphresult["zHmax"], immorphresult["zH_sd"], zd[c], z0[c], immorphresult["test"]), axis=1)
+            np.savetxt(outputDir + '/' + pre + '_' + 'IMPGrid_anisotropic_' + str(gridid) + '.txt', arr,
+                        fmt=numformat, delimiter=' ', header=headerAniso, comments='')
+            del arr
+
+            arr2 = np.array([[gridid, immorphresult["pai_all"], immorphresult["fai_all"], immorphresult["zH_all"],
+                                immorphresult["zHmax_all"], immorphresult["zH_sd_all"], zdall[c], z0all[c], wai]])
+
+            arrmat = np.vstack([arrmat, arr2])
 
-            dataset = None
-            dataset2 = None
+            if calcSS:
+                np.savetxt(outputDir + '/' + pre + '_' + 'IMPGrid_SS_'  + str(gridid) + '.txt', arrSS,
+                fmt=numformatSS, delimiter=' ', header=headerSS, comments='')
 
         arrmatsave = arrmat[1: arrmat.shape[0], :]
         np.savetxt(outputDir + '/' + pre + '_' + 'IMPGrid_isotropic.txt', arrmatsave,
@@ -482,7 +404,7 @@ class ProcessingImageMorphParmsAlgorithm(QgsProcessingAlgorithm):
         'roughness of a surface and are included in various local and mesoscale climate models (e.g. Grimmond and Oke 1999). They may vary depending '
         'on what angle (wind direction) you are interested in. Thus, this plugin is able to derive the parameters for different directions. '
         'Preferably, a ground and 3D-object DSM and DEM should be used as input data. The 3D objects are usually buildings but can also be 3D '
-        'vegetation (i.e. trees and bushes). It is also possible to derive the parameters from a 3D object DSM with no ground heights.\n'
+        'vegetation (i.e. trees and bushes). It is also possible to derive the parameters from a 3D object DSM with no ground heights. The grid polygons can be calculated on several parallel processes (advanced parameters).\n'
         '-------------\n'
         'Grimmond CSB and Oke TR (1999) Aerodynamic properties of urban areas derived from analysis of surface form. J Appl Meteorol 38: 1262-1292'
         '\n'
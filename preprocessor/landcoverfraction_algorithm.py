@@ -42,13 +42,11 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterFeatureSource,
                        QgsProcessingParameterField,
                        QgsProcessingException,
-                       QgsFeature,
-                       QgsVectorFileWriter,
                        QgsVectorDataProvider,
-                       QgsField)
+                       QgsField,
+                       QgsProcessingParameterDefinition)
 
 from qgis.PyQt.QtGui import QIcon
-from osgeo import gdal, ogr
 from osgeo.gdalconst import *
 import os
 import numpy as np
@@ -58,6 +56,7 @@ import sys
 # from ..util import misc
 # from ..util import landCoverFractions_v1 as land
 from ..util import landCoverFractions_v2 as land
+from ..util import gridProcessing as gp
 
 
 class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
@@ -75,6 +74,7 @@ class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
     OUTPUT_DIR = 'OUTPUT_DIR'
     IGNORE_NODATA = 'IGNORE_NODATA'
     ATTR_TABLE = 'ATTR_TABLE'
+    WORKERS = 'WORKERS'
     
     
     def initAlgorithm(self, config):
@@ -107,6 +107,12 @@ class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR, 
             self.tr('Output folder')))
 
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+            self.tr("Number of parallel processes for the grid polygons"),
+            QgsProcessingParameterNumber.Integer, defaultValue=1, minValue=1)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
+
         self.plugin_dir = os.path.dirname(__file__)
         if not (os.path.isdir(self.plugin_dir + '/data')):
             os.mkdir(self.plugin_dir + '/data')
@@ -124,13 +130,12 @@ class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
         attrTable = self.parameterAsBool(parameters, self.ATTR_TABLE, context)
         ignoreNodata = self.parameterAsBool(parameters, self.IGNORE_NODATA, context)
         outputDir = self.parameterAsString(parameters, self.OUTPUT_DIR, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
 
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not (os.path.isdir(outputDir)):
                 os.mkdir(outputDir)
 
-        r = inputDistance
-        
         degree = float(inputInterval)
         pre = filePrefix
         ret = 0
@@ -154,11 +159,9 @@ class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
         poly_field = idField
         feedback.setProgressText("poly_field: " + str(poly_field))
         prov = vlayer.dataProvider()
-        fields = prov.fields()
         idx = vlayer.fields().indexFromName(poly_field[0])
         #dir_poly = self.plugin_dir + '/data/poly_temp.shp'
         nGrids = vlayer.featureCount()
-        index = 1
         feedback.setProgressText("Number of grids to analyse: " + str(nGrids))
 
         feedback.setProgressText("idx: " + str(idx))
@@ -170,103 +173,65 @@ class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
         provider = dsmlayer.dataProvider()
         filePath_dsm_build = str(provider.dataSourceUri())
 
-        for f in vlayer.getFeatures():  # looping through each grid polygon
-            feedback.setProgress(int((index * 100) / nGrids))
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-            
-            index += 1
-
-            attributes = f.attributes()
-            geometry = f.geometry()
-            feature = QgsFeature()
-            feature.setAttributes(attributes)
-            feature.setGeometry(geometry)
-
-            if imid == 1:  # use center point
-                r = inputDistance
-                y = f.geometry().centroid().asPoint().y()
-                x = f.geometry().centroid().asPoint().x()
-            else:
-                r = 0  # Uses as info to separate from IMP point to grid
-                writer = QgsVectorFileWriter(self.dir_poly, "CP1250", fields, prov.wkbType(),
-                                                prov.crs(), "ESRI shapefile")
-                if writer.hasError() != QgsVectorFileWriter.NoError:
-                    raise QgsProcessingException("Error when creating shapefile: ", str(writer.hasError()))
-                writer.addFeature(feature)
-                del writer
-            
-            if imid == 1:
-                bbox = (x - r, y + r, x + r, y - r)
-            else:
-                # Remove gdalwarp cuttoline with gdal.Translate. Cut to envelope of polygon feature
-                VectorDriver = ogr.GetDriverByName("ESRI Shapefile")
-                Vector = VectorDriver.Open(self.dir_poly, 0)  #self.dir_poly
-                layer = Vector.GetLayer()
-                feature = layer.GetFeature(0)
-                geom = feature.GetGeometryRef()
-                minX, maxX, minY, maxY = geom.GetEnvelope()
-                bbox = (minX, maxY, maxX, minY)  # Reorder bbox to use with gdal_translate
-                Vector.Destroy()
-
-            # Remove gdalwarp with gdal.Translate
-            # added gdal.Warp() for irregular grids
-            bigraster = gdal.Open(filePath_dsm_build)
-            if imid == 1:
-                gdal.Translate(self.plugin_dir + '/data/clipdsm.tif', bigraster, projWin=bbox)
-            else:
-                clip_spec = gdal.WarpOptions(
-                    format="GTiff",
-                    cutlineDSName=self.dir_poly,
-                    cropToCutline=True
-                )
-                gdal.Warp(self.plugin_dir + '/data/clipdsm.tif', bigraster, options=clip_spec)
-            bigraster = None
-
-            dataset = gdal.Open(self.plugin_dir + '/data/clipdsm.tif')
-            lcgrid = dataset.ReadAsArray().astype(float)
-            #sizex = lcgrid.shape[0]
-            #sizey = lcgrid.shape[1]
-
-            # feedback.setProgressText(str(bbox))
-            #geotransform = dataset.GetGeoTransform()
-            #scale = 1 / geotransform[1]
-            nd = dataset.GetRasterBand(1).GetNoDataValue()
-            nodata_test = (lcgrid == nd)
-            if ignoreNodata:
-                if np.sum(lcgrid) == (lcgrid.shape[0] * lcgrid.shape[1] * nd):
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes Only NoData Pixels")
-                    cal = 0
+        # land cover grid read once, each grid polygon is clipped in memory
+        bigraster = gp.memory_raster(filePath_dsm_build)
+        crs_wkt = prov.crs().toWkt()
+        gridids = [f.attributes()[idx] for f in vlayer.getFeatures()]
+
+        def grids():
+            for f in vlayer.getFeatures():  # looping through each grid polygon
+                if imid == 1:  # use center point
+                    r = inputDistance
+                    y = f.geometry().centroid().asPoint().y()
+                    x = f.geometry().centroid().asPoint().x()
+                    bbox = (x - r, y + r, x + r, y - r)
+                else:
+                    bbox = None
+
+                dataset = gp.clip_grid(bigraster, imid, bbox, f.geometry().asWkt(), crs_wkt)
+                lcgrid = dataset.ReadAsArray().astype(float)
+                nd = dataset.GetRasterBand(1).GetNoDataValue()
+                dataset = None
+
+                nodata_test = (lcgrid == nd)
+                if ignoreNodata:
+                    if np.sum(lcgrid) == (lcgrid.shape[0] * lcgrid.shape[1] * nd):
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes Only NoData Pixels")
+                        cal = 0
+                    else:
+                        lcgrid[lcgrid == nd] = 0
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
+                        cal = 1
                 else:
-                    lcgrid[lcgrid == nd] = 0
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
-                    # feedback.setProgressText("Grid " + str(f.attributes()[idx]) + "includes NoData Pixels. Nodata set to paved.")
-                    cal = 1
-            else:
-                if nodata_test.any():
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes NoData Pixels")
-                    cal = 0
+                    if nodata_test.any():
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " not calculated. Includes NoData Pixels")
+                        cal = 0
+                    else:
+                        cal = 1
+                        feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
+
+                if cal == 1:
+                    yield (lcgrid, imid, degree, gp.SilentFeedback(), imp_point)
                 else:
-                    cal = 1
-                    feedback.setProgressText("Grid " + str(f.attributes()[idx]) + " being calculated.")
+                    yield None
 
-            if cal == 1:
-                landcoverresult = land.landcover_v2(lcgrid, imid, degree, feedback, imp_point)
+        results = gp.run_grids(land.landcover_v2, grids(), nGrids, workers, feedback)
+        bigraster = None
+
+        for gridid, landcoverresult in zip(gridids, results):
+            if landcoverresult is not None:
                 landcoverresult = self.resultcheck(landcoverresult)
 
                 arr = np.concatenate((landcoverresult["deg"], landcoverresult["lc_frac"]), axis=1)
-                np.savetxt(outputDir + '/' + pre + '_' + 'LCFG_anisotropic_result_' + str(f.attributes()[idx]) + '.txt', arr,
+                np.savetxt(outputDir + '/' + pre + '_' + 'LCFG_anisotropic_result_' + str(gridid) + '.txt', arr,
                             fmt=numformat, delimiter=' ', header=header, comments='')
                 del arr
-                arr2 = np.array([f.attributes()[idx], landcoverresult["lc_frac_all"][0, 0], landcoverresult["lc_frac_all"][0, 1],
+                arr2 = np.array([gridid, landcoverresult["lc_frac_all"][0, 0], landcoverresult["lc_frac_all"][0, 1],
                                     landcoverresult["lc_frac_all"][0, 2], landcoverresult["lc_frac_all"][0, 3], landcoverresult["lc_frac_all"][0, 4],
                                     landcoverresult["lc_frac_all"][0, 5], landcoverresult["lc_frac_all"][0, 6]])
 
                 arrmat = np.vstack([arrmat, arr2])
 
-            dataset = None
-
         arrmatsave = arrmat[1: arrmat.shape[0], :]
         np.savetxt(outputDir + '/' + pre + '_' + 'LCFG_isotropic.txt', arrmatsave,
                             fmt=numformat2, delimiter=' ', header=header2, comments='')
@@ -344,7 +309,7 @@ class ProcessingLandCoverFractionAlgorithm(QgsProcessingAlgorithm):
         'is able to derive the land cover fractions for different directions. It is the same as the Land Cover Fraction (Point) except that '
         'this plugin calculates the fractions for each polygon object in polygon vector layer. The polygons should preferable be squares but could '
         'be any other regular shape. To create such a grid, built in functions in QGIS can be used (see Vector geometry -> Research Tools -> Create Grid in the '
-        'Processing Toolbox).\n'
+        'Processing Toolbox). The grid polygons can be calculated on several parallel processes (advanced parameters).\n'
         '--------------\n'
         'Full manual available via the <b>Help</b>-button.')
 
@@ -45,7 +45,6 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterExtent,
                        QgsProcessingException,
                        QgsVectorLayer,
-                       QgsFeature,
                        QgsGeometry,
                        QgsPointXY,
                        QgsVectorFileWriter,
@@ -260,21 +259,14 @@ class ProcessingTreeGeneratorAlgorithm(QgsProcessingAlgorithm):
                     raise QgsProcessingException("Error! Check the coordinate systems of your input data. Have to match!")
                     return
 
-        index = 1
-        # Main loop
-        for f in vlayer.getFeatures():  # looping through each grid polygon
-
-            feedback.setProgress(int((index * 100) / numfeat))
+        # Tree attributes and positions
+        feedback.setProgressText("Reading tree positions and attributes")
+        trees = np.zeros((numfeat, 6))
+        index = 0
+        for f in vlayer.getFeatures():  # looping through each tree point
             if feedback.isCanceled():
                 feedback.setProgressText("Calculation cancelled")
                 break
-            index = index + 1
-
-            attributes = f.attributes()
-            geometry = f.geometry()
-            feature = QgsFeature()
-            feature.setAttributes(attributes)
-            feature.setGeometry(geometry)
 
             y = f.geometry().centroid().asPoint().y()
             x = f.geometry().centroid().asPoint().x()
@@ -285,22 +277,19 @@ class ProcessingTreeGeneratorAlgorithm(QgsProcessingAlgorithm):
             cola = np.round((x - minx) * scale)
             rowa = np.round((miny + rows / scale - y) * scale)
 
-            # QMessageBox.information(None, "scale=", str(scale))
-            # QMessageBox.information(None, "x=", str(x))
-            # QMessageBox.information(None, "y=", str(y))
-            # QMessageBox.information(None, "minx=", str(minx))
-            # QMessageBox.information(None, "miny=", str(miny))
-            # QMessageBox.information(None, "cola=", str(cola))
-            # QMessageBox.information(None, "rowa=", str(rowa))
-            # QMessageBox.information(None, "rows=", str(rows))
-
             # Check if there are trees with a tree canopy diameter smaller than the pixel resolution of the input raster data
             if dia < geotransform[1]:
                 raise QgsProcessingException("Error! You have tree canopy diameters that are smaller than the pixel resolution.")
                 return
 
-            cdsm_array, tdsm_array = makevegdems.vegunitsgeneration(build_array, cdsm_array, tdsm_array, ttype, height,
-                                                                    trunk, dia, rowa, cola, sizex, sizey, scale)
+            trees[index, :] = [ttype, height, trunk, dia, rowa, cola]
+            index = index + 1
+
+        # Main loop, trees are added tile by tile
+        feedback.setProgressText("Generating vegetation rasters")
+        trees = trees[:index, :]
+        cdsm_array, tdsm_array = makevegdems.vegunitsbatch(build_array, cdsm_array, tdsm_array, trees[:, 0], trees[:, 1],
+                                                           trees[:, 2], trees[:, 3], trees[:, 4], trees[:, 5], scale, feedback)
 
         saverasternd(dataset, outputCDSM, cdsm_array)
         saverasternd(dataset, outputTDSM, tdsm_array)
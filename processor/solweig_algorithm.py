@@ -64,9 +64,11 @@ from ..util.SEBESOLWEIGCommonFiles import Solweig_v2015_metdata_noload as metloa
 from ..util.SEBESOLWEIGCommonFiles.clearnessindex_2013b import clearnessindex_2013b
 from ..functions.SOLWEIGpython.Tgmaps_v1 import Tgmaps_v1
 from ..functions.SOLWEIGpython import Solweig_2022a_calc_forprocessing as so
+from ..functions.SOLWEIGpython.patch_characteristics import PatchClasses
+from ..functions.SOLWEIGpython.solweig_poi import SolweigPoi
+from ..functions.SOLWEIGpython.poi_recorder import PoiRecorder
 from ..functions.SOLWEIGpython import WriteMetadataSOLWEIG
-from ..functions.SOLWEIGpython import PET_calculations as p
-from ..functions.SOLWEIGpython import UTCI_calculations as utci
+from ..functions.SOLWEIGpython.PET_calculations import PET_person
 from ..functions.SOLWEIGpython.CirclePlotBar import PolarBarPlot
 import matplotlib.pyplot as plt
 from shutil import copyfile, rmtree
@@ -132,6 +134,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
     # POI = 'POI'
     POI_FILE = 'POI_FILE'
     POI_FIELD = 'POI_FIELD'
+    POI_ONLY = 'POI_ONLY'
     CYL = 'CYL'
 
     #Output
@@ -241,6 +244,10 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             self.tr('ID field'),'', self.POI_FILE, QgsProcessingParameterField.Numeric, optional=True)
         poi_field.setFlags(poi_field.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
         self.addParameter(poi_field)
+        poi_only = QgsProcessingParameterBoolean(self.POI_ONLY,
+            self.tr("Calculate only at the Point of Interest(s) (no raster output)"), defaultValue=False)
+        poi_only.setFlags(poi_only.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(poi_only)
 
         #PET parameters
         age = QgsProcessingParameterNumber(self.AGE, self.tr('Age (yy)'),
@@ -324,6 +331,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         # usePOI = self.parameterAsBool(parameters, self.POI, context)
         poilyr = self.parameterAsVectorLayer(parameters, self.POI_FILE, context)
         poi_field = None
+        poiOnly = self.parameterAsBool(parameters, self.POI_ONLY, context)
         mbody = None
         ht = None
         clo = None
@@ -387,6 +395,19 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             outputKdiff = True
             #outputSstr = True
 
+        # Calculation at the POIs only, no rasters are saved
+        if poiOnly:
+            if poilyr is None:
+                raise QgsProcessingException("A vector point file including Point of Interest(s) is required to calculate only at the Point of Interest(s)")
+            if outputTreeplanter:
+                raise QgsProcessingException("Rasters for the TreePlanter and Spatial TC tools can not be saved when calculating only at the Point of Interest(s)")
+            outputTmrt = False
+            outputKup = False
+            outputKdown = False
+            outputLup = False
+            outputLdown = False
+            outputSh = False
+
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not (os.path.isdir(outputDir)):
                 os.mkdir(outputDir)
@@ -751,6 +772,9 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
 
                 ind += 1
 
+            if poiOnly and (np.any(poisxy[:, 1] < 0) or np.any(poisxy[:, 1] >= cols) or np.any(poisxy[:, 2] < 0) or np.any(poisxy[:, 2] >= rows)):
+                raise QgsProcessingException("Error: Point of Interest(s) outside the extent of the DSM")
+
             for k in range(0, poisxy.shape[0]):
                 poi_save = []  # np.zeros((1, 33))
                 data_out = outputDir + '/POI_' + str(poiname[k]) + '.txt'
@@ -877,6 +901,14 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             # asvf to calculate sunlit and shaded patches
             asvf = np.arccos(np.sqrt(svf))
 
+            # sky, vegetation and building patches of each pixel, classified once for all timesteps. diffsh is kept
+            # in patch_classes as a float32 matrix (pixels, patches). At the POIs only, the patches are classified in
+            # the window of each POI
+            patch_classes = None
+            if not poiOnly:
+                patch_classes = PatchClasses(shmat, vegshmat, vbshvegshmat, asvf, diffsh)
+                diffsh = None
+
             anisotropic_feedback = "Sky divided into " + str(int(shmat.shape[2])) + " patches\n \
                                     Anisotropic sky for diffuse shortwave radiation (Perez et al., 1993) and longwave radiation (Martin & Berdahl, 1984)"
             feedback.setProgressText(anisotropic_feedback)
@@ -888,6 +920,7 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             vegshmat = None
             vbshvegshmat = None
             asvf = None
+            patch_classes = None
             patch_option = 0
 
         # % Ts parameterisation maps
@@ -977,6 +1010,39 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
                     '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
                         '%.2f %.2f %.2f %.2f %.2f %.2f %.2f %.2f'
 
+        # Pixels of the POIs in the outputs
+        if poiOnly:
+            # SOLWEIG in a window around each POI instead of the whole grid. Outputs are arrays (1, POIs)
+            feedback.setProgressText("Calculating at the Point of Interest(s) only")
+            poi_model = SolweigPoi(poisxy, {
+                'dsm': dsm, 'scale': scale, 'rows': rows, 'cols': cols, 'svf': svf, 'svfN': svfN, 'svfW': svfW,
+                'svfE': svfE, 'svfS': svfS, 'svfveg': svfveg, 'svfNveg': svfNveg, 'svfEveg': svfEveg,
+                'svfSveg': svfSveg, 'svfWveg': svfWveg, 'svfaveg': svfaveg, 'svfEaveg': svfEaveg,
+                'svfSaveg': svfSaveg, 'svfWaveg': svfWaveg, 'svfNaveg': svfNaveg, 'vegdem': vegdsm,
+                'vegdem2': vegdsm2, 'albedo_b': albedo_b, 'absK': absK, 'absL': absL, 'ewall': ewall,
+                'Fside': Fside, 'Fup': Fup, 'Fcyl': Fcyl, 'usevegdem': usevegdem, 'onlyglobal': onlyglobal,
+                'buildings': buildings, 'location': location, 'landcover': landcover, 'lc_grid': lcgrid,
+                'dirwalls': wallaspect, 'walls': wallheight, 'cyl': cyl, 'elvis': elvis, 'amaxvalue': amaxvalue,
+                'bush': bush, 'TgK': TgK, 'Tstart': Tstart, 'alb_grid': alb_grid, 'emis_grid': emis_grid,
+                'TgK_wall': TgK_wall, 'Tstart_wall': Tstart_wall, 'TmaxLST': TmaxLST, 'TmaxLST_wall': TmaxLST_wall,
+                'first': first, 'second': second, 'svfalfa': svfalfa, 'svfbuveg': svfbuveg,
+                'firstdaytime': firstdaytime, 'timeadd': timeadd, 'timestepdec': timestepdec, 'diffsh': diffsh,
+                'shmat': shmat, 'vegshmat': vegshmat, 'vbshvegshmat': vbshvegshmat,
+                'anisotropic_sky': anisotropic_sky, 'asvf': asvf, 'patch_option': patch_option})
+            poi_rows = np.zeros(poisxy.shape[0], dtype=int)
+            poi_cols = np.arange(poisxy.shape[0])
+        elif not poisxy is None:
+            poi_rows = poisxy[:, 2].astype(int)
+            poi_cols = poisxy[:, 1].astype(int)
+
+        # POI output, buffered and written in blocks of timesteps
+        if not poisxy is None:
+            poi_svf = svf[poisxy[:, 2].astype(int), poisxy[:, 1].astype(int)]
+            poi_svfbuveg = svfbuveg[poisxy[:, 2].astype(int), poisxy[:, 1].astype(int)]
+            poi_recorder = PoiRecorder([outputDir + '/POI_' + str(poiname[k]) + '.txt' for k in range(poisxy.shape[0])],
+                                       poi_rows, poi_cols, numformat, PET_person(mbody, age, ht, activity, sex, clo),
+                                       sensorheight, Ta.__len__())
+
         for i in np.arange(0, Ta.__len__()):
             feedback.setProgress(int(i * (100. / Ta.__len__()))) # move progressbar forward
             if feedback.isCanceled():
@@ -1004,11 +1070,11 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
 
             # radI[i] = radI[i]/np.sin(altitude[0][i] * np.pi/180)
 
-            Tmrt, Kdown, Kup, Ldown, Lup, Tg, ea, esky, I0, CI, shadow, firstdaytime, timestepdec, timeadd, \
-                    Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, Keast, Ksouth, Kwest, Knorth, Least, \
-                    Lsouth, Lwest, Lnorth, KsideI, TgOut1, TgOut, radIout, radDout, \
-                    Lside, Lsky_patch_characteristics, CI_Tg, CI_TgG, KsideD, \
-                        dRad, Kside = so.Solweig_2022a_calc(
+            if poiOnly:
+                solweig_outputs = poi_model.timestep(i, altitude[0][i], azimuth[0][i], zen[0][i], jday[0][i],
+                        psi[0][i], dectime[i], altmax[0][i], Ta[i], RH[i], radG[i], radD[i], radI[i], P[i], Twater, CI)
+            else:
+                solweig_outputs = so.Solweig_2022a_calc(
                         i, dsm, scale, rows, cols, svf, svfN, svfW, svfE, svfS, svfveg,
                         svfNveg, svfEveg, svfSveg, svfWveg, svfaveg, svfEaveg, svfSaveg, svfWaveg, svfNaveg, \
                         vegdsm, vegdsm2, albedo_b, absK, absL, ewall, Fside, Fup, Fcyl, altitude[0][i],
@@ -1018,7 +1084,13 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
                         bush, Twater, TgK, Tstart, alb_grid, emis_grid, TgK_wall, Tstart_wall, TmaxLST,
                         TmaxLST_wall, first, second, svfalfa, svfbuveg, firstdaytime, timeadd, timestepdec, 
                         Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, CI, TgOut1, diffsh, shmat, vegshmat, vbshvegshmat, 
-                        anisotropic_sky, asvf, patch_option)
+                        anisotropic_sky, asvf, patch_option, patch_classes)
+
+            Tmrt, Kdown, Kup, Ldown, Lup, Tg, ea, esky, I0, CI, shadow, firstdaytime, timestepdec, timeadd, \
+                    Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, Keast, Ksouth, Kwest, Knorth, Least, \
+                    Lsouth, Lwest, Lnorth, KsideI, TgOut1, TgOut, radIout, radDout, \
+                    Lside, Lsky_patch_characteristics, CI_Tg, CI_TgG, KsideD, \
+                        dRad, Kside = solweig_outputs
 
             # Tmrt, Kdown, Kup, Ldown, Lup, Tg, ea, esky, I0, CI, shadow, firstdaytime, timestepdec, timeadd, \
             #         Tgmap1, Tgmap1E, Tgmap1S, Tgmap1W, Tgmap1N, Keast, Ksouth, Kwest, Knorth, Least, \
@@ -1052,7 +1124,8 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
             if i < first_unique_day.shape[0]:
                 I0_array[i] = I0
 
-            tmrtplot = tmrtplot + Tmrt
+            if not poiOnly:
+                tmrtplot = tmrtplot + Tmrt
 
             if altitude[0][i] > 0:
                 w = 'D'
@@ -1113,61 +1186,11 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
 
             # Write to POIs
             if not poisxy is None:
-                for k in range(0, poisxy.shape[0]):
-                    poi_save = np.zeros((1, 41))
-                    poi_save[0, 0] = YYYY[0][i]
-                    poi_save[0, 1] = jday[0][i]
-                    poi_save[0, 2] = hours[i]
-                    poi_save[0, 3] = minu[i]
-                    poi_save[0, 4] = dectime[i]
-                    poi_save[0, 5] = altitude[0][i]
-                    poi_save[0, 6] = azimuth[0][i]
-                    poi_save[0, 7] = radIout
-                    poi_save[0, 8] = radDout
-                    poi_save[0, 9] = radG[i]
-                    poi_save[0, 10] = Kdown[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 11] = Kup[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 12] = Keast[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 13] = Ksouth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 14] = Kwest[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 15] = Knorth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 16] = Ldown[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 17] = Lup[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 18] = Least[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 19] = Lsouth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 20] = Lwest[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 21] = Lnorth[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 22] = Ta[i]
-                    poi_save[0, 23] = TgOut[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 24] = RH[i]
-                    poi_save[0, 25] = esky
-                    poi_save[0, 26] = Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 27] = I0
-                    poi_save[0, 28] = CI
-                    poi_save[0, 29] = shadow[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 30] = svf[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 31] = svfbuveg[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 32] = KsideI[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    # Recalculating wind speed based on powerlaw
-                    WsPET = (1.1 / sensorheight) ** 0.2 * Ws[i]
-                    WsUTCI = (10. / sensorheight) ** 0.2 * Ws[i]
-                    resultPET = p._PET(Ta[i], RH[i], Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])], WsPET,
-                                        mbody, age, ht, activity, clo, sex)
-                    poi_save[0, 33] = resultPET
-                    resultUTCI = utci.utci_calculator(Ta[i], RH[i], Tmrt[int(poisxy[k, 2]), int(poisxy[k, 1])],
-                                                        WsUTCI)
-                    poi_save[0, 34] = resultUTCI
-                    poi_save[0, 35] = CI_Tg
-                    poi_save[0, 36] = CI_TgG
-                    poi_save[0, 37] = KsideD[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 38] = Lside[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 39] = dRad[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    poi_save[0, 40] = Kside[int(poisxy[k, 2]), int(poisxy[k, 1])]
-                    data_out = outputDir + '/POI_' + str(poiname[k]) + '.txt'
-                    # f_handle = file(data_out, 'a')
-                    f_handle = open(data_out, 'ab')
-                    np.savetxt(f_handle, poi_save, fmt=numformat)
-                    f_handle.close()
+                poi_recorder.record([YYYY[0][i], jday[0][i], hours[i], minu[i], dectime[i], altitude[0][i],
+                                     azimuth[0][i], radIout, radDout, radG[i], Kdown, Kup, Keast, Ksouth, Kwest,
+                                     Knorth, Ldown, Lup, Least, Lsouth, Lwest, Lnorth, Ta[i], TgOut, RH[i], esky, Tmrt,
+                                     I0, CI, shadow, poi_svf, poi_svfbuveg, KsideI, None, None, CI_Tg, CI_TgG, KsideD,
+                                     Lside, dRad, Kside], Ws[i])
 
             if hours[i] < 10:
                 XH = '0'
@@ -1212,6 +1235,10 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
                         skyviewimage_out = outputDir + '/POI_' + str(poiname[k]) + '.png'
                         PolarBarPlot(Lsky_patch_characteristics, altitude[0][i], azimuth[0][i], 'Hemisphere partitioning', skyviewimage_out, 0, 5, 0)
 
+        # Remaining POI output (also when cancelled)
+        if not poisxy is None:
+            poi_recorder.flush()
+
         # Save files for Tree Planter
         if outputTreeplanter:
             feedback.setProgressText("Saving files for Tree Planter tool")
@@ -1246,8 +1273,9 @@ class ProcessingSOLWEIGAlgorithm(QgsProcessingAlgorithm):
         # Copying met file for SpatialTC
         copyfile(inputMet, outputDir + '/metforcing.txt')
         
-        tmrtplot = tmrtplot / Ta.__len__()  # fix average Tmrt instead of sum, 20191022
-        saveraster(gdal_dsm, outputDir + '/Tmrt_average.tif', tmrtplot)
+        if not poiOnly:
+            tmrtplot = tmrtplot / Ta.__len__()  # fix average Tmrt instead of sum, 20191022
+            saveraster(gdal_dsm, outputDir + '/Tmrt_average.tif', tmrtplot)
         feedback.setProgressText("SOLWEIG: Model calculation finished.")
 
         rmtree(self.temp_dir, ignore_errors=True)  
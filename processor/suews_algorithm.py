@@ -40,6 +40,7 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterEnum,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterBoolean,
+                       QgsProcessingParameterDefinition,
                        QgsProcessingException)
 
 # try:
@@ -49,6 +50,7 @@ from qgis.core import (QgsProcessing,
 #     pass
 from pathlib import Path
 from ..util import f90nml
+from ..functions.SUEWS import suews_grids as suewsgrids
 import sys, os
 from qgis.PyQt.QtGui import QIcon
 import inspect
@@ -73,6 +75,7 @@ class ProcessingSuewsAlgorithm(QgsProcessingAlgorithm):
     SNOW = 'SNOW'
     SPINUP = 'SPINUP'
     TIMERESOUT = 'TIMERESOUT'
+    WORKERS = 'WORKERS'
 
     def initAlgorithm(self, config):
 
@@ -157,6 +160,13 @@ class ProcessingSuewsAlgorithm(QgsProcessingAlgorithm):
                                                        minValue=1))                                                                                       
         self.addParameter(QgsProcessingParameterFolderDestination(self.OUTPUT_DIR,
                                                      'Output folder'))
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+                                               self.tr("Number of parallel processes for the grids"),
+                                               QgsProcessingParameterNumber.Integer,
+                                               defaultValue=1,
+                                               minValue=1)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
 
 
     def processAlgorithm(self, parameters, context, feedback):
@@ -190,6 +200,7 @@ class ProcessingSuewsAlgorithm(QgsProcessingAlgorithm):
         smd = self.parameterAsString(parameters, self.SMD, context)
         wu = self.parameterAsString(parameters, self.WU, context)
         outputRes = self.parameterAsInt(parameters, self.TIMERESOUT, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
         # spinup = self.parameterAsBool(parameters, self.SPINUP, context)
 
         feedback.setProgressText(self.supylib)
@@ -239,27 +250,9 @@ class ProcessingSuewsAlgorithm(QgsProcessingAlgorithm):
         path_runcontrol = Path(infolder) / 'RunControl.nml'
         feedback.setProgressText("Initiating model")
         df_state_init = sp.init_supy(path_runcontrol)
-        grid = df_state_init.index[0]
-        feedback.setProgressText("Loading forcing data")
-        df_forcing = sp.load_forcing_grid(path_runcontrol, grid)
 
-        # SuPy simulation
-        feedback.setProgressText("Running model (QGIS not responsive)")
-        df_output, df_state_final = sp.run_supy(df_forcing,
-                                                df_state_init,
-                                                check_input=True,
-                                                serial_mode=True,
-                                                )
-
-        # resampling SuPy results for plotting
-        # df_output_suews = df_output.loc[grid, 'SUEWS']
-        # df_output_suews_rsmp = df_output_suews.resample('1h').mean()
-
-        # use SuPy function to save results
-        feedback.setProgressText("Saving to disk")
-        list_path_save = sp.save_supy(df_output,
-                                    df_state_final,
-                                    path_runcontrol=path_runcontrol)
+        # SuPy simulation, all grids (forcing loaded for each grid), year by year and saved to disk grid by grid
+        list_path_save = suewsgrids.run_grids(path_runcontrol, df_state_init, workers, feedback)
         #####################################################################################
 
         feedback.setProgressText('Model finished')
@@ -116,6 +116,13 @@ class URockAlgorithm(QgsProcessingAlgorithm):
     SAVE_VECTOR = "SAVE_VECTOR"
     SAVE_NETCDF = "SAVE_NETCDF"
     LOAD_OUTPUT = "LOAD_OUTPUT"
+    LOW_MEMORY = "LOW_MEMORY"
+    WARM_START_FILE = "WARM_START_FILE"
+    SAVE_WARM_START = "SAVE_WARM_START"
+    NETCDF_VARIABLES = "NETCDF_VARIABLES"
+    LIST_OF_NETCDF_VARIABLES = pd.Series([WINDSPEED_X, WINDSPEED_Y, WINDSPEED_Z])
+    NETCDF_LEVELS = "NETCDF_LEVELS"
+    NETCDF_COMPRESSION = "NETCDF_COMPRESSION"
     
     def initAlgorithm(self, config):
         """
@@ -277,11 +284,51 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                 self.SAVE_NETCDF,
                 self.tr("Save 3D wind field in a NetCDF file"),
                 defaultValue=True))
+        self.addParameter(
+           QgsProcessingParameterEnum(
+               self.NETCDF_VARIABLES, 
+               self.tr('3D wind components saved in the NetCDF file'),
+               self.LIST_OF_NETCDF_VARIABLES.values,
+               allowMultiple = True,
+               defaultValue=[0, 1, 2],
+               optional = True))
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.NETCDF_LEVELS,
+                self.tr('Heights (m) saved in the NetCDF file - if several values, separated by "," (all levels if empty)'),
+                defaultValue = "",
+                optional = True))
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.NETCDF_COMPRESSION,
+                self.tr('NetCDF compression level (0: no compression)'),
+                QgsProcessingParameterNumber.Integer,
+                NETCDF_COMPRESSION_LEVEL,
+                True,
+                minValue = 0,
+                maxValue = 9))
         self.addParameter(
             QgsProcessingParameterBoolean(
                 self.LOAD_OUTPUT,
                 self.tr("Open output 2D file(s) after running algorithm"),
                 defaultValue=True))        
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.LOW_MEMORY,
+                self.tr("Reduced-memory wind solver (single precision, for large domains)"),
+                defaultValue=LOW_MEMORY_SOLVER))
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.WARM_START_FILE,
+                self.tr('Previous URock solution used to warm-start the solver (.npz)'),
+                defaultValue = '',
+                extension='npz',
+                optional = True))
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.SAVE_WARM_START,
+                self.tr("Save the solver solution to warm-start later runs"),
+                defaultValue=SAVE_WARM_START))
         
         # Optional parameters
         # self.addParameter(
@@ -411,7 +458,19 @@ class URockAlgorithm(QgsProcessingAlgorithm):
         saveRaster = self.parameterAsBool(parameters, self.SAVE_RASTER, context)
         saveVector = self.parameterAsBool(parameters, self.SAVE_VECTOR, context)
         saveNetcdf = self.parameterAsBool(parameters, self.SAVE_NETCDF, context)
+        netcdfVariables = list(self.LIST_OF_NETCDF_VARIABLES.loc[self.parameterAsEnums(parameters, self.NETCDF_VARIABLES, context)])
+        if not netcdfVariables:
+            netcdfVariables = NETCDF_VARIABLES
+        netcdfLevels_str = self.parameterAsString(parameters, self.NETCDF_LEVELS, context)
+        if netcdfLevels_str.strip():
+            netcdfLevels = [float(i) for i in netcdfLevels_str.split(",")]
+        else:
+            netcdfLevels = None
+        netcdfCompressionLevel = self.parameterAsInt(parameters, self.NETCDF_COMPRESSION, context)
         loadOutput = self.parameterAsBool(parameters, self.LOAD_OUTPUT, context)
+        lowMemory = self.parameterAsBool(parameters, self.LOW_MEMORY, context)
+        warmStartFile = self.parameterAsString(parameters, self.WARM_START_FILE, context)
+        saveWarmStart = self.parameterAsBool(parameters, self.SAVE_WARM_START, context)
 
         # Creates the output folder if it does not exist
         if not os.path.exists(outputDirectory):
@@ -481,7 +540,13 @@ class URockAlgorithm(QgsProcessingAlgorithm):
                                  z_out = z_out,
                                  debug = DEBUG,
                                  profileType = profileType,
-                                 verticalProfileFile = profileFile)
+                                 verticalProfileFile = profileFile,
+                                 lowMemory = lowMemory,
+                                 warmStartFile = warmStartFile,
+                                 saveWarmStart = saveWarmStart,
+                                 netcdfVariables = netcdfVariables,
+                                 netcdfLevels = netcdfLevels,
+                                 netcdfCompressionLevel = netcdfCompressionLevel)
         
         # Load files into QGIS if user set it
         if loadOutput:
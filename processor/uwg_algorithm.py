@@ -32,17 +32,10 @@ from qgis.PyQt.QtGui import QIcon
 from osgeo.gdalconst import *
 import os
 import sys
-import numpy as np
 import inspect
 from pathlib import Path
-import shutil
-import traceback
 import math
-from ..util.umep_uwg_export_component import get_uwg_file, read_uwg_file
-try:
-    from uwg import UWG
-except:
-    pass
+from ..functions.UWG import uwg_grids as uwggrids
 
 
 class ProcessingUWGPreprocessorAlgorithm(QgsProcessingAlgorithm):
@@ -61,6 +54,7 @@ class ProcessingUWGPreprocessorAlgorithm(QgsProcessingAlgorithm):
     OUTPUT_FORMAT = 'OUTPUT_FORMAT'
     DTSIM = 'DTSIM'
     EXCLUDE_RURAL = 'EXCLUDE_RURAL'
+    WORKERS = 'WORKERS'
 
 
     def initAlgorithm(self, config):
@@ -96,6 +90,13 @@ class ProcessingUWGPreprocessorAlgorithm(QgsProcessingAlgorithm):
             self.tr('Output folder')))
         self.addParameter(QgsProcessingParameterBoolean(self.OUTPUT_FORMAT,
             self.tr('Save output in UMEP specific format. Leave ticked off to store in epw-format.')))
+        workers = QgsProcessingParameterNumber(self.WORKERS,
+                                               self.tr("Number of parallel processes for the grids"),
+                                               QgsProcessingParameterNumber.Integer,
+                                               defaultValue=1,
+                                               minValue=1)
+        workers.setFlags(workers.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(workers)
 
 
     def processAlgorithm(self, parameters, context, feedback):
@@ -117,6 +118,7 @@ class ProcessingUWGPreprocessorAlgorithm(QgsProcessingAlgorithm):
         umepformat = self.parameterAsBoolean(parameters, self.OUTPUT_FORMAT, context)
         dtSim = self.parameterAsDouble(parameters, self.DTSIM, context)
         excludeRural = self.parameterAsBoolean(parameters, self.EXCLUDE_RURAL, context)
+        workers = self.parameterAsInt(parameters, self.WORKERS, context)
         
         if parameters['OUTPUT_DIR'] == 'TEMPORARY_OUTPUT':
             if not (os.path.isdir(outputDir)):
@@ -136,171 +138,18 @@ class ProcessingUWGPreprocessorAlgorithm(QgsProcessingAlgorithm):
 
         feedback.setProgressText("Number of grids to calculate: " + str(nGrids))
 
-        mm = startDate[5:7]
-        dd = startDate[8:10]
-
-        index = 1
-
-        if umepformat:
-            header = '%iy  id  it imin   Q*      QH      QE      Qs      Qf    Wind    RH     Td     press   rain ' \
-                        '   Kdn    snow    ldown   fcld    wuh     xsmd    lai_hr  Kdiff   Kdir    Wd'
-            numformat = '%d %d %d %d %.2f %.2f %.2f %.2f %.2f %.5f %.2f %.2f %.2f %.2f %.2f %.2f %.2f ' \
-                            '%.2f %.2f %.2f %.2f %.2f %.2f %.2f' 
-
+        grids = []
         for f in vlayer.getFeatures():  # looping through each vector object
-            feedback.setProgress(int((index * 100) / nGrids))
-            if feedback.isCanceled():
-                feedback.setProgressText("Calculation cancelled")
-                break
-
             numtype = math.modf(f.attributes()[idx])
             if numtype[0] == 0.0:
                 attr = int(f.attributes()[idx])
-            
-            ## generate input files for UWG
-            uwgDict = read_uwg_file(inputDir, prefix + '_' + str(attr))
-            uwgDict['Month'] = mm
-            uwgDict['Day'] = dd
-            uwgDict['nDay'] = nDays
-            uwgDict['dtSim'] = dtSim
-            get_uwg_file(uwgDict, inputDir, prefix + '_' + str(attr))
-            
-            # inputUWGfile = inputDir + '/' + prefix + '_' + str(f.attributes()[idx])  + '.uwg'
-            epw_path = inputDir + '/' + prefix + '_' + str(attr)  + '.epw'
-            uwg_path = inputDir + '/' + prefix + '_' + str(attr)  + '_UWG.epw'
-            param_path = inputDir + '/' + prefix + '_' + str(attr)  + '.uwg'
-
-            shutil.copy(inputMet, epw_path)
-
-            if index == 1:
-                if umepformat:
-                    epwdata = np.genfromtxt(inputMet, skip_header=8, delimiter=',', filling_values=99999)
-                    umep_forcing = self.epw2UMEP(epwdata)
-                    np.savetxt(outputDir + '/metdata_UMEP.txt', umep_forcing, fmt=numformat, header=header, comments='')
-                # else:
-                #     shutil.copy(inputMet, )
-
-            # run model
-            if excludeRural:
-                if uwgDict['bldDensity'] < 0.005:
-                    feedback.setProgressText("Grid: " + str(attr) + ' not calculated. Less than 0.005 in building fraction.')
-
-                    if umepformat:
-                        epwdata_uwg = np.genfromtxt(epw_path, skip_header=8, delimiter=',', filling_values=99999)
-                        umep_uwg = self.epw2UMEP(epwdata_uwg)
-                        np.savetxt(outputDir + '/' + prefix + '_' + str(attr) +  '_UMEP_UWG.txt', umep_uwg, fmt=numformat, header=header, comments='')
-                        os.remove(epw_path)
-                    else:
-                        shutil.move(epw_path, Path(outputDir + '/' + prefix + '_' + str(attr)  + '_UWG.epw'))
-                else:
-                    feedback.setProgressText("UWG calculating grid: " + str(attr))
-                    try:
-                        model = UWG.from_param_file(param_path, epw_path=epw_path)
-                        model.generate()
-                        model.simulate()
-                        model.write_epw()
-
-                        if umepformat:
-                            epwdata_uwg = np.genfromtxt(uwg_path, skip_header=8, delimiter=',', filling_values=99999)
-                            umep_uwg = self.epw2UMEP(epwdata_uwg)
-                            np.savetxt(outputDir + '/' + prefix + '_' + str(attr) +  '_UMEP_UWG.txt', umep_uwg, fmt=numformat, header=header, comments='')
-                            os.remove(uwg_path)
-                        else:
-                            shutil.move(uwg_path, Path(outputDir + '/' + prefix + '_' + str(attr)  + '_UWG.epw'))
-                        
-                        os.remove(epw_path)
-
-                    except Exception as e:
-                        feedback.pushWarning("Calculating grid " + str(attr) + ' failed: ' + str(e))
-                        feedback.pushWarning('To get the full traceback error message, open the Python console in QGIS and re-run the simulation.')
-                        feedback.pushWarning('If you cannot solve the error yourself, report an issue to our code reporitory (see UMEP-Manual for details).')
-                        print('Traceback error message while caclulation grid: ' + str(attr))
-                        print(traceback.format_exc())
-                
-            else:
-                feedback.setProgressText("UWG calculating grid: " + str(attr))
-                try:
-                    model = UWG.from_param_file(param_path, epw_path=epw_path)
-                    model.generate()
-                    model.simulate()
-                    model.write_epw()
-
-                    if umepformat:
-                        epwdata_uwg = np.genfromtxt(uwg_path, skip_header=8, delimiter=',', filling_values=99999)
-                        umep_uwg = self.epw2UMEP(epwdata_uwg)
-                        np.savetxt(outputDir + '/' + prefix + '_' + str(attr) +  '_UMEP_UWG.txt', umep_uwg, fmt=numformat, header=header, comments='')
-                        os.remove(uwg_path)
-                    else:
-                        shutil.move(uwg_path, Path(outputDir + '/' + prefix + '_' + str(attr)  + '_UWG.epw'))
-                    
-                    os.remove(epw_path)
+            grids.append(attr)
 
-                except Exception as e:
-                    feedback.pushWarning("Calculating grid " + str(attr) + ' failed: ' + str(e))
-                    feedback.pushWarning('To get the full traceback error message, open the Python console in QGIS and re-run the simulation.')
-                    feedback.pushWarning('If you cannot solve the error yourself, report an issue to our code reporitory (see UMEP-Manual for details).')
-                    print('Traceback error message while caclulation grid: ' + str(attr))
-                    print(traceback.format_exc())
-
-            index += 1
+        uwggrids.run_grids(grids, inputDir, prefix, startDate, nDays, dtSim, inputMet, outputDir, umepformat,
+                           excludeRural, workers, feedback)
 
         return {self.OUTPUT_DIR: outputDir}
 
-    def epw2UMEP(self, met_old):
-        met_new = np.zeros((met_old.shape[0], 24)) - 999
-
-        # yyyy
-        met_new[:, 0] = 1985
-        met_new[met_old.shape[0] - 1, 0] = 1986
-
-        # hour
-        met_new[:, 2] = met_old[:, 3]
-        test = met_new[:, 2] == 24
-        met_new[test, 2] = 0
-
-        # day of year
-        mm = met_old[:, 1]
-        dd = met_old[:, 2]
-        rownum = met_old.shape[0]
-        for i in range(0, rownum):
-            yy = int(met_new[i, 0])
-            if (yy % 4) == 0:
-                if (yy % 100) == 0:
-                    if (yy % 400) == 0:
-                        leapyear = 1
-                    else:
-                        leapyear = 0
-                else:
-                    leapyear = 1
-            else:
-                leapyear = 0
-            if leapyear == 1:
-                dayspermonth = [31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-            else:
-                dayspermonth = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-            met_new[i, 1] = sum(dayspermonth[0:int(mm[i] - 1)]) + dd[i]
-
-        met_new[np.where(met_new[:, 2] == 0), 1] = met_new[np.where(met_new[:, 2] == 0), 1] + 1
-        met_new[met_old.shape[0] - 1, 1] = 1
-
-        # minute
-        met_new[:, 3] = 0
-
-        # met variables
-        met_new[:, 11] = met_old[:, 6]  # Ta
-        met_new[:, 10] = met_old[:, 8]  # Rh
-        met_new[:, 12] = met_old[:, 9] / 1000.  # P
-        met_new[:, 16] = met_old[:, 12]  # Ldown
-        met_new[:, 14] = met_old[:, 13]  # Kdown
-        met_new[:, 22] = met_old[:, 14]  # Kdir
-        met_new[:, 21] = met_old[:, 15]  # Kdiff
-        met_new[:, 23] = met_old[:, 20]  # Wdir
-        met_new[:, 9] = met_old[:, 21]  # Ws
-        met_new[:, 13] = met_old[:, 33]  # Rain
-        met_new[np.where(met_new[:, 13] == 999), 13] = 0
-
-        return met_new
-    
     def name(self):
         return 'Urban Heat Island: Urban Weather Generator'
 
@@ -327,6 +176,8 @@ class ProcessingUWGPreprocessorAlgorithm(QgsProcessingAlgorithm):
         '\n'
         'You can also increase stability by ticking in the box to exclude grids with very low building fraction.'
         '\n'
+        'Grids can be calculated in parallel (advanced parameter). Finished grids are listed in uwg_manifest.json in the output folder, and a run that was interrupted continues with the remaining grids if it is started again with the same settings and output folder.'
+        '\n'
         '----------------------\n'
         'Full manual is available via the <b>Help</b>-button.')
 
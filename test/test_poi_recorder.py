@@ -0,0 +1,94 @@
+# coding=utf-8
+"""Tests the buffered POI output (PoiRecorder) and the vectorized PET and UTCI against the values of each POI."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython import PET_calculations as p
+from ..functions.SOLWEIGpython import UTCI_calculations as utci
+from ..functions.SOLWEIGpython.poi_recorder import PoiRecorder, POI_COLUMNS
+
+NUMFORMAT = '%d %d %d %d %.5f' + ' %.2f' * 36
+
+
+def climate(size, seed=0):
+    """Random air temperature, relative humidity, mean radiant temperature and wind speed."""
+    rng = np.random.default_rng(seed)
+    Ta = rng.uniform(-15., 40., size)
+    RH = rng.uniform(10., 100., size)
+    Tmrt = Ta + rng.uniform(-10., 40., size)
+    Ws = rng.uniform(0.5, 12., size)
+
+    return Ta, RH, Tmrt, Ws
+
+
+class TestPoiRecorder(unittest.TestCase):
+    """Test that the POI files of the recorder equal the files written per timestep and POI."""
+
+    def test_pet(self):
+        """Test the PET of arrays against the PET of each value."""
+        Ta, RH, Tmrt, Ws = climate(200)
+        for sex in (1, 2):
+            vec = p._PET_vec(Ta, RH, Tmrt, Ws, 75., 35., 1.75, 80., 0.9, sex)
+            scalar = [p._PET(Ta[i], RH[i], Tmrt[i], Ws[i], 75., 35., 1.75, 80., 0.9, sex) for i in range(Ta.size)]
+            np.testing.assert_allclose(vec, scalar, rtol=0, atol=1e-9)
+
+    def test_utci(self):
+        """Test the UTCI of arrays against the UTCI of each value, including missing values."""
+        Ta, RH, Tmrt, Ws = climate(200)
+        Ta[:3] = -999.
+        Ws[3:5] = -999.
+        vec = utci.utci_calculator_vec(Ta, RH, Tmrt, Ws)
+        scalar = [utci.utci_calculator(Ta[i], RH[i], Tmrt[i], Ws[i]) for i in range(Ta.size)]
+        np.testing.assert_allclose(vec, scalar, rtol=0, atol=1e-9)
+
+    def test_files(self):
+        """Test the POI files written in blocks against one row per timestep and POI."""
+        timesteps, rows, cols = 7, 6, 8
+        poi_rows, poi_cols = np.array([0, 3, 5]), np.array([7, 2, 5])
+        Ta, RH, _, Ws = climate(timesteps)
+        pet = p.PET_person(75., 35., 1.75, 80., 1, 0.9)
+        rng = np.random.default_rng(1)
+        grids = [rng.uniform(-5., 60., (timesteps, rows, cols)) for _ in range(POI_COLUMNS)]
+        poi_svf = rng.random(poi_rows.size)
+
+        with tempfile.TemporaryDirectory() as directory:
+            blocks = [os.path.join(directory, 'block_%d.txt' % k) for k in range(poi_rows.size)]
+            single = [os.path.join(directory, 'single_%d.txt' % k) for k in range(poi_rows.size)]
+            recorder = PoiRecorder(blocks, poi_rows, poi_cols, NUMFORMAT, pet, 2., timesteps)
+            recorder.values = np.zeros((3, poi_rows.size, POI_COLUMNS))
+            recorder.wind = np.zeros(3)
+
+            for i in range(timesteps):
+                values = [2020, 172, i, 0, 172 + i / 24.] + [grids[c][i] for c in range(5, 30)]
+                values[22], values[24] = Ta[i], RH[i]
+                values += [poi_svf, 0.8, grids[32][i], None, None] + [grids[c][i] for c in range(35, POI_COLUMNS)]
+                recorder.record(values, Ws[i])
+
+                for k in range(poi_rows.size):
+                    poi_save = np.zeros((1, POI_COLUMNS))
+                    for column, value in enumerate(values):
+                        if isinstance(value, np.ndarray):
+                            value = value[poi_rows[k], poi_cols[k]] if value.ndim == 2 else value[k]
+                        if value is not None:
+                            poi_save[0, column] = value
+                    Tmrt = poi_save[0, 26]
+                    poi_save[0, 33] = p._PET(Ta[i], RH[i], Tmrt, (1.1 / 2.) ** 0.2 * Ws[i], 75., 35., 1.75, 80.,
+                                             0.9, 1)
+                    poi_save[0, 34] = utci.utci_calculator(Ta[i], RH[i], Tmrt, (10. / 2.) ** 0.2 * Ws[i])
+                    with open(single[k], 'ab') as f_handle:
+                        np.savetxt(f_handle, poi_save, fmt=NUMFORMAT)
+            recorder.flush()
+
+            for block, row in zip(blocks, single):
+                with open(block) as block_file, open(row) as row_file:
+                    self.assertEqual(block_file.read(), row_file.read())
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TestPoiRecorder)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
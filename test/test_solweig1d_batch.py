@@ -0,0 +1,107 @@
+# coding=utf-8
+"""Tests the batched SOLWEIG1D model (TreePlanter) against the timestep loop."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..functions.TreePlanter.SOLWEIG1D import SOLWEIG1D_2023a
+
+
+class TestSolweig1DBatch(unittest.TestCase):
+    """Test that Tmrt under trees from the batched model equals Tmrt from the loop over timesteps."""
+
+    def setUp(self):
+        self.infolder = tempfile.mkdtemp()
+
+        # UTC, posture, onlyglobal, landcover, anisotropic, cylinder, albedo_walls, albedo_ground, emissivity_walls,
+        # emissivity_ground, absK, absL, elevation, patch_option
+        with open(os.path.join(self.infolder, 'treeplantersettings.txt'), 'w') as f:
+            f.write('UTC posture onlyglobal landcover anisotropic cylinder albedo_walls albedo_ground emissivity_walls '
+                    'emissivity_ground absK absL elevation patch_option\n')
+            f.write('1 0 0 1 1 1 0.2 0.15 0.9 0.95 0.7 0.95 10 2\n')
+
+        # One summer day, hourly (UMEP met format)
+        met = np.zeros((24, 24))
+        hours = np.arange(24)
+        daylight = np.clip(np.sin((hours - 4) / 16. * np.pi), 0, None)
+        met[:, 0] = 2020
+        met[:, 1] = 172
+        met[:, 2] = hours
+        met[:, 9] = 2.
+        met[:, 10] = 60. - 20 * daylight
+        met[:, 11] = 15. + 10 * daylight
+        met[:, 12] = 101.3
+        met[:, 14] = 850. * daylight
+        met[:, 21] = 120. * daylight
+        met[:, 22] = 800. * daylight
+        self.metfile = os.path.join(self.infolder, 'metforcing.txt')
+        np.savetxt(self.metfile, met, header=' '.join(['col' + str(i) for i in range(24)]), comments='', fmt='%.3f')
+
+        self.dsm = np.zeros((10, 10))
+        self.dsm[4:6, 4:6] = 20.
+        self.lon = 11.97
+        self.lat = 57.7
+
+    def tearDown(self):
+        shutil.rmtree(self.infolder)
+
+    def test_batch_equals_loop(self):
+        """Test Tmrt for several transmissivities in one batched run."""
+        r_range = range(6, 19)
+        taus = [0.03, 0.1, 0.3]
+
+        tmrt_batch, azimuth, altitude, amaxvalue = SOLWEIG1D_2023a.tmrt_1d_fun(
+            self.metfile, self.infolder, taus, self.lon, self.lat, self.dsm, r_range, self.infolder, batch=True)
+
+        for c, tau in enumerate(taus):
+            tmrt_loop, _, _, _ = SOLWEIG1D_2023a.tmrt_1d_fun(
+                self.metfile, self.infolder, tau, self.lon, self.lat, self.dsm, r_range, self.infolder)
+            np.testing.assert_allclose(tmrt_batch[:, c], tmrt_loop[:, 0], rtol=0, atol=1e-6)
+            np.testing.assert_array_equal(tmrt_batch[:, -1], tmrt_loop[:, 1])
+
+        self.assertEqual(amaxvalue, 20.)
+
+    def test_cached(self):
+        """Test that cached Tmrt is reused and equals the batched Tmrt."""
+        r_range = range(8, 16)
+        tmrt_1d, _, _, _ = SOLWEIG1D_2023a.tmrt_1d_cached(
+            self.metfile, self.infolder, [0.03], self.lon, self.lat, self.dsm, r_range, self.infolder)
+        tmrt_2d, _, _, _ = SOLWEIG1D_2023a.tmrt_1d_cached(
+            self.metfile, self.infolder, [0.2, 0.03], self.lon, self.lat, self.dsm, r_range, self.infolder)
+        tmrt_batch, _, _, _ = SOLWEIG1D_2023a.tmrt_1d_fun(
+            self.metfile, self.infolder, [0.2], self.lon, self.lat, self.dsm, r_range, self.infolder, batch=True)
+
+        self.assertEqual(tmrt_1d.shape, (8, 2))
+        np.testing.assert_array_equal(tmrt_2d[:, 1], tmrt_1d[:, 0])
+        np.testing.assert_allclose(tmrt_2d[:, 0], tmrt_batch[:, 0], rtol=0, atol=1e-9)
+
+    def test_cached_ranges(self):
+        """Test cached Tmrt and hours of different timesteps for the same met file."""
+        for r_range in (range(8, 16), range(6, 19), range(8, 16)):
+            tmrt_1d, _, _, _ = SOLWEIG1D_2023a.tmrt_1d_cached(
+                self.metfile, self.infolder, [0.03], self.lon, self.lat, self.dsm, r_range, self.infolder)
+            tmrt_batch, _, _, _ = SOLWEIG1D_2023a.tmrt_1d_fun(
+                self.metfile, self.infolder, [0.03], self.lon, self.lat, self.dsm, r_range, self.infolder, batch=True)
+
+            self.assertEqual(tmrt_1d.shape, (r_range.__len__(), 2))
+            np.testing.assert_array_equal(tmrt_1d[:, -1], np.array(r_range))
+            np.testing.assert_allclose(tmrt_1d[:, 0], tmrt_batch[:, 0], rtol=0, atol=1e-9)
+
+    def test_cache_size(self):
+        """Test that the caches keep at most CACHE_SIZE entries."""
+        taus = [0.01 * i for i in range(1, SOLWEIG1D_2023a.CACHE_SIZE + 5)]
+        SOLWEIG1D_2023a.tmrt_1d_cached(
+            self.metfile, self.infolder, taus, self.lon, self.lat, self.dsm, range(10, 12), self.infolder)
+
+        self.assertLessEqual(SOLWEIG1D_2023a._tmrt_cache.__len__(), SOLWEIG1D_2023a.CACHE_SIZE)
+        self.assertLessEqual(SOLWEIG1D_2023a._sun_cache.__len__(), SOLWEIG1D_2023a.CACHE_SIZE)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TestSolweig1DBatch)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Tests the matrix products over the sky patches (PatchClasses) against the loops over the patches."""
+
+import os
+import time
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython.Kside_veg_v2022a import Kside_veg_v2022a
+from ..functions.SOLWEIGpython.patch_characteristics import PatchClasses
+from ..util.SEBESOLWEIGCommonFiles.Perez_v3 import Perez_v3
+
+
+def sky_matrices(rows, cols, patches, dtype=float, seed=0):
+    """Random shadow matrices (rows, cols, patches), diffsh and asvf of a grid."""
+    rng = np.random.default_rng(seed)
+    shmat = (rng.random((rows, cols, patches)) > 0.3).astype(dtype)
+    vegshmat = (rng.random((rows, cols, patches)) > 0.2).astype(dtype)
+    vbshvegshmat = (rng.random((rows, cols, patches)) > 0.2).astype(dtype)
+    diffsh = shmat - (1 - vegshmat) * (1 - 0.03)
+    asvf = np.arccos(np.sqrt(rng.uniform(0.2, 1., (rows, cols))))
+
+    return shmat, vegshmat, vbshvegshmat, diffsh, asvf
+
+
+class TestSolweigPatchReductions(unittest.TestCase):
+    """Test that the diffuse luminance and Kside of the anisotropic sky equal the loops over the patches."""
+
+    def setUp(self):
+        self.rows, self.cols = 20, 25
+        # 153 patches
+        self.lv, _, _ = Perez_v3(40., 150., 200., 600., 172, 1, 2)
+        self.shmat, self.vegshmat, self.vbshvegshmat, self.diffsh, self.asvf = sky_matrices(
+            self.rows, self.cols, self.lv.shape[0])
+        self.patch_classes = PatchClasses(self.shmat, self.vegshmat, self.vbshvegshmat, self.asvf, self.diffsh)
+
+    def kside(self, cyl, patch_classes, diffsh):
+        """Kside_veg_v2022a of the grid, with or without precomputed patch classes."""
+        grid = np.linspace(0.3, 0.9, self.rows * self.cols).reshape(self.rows, self.cols)
+        return Kside_veg_v2022a(600., 200., 700., grid > 0.5, grid, grid, grid, grid, grid, grid, grid, grid,
+                                150., 40., 0.03, 0., 0.2, 0.5, grid * 100, grid * 90, grid * 80, grid * 70,
+                                cyl, self.lv, 1, diffsh, self.rows, self.cols, self.asvf,
+                                self.shmat, self.vegshmat, self.vbshvegshmat, patch_classes)
+
+    def test_diffuse_luminance(self):
+        """Test the total relative luminance from the sky into each pixel."""
+        aniLum = np.zeros((self.rows, self.cols))
+        for idx in range(self.lv.shape[0]):
+            aniLum += self.diffsh[:, :, idx] * self.lv[idx, 2]
+
+        aniLum_matrix = self.patch_classes.grid(self.patch_classes.diffuse_sum(self.lv[:, 2]))
+        np.testing.assert_allclose(aniLum_matrix, aniLum, rtol=1e-5, atol=1e-8)
+
+    def test_kside(self):
+        """Test Kside of a cylinder and of a box."""
+        for cyl in (1, 0):
+            loop = self.kside(cyl, None, self.diffsh)
+            matrix = self.kside(cyl, self.patch_classes, None)
+            for k_loop, k_matrix in zip(loop, matrix):
+                np.testing.assert_allclose(k_matrix, k_loop, rtol=1e-5, atol=1e-6)
+
+    @unittest.skipUnless(os.environ.get('UMEP_TIMING'), 'set UMEP_TIMING to time a 1000x1000 grid')
+    def test_timing(self):
+        """Time the sums over the patches of one timestep on a 1000x1000 grid."""
+        rows, cols = 1000, 1000
+        shmat, vegshmat, vbshvegshmat, diffsh, asvf = sky_matrices(rows, cols, self.lv.shape[0], dtype=np.float32)
+        self.rows, self.cols = rows, cols
+        self.shmat, self.vegshmat, self.vbshvegshmat, self.asvf = shmat, vegshmat, vbshvegshmat, asvf
+
+        start = time.time()
+        patch_classes = PatchClasses(shmat, vegshmat, vbshvegshmat, asvf, diffsh)
+        print('\nPatch classes (once per run): %.2f s' % (time.time() - start))
+
+        start = time.time()
+        aniLum = np.zeros((rows, cols))
+        for idx in range(self.lv.shape[0]):
+            aniLum += diffsh[:, :, idx] * self.lv[idx, 2]
+        loop = time.time() - start
+        start = time.time()
+        patch_classes.grid(patch_classes.diffuse_sum(self.lv[:, 2]))
+        print('aniLum: loop %.2f s, matrix product %.2f s' % (loop, time.time() - start))
+
+        for cyl in (1, 0):
+            start = time.time()
+            self.kside(cyl, None, diffsh)
+            loop = time.time() - start
+            start = time.time()
+            self.kside(cyl, patch_classes, None)
+            print('Kside (cyl=%d): loop %.2f s, matrix products %.2f s' % (cyl, loop, time.time() - start))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TestSolweigPatchReductions)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
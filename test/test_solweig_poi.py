@@ -0,0 +1,172 @@
+# coding=utf-8
+"""Tests SOLWEIG at points of interest only (SolweigPoi) against SOLWEIG of the whole grid."""
+
+import unittest
+
+import numpy as np
+
+from ..functions.SOLWEIGpython import Solweig_2022a_calc_forprocessing as so
+from ..functions.SOLWEIGpython.patch_characteristics import PatchClasses
+from ..functions.SOLWEIGpython.solweig_poi import SolweigPoi, ray_shadows
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_13 import shadowingfunction_wallheight_13
+from ..util.SEBESOLWEIGCommonFiles.shadowingfunction_wallheight_23 import shadowingfunction_wallheight_23
+
+# Sun positions (altitude, azimuth) and radiation (radG, radD, radI) of the timesteps, starting at night
+TIMESTEPS = ((-5., 20., 0., 0., 0.), (15., 80., 250., 100., 400.), (45., 160., 700., 150., 800.),
+             (30., 250., 500., 120., 600.), (10., 300., 100., 80., 150.))
+
+
+def surface(rows, cols, seed=0):
+    """Random DSM with buildings, wall heights and aspects, and vegetation DSMs (as prepared by SOLWEIG)."""
+    rng = np.random.default_rng(seed)
+    dsm = 10. + rng.random((rows, cols)) * 0.5
+    buildings = np.ones((rows, cols))
+    for _ in range(8):
+        row, col = rng.integers(0, rows - 8), rng.integers(0, cols - 8)
+        height, width = rng.integers(3, 9, 2)
+        dsm[row:row + height, col:col + width] = 10. + rng.uniform(5., 25.)
+        buildings[row:row + height, col:col + width] = 0.
+
+    padded = np.pad(dsm, 1, mode='edge')
+    neighbours = np.max([padded[:-2, 1:-1], padded[2:, 1:-1], padded[1:-1, :-2], padded[1:-1, 2:]], axis=0)
+    walls = neighbours - dsm
+    walls[walls < 3.] = 0.
+    dirwalls = rng.uniform(0., 360., (rows, cols)) * (walls > 0)
+
+    vegdem = (rng.random((rows, cols)) > 0.9) * rng.uniform(3., 12., (rows, cols)) * buildings
+    vegdem2 = vegdem * 0.25
+    vegdem = vegdem + dsm
+    vegdem[vegdem == dsm] = 0
+    vegdem2 = vegdem2 + dsm
+    vegdem2[vegdem2 == dsm] = 0
+    bush = np.logical_not((vegdem2 * vegdem)) * vegdem
+
+    return dsm, buildings, walls, dirwalls, vegdem, vegdem2, bush
+
+
+def arguments(rows, cols, usevegdem, anisotropic_sky, cyl, seed=0):
+    """Arguments of Solweig_2022a_calc that do not change between timesteps."""
+    rng = np.random.default_rng(seed)
+    dsm, buildings, walls, dirwalls, vegdem, vegdem2, bush = surface(rows, cols, seed)
+    svf = rng.uniform(0.3, 1., (rows, cols))
+    svfveg = rng.uniform(0.8, 1., (rows, cols))
+    svfaveg = rng.uniform(0.8, 1., (rows, cols))
+    grid_arguments = {'svf': svf, 'svfveg': svfveg, 'svfaveg': svfaveg}
+    for direction in ('N', 'E', 'S', 'W'):
+        grid_arguments['svf' + direction] = svf * rng.uniform(0.9, 1., (rows, cols))
+        grid_arguments['svf' + direction + 'veg'] = svfveg * rng.uniform(0.9, 1., (rows, cols))
+        grid_arguments['svf' + direction + 'aveg'] = svfaveg * rng.uniform(0.9, 1., (rows, cols))
+
+    shmat = vegshmat = vbshvegshmat = diffsh = asvf = None
+    patch_option = 0
+    if anisotropic_sky == 1:
+        patch_option = 2
+        shmat = (rng.random((rows, cols, 153)) > 0.3).astype(float)
+        vegshmat = (rng.random((rows, cols, 153)) > 0.1).astype(float)
+        vbshvegshmat = (rng.random((rows, cols, 153)) > 0.1).astype(float)
+        diffsh = shmat - (1 - vegshmat) * (1 - 0.03)
+        asvf = np.arccos(np.sqrt(svf))
+
+    grid_arguments.update({
+        'dsm': dsm, 'scale': 1., 'rows': rows, 'cols': cols, 'vegdem': vegdem, 'vegdem2': vegdem2, 'albedo_b': 0.2,
+        'absK': 0.7, 'absL': 0.95, 'ewall': 0.9, 'Fside': 0.22, 'Fup': 0.06, 'Fcyl': 0.28, 'usevegdem': usevegdem,
+        'onlyglobal': 0, 'buildings': buildings, 'location': {'latitude': 57.7, 'longitude': 12., 'altitude': 10.},
+        'landcover': 0, 'lc_grid': None, 'dirwalls': dirwalls, 'walls': walls, 'cyl': cyl, 'elvis': 0,
+        'amaxvalue': max(dsm.max() - dsm.min(), vegdem.max()) if usevegdem == 1 else 0, 'bush': bush,
+        'TgK': np.zeros((rows, cols)) + 0.37, 'Tstart': np.zeros((rows, cols)) - 3.41,
+        'alb_grid': np.zeros((rows, cols)) + 0.15, 'emis_grid': np.zeros((rows, cols)) + 0.95, 'TgK_wall': 0.37,
+        'Tstart_wall': -3.41, 'TmaxLST': 15., 'TmaxLST_wall': 15., 'first': 1., 'second': 22.,
+        'svfalfa': np.arcsin(np.exp(np.log(1. - svf) / 2.)), 'svfbuveg': svf - (1. - svfveg) * (1. - 0.03),
+        'firstdaytime': 1., 'timeadd': 0., 'timestepdec': 1. / 24, 'diffsh': diffsh, 'shmat': shmat,
+        'vegshmat': vegshmat, 'vbshvegshmat': vbshvegshmat, 'anisotropic_sky': anisotropic_sky, 'asvf': asvf,
+        'patch_option': patch_option})
+
+    return grid_arguments
+
+
+def timestep_arguments(i, timestep):
+    """Arguments of Solweig_2022a_calc of one timestep."""
+    altitude, azimuth, radG, radD, radI = timestep
+    return {'i': i, 'altitude': altitude, 'azimuth': azimuth, 'zen': (90. - altitude) * np.pi / 180., 'jday': 172,
+            'psi': 0.03, 'dectime': 172.25 + i / 24., 'altmax': 55., 'Ta': 20. + i, 'RH': 60., 'radG': radG,
+            'radD': radD, 'radI': radI, 'P': 101.3, 'Twater': 15., 'CI': 1.}
+
+
+class TestSolweigPoi(unittest.TestCase):
+    """Test that SOLWEIG at the POIs gives the values of SOLWEIG of the whole grid at the POIs."""
+
+    def setUp(self):
+        self.rows, self.cols = 60, 70
+        # POIs (index, column, row) in the middle, near an edge and in a corner of the grid
+        self.poisxy = np.array([[0, 35, 30], [1, 10, 2], [2, 69, 59]], dtype=float)
+
+    def test_ray_shadows(self):
+        """Test the shadows of the pixels against the shadowing functions of the whole grid."""
+        dsm, _, walls, dirwalls, vegdem, vegdem2, bush = surface(self.rows, self.cols)
+        aspect = dirwalls * np.pi / 180.
+        amaxvalue = max(dsm.max() - dsm.min(), vegdem.max())
+        rows, cols = np.mgrid[0:self.rows, 0:self.cols]
+        rows, cols = rows.ravel(), cols.ravel()
+        for altitude, azimuth in ((5., 30.), (25., 100.), (50., 180.), (35., 260.), (15., 340.), (40., 45.)):
+            sh, _, wallsun, _, _ = shadowingfunction_wallheight_13(dsm, azimuth, altitude, 1., walls, aspect)
+            ray_sh, _, ray_wallsun = ray_shadows(dsm, rows, cols, azimuth, altitude, 1., walls.ravel(),
+                                                 aspect.ravel(), 0, vegdem, vegdem2, 0, bush.ravel())
+            np.testing.assert_array_equal(ray_sh.reshape(sh.shape), sh)
+            np.testing.assert_array_equal(ray_wallsun.reshape(sh.shape), wallsun)
+
+            vegsh, sh, _, _, wallsun, _, _, _ = shadowingfunction_wallheight_23(
+                dsm, vegdem, vegdem2, azimuth, altitude, 1., amaxvalue, bush, walls, aspect)
+            ray_sh, ray_vegsh, ray_wallsun = ray_shadows(dsm, rows, cols, azimuth, altitude, 1., walls.ravel(),
+                                                         aspect.ravel(), 1, vegdem, vegdem2, amaxvalue, bush.ravel())
+            np.testing.assert_array_equal(ray_sh.reshape(sh.shape), sh)
+            np.testing.assert_array_equal(ray_vegsh.reshape(sh.shape), vegsh)
+            np.testing.assert_array_equal(ray_wallsun.reshape(sh.shape), wallsun)
+
+    def compare(self, usevegdem, anisotropic_sky, cyl):
+        """Compare all outputs of the timesteps at the POIs."""
+        grid_arguments = arguments(self.rows, self.cols, usevegdem, anisotropic_sky, cyl)
+        poi = SolweigPoi(self.poisxy, arguments(self.rows, self.cols, usevegdem, anisotropic_sky, cyl))
+
+        state = {name: np.zeros((self.rows, self.cols)) for name in
+                 ('Tgmap1', 'Tgmap1E', 'Tgmap1S', 'Tgmap1W', 'Tgmap1N', 'TgOut1')}
+        patch_classes = None
+        if anisotropic_sky == 1:
+            patch_classes = PatchClasses(grid_arguments['shmat'], grid_arguments['vegshmat'],
+                                         grid_arguments['vbshvegshmat'], grid_arguments['asvf'],
+                                         grid_arguments['diffsh'])
+
+        rows = self.poisxy[:, 2].astype(int)
+        cols = self.poisxy[:, 1].astype(int)
+        for i, timestep in enumerate(TIMESTEPS):
+            step_arguments = timestep_arguments(i, timestep)
+            outputs = so.Solweig_2022a_calc(**grid_arguments, **state, **step_arguments, patch_classes=patch_classes)
+            for name, position in (('firstdaytime', 11), ('timestepdec', 12), ('timeadd', 13), ('Tgmap1', 14),
+                                   ('Tgmap1E', 15), ('Tgmap1S', 16), ('Tgmap1W', 17), ('Tgmap1N', 18),
+                                   ('TgOut1', 28)):
+                if name in state:
+                    state[name] = outputs[position]
+                else:
+                    grid_arguments[name] = outputs[position]
+
+            poi_outputs = poi.timestep(**step_arguments)
+            self.assertEqual(len(poi_outputs), len(outputs))
+            for output, poi_output in zip(outputs, poi_outputs):
+                if isinstance(output, np.ndarray) and output.shape == (self.rows, self.cols):
+                    np.testing.assert_allclose(poi_output[0], output[rows, cols], rtol=1e-6, atol=1e-6)
+                elif output is not None:
+                    np.testing.assert_allclose(poi_output, output, rtol=1e-6, atol=1e-6)
+
+    def test_isotropic(self):
+        """Test with vegetation and an isotropic sky."""
+        self.compare(1, 0, 1)
+
+    def test_anisotropic(self):
+        """Test without vegetation and with an anisotropic sky."""
+        self.compare(0, 1, 0)
+        self.compare(1, 1, 1)
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TestSolweigPoi)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -0,0 +1,86 @@
+# coding=utf-8
+"""Tests the FFT scoring of TreePlanter positions against the sum of the weights under the tree shadow."""
+
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from ..functions.TreePlanter.TreePlanter import TreePlanterScoring
+
+
+def direct_scores(weight, treerasters):
+    """Sum of the weights under the tree shadow for each position, pasting the shadow at each position."""
+    kernel = treerasters.treeshade_bool
+    rows, cols = weight.shape[0], weight.shape[1]
+    padded = np.zeros((rows + 2 * kernel.shape[0], cols + 2 * kernel.shape[1], weight.shape[2]))
+    padded[kernel.shape[0]:kernel.shape[0] + rows, kernel.shape[1]:kernel.shape[1] + cols] = weight
+    score = np.zeros((rows, cols))
+    for y in range(rows):
+        for x in range(cols):
+            y1 = kernel.shape[0] + y - int(treerasters.buffer_y[0])
+            x1 = kernel.shape[1] + x - int(treerasters.buffer_x[0])
+            score[y, x] = np.sum(padded[y1:y1 + kernel.shape[0], x1:x1 + kernel.shape[1]] * kernel)
+
+    return score
+
+
+class TestTreePlanterScoring(unittest.TestCase):
+    """Test the scores and the ties between positions with the same score."""
+
+    def setUp(self):
+        # Round crown with a shadow that moves over 3 timesteps
+        yy, xx = np.mgrid[-3:4, -3:4]
+        kernel = np.zeros((7, 9, 3))
+        for t in range(3):
+            kernel[:, t:t + 7, t] = np.hypot(yy, xx) <= 3
+        self.treerasters = SimpleNamespace(treeshade_bool=kernel, buffer_y=np.array([3, 4]),
+                                           buffer_x=np.array([3, 6]))
+
+        # Uniform Tmrt (one decimal) on sunlit ground, buildings in a corner: all positions away from the edges and
+        # the buildings tie exactly
+        buildings = np.ones((40, 50))
+        buildings[:12, :15] = 0
+        self.weight_sun = buildings[:, :, np.newaxis] * np.full((40, 50, 3), 61.3)
+        self.weight_shade = buildings[:, :, np.newaxis] * np.full((40, 50, 3), 38.7)
+
+    def test_scores(self):
+        """Test the FFT scores against the direct sums, with exactly 0 where there are no weights."""
+        scores = TreePlanterScoring.score_positions([self.weight_sun, self.weight_shade], self.treerasters)
+        for score, weight in zip(scores, [self.weight_sun, self.weight_shade]):
+            direct = direct_scores(weight, self.treerasters)
+            np.testing.assert_allclose(score, direct, rtol=0, atol=1e-8)
+            self.assertTrue(np.all(score[direct == 0] == 0))
+
+    def test_ties(self):
+        """Test that exactly tied positions give the first position, as np.where on the direct sums."""
+        sum_sun, sum_shade = TreePlanterScoring.score_positions([self.weight_sun, self.weight_shade],
+                                                                self.treerasters)
+        d_tmrt = np.around(sum_sun, decimals=1) - np.around(sum_shade, decimals=1)
+        direct = np.around(direct_scores(self.weight_sun, self.treerasters), decimals=1) \
+            - np.around(direct_scores(self.weight_shade, self.treerasters), decimals=1)
+        direct_y, direct_x = np.where(direct == np.max(direct))
+        self.assertGreater(direct_y.size, 100)
+
+        atol = TreePlanterScoring.score_tolerance(sum_sun, sum_shade)
+        tied = TreePlanterScoring.tied_max(d_tmrt, atol)
+        np.testing.assert_array_equal(tied, direct == np.max(direct))
+        temp_y, temp_x = np.where(tied)
+        self.assertEqual((temp_y[0], temp_x[0]), (direct_y[0], direct_x[0]))
+
+    def test_ties_round_off(self):
+        """Test that differences of equal value but different round-off tie."""
+        # 12.3 - 12.1 > 0.2 > 10.2 - 10.0 in floating point
+        d_tmrt = np.array([[0.1, 10.2 - 10.0], [12.3 - 12.1, 0.]])
+        self.assertEqual(np.argmax(d_tmrt), 2)
+
+        tied = TreePlanterScoring.tied_max(d_tmrt, TreePlanterScoring.score_tolerance(np.array([12.3, 12.1])))
+        np.testing.assert_array_equal(tied, [[False, True], [True, False]])
+        temp_y, temp_x = np.where(tied)
+        self.assertEqual((temp_y[0], temp_x[0]), (0, 1))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TestTreePlanterScoring)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
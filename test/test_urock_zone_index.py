@@ -0,0 +1,168 @@
+# coding=utf-8
+"""Tests the indexed assignment of the grid points to the Röckle zones (ZoneIndex) against the spatial join."""
+
+import os
+import time
+import unittest
+from fractions import Fraction
+
+import numpy as np
+
+from ..functions.URock import ZoneIndex
+
+try:
+    from shapely import wkt as shapely_wkt
+    from shapely.geometry import Point
+except ImportError:
+    shapely_wkt = None
+
+# Grid of the tests: 2 m cells, not starting at the origin
+MESH_SIZE = 2.
+X0, Y0 = 1000.5, 2000.25
+NX, NY = 60, 50
+
+
+def ring_wkt(coords):
+    """WKT ring of a list of (x, y), closed."""
+    coords = list(coords) + [coords[0]]
+    return '(' + ', '.join('%r %r' % (float(x), float(y)) for x, y in coords) + ')'
+
+
+def ellipse(xc, yc, a, b, angle, start=0., stop=2 * np.pi, n=41):
+    """Vertices of an (arc of) ellipse rotated by angle, closed through the center for an arc."""
+    t = np.linspace(start, stop, n, endpoint=(stop - start) < 2 * np.pi)
+    x, y = a * np.cos(t), b * np.sin(t)
+    coords = [(xc + x[i] * np.cos(angle) - y[i] * np.sin(angle), yc + x[i] * np.sin(angle) + y[i] * np.cos(angle))
+              for i in range(t.size)]
+    if (stop - start) < 2 * np.pi:
+        coords.append((xc, yc))
+
+    return coords
+
+
+def building_zones(seed=0, buildings=12, nx=NX, ny=NY):
+    """WKT of synthetic Röckle zones of rotated rectangular buildings: the building (rooftop), an upstream
+    displacement half ellipse and a wake ellipse, plus zones with holes, several parts and edges on grid points."""
+    rng = np.random.default_rng(seed)
+    zones = []
+    for _ in range(buildings):
+        xc = X0 + rng.uniform(15, (nx - 8) * MESH_SIZE)
+        yc = Y0 + rng.uniform(15, (ny - 8) * MESH_SIZE)
+        length, width = rng.uniform(6, 25), rng.uniform(5, 12)
+        angle = rng.uniform(0, np.pi)
+        rectangle = [(xc + dx * np.cos(angle) - dy * np.sin(angle), yc + dx * np.sin(angle) + dy * np.cos(angle))
+                     for dx, dy in ((-length / 2, -width / 2), (length / 2, -width / 2),
+                                    (length / 2, width / 2), (-length / 2, width / 2))]
+        zones.append('POLYGON (' + ring_wkt(rectangle) + ')')
+        zones.append('POLYGON (' + ring_wkt(ellipse(xc, yc, width, length / 2, angle, np.pi / 2, 3 * np.pi / 2)) + ')')
+        zones.append('POLYGON (' + ring_wkt(ellipse(xc, yc, 2 * width, length / 2, angle)) + ')')
+
+    # Edges through grid points (boundary points intersect), a hole and two parts
+    x1, y1 = X0 + 10 * MESH_SIZE, Y0 + 8 * MESH_SIZE
+    x2, y2 = X0 + 20 * MESH_SIZE, Y0 + 15 * MESH_SIZE
+    zones.append('POLYGON (' + ring_wkt([(x1, y1), (x2, y1), (x2, y2), (x1, y2)]) + ')')
+    zones.append('POLYGON (' + ring_wkt([(x1, y1), (x2, y2), (x1, y2)]) + ')')
+    zones.append('POLYGON (' + ring_wkt([(x1 - 10, y1 - 10), (x2 + 10, y1 - 10), (x2 + 10, y2 + 10), (x1 - 10, y2 + 10)])
+                 + ', ' + ring_wkt([(x1, y1), (x1, y2), (x2, y2), (x2, y1)]) + ')')
+    zones.append('MULTIPOLYGON ((' + ring_wkt([(x1, y1), (x1 + 5, y1), (x1 + 5, y1 + 5)]) + '), ('
+                 + ring_wkt([(x2, y2), (x2 + 7, y2), (x2 + 7, y2 + 7), (x2, y2 + 7)]) + '))')
+    # Zone partly outside the grid
+    zones.append('POLYGON (' + ring_wkt([(X0 - 30, Y0 - 30), (X0 + 15, Y0 - 30), (X0 + 15, Y0 + 15)]) + ')')
+
+    return zones
+
+
+def grid_points(missing=0.05, seed=0, nx=NX, ny=NY):
+    """ID, x and y of the grid points, with some points missing."""
+    x, y = np.meshgrid(X0 + MESH_SIZE * np.arange(nx), Y0 + MESH_SIZE * np.arange(ny), indexing='ij')
+    keep = np.random.default_rng(seed).random(x.size) >= missing
+    idPoints = np.arange(1, x.size + 1)[keep]
+
+    return idPoints, x.ravel()[keep], y.ravel()[keep]
+
+
+def intersects_exact(px, py, rings):
+    """ST_INTERSECTS of a point and a polygon (rings) in exact arithmetic: inside (even-odd) or on the boundary."""
+    px, py = Fraction(px), Fraction(py)
+    inside = False
+    for ring in rings:
+        for (xa, ya), (xb, yb) in zip(ring[:-1], ring[1:]):
+            xa, ya, xb, yb = Fraction(xa), Fraction(ya), Fraction(xb), Fraction(yb)
+            if ((xb - xa) * (py - ya) == (yb - ya) * (px - xa)) and (min(xa, xb) <= px <= max(xa, xb)) \
+                    and (min(ya, yb) <= py <= max(ya, yb)):
+                return True
+            if (ya > py) != (yb > py) and px < xa + (py - ya) * (xb - xa) / (yb - ya):
+                inside = not inside
+
+    return inside
+
+
+def spatial_join(zones, idPoints, xPoints, yPoints, intersects):
+    """(zone, point) pairs of the spatial join between the zones and all the grid points (the former query)."""
+    pairs = set()
+    for i, zone in enumerate(zones):
+        rings = ZoneIndex.parseRings(zone)
+        coords = np.concatenate(rings)
+        candidates = (xPoints >= coords[:, 0].min()) & (xPoints <= coords[:, 0].max()) \
+            & (yPoints >= coords[:, 1].min()) & (yPoints <= coords[:, 1].max())
+        for p in np.flatnonzero(candidates):
+            if intersects(zone, rings, xPoints[p], yPoints[p]):
+                pairs.add((i, int(idPoints[p])))
+
+    return pairs
+
+
+class TestZoneIndex(unittest.TestCase):
+    """Test that the indexed assignment gives the (zone, point) pairs of the spatial join."""
+
+    def setUp(self):
+        self.zones = building_zones()
+        self.idPoints, self.xPoints, self.yPoints = grid_points()
+        self.gridIndex = ZoneIndex.createGridIndex(self.idPoints, self.xPoints, self.yPoints)
+
+    def indexed(self):
+        """(zone, point) pairs of the indexed assignment."""
+        polygonIndex, idPoint = ZoneIndex.assignPointsToPolygons(
+            self.gridIndex, [ZoneIndex.parseRings(zone) for zone in self.zones])
+
+        return set(zip(polygonIndex.tolist(), idPoint.tolist()))
+
+    def test_exact(self):
+        """Test against the intersection of each point and zone in exact arithmetic."""
+        join = spatial_join(self.zones, self.idPoints, self.xPoints, self.yPoints,
+                            lambda zone, rings, x, y: intersects_exact(x, y, rings))
+
+        self.assertGreater(join.__len__(), 1000)
+        self.assertEqual(self.indexed(), join)
+
+    @unittest.skipIf(shapely_wkt is None, 'shapely (GEOS) is not installed')
+    def test_geos(self):
+        """Test against ST_INTERSECTS as calculated by GEOS."""
+        geometries = {zone: shapely_wkt.loads(zone) for zone in self.zones}
+        join = spatial_join(self.zones, self.idPoints, self.xPoints, self.yPoints,
+                            lambda zone, rings, x, y: geometries[zone].intersects(Point(x, y)))
+
+        self.assertEqual(self.indexed(), join)
+
+    @unittest.skipUnless(os.environ.get('UMEP_TIMING'), 'set UMEP_TIMING to time 2,000 zones on a 1000x1000 grid')
+    def test_timing(self):
+        """Time the indexed assignment against the test of each zone on the whole grid."""
+        zones = building_zones(buildings=700, nx=1000, ny=1000)
+        idPoints, xPoints, yPoints = grid_points(missing=0., nx=1000, ny=1000)
+        listOfRings = [ZoneIndex.parseRings(zone) for zone in zones]
+
+        start = time.time()
+        gridIndex = ZoneIndex.createGridIndex(idPoints, xPoints, yPoints)
+        ZoneIndex.assignPointsToPolygons(gridIndex, listOfRings)
+        print('\nIndexed assignment of %d zones: %.2f s' % (zones.__len__(), time.time() - start))
+
+        start = time.time()
+        for rings in listOfRings[:20]:
+            ZoneIndex.pointsInRings(xPoints, yPoints, rings)
+        print('Whole grid test of 20 zones: %.2f s' % (time.time() - start))
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(TestZoneIndex)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)
@@ -252,4 +252,88 @@ def RoughnessCalc(Roughnessmethod,zH,fai,pai,zMax,zSdev):
         else:
             z_0_output = 0.
             z_d_output = 0.
-    return(z_d_output,z_0_output)
\ No newline at end of file
+    return(z_d_output,z_0_output)
+def RoughnessCalcArray(Roughnessmethod, zH, fai, pai, zMax, zSdev):
+    # Same methods as RoughnessCalc for arrays of any shape (e.g. grids x wind directions), i.e. all grids in one call.
+    # Branches of the methods are selected with masks (np.where) instead of per element if statements.
+    zH = np.asarray(zH, dtype=float)
+    fai = np.asarray(fai, dtype=float)
+    pai = np.asarray(pai, dtype=float)
+    zMax = np.asarray(zMax, dtype=float)
+    zSdev = np.asarray(zSdev, dtype=float)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        if Roughnessmethod == 'RT':
+            #Rule of thumb method
+            z_d_output = 0.7*zH
+            z_0_output = 0.1*zH
+        elif Roughnessmethod == 'Rau':
+            ##### Raupach 1994/95 ####
+            Cs=0.003
+            Cr=0.3
+            Stab=0.193
+            UdivUmax=0.3
+            Cdl=7.5
+            k=0.4
+            RauZdexpW=(np.exp(-((Cdl*2*fai)**0.5)))-1
+            z_d_output= (1+ (RauZdexpW/((Cdl*2*fai)**0.5)))*zH
+            RauZoUtermW = 1/(np.minimum(((Cs+(Cr*fai))**0.5), UdivUmax))
+            RauZoexpW = np.exp((-k*RauZoUtermW)+Stab)
+            z_0_output = ((1-(z_d_output/zH))*RauZoexpW)*zH
+        elif Roughnessmethod == 'Bot':
+            #Bottema
+            Cdh = 0.8
+            k=0.4
+            z_d_output = (pai**0.6)*zH
+            BotZoexpW =np.exp(-k/((0.5*fai*Cdh)**0.5))
+            z_0_output = (zH - z_d_output)*(BotZoexpW)
+        elif Roughnessmethod in ('Mac', 'Kan'):
+            #MacDonald
+            Clb = 1.2
+            k=0.4
+            #Staggered array
+            Alph = 4.43
+            Beet = 1.0
+            #Square array
+            #Alph = 3.59
+            #Beet = 0.55
+            built = zH > 0.
+            z_d_output = (1+((Alph**-pai)*(pai-1)))*zH
+            z0Mac = np.where(z_d_output != zH,
+                             (zH*((1-z_d_output/zH))*np.exp(-(0.5*Beet*(Clb/k**2)*(1-(z_d_output/zH))*fai)**-0.5)), 0.)
+            if Roughnessmethod == 'Mac':
+                z_0_output = z0Mac
+            else:
+                #Kanda
+                Ao = 1.29
+                Bo = 0.36
+                Co = -0.17
+                A1 = 0.71
+                B1= 20.21
+                C1 = -0.77
+                X=(zSdev+zH)/zMax
+                z_d_output = np.where((0 < X) & (X <= 1), ((Co*(X**2))+((((Ao*(pai**Bo))-Co))*X))*zMax,
+                                      (Ao*(pai**Bo))*zH)
+                Y = (pai*zSdev)/zH
+                z_0_output = np.where(Y >= 0, ((B1*(Y**2))+(C1*Y)+A1)*z0Mac, A1*z0Mac)
+            z_d_output = np.where(built, z_d_output, 0.)
+            z_0_output = np.where(built, z_0_output, 0.)
+        elif Roughnessmethod == 'Mho':
+            #Millward Hopkins
+            #### Millward-Hopkins (2011)- Uniform with correction ####
+            CD=1.2
+            k= 0.4
+            ZdMho_U = np.where(pai >= 0.19,
+                               (((19.2*pai) - 1 + (np.exp(-19.2*pai)))/((19.2*pai)*(1-(np.exp(-19.2*pai)))))*zH,
+                               (((117*pai) + ((187.2*(pai**3))-6.1)*(1-np.exp(-19.2*pai)))/((1+(114*pai)+(187*pai**3))*(1-(np.exp(-19.2*pai)))))*zH)
+            ZoMhoexp_U = np.exp(-((0.5*CD*(k**-2)*fai)**-0.5))
+            ZoMho_U=((1-(ZdMho_U/zH))* ZoMhoexp_U)*zH
+            ZdMho_UCor=zH*((ZdMho_U/zH)+((0.2375*np.log(pai)+1.1738)*(zSdev/zH)))
+            ZoMho_UCor= zH*((ZoMho_U/zH)+ (np.exp((0.8867*fai)-1)*((zSdev/zH)**np.exp(2.3271*fai))))
+            z_d_output = np.where(zH > 0., ZdMho_UCor, 0.)
+            z_0_output = np.where(zH > 0., ZoMho_UCor, 0.)
+        else:
+            z_d_output = np.zeros(zH.shape) - 999.
+            z_0_output = np.zeros(zH.shape) - 999.
+
+    return(z_d_output,z_0_output)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+'''
+Per polygon processing for the Grid preprocessors (Morphometric Calculator and Land Cover Fraction).
+
+Rasters are read once into in-memory (MEM) datasets and each polygon is clipped in memory, with the same
+gdal.Translate (projWin) and gdal.Warp (cutline) as before but without temporary files. The kernels of the
+polygons are run on a pool of processes and the results are returned in feature order.
+'''
+import numpy as np
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from osgeo import gdal, ogr, osr
+from . import RoughnessCalcFunctionV2 as rg
+from . import imageMorphometricParms_v2 as morph
+from . import ssParms as ss
+from ..functions import wallalgorithms as wa
+from .processContext import process_context
+
+# Seconds between two checks of the cancel button while waiting for the workers
+WAIT_TIMEOUT = 1
+
+# Number of clipped grids per worker waiting in the pool (limits memory use)
+PENDING_PER_WORKER = 2
+
+class SilentFeedback():
+    '''Feedback for kernels run in worker processes (QgsProcessingFeedback can not be pickled)'''
+    def setProgress(self, progress):
+        pass
+
+    def setProgressText(self, text):
+        pass
+
+    def pushWarning(self, text):
+        pass
+
+    def isCanceled(self):
+        return False
+
+def memory_raster(filepath):
+    '''Raster file read once into an in-memory dataset'''
+    bigraster = gdal.Open(filepath)
+    raster = gdal.Translate('', bigraster, format='MEM')
+    bigraster = None
+
+    return raster
+
+def clip_window(raster, bbox):
+    '''Window of an in-memory raster, bbox = (minX, maxY, maxX, minY)'''
+    return gdal.Translate('', raster, format='MEM', projWin=bbox)
+
+def clip_cutline(raster, polygon_wkt, crs_wkt):
+    '''In-memory raster cropped to a polygon, pixels outside the polygon are NoData'''
+    dir_poly = '/vsimem/poly_temp_' + uuid.uuid4().hex + '.shp'
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(crs_wkt)
+    VectorDriver = ogr.GetDriverByName("ESRI Shapefile")
+    Vector = VectorDriver.CreateDataSource(dir_poly)
+    layer = Vector.CreateLayer('poly_temp', srs, ogr.wkbPolygon)
+    feature = ogr.Feature(layer.GetLayerDefn())
+    feature.SetGeometry(ogr.CreateGeometryFromWkt(polygon_wkt))
+    layer.CreateFeature(feature)
+    feature = None
+    Vector = None
+
+    clip_spec = gdal.WarpOptions(format="MEM", cutlineDSName=dir_poly, cropToCutline=True)
+    clip = gdal.Warp('', raster, options=clip_spec)
+    VectorDriver.DeleteDataSource(dir_poly)
+
+    return clip
+
+def clip_grid(raster, imid, bbox, polygon_wkt, crs_wkt):
+    '''Raster of one grid polygon; window around the centroid (imid == 1) or cropped to the polygon'''
+    if imid == 1:
+        return clip_window(raster, bbox)
+    else:
+        return clip_cutline(raster, polygon_wkt, crs_wkt)
+
+def morphometry_grid(dsm_array, dem_array, cdsm_array, nd, scale, pixel_area, imid, degree):
+    '''Morphometric parameters of one grid (NoData set to -9999). Returns the result of imagemorphparam_v2, the wall
+    area index and the SUEWS/SS result if cdsm_array is given. Roughness is calculated for all grids at once
+    (RoughnessCalcArray)'''
+    feedback = SilentFeedback()
+    imp_point = 0
+
+    immorphresult = morph.imagemorphparam_v2(dsm_array, dem_array, scale, imid, degree, feedback, imp_point)
+
+    # adding wai area to isotrophic (wall area index)
+    total = 100. / (int(dsm_array.shape[0] * dsm_array.shape[1]))
+
+    numPixels = len(dsm_array[np.where(dsm_array != nd)])
+    buildDSM = np.copy(dsm_array) - np.copy(dem_array)
+    buildDSM[buildDSM == nd] = 0
+    buildDSM[(buildDSM < 2.)] = 0 # building should be higher than 2 meter
+    walls = wa.findwalls(buildDSM, 0.5, feedback, total) # 0.5 meter difference in kernel filter identify a wall
+    wallarea = np.sum(walls)
+    gridArea = numPixels * pixel_area # changed to work for irregular grids
+    wai = wallarea / gridArea
+
+    if cdsm_array is not None:
+        ssResults = ss.ss_calc(buildDSM, cdsm_array, walls, numPixels, feedback)
+        arrSS = np.hstack([ssResults["z"], ssResults["paiZ_b"], ssResults["bScale"], ssResults["paiZ_v"], ssResults["vScale"]])
+    else:
+        arrSS = None
+
+    return immorphresult, wai, arrSS
+
+def morphometry_roughness(Roughnessmethod, immorphresults):
+    '''zd and z0 for the wind directions (one array per grid) and isotropic zd and z0 (arrays of grids) of the
+    results of morphometry_grid, calculated in one call for all grids'''
+    if not immorphresults:
+        return [], [], np.zeros((0)), np.zeros((0))
+
+    directions = np.cumsum([r["zH"].shape[0] for r in immorphresults])[:-1]
+    zd, z0 = rg.RoughnessCalcArray(Roughnessmethod, *[np.concatenate([r[key] for r in immorphresults])
+                                                      for key in ("zH", "fai", "pai", "zHmax", "zH_sd")])
+    zdall, z0all = rg.RoughnessCalcArray(Roughnessmethod, *[np.array([r[key] for r in immorphresults])
+                                                            for key in ("zH_all", "fai_all", "pai_all", "zHmax_all", "zH_sd_all")])
+
+    # If zd and z0 are lower than open country, set to open country
+    zdall[zdall == 0.0] = 0.1
+    z0all[z0all == 0.0] = 0.03
+
+    return np.split(zd, directions), np.split(z0, directions), zdall, z0all
+
+def collect_results(pending, results):
+    '''Moves the results of finished futures to results. Returns the number of finished grids'''
+    done, _ = wait(list(pending), timeout=WAIT_TIMEOUT, return_when=FIRST_COMPLETED)
+    for future in done:
+        results[pending.pop(future)[0]] = future.result()
+
+    return done.__len__()
+
+def run_grids(kernel, grids, nGrids, workers, feedback):
+    '''Runs kernel(*args) for the args of each grid yielded by grids (None for grids not calculated) on a pool of
+    workers. Returns the results in the order of the grids, None for grids not calculated or cancelled. Falls back
+    to a serial run if the worker processes can not be started.'''
+    results = [None] * nGrids
+    pending = {}
+    submitting = None
+    finished = 0
+    grids = enumerate(grids)
+
+    if workers > 1:
+        feedback.setProgressText('Calculating grids on ' + str(workers) + ' processes...')
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=process_context()) as executor:
+                for index, args in grids:
+                    if feedback.isCanceled():
+                        break
+                    if args is None:
+                        finished += 1
+                    else:
+                        # Kept until submitted, to be calculated serially if the submit fails
+                        submitting = (index, args)
+                        pending[executor.submit(kernel, *args)] = submitting
+                        submitting = None
+                        while pending.__len__() >= PENDING_PER_WORKER * workers:
+                            finished += collect_results(pending, results)
+                    feedback.setProgress(int((finished * 100) / nGrids))
+
+                while pending:
+                    if feedback.isCanceled():
+                        for future in pending:
+                            future.cancel()
+                        break
+                    finished += collect_results(pending, results)
+                    feedback.setProgress(int((finished * 100) / nGrids))
+        except (BrokenProcessPool, OSError) as e:
+            feedback.setProgressText('Could not calculate grids in parallel (' + str(e) + '). Calculating grids serially...')
+            left = list(pending.values())
+            if submitting is not None:
+                left.append(submitting)
+            for index, args in left:
+                results[index] = kernel(*args)
+                finished += 1
+
+    # Serial run, or the grids left if the worker processes failed
+    for index, args in grids:
+        if feedback.isCanceled():
+            break
+        if args is not None:
+            results[index] = kernel(*args)
+        finished += 1
+        feedback.setProgress(int((finished * 100) / nGrids))
+
+    if feedback.isCanceled():
+        feedback.setProgressText("Calculation cancelled")
+
+    return results
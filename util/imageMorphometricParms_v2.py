@@ -15,19 +15,85 @@ Author:
 dsm = Digital Surface Model (Ground and building heights)
 dem = Digital Elevation Model (Ground heights)
 mid = Start from center of domain (1) or calculate thruogh whole grid (0)
+alltransects = Use all transects parallel to the centre line (True) or only the centre line (False)
 scale = 1/pixel resolution (m)
 dtheta = 5.  # degree interval
 feedback = USed to communicate with QGIS
 imp_point = used to communicate with QGIS
 
-
+The rotated grid is not computed. For each angle, only the transects used (the centre line) are sampled from the
+unrotated grid with the nearest neighbour mapping of scipy.ndimage.rotate(order=0, reshape=True).
 '''
 import numpy as np
-import scipy.ndimage.interpolation as sc
+from functools import lru_cache
+from scipy import ndimage, special
 # import matplotlib as plt
 
 
-def imagemorphparam_v2(dsm, dem, scale, mid, dtheta, feedback, imp_point):
+def rotated_grid(shape, angle):
+    '''Rotation matrix, offset and shape of the grid rotated by angle (degrees) as in scipy.ndimage.rotate with
+    reshape=True, i.e. pixel (y, x) in the rotated grid is rot_matrix @ (y, x) + offset in the unrotated grid'''
+    c, s = special.cosdg(angle), special.sindg(angle)
+    rot_matrix = np.array([[c, s],
+                           [-s, c]])
+
+    in_shape = np.asarray(shape)
+    iy, ix = in_shape
+    out_bounds = rot_matrix @ [[0, 0, iy, iy],
+                               [0, ix, 0, ix]]
+    out_shape = (np.ptp(out_bounds, axis=1) + 0.5).astype(int)
+    offset = (in_shape - 1) / 2 - rot_matrix @ ((out_shape - 1) / 2)
+
+    return rot_matrix, offset, out_shape
+
+
+@lru_cache(maxsize=1)
+def offset_first():
+    '''True if scipy.ndimage.rotate adds the offset before the rotated pixel indices. Pixels exactly between two
+    pixels of the unrotated grid are rounded depending on the order of the sum, which differs between scipy versions'''
+    probe = np.arange(40 * 36, dtype=float).reshape((40, 36))
+    for angle in (135, 210, 225):
+        rotated = ndimage.rotate(probe, angle, order=0, reshape=True, mode='constant', cval=-99)
+        rot_matrix, offset, out_shape = rotated_grid(probe.shape, angle)
+        out_y, out_x = np.meshgrid(np.arange(out_shape[0]), np.arange(out_shape[1]), indexing='ij')
+        last = np.array([rot_matrix[0, 0] * out_y + rot_matrix[0, 1] * out_x + offset[0],
+                         rot_matrix[1, 0] * out_y + rot_matrix[1, 1] * out_x + offset[1]])
+        if not np.array_equal(rotated, ndimage.map_coordinates(probe, last, order=0, mode='constant', cval=-99)):
+            return True
+
+    return False
+
+
+def rotated_coordinates(rot_matrix, offset, out_y, out_x):
+    '''Positions in the unrotated grid of pixels out_y, out_x of the rotated grid (rotated_grid)'''
+    if offset_first():
+        return np.array([offset[0] + rot_matrix[0, 0] * out_y + rot_matrix[0, 1] * out_x,
+                         offset[1] + rot_matrix[1, 0] * out_y + rot_matrix[1, 1] * out_x])
+
+    return np.array([rot_matrix[0, 0] * out_y + rot_matrix[0, 1] * out_x + offset[0],
+                     rot_matrix[1, 0] * out_y + rot_matrix[1, 1] * out_x + offset[1]])
+
+
+def rotated_transects(build, rot_matrix, offset, rows, columns):
+    '''Pixels rows, columns of the rotated grid (rotated_grid) sampled from the unrotated grid with nearest
+    neighbour, i.e. rotate(build, angle, order=0, reshape=True, mode='constant', cval=-99)[rows, columns]'''
+    out_y, out_x = np.meshgrid(rows, columns, indexing='ij')
+    coordinates = rotated_coordinates(rot_matrix, offset, out_y, out_x)
+
+    return ndimage.map_coordinates(build, coordinates, order=0, mode='constant', cval=-99)
+
+
+def leading_edge(transects):
+    '''Leading edge filter along transects (rows, columns); height difference to the next pixel. Outside (-99) is
+    treated as ground'''
+    buildZero = np.where(transects == -99, 0, transects)  # remove -99 to avoid one 99 meter tall building wall
+    walls = np.zeros(transects.shape)
+    walls[:-1, :] = buildZero[1:, :] - buildZero[:-1, :]
+
+    return walls
+
+
+def imagemorphparam_v2(dsm, dem, scale, mid, dtheta, feedback, imp_point, alltransects=False):
 
     numPixels = len(dsm[np.where(dsm != -9999)]) # too deal with irregular grids
 
@@ -74,39 +140,33 @@ def imagemorphparam_v2(dsm, dem, scale, mid, dtheta, feedback, imp_point):
         if imp_point == 1:
             feedback.setProgress(int(angle/3.6))
 
-        # Rotating buildings
-        # d = sc.rotate(build, angle, order=0, reshape=False, mode='nearest') #old
-        a = sc.rotate(build, angle, order=0, reshape=True, mode='constant', cval=-99)
-       
-        #% convolve leading edge filter with domain
-        c = a * 0.0
-
-        n = c.shape[1]
+        # Transects of the rotated buildings, sampled from the unrotated grid
+        rot_matrix, offset, (ny, n) = rotated_grid(build.shape, angle)
         imid = np.floor((n/2.))
-
-        # filter for fai. Moved inside loop since size change if grid is irregular
-        filt1 = np.ones((n, 1)) * -1.
-        filt2 = np.ones((n, 1))
-        filt = np.array(np.hstack((filt1, filt2))).conj().T
-        buildZero = np.copy(a)
-        buildZero[buildZero == -99] = 0 # remove -99 to avoid one 99 meter tall building wall
-
-        for i in np.arange(1, c.shape[0]):
-            c[int(i)-1, :] = np.sum((filt*buildZero[int(i)-1:i+1, :]), 0)
+        if alltransects:
+            columns = np.arange(n)  # all transects parallel to the centre line
+        else:
+            columns = np.arange(int(imid), int(imid) + 1)  # centre line
 
         if mid == 1: # from center point
-            ny = a.shape[0]
             imidy = np.floor((ny/2.)) # the mid (NtoS) line of the grid
-            lineMid = a[0:int(imidy),int(imid)]
-            walltemp = c[0:int(imidy),int(imid)]
+            rows = np.arange(int(imidy) + 1)  # one more row for the leading edge filter
         else: #whole grid
-            lineMid = a[:,int(imid)] # whole center line
-            walltemp = c[:,int(imid)]
+            imidy = ny
+            rows = np.arange(ny)
+
+        lines = rotated_transects(build, rot_matrix, offset, rows, columns)
+
+        #% leading edge filter along the transects
+        walls = leading_edge(lines)
+
+        lineMid = lines[0:int(imidy), :]
+        walltemp = walls[0:int(imidy), :]
 
         bld = lineMid[np.where(lineMid > -99)]
         wall = walltemp[np.where(lineMid > -99)]
         ly = bld.shape[0] #number of pixels to consider in NtoS
-        lx = 1 #!TODO should this consider full length (EtoW) of grid and if so, how?
+        lx = 1 # ly includes the pixels of all transects
         
         wall = wall[np.where(wall > 2)]  # wall vector
         fai[j] = np.sum(wall)/((lx*ly)/scale)
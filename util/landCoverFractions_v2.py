@@ -10,69 +10,76 @@
 #%   Modified by Fredrik Lindberg 2010-01-09, fredrik.lindberg@kcl.ac.uk
 #%   Translated to Python 20150108
 #    Extended to be albe to calculate on irregular grids, Fredrik 20230207
+#    Single pass over all directions (transect pixels sampled from the unrotated grid for all angles and counted
+#    with one bincount)
 #%--------------------------------------------------------------------------
 
 import numpy as np
-import scipy.ndimage.interpolation as sc
+from functools import lru_cache
+from scipy import ndimage
+from .imageMorphometricParms_v2 import rotated_grid, rotated_coordinates
 # import matplotlib.pylab as plt
 
+# Number of land cover classes
+LC_CLASSES = 7
 
-def landcover_v2(lc_grid, mid, dtheta, feedback, imp_point):
-
-    # Isotropic (this is the same as before. Works on irregular grids)
-    lc_frac_all = np.zeros((1, 7))
-    for i in range(0, 7):
-        lc_gridvec = lc_grid[np.where(lc_grid == i + 1)]
-        if lc_gridvec.size > 0:
-            # lc_frac_all[0, i] = round((lc_gridvec.size * 1.0) / (lc_grid.size * 1.0), 3)
-            lc_frac_all[0, i] = round((lc_gridvec.size * 1.0) / (lc_grid.size - (lc_grid == 0).sum()),3) # ignoring NoData (0) pixels
-
-    # Anisotropic (Adjusted for irregular grids)
-    lc_frac = np.zeros((int(360./dtheta), 7))
-    deg = np.zeros((int(360./dtheta), 1))
-
-    #n = lc_grid.shape[0]
-    #imid = np.floor((n/2.))
-    # if mid == 1:
-        # dY = np.int16(np.arange(np.dot(1, imid)))  # the half length of the grid (y)
-    #else: #moved inside loop as it varies on an irregular grid
-        #dY = np.int16(np.arange(np.dot(1, n)))  # the whole length of the grid (y)
-
-        # dX = np.int16(np.arange(imid, imid+1))
-        #lx = dX.shape[0]
-        #ly = dY.shape[0]
-
-    j = int(0)
-    for angle in np.arange(0, 360, dtheta):
-        if imp_point == 1:
-            feedback.setProgress(int(angle/3.6))
 
-        #d = sc.rotate(lc_grid, angle, order=0, reshape=False, mode='nearest') #old
-        d = sc.rotate(lc_grid, angle, order=0, reshape=True, mode='constant', cval=-99)
-
-        n = d.shape[1]
+@lru_cache(maxsize=32)
+def transect_coordinates(shape, mid, dtheta):
+    '''Positions in the unrotated grid of the centre line of the grid rotated by each angle (0 to 360, dtheta), as in
+    rotate(lc_grid, angle, order=0, reshape=True). Returns the stacked coordinates and the angle index of each pixel'''
+    coordinates = []
+    angle_index = []
+    for j, angle in enumerate(np.arange(0, 360, dtheta)):
+        rot_matrix, offset, (ny, n) = rotated_grid(shape, angle)
         imid = np.floor((n/2.)) # the mid (NtoS) line of the grid
         if mid == 1: # from center point
-            ny = d.shape[0]
-            imidy = np.floor((ny/2.)) # the mid (NtoS) line of the grid
-            lineMid = d[0:imidy,imid]
+            rows = np.arange(int(np.floor((ny/2.))))
         else: #whole grid
-            lineMid = d[:,int(imid)] # whole center line
-        bld = lineMid[np.where(lineMid > 0)] # line within grid only  
+            rows = np.arange(ny)
+        coordinates.append(rotated_coordinates(rot_matrix, offset, rows, np.full(rows.shape[0], int(imid))))
+        angle_index.append(np.full(rows.shape[0], j))
+
+    return np.concatenate(coordinates, axis=1), np.concatenate(angle_index)
 
-        #b = np.round(((lc_grid.max()-lc_grid.min())/d.max())*d+lc_grid.min(), 0) #not needed anymore
-        #bld = b[dY, dX]  # lc array
-        ly = bld.shape[0] #number of pixels to consider in NtoS
-        lx = 1 #!TODO should this consider full length (EtoW) of grid and if so, how?
 
-        for i in range(0, 7):
-            bldtemp = bld[np.where(bld == i + 1)]  # lc vector
-            lc_frac[j, i] = np.float32(bldtemp.shape[0]) / (lx*ly)
+def landcover_v2(lc_grid, mid, dtheta, feedback, imp_point):
+
+    # Isotropic (this is the same as before. Works on irregular grids)
+    lc_frac_all = np.zeros((1, LC_CLASSES))
+    lc_class = np.isin(lc_grid, np.arange(1, LC_CLASSES + 1))
+    lc_count = np.bincount(lc_grid[lc_class].astype(int), minlength=LC_CLASSES + 1)
+    for i in range(0, LC_CLASSES):
+        if lc_count[i + 1] > 0:
+            # lc_frac_all[0, i] = round((lc_gridvec.size * 1.0) / (lc_grid.size * 1.0), 3)
+            lc_frac_all[0, i] = round((lc_count[i + 1] * 1.0) / (lc_grid.size - (lc_grid == 0).sum()),3) # ignoring NoData (0) pixels
 
-        deg[j] = angle
-        j += 1
+    # Anisotropic (Adjusted for irregular grids)
+    deg = np.arange(0, 360, dtheta).reshape((-1, 1)).astype(float)
+    steps = deg.shape[0]
+
+    # Centre lines of all rotations sampled at once (-99 outside the grid)
+    coordinates, angle_index = transect_coordinates(lc_grid.shape, mid, dtheta)
+    lineMid = ndimage.map_coordinates(lc_grid, coordinates, order=0, mode='constant', cval=-99)
+    if imp_point == 1:
+        feedback.setProgress(50)
+
+    inside = lineMid > 0 # line within grid only
+    ly = np.bincount(angle_index[inside], minlength=steps) #number of pixels to consider in NtoS
+    lx = 1 #!TODO should this consider full length (EtoW) of grid and if so, how?
+
+    # Histogram of land cover classes for all angles
+    classes = inside & np.isin(lineMid, np.arange(1, LC_CLASSES + 1))
+    counts = np.bincount(angle_index[classes] * LC_CLASSES + lineMid[classes].astype(int) - 1,
+                         minlength=steps * LC_CLASSES).reshape((steps, LC_CLASSES))
+    lc_frac = np.zeros((steps, LC_CLASSES))
+    for j in range(steps):
+        for i in range(0, LC_CLASSES):
+            lc_frac[j, i] = np.float32(counts[j, i]) / (lx*int(ly[j]))
+
+    if imp_point == 1:
+        feedback.setProgress(100)
 
     landcoverresult = {'lc_frac_all': lc_frac_all, 'lc_frac': lc_frac, 'deg': deg}
 
     return landcoverresult
-
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+'''
+Multiprocessing context of the process pools of the plugin (grid preprocessors, TreePlanter, UWG and SUEWS).
+'''
+import multiprocessing
+import os
+import shutil
+import sys
+
+def is_python(path):
+    '''True if path is a Python interpreter (and not e.g. the QGIS executable)'''
+    return bool(path) and os.path.basename(path).lower().startswith('python') and os.path.isfile(path)
+
+def python_executable():
+    '''Python interpreter of the running Python, None if not found. QGIS sets sys.executable to its own executable;
+    the interpreter is then looked for in exec_prefix (Windows) or exec_prefix/bin (Linux, macOS)'''
+    if is_python(sys.executable):
+        return sys.executable
+
+    version = 'python{0}.{1}'.format(*sys.version_info[:2])
+    candidates = []
+    for prefix in dict.fromkeys((sys.exec_prefix, sys.base_exec_prefix)):
+        for folder in ('', 'bin'):
+            for exe in ('pythonw.exe', 'python.exe', version, 'python3', 'python'):
+                candidates.append(os.path.join(prefix, folder, exe))
+    candidates.append(getattr(sys, '_base_executable', None))
+    candidates.append(shutil.which(version))
+
+    for python_exe in candidates:
+        if is_python(python_exe):
+            return python_exe
+
+    return None
+
+def process_context():
+    '''Spawn context using a Python interpreter. Raises OSError if no interpreter is found, i.e. the callers run
+    serially'''
+    context = multiprocessing.get_context('spawn')
+    python_exe = python_executable()
+    if python_exe is None:
+        raise OSError('No Python interpreter found for the worker processes')
+    if python_exe != sys.executable:
+        context.set_executable(python_exe)
+
+    return context